@@ -0,0 +1,163 @@
+# --------------------------------------------------------------------------
+# Микробенчмарк хода в Game.make_turn: прежнее представление поля в виде
+# двумерного списка из строк против битового представления из game.engine
+# и таблицы исходов из game.outcome_table
+#
+# Запуск из корня репозитория:
+#   python -m benchmarks.engine_benchmark
+# --------------------------------------------------------------------------
+
+
+import random
+import timeit
+
+from game import engine
+from game.outcome_table import shared_table
+from game.game import Game, GameResultCode, TurnResult, TurnResultCode
+
+
+class _LegacyGame(Game):
+    """
+    Копия прежней реализации хода, хранящей поле в виде двумерного списка из строк
+    """
+
+    def start_new_session(self, player_id: int, session_token: str):
+        super().start_new_session(player_id, session_token)
+        self.legacy_matrix = [[" ", " ", " "],
+                              [" ", " ", " "],
+                              [" ", " ", " "]]
+
+    def make_turn(self, player_id: int, row: int, column: int) -> TurnResult:
+        player = None
+        for pl in self.players:
+            if pl.id == player_id:
+                player = pl
+
+        if row in [0, 1, 2] and column in [0, 1, 2]:
+            cell = self.legacy_matrix[row][column]
+
+            if cell == " ":
+                self.legacy_matrix[row][column] = player.sign
+
+                if player.sign == "X":
+                    self.turn = "O"
+                else:
+                    self.turn = "X"
+
+                if self._is_player_win(self.legacy_matrix):
+                    game_result = GameResultCode.PLAYER_WIN
+                elif self._is_matrix_full(self.legacy_matrix):
+                    game_result = GameResultCode.NO_ONE_WIN
+                else:
+                    game_result = GameResultCode.GAME_CONTINUE
+
+                return TurnResult(True, game_result, TurnResultCode.SUCCESS, None, None)
+
+        return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, None, None)
+
+    @staticmethod
+    def _is_player_win(matrix: [[str]]) -> bool:
+        for sign in ["X", "O"]:
+            if matrix[0][0] == sign and matrix[0][1] == sign and matrix[0][2] == sign:
+                return True
+            if matrix[1][0] == sign and matrix[1][1] == sign and matrix[1][2] == sign:
+                return True
+            if matrix[2][0] == sign and matrix[2][1] == sign and matrix[2][2] == sign:
+                return True
+
+            if matrix[0][0] == sign and matrix[1][0] == sign and matrix[2][0] == sign:
+                return True
+            if matrix[0][1] == sign and matrix[1][1] == sign and matrix[2][1] == sign:
+                return True
+            if matrix[0][2] == sign and matrix[1][2] == sign and matrix[2][2] == sign:
+                return True
+
+            if matrix[0][0] == sign and matrix[1][1] == sign and matrix[2][2] == sign:
+                return True
+            if matrix[0][2] == sign and matrix[1][1] == sign and matrix[2][0] == sign:
+                return True
+
+        return False
+
+    @staticmethod
+    def _is_matrix_full(matrix: [[str]]) -> bool:
+        for row in matrix:
+            if " " in row:
+                return False
+        return True
+
+
+def _play(game_class: type, move_orders: [[int]]) -> int:
+    turns = 0
+
+    for moves in move_orders:
+        game = game_class()
+        game.start_new_session(1, "benchmark")
+        game.join_to_session(2)
+
+        for turn, move in enumerate(moves):
+            result = game.make_turn(1 + turn % 2, move // 3, move % 3)
+            turns += 1
+
+            if result.game_result_code != GameResultCode.GAME_CONTINUE:
+                break
+
+    return turns
+
+
+def _positions(move_orders: [[int]]) -> [(int, int)]:
+    positions = []
+
+    for moves in move_orders:
+        x_mask, o_mask = 0, 0
+
+        for turn, move in enumerate(moves):
+            if turn % 2 == 0:
+                x_mask |= 1 << move
+            else:
+                o_mask |= 1 << move
+
+            positions.append((x_mask, o_mask))
+
+    return positions
+
+
+def main(games: int = 20000, repeat: int = 5):
+    rng = random.Random(0)
+    move_orders = [rng.sample(range(9), 9) for _ in range(games)]
+
+    total_turns = _play(_LegacyGame, move_orders)
+    assert total_turns == _play(Game, move_orders)
+
+    print("Полный ход Game.make_turn:")
+
+    for name, game_class in (("matrix", _LegacyGame), ("bitboard", Game)):
+        best = min(timeit.repeat(lambda: _play(game_class, move_orders), number=1, repeat=repeat))
+        print(f"{name:>10}: {best / total_turns * 1e9:8.1f} нс на ход ({total_turns} ходов)")
+
+    positions = _positions(move_orders)
+    matrices = [engine.to_matrix(x_mask, o_mask) for x_mask, o_mask in positions]
+
+    def legacy_check():
+        for matrix in matrices:
+            _LegacyGame._is_player_win(matrix) or _LegacyGame._is_matrix_full(matrix)
+
+    def bitboard_check():
+        for x_mask, o_mask in positions:
+            engine.outcome(x_mask, o_mask)
+
+    table = shared_table()
+
+    def table_check():
+        for x_mask, o_mask in positions:
+            table.outcome(engine.board_code(x_mask, o_mask))
+
+    print("Проверка победы и ничьей:")
+
+    for name, check in (("matrix", legacy_check), ("bitboard", bitboard_check), ("table", table_check)):
+        best = min(timeit.repeat(check, number=1, repeat=repeat))
+        print(f"{name:>10}: {best / len(positions) * 1e9:8.1f} нс на позицию ({len(positions)} позиций)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# --------------------------------------------------------------------------
+# Задержка одного хода AI: прямой проход на numpy против model.predict Keras
+# (если Keras установлен)
+#
+# Запуск из корня репозитория:
+#   python -m benchmarks.inference_benchmark
+# --------------------------------------------------------------------------
+
+
+import timeit
+
+from game.inference import NumpyModel, encode_board
+
+
+def main(number: int = 20, repeat: int = 3):
+    board = encode_board(0b000_010_001, 0b000_000_100).reshape(1, 1, 27)
+    models = [("numpy", NumpyModel.load())]
+
+    try:
+        from keras.models import load_model
+        from neural_network.export import H5_PATH
+
+        models.append(("keras", load_model(H5_PATH, compile=False)))
+    except ImportError:
+        print("Keras не установлен, замеряется только numpy модель")
+
+    for name, model in models:
+        best = min(timeit.repeat(lambda: model.predict(board, verbose=0), number=number, repeat=repeat))
+        print(f"{name:>6}: {best / number * 1e6:10.1f} мкс на ход")
+
+
+if __name__ == "__main__":
+    main()
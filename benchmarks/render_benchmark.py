@@ -0,0 +1,141 @@
+# --------------------------------------------------------------------------
+# Микробенчмарк отрисовки поля: прежняя сборка клавиатуры и текста из
+# двумерного списка строк на каждом ходу (вместе с сериализацией клавиатуры
+# в JSON при отправке) против RenderCache
+#
+# Запуск из корня репозитория:
+#   python -m benchmarks.render_benchmark
+# --------------------------------------------------------------------------
+
+
+import json
+import random
+import timeit
+
+from telebot.apihelper import _convert_markup
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from client.callback_data import CallData, decode, encode
+from client.render_cache import RenderCache
+from game import engine
+from game.outcome_table import shared_table
+
+
+def _legacy_matrix_to_markup(matrix: [[str]]) -> InlineKeyboardMarkup:
+    """
+    Копия прежней сборки клавиатуры поля (с прежним форматом callback_data)
+    """
+
+    markup = InlineKeyboardMarkup(row_width=3)
+
+    cell_1_1 = InlineKeyboardButton(matrix[0][0], callback_data='turn 0 0')
+    cell_1_2 = InlineKeyboardButton(matrix[0][1], callback_data='turn 0 1')
+    cell_1_3 = InlineKeyboardButton(matrix[0][2], callback_data='turn 0 2')
+    markup.row(cell_1_1, cell_1_2, cell_1_3)
+
+    cell_2_1 = InlineKeyboardButton(matrix[1][0], callback_data='turn 1 0')
+    cell_2_2 = InlineKeyboardButton(matrix[1][1], callback_data='turn 1 1')
+    cell_2_3 = InlineKeyboardButton(matrix[1][2], callback_data='turn 1 2')
+    markup.row(cell_2_1, cell_2_2, cell_2_3)
+
+    cell_3_1 = InlineKeyboardButton(matrix[2][0], callback_data='turn 2 0')
+    cell_3_2 = InlineKeyboardButton(matrix[2][1], callback_data='turn 2 1')
+    cell_3_3 = InlineKeyboardButton(matrix[2][2], callback_data='turn 2 2')
+    markup.row(cell_3_1, cell_3_2, cell_3_3)
+
+    markup.row(InlineKeyboardButton(text="Отмена", callback_data="reset"))
+
+    return markup
+
+
+def _legacy_matrix_to_emojis(matrix: [[str]]) -> str:
+    """
+    Копия прежней сборки текста поля
+    """
+
+    out_str = ""
+
+    for row in matrix:
+        row_str = ""
+
+        for cell in row:
+            if cell == ' ':
+                row_str += "⬜️"
+            elif cell == 'O':
+                row_str += "⭕️"
+            elif cell == "X":
+                row_str += "❌"
+
+        row_str += "\n"
+        out_str += row_str
+
+    return out_str
+
+
+def _positions(games: int) -> [(int, int)]:
+    rng = random.Random(0)
+    positions = []
+
+    for _ in range(games):
+        x_mask, o_mask = 0, 0
+
+        for turn, move in enumerate(rng.sample(range(9), 9)):
+            if turn % 2 == 0:
+                x_mask |= 1 << move
+            else:
+                o_mask |= 1 << move
+
+            positions.append((x_mask, o_mask))
+
+            if engine.outcome(x_mask, o_mask) != engine.CONTINUE:
+                break
+
+    return positions
+
+
+def main(games: int = 20000, repeat: int = 5):
+    positions = _positions(games)
+
+    def legacy_render():
+        for x_mask, o_mask in positions:
+            # Как раньше: матрица строится из масок, а клавиатура сериализуется при отправке
+            matrix = engine.to_matrix(x_mask, o_mask)
+            _convert_markup(_legacy_matrix_to_markup(matrix))
+            _legacy_matrix_to_emojis(matrix)
+
+    lazy_cache = RenderCache(encode(CallData.RESET))
+
+    def cached_render():
+        for x_mask, o_mask in positions:
+            _convert_markup(lazy_cache.markup(x_mask, o_mask, CallData.TURN))
+            lazy_cache.text(x_mask, o_mask)
+
+    for x_mask, o_mask in positions:
+        matrix = engine.to_matrix(x_mask, o_mask)
+        cached = json.loads(lazy_cache.markup(x_mask, o_mask, CallData.TURN).to_json())["inline_keyboard"]
+        legacy = json.loads(_legacy_matrix_to_markup(matrix).to_json())["inline_keyboard"]
+
+        # Надписи кнопок совпадают, а callback_data отличается только форматом
+        assert [[button["text"] for button in row] for row in cached] == [[button["text"] for button in row]
+                                                                          for row in legacy]
+        assert [decode(button["callback_data"]).cell for row in cached[:3] for button in row] == list(range(9))
+        assert lazy_cache.text(x_mask, o_mask) == _legacy_matrix_to_emojis(matrix)
+
+    print("Отрисовка поля на ходу (клавиатура в JSON и текст):")
+
+    for name, render in (("legacy", legacy_render), ("cache", cached_render)):
+        best = min(timeit.repeat(render, number=1, repeat=repeat))
+        print(f"{name:>10}: {best / len(positions) * 1e9:8.1f} нс на ход ({len(positions)} ходов)")
+
+    table = shared_table()
+    reachable = [code for code in range(3 ** 9) if table.is_reachable(code)]
+
+    def build():
+        RenderCache(encode(CallData.RESET)).build((CallData.TURN, CallData.TURN_AI), reachable)
+
+    best = min(timeit.repeat(build, number=1, repeat=repeat))
+    print(f"Построение всех {len(reachable)} достижимых полей для двух префиксов заранее: {best * 1e3:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
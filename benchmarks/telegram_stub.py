@@ -0,0 +1,230 @@
+# --------------------------------------------------------------------------
+# Локальная замена серверов Telegram для проверки и замеров без сети
+#
+# FakeTelegram - HTTP-сервер с минимальным Bot API: getUpdates (длинный
+# опрос), setWebhook, deleteWebhook, sendMessage, editMessageText,
+# answerCallbackQuery и getMe, остальные методы отвечают true. Бот
+# подключается к нему через telebot.apihelper.API_URL = FakeTelegram.api_url.
+# Обновления передаются через push: пока webhook не установлен, они ждут
+# getUpdates, а после setWebhook отправляются POST-запросом на адрес webhook
+# с секретным токеном, как это делает Telegram. Время каждого вызова Bot API
+# записывается, чтобы мерить задержку от отправки обновления до ответа бота.
+# Задержка latency имитирует сеть до Telegram: на нее откладывается каждый
+# ответ Bot API и каждая доставка на webhook
+# --------------------------------------------------------------------------
+
+
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from client.webhook import SECRET_HEADER
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # Как и api.telegram.org, соединения с ботом не закрываются после ответа
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело ответа уходят одним пакетом, иначе на соединении keep-alive каждый ответ ждет задержанного
+    # подтверждения TCP
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: "_HTTPServer"
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+
+        if length:
+            body = self.rfile.read(length)
+
+            if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                params.update(parse_qsl(body.decode()))
+
+        method = url.path.rsplit("/", 1)[-1]
+        result = self.server.telegram.call(method, params)
+
+        if self.server.telegram.latency:
+            time.sleep(self.server.telegram.latency)
+        data = json.dumps({"ok": True, "result": result}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    telegram: "FakeTelegram"
+
+
+class FakeTelegram:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        :param port: порт сервера (0 - любой свободный)
+        :param latency: задержка сети до Telegram в секундах
+        """
+
+        self.latency = latency
+
+        self._condition = threading.Condition()
+        self._updates: [dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._is_released = False
+
+        self.webhook_url: str | None = None
+        self.secret_token: str | None = None
+
+        self.calls: [(float, str, dict)] = []
+        """
+        calls: [(время вызова time.perf_counter, метод Bot API, параметры)]
+        Все вызовы Bot API кроме getUpdates
+        """
+
+        self.answered: {str: float} = {}
+        """
+        answered: {callback_query_id: str, время ответа на нажатие time.perf_counter}
+        """
+
+        self._server = _HTTPServer((host, port), _RequestHandler)
+        self._server.telegram = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True)
+
+    @property
+    def api_url(self) -> str:
+        """
+        :return: шаблон для telebot.apihelper.API_URL
+        """
+
+        host, port = self._server.server_address[:2]
+
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.release()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def release(self):
+        """
+        Сразу завершает текущие и будущие getUpdates пустым ответом, чтобы остановленный polling не ждал окончания
+        длинного опроса
+        """
+
+        with self._condition:
+            self._is_released = True
+            self._condition.notify_all()
+
+    def wait_webhook(self, timeout: float = 5.0) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self.webhook_url is not None, timeout)
+
+    def wait_answered(self, count: int, timeout: float = 30.0) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.answered) >= count, timeout)
+
+    def push(self, update: dict, secret_token: str | None = None) -> int:
+        """
+        Доставляет обновление боту, update_id назначается автоматически
+        :param secret_token: токен для заголовка вместо переданного в setWebhook (например неверный)
+        :return: HTTP-статус ответа webhook, или 200 - если обновление ждет getUpdates
+        """
+
+        update = {"update_id": next(self._update_ids), **update}
+
+        with self._condition:
+            webhook_url = self.webhook_url
+
+            if webhook_url is None:
+                self._updates.append(update)
+                self._condition.notify_all()
+
+                return 200
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        request = urllib.request.Request(
+            webhook_url,
+            data=json.dumps(update).encode(),
+            headers={"Content-Type": "application/json", SECRET_HEADER: secret_token or self.secret_token or ""}
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def call(self, method: str, params: {str: str}) -> any:
+        if method == "getUpdates":
+            return self._get_updates(params)
+
+        now = time.perf_counter()
+
+        with self._condition:
+            self.calls.append((now, method, params))
+
+            match method:
+                case "setWebhook":
+                    self.webhook_url = params.get("url") or None
+                    self.secret_token = params.get("secret_token")
+                case "deleteWebhook":
+                    self.webhook_url = None
+                    self.secret_token = None
+                case "answerCallbackQuery":
+                    self.answered[params["callback_query_id"]] = now
+
+            self._condition.notify_all()
+
+        match method:
+            case "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+            case "sendMessage" | "editMessageText":
+                return {
+                    "message_id": int(params.get("message_id") or next(self._message_ids)),
+                    "date": int(time.time()),
+                    "chat": {"id": int(params["chat_id"]), "type": "private"},
+                    "text": params.get("text", "")
+                }
+            case _:
+                return True
+
+    def _get_updates(self, params: {str: str}) -> [dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+
+        with self._condition:
+            # Как в Bot API: offset подтверждает все обновления с меньшим update_id
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+
+            while not self._updates and not self._is_released:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                self._condition.wait(remaining)
+
+            return self._updates[:limit]
@@ -0,0 +1,165 @@
+# --------------------------------------------------------------------------
+# Замер приема обновлений: long polling (infinity_polling) против webhook
+#
+# Бот работает с локальной заменой Telegram (FakeTelegram) и хранилищем в
+# памяти. Обновления - нажатия на кнопку "ПРИСОЕДИНИТЬСЯ" от разных
+# пользователей - отправляются с постоянной частотой, а задержка считается
+# от отправки обновления до ответа бота на нажатие (answerCallbackQuery).
+# FakeTelegram задерживает каждый запрос на latency, как сеть до Telegram.
+# Ограничение скорости исходящих сообщений отключено: оно относится к
+# Telegram, а не к приему обновлений. Затем проверяется, что webhook
+# отклоняет запросы с неверным секретным токеном
+#
+# Запуск из корня репозитория:
+#   python -m benchmarks.webhook_benchmark
+# --------------------------------------------------------------------------
+
+
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import apihelper
+
+from benchmarks.telegram_stub import FakeTelegram
+from client.bot_client import BotClient
+from client.callback_data import CallData, encode
+from client.dispatcher import OutboundDispatcher
+from database.memory_storage import MemoryStorage
+
+
+TOKEN = "1:offline"
+
+
+def _client() -> BotClient:
+    client = BotClient(bot_token=TOKEN, storage=MemoryStorage(), reset_time=300, model=None)
+
+    client.dispatcher.stop()
+    client.dispatcher = OutboundDispatcher(client._send_reply, global_rate=1e6, chat_rate=1e6, chat_burst=1000)
+    client.dispatcher.start()
+
+    return client
+
+
+def _callback(index: int, users: int) -> dict:
+    user = {"id": 1000 + index % users, "is_bot": False, "first_name": "user"}
+
+    return {
+        "callback_query": {"id": f"q{index}", "from": user, "chat_instance": "0", "data": encode(CallData.BUTTON_JOIN)}
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+
+        return sock.getsockname()[1]
+
+
+def _drive(telegram: FakeTelegram, updates: int, users: int, rate: float, connections: int) -> {str: float}:
+    """
+    Отправляет updates нажатий с частотой rate в секунду
+    :param connections: количество одновременных доставок, как max_connections у webhook
+    :return: задержки и пропускная способность
+    """
+
+    sent_at = {}
+    started = time.perf_counter()
+
+    def deliver(index: int):
+        sent_at[f"q{index}"] = time.perf_counter()
+        status = telegram.push(_callback(index, users))
+        assert status == 200, status
+
+    with ThreadPoolExecutor(connections) as pool:
+        for index in range(updates):
+            delay = started + index / rate - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+            pool.submit(deliver, index)
+
+    assert telegram.wait_answered(updates), f"ответов на нажатия: {len(telegram.answered)} из {updates}"
+    finished = max(telegram.answered.values())
+
+    latencies = sorted((telegram.answered[key] - value) * 1e3 for key, value in sent_at.items())
+
+    return {
+        "throughput": updates / (finished - started),
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "max": latencies[-1]
+    }
+
+
+def _polling(updates: int, users: int, rate: float, latency: float) -> {str: float}:
+    telegram = FakeTelegram(latency=latency)
+    telegram.start()
+    apihelper.API_URL = telegram.api_url
+
+    client = _client()
+    thread = threading.Thread(target=client.start, daemon=True)
+    thread.start()
+
+    try:
+        return _drive(telegram, updates, users, rate, connections=1)
+    finally:
+        client.bot.stop_polling()
+        telegram.release()
+        thread.join()
+        telegram.stop()
+
+
+def _webhook(updates: int, users: int, rate: float, latency: float, workers: int) -> {str: float}:
+    telegram = FakeTelegram(latency=latency)
+    telegram.start()
+    apihelper.API_URL = telegram.api_url
+
+    port = _free_port()
+    client = _client()
+    thread = threading.Thread(
+        target=client.start_webhook,
+        kwargs={"url": f"http://127.0.0.1:{port}/webhook", "host": "127.0.0.1", "port": port, "workers": workers},
+        daemon=True
+    )
+    thread.start()
+
+    try:
+        assert telegram.wait_webhook()
+        result = _drive(telegram, updates, users, rate, connections=workers)
+
+        # Запросы без секретного токена или с чужим токеном не доходят до обработчиков
+        assert telegram.push(_callback(updates, users), secret_token="wrong") == 403
+        assert client.webhook.metrics().rejected == 1
+        assert client.webhook.metrics().received == updates
+
+        return result
+    finally:
+        client.webhook.stop()
+        thread.join()
+        telegram.stop()
+
+
+def main(updates: int = 2000, users: int = 200, rate: float = 200.0, latency: float = 0.02, workers: int = 8):
+    results = {
+        "polling": _polling(updates, users, rate, latency),
+        "webhook": _webhook(updates, users, rate, latency, workers)
+    }
+
+    print(
+        f"Прием {updates} нажатий от {users} пользователей, {rate:.0f} обновлений в секунду, задержка сети "
+        f"{latency * 1e3:.0f} мс:"
+    )
+
+    for name, result in results.items():
+        print(
+            f"{name:>10}: {result['throughput']:7.0f} обновлений/с, задержка p50 {result['p50']:6.2f} мс, "
+            f"p99 {result['p99']:6.2f} мс, max {result['max']:6.2f} мс"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import asyncio
+import datetime
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from telebot.types import CallbackQuery, Message
+from telebot.util import is_command
+from database.async_database_utils import AsyncDatabaseAPI
+from database.storage import Storage
+from client.callback_data import Callback, CallbackRouter
+from client.dispatcher import AsyncOutboundDispatcher
+from client.game_core import Board, GameCore, GameRecord, Reply, CallData, is_board_lost, is_board_not_modified
+from game.inference import Model
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class AsyncBotClient:
+    """
+    Вариант BotClient на asyncio. Игровая логика та же (GameCore), но обработчики не занимают поток на время запросов к
+    Telegram и БД, поэтому один процесс обслуживает тысячи одновременных игроков
+    """
+
+    def __init__(self, bot_token: str, storage: Storage, reset_time: int, model: Model | None,
+                 database_workers: int = 8, database_timeout: float = 5.0):
+        """
+        :param bot_token: уникальный токен Telegram-бота
+        :param storage: хранилище статистики пользователей (DatabaseAPI, SQLiteStorage или MemoryStorage),
+        закрывается при остановке бота
+        :param reset_time: время после которого пользователь будет удален из оперативной памяти (не из БД)
+        :param model: модель для игры против AI, или None - если не подразумевается режим против бота
+        :param database_workers: максимальное количество одновременных запросов к хранилищу
+        :param database_timeout: время в секундах, дольше которого обработчик не ждет ответа хранилища
+        """
+
+        self.core = GameCore(reset_time, model, on_expire=self._send)
+        """
+        Игровая логика общая с BotClient: статусы пользователей, игры и ответы на действия пользователей
+        """
+
+        self.bot = AsyncTeleBot(bot_token, parse_mode=None)
+        """
+        Текущий экземпляр класса AsyncTeleBot содержащий API для управления Telegram-ботом
+        """
+
+        self.database_api = AsyncDatabaseAPI(storage, max_workers=database_workers, timeout=database_timeout)
+        """
+        Текущий экземпляр класса AsyncDatabaseAPI содержащий API для запросов к БД
+        """
+
+        self.dispatcher = AsyncOutboundDispatcher(self._send_reply)
+        """
+        Очередь исходящих сообщений с ограничением скорости отправки в Telegram. Отправляет ответы задачами в цикле
+        событий бота
+        """
+
+        self.router = CallbackRouter()
+        """
+        Обработчики нажатий на кнопки по коду действия, обработчики - корутины
+        """
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._polling_task: asyncio.Task | None = None
+
+        # Изменяет время последней активности пользователя. Если пользователь не загружен из БД - загружает, если
+        # это новый пользователь - также добавляет его в БД
+        async def _update_timestamp(player_id: int):
+            if self.core.touch(player_id):
+                return
+
+            ensure_user_query = await self.database_api.ensure_user(player_id)
+
+            if ensure_user_query.success:
+                self.core.load_user(player_id, is_new=ensure_user_query.data)
+            else:
+                self._send(self.core.load_error(player_id))
+
+        # Обрабатывает сообщение если отправивший его пользователь не начал поиск сессии или игру и просто общается с
+        # ботом или если это новый пользователь
+        @self.bot.message_handler(
+            func=lambda message: not is_command(message.text) and self.core.is_chatting(message.from_user.id)
+        )
+        async def chat_message_handler(message: Message):
+            await _update_timestamp(message.from_user.id)
+
+            self._send(self.core.greeting(message))
+
+        # Обрабатывает сообщение если отправивший его пользователь сейчас в игре
+        @self.bot.message_handler(
+            func=lambda message: not is_command(message.text) and self.core.is_in_game(message.from_user.id)
+        )
+        async def chat_message_handler_while_game(message):
+            await _update_timestamp(message.from_user.id)
+
+        # Все нажатия проходят через один обработчик: он сразу отвечает на нажатие, один раз разбирает callback_data и
+        # вызывает обработчик действия из self.router
+        @self.bot.callback_query_handler(func=lambda call: True)
+        async def callback_handler(call: CallbackQuery):
+            await self._answer(call)
+            routed = self.router.route(call.data)
+
+            # Кнопка из прежнего формата callback_data
+            if routed is None:
+                return
+
+            handler, callback = routed
+            player_id = call.from_user.id
+            await _update_timestamp(player_id)
+
+            await handler(player_id, callback)
+
+        # Обрабатывает нажатие на кнопку "СТАРТ"
+        @self.router.handler(CallData.BUTTON_START)
+        async def button_start_callback(player_id: int, callback: Callback):
+            nick_query = await self.database_api.get_nickname(player_id)
+            nickname = nick_query.data if nick_query.success else None
+
+            self._send(self.core.start_session(player_id, nickname))
+
+        # Обрабатывает нажатие на кнопку "ПРИСОЕДИНИТЬСЯ"
+        @self.router.handler(CallData.BUTTON_JOIN)
+        async def button_join_callback(player_id: int, callback: Callback):
+            lobbies = self.core.joinable_lobbies(player_id)
+            nicknames = None
+
+            if lobbies:
+                nicknames = (await self.database_api.get_nicknames([i.players[0].id for i in lobbies])).data
+
+            self._send(self.core.join_menu(player_id, lobbies, nicknames))
+
+        # join_session, reset, turn и ai_turn берут блокировки сессий (StripedLock), а ai_turn держит свою на время хода
+        # модели. Поэтому они выполняются вне цикла событий: иначе совпадение полосы блокировки останавливало бы весь
+        # цикл до конца хода модели
+        @self.router.handler(CallData.SESSION_JOIN)
+        async def session_join_session_callback(player_id: int, callback: Callback):
+            self._send(await asyncio.to_thread(self.core.join_session, player_id, callback.tag))
+
+        @self.router.handler(CallData.RESET)
+        async def reset_callback(player_id: int, callback: Callback):
+            self._send(await asyncio.to_thread(self.core.reset, player_id))
+
+        # Обрабатывает нажатие на кнопку хода
+        @self.router.handler(CallData.TURN)
+        async def game_turn_callback(player_id: int, callback: Callback):
+            replies, record = await asyncio.to_thread(self.core.turn, player_id, callback.cell, callback.tag)
+            self._send(replies)
+
+            if record is not None:
+                self._send(self.core.record_replies(record, await self._record(record)))
+
+        @self.router.handler(CallData.BUTTON_AI)
+        async def button_ai_callback(player_id: int, callback: Callback):
+            self._send(self.core.start_ai_game(player_id))
+
+        @self.router.handler(CallData.TURN_AI)
+        async def ai_game_turn_callback(player_id: int, callback: Callback):
+            self._send(await asyncio.to_thread(self.core.ai_turn, player_id, callback.cell, callback.tag))
+
+        @self.bot.message_handler(commands=["start"])
+        async def command_start_message_handler(message):
+            await _update_timestamp(message.from_user.id)
+
+            self._send(self.core.main_menu(message))
+
+        @self.bot.message_handler(commands=["leaders"])
+        async def command_leaders_message_handler(message):
+            player_id = message.from_user.id
+            get_leaders_query = await self.database_api.get_leaders()
+            await _update_timestamp(player_id)
+
+            self._send(self.core.leaders(player_id, get_leaders_query))
+
+        @self.bot.message_handler(commands=["score"])
+        async def command_score_message_handler(message):
+            player_id = message.from_user.id
+            get_score_query = await self.database_api.get_user_score(player_id)
+            get_rank_query = await self.database_api.get_user_rank(player_id)
+            await _update_timestamp(player_id)
+
+            self._send(self.core.score(player_id, get_score_query, get_rank_query))
+
+        @self.bot.message_handler(commands=["nick"])
+        async def command_nick_message_handler(message):
+            player_id = message.from_user.id
+            await _update_timestamp(player_id)
+
+            nick = self.core.parse_nickname(message.text)
+            set_nick_query = None if nick is None else await self.database_api.set_nickname(player_id, nick)
+
+            self._send(self.core.nickname_replies(player_id, nick, set_nick_query))
+
+    async def _answer(self, call: CallbackQuery):
+        try:
+            await self.bot.answer_callback_query(call.id)
+        except ApiTelegramException as e:
+            # Telegram не принимает ответ на слишком старое нажатие, само нажатие при этом обрабатывается
+            _log(f"Не удалось ответить на нажатие {call.id}: {e}")
+
+    def _send(self, replies: [Reply]):
+        # Не ждет отправки, поэтому вызывается и из цикла событий, и из потока ExpiryService
+        self.dispatcher.submit(replies)
+
+    async def _send_reply(self, reply: Reply):
+        if reply.reply_to is not None:
+            await self.bot.reply_to(reply.reply_to, text=reply.text, reply_markup=reply.reply_markup)
+        elif reply.board == Board.NONE:
+            await self.bot.send_message(reply.chat_id, text=reply.text, reply_markup=reply.reply_markup)
+        else:
+            await self._send_board(reply)
+
+    async def _send_board(self, reply: Reply):
+        """
+        Изменяет сообщение с полем игрока, а если его нет - отправляет новое
+        """
+
+        boards = self.core.boards
+        message_id = None if reply.board == Board.NEW else boards.get(reply.chat_id)
+
+        if message_id is not None:
+            try:
+                await self.bot.edit_message_text(reply.text, reply.chat_id, message_id,
+                                                 reply_markup=reply.reply_markup)
+            except ApiTelegramException as e:
+                if is_board_lost(e):
+                    # Сообщение удалили, или оно слишком старое для изменения - поле отправляется заново
+                    _log(f"Не удалось изменить поле игрока {reply.chat_id}: {e}")
+                    message_id = None
+                elif not is_board_not_modified(e):
+                    # Остальные ошибки, в том числе 429 (его AsyncOutboundDispatcher повторит позже), новым
+                    # сообщением не исправить: у игрока оказалось бы два поля
+                    raise
+
+            if message_id is not None:
+                if reply.board == Board.FINAL:
+                    boards.pop(reply.chat_id)
+
+                return
+
+        message = await self.bot.send_message(reply.chat_id, text=reply.text, reply_markup=reply.reply_markup)
+
+        if reply.board == Board.FINAL:
+            boards.pop(reply.chat_id)
+        else:
+            boards.set(reply.chat_id, message.message_id)
+
+    async def _record(self, record: GameRecord) -> bool:
+        """
+        Сохраняет результат игры в БД
+        :return: True - если данные обоих игроков сохранены
+        """
+
+        if record.is_draw:
+            record_query = await self.database_api.record_draw(record.winner_id, record.loser_id)
+        else:
+            record_query = await self.database_api.record_game_result(record.winner_id, record.loser_id)
+
+        return record_query.success
+
+    def set_model(self, model: Model | None):
+        """
+        Заменяет модель для игры против AI, кэш ходов старой модели сбрасывается. Уже идущие игры доигрываются старой
+        моделью
+        """
+
+        self.core.set_model(model)
+
+    def metrics(self) -> {str: any}:
+        """
+        Метрики компонентов бота
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
+        """
+
+        out_dict = self.core.metrics()
+        out_dict["outbound"] = self.dispatcher.metrics()
+        out_dict.update(self.database_api.metrics())
+
+        return out_dict
+
+    async def run(self):
+        """
+        Работа бота в текущем цикле событий до остановки
+        """
+        _log("Старт бота")
+
+        self._loop = asyncio.get_running_loop()
+        self.core.start()
+        self.dispatcher.start()
+        self._polling_task = self._loop.create_task(self.bot.infinity_polling())
+
+        try:
+            # asyncio.wait не пробрасывает отмену опроса из stop, а отмена самого run прерывает ожидание
+            await asyncio.wait([self._polling_task])
+
+            if not self._polling_task.cancelled():
+                self._polling_task.result()
+        finally:
+            self._polling_task.cancel()
+            await self.dispatcher.stop(5.0)
+            await self.bot.close_session()
+            self.core.stop()
+            self.database_api.close()
+
+    def start(self):
+        """
+        Запуск бота в новом цикле событий
+        """
+
+        asyncio.run(self.run())
+
+    def stop(self):
+        """
+        Остановка бота: отменяет опрос Telegram, после чего run отправляет оставшиеся ответы, останавливает фоновый
+        поток удаления неактивных пользователей и закрывает пул запросов к БД. Можно вызывать из любого потока
+        """
+
+        if self._polling_task is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._polling_task.cancel)
@@ -1,33 +1,18 @@
-import threading
-import time
 import datetime
+import secrets
 import telebot
 
-from enum import IntEnum, StrEnum
-from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
-from database.database_utils import DatabaseAPI
-from game.game import Game, TurnResult, GameResultCode, TurnResultCode, GameAI
-from keras.models import Sequential
-
-
-class _Status(IntEnum):
-    IS_NOW_CHAT = 0
-    IS_NOW_AWAITING_TOKEN = 1
-    IS_NOW_GAME = 2
-    IS_NOW_AWAITING_PLAYER = 3
-    IS_NOW_AI_GAME = 4
-
-
-# В данном случае используется StrEnum так как параметр callback_data класса InlineKeyboardMarkup требует
-# строчный тип данных входного значения
-class _CallData(StrEnum):
-    BUTTON_AI = "ai"
-    BUTTON_START = "start"
-    BUTTON_JOIN = "join"
-    SESSION_JOIN = "session"
-    TURN = "turn"
-    TURN_AI = "turn_ai"
-    RESET = "reset"
+from urllib.parse import urlparse
+from telebot.apihelper import ApiTelegramException
+from telebot.types import CallbackQuery, Message, Update
+from telebot.util import is_command
+from database.executor import DatabaseExecutor
+from database.storage import DatabaseOperationResult, Storage
+from client.callback_data import Callback, CallbackRouter
+from client.dispatcher import OutboundDispatcher
+from client.game_core import Board, GameCore, GameRecord, Reply, CallData, is_board_lost, is_board_not_modified
+from client.webhook import WebhookServer
+from game.inference import Model
 
 
 def _log(message: str):
@@ -35,783 +20,347 @@ def _log(message: str):
     print(f"{str(date)}: {message}")
 
 
-def _check_players(timestamps: {int, int}, statuses: {int, _Status}, games: [Game], reset_time: int):
-    while True:
-        time.sleep(reset_time)
-
-        if len(timestamps) > 0 and len(statuses) > 0:
-            time_five_minute_ago = time.time() - reset_time
-
-            for key, value in list(timestamps.items()):
-                if time_five_minute_ago > value:
-                    for i in range(len(games)):
-                        if games[i].is_player_in_game(key):
-                            del games[i]
-
-                    del timestamps[key], statuses[key]
-                    _log(f"Пользователь {key} удалён из оперативной памяти")
-
-
 class BotClient:
-    def __init__(self, bot_token: str, database_conn_kwargs: {str: str}, reset_time: int, model: Sequential | None):
+    def __init__(self, bot_token: str, storage: Storage, reset_time: int, model: Model | None,
+                 database_workers: int = 8, database_timeout: float = 5.0):
         """
         :param bot_token: уникальный токен Telegram-бота
-        :param database_conn_kwargs: словарь с аргументами для соединения с БД
+        :param storage: хранилище статистики пользователей (DatabaseAPI, SQLiteStorage или MemoryStorage),
+        закрывается при остановке бота
         :param reset_time: время после которого пользователь будет удален из оперативной памяти (не из БД)
         :param model: модель для игры против AI, или None - если не подразумевается режим против бота
+        :param database_workers: максимальное количество одновременных запросов к хранилищу
+        :param database_timeout: время в секундах, дольше которого обработчик не ждет ответа хранилища
         """
 
-        self._chats_statuses = {}
+        self.core = GameCore(reset_time, model, on_expire=self._send)
         """
-        _chats_statuses: {player_id: int, status: _Status}
-        Словарь содержащий в себе статусы всех пользователей
-        
-        player_id:
-            id игрока
-        status:
-            _Status.IS_NOW_CHAT - еще не идёт игра или поиск сессии
-            _Status.IS_NOW_AWAITING_TOKEN - ожидается ввод токена для присоеденения к существующей сессии
-            _Status.IS_NOW_GAME - в данный момент идёт игра
+        Игровая логика общая с AsyncBotClient: статусы пользователей, игры и ответы на действия пользователей
         """
 
-        self._timestamps = {}
+        self.bot = telebot.TeleBot(bot_token, parse_mode=None)
         """
-        _timestamps: {player_id: int, timestamp: int}
-        Словарь содержащий в себе время последней активности каждого пользователя
-
-        player_id:
-            id игрока
-        timestamp:
-            время в секундах
+        Текущий экземпляр класса TeleBot содержащий API для управления Telegram-ботом
         """
 
-        self._games = []
+        self.database_api = storage
         """
-        _games: {game: Game}
-        Список всех игр идущих на данный момент
+        Хранилище статистики пользователей. Запросы к нему идут через self.database, напрямую читаются только
+        загруженные в память таблица лидеров и индекс мест
         """
 
-        self._ai_games = []
+        self.database = DatabaseExecutor(storage, max_workers=database_workers, timeout=database_timeout)
         """
-        _ai_games: {ai_game: GameAI}
-        Список всех игр идущих на данный момент
+        Пул потоков для запросов к хранилищу, потоки TeleBot ждут ответа не дольше database_timeout
         """
 
-        self.bot = telebot.TeleBot(bot_token, parse_mode=None)
+        self.dispatcher = OutboundDispatcher(self._send_reply)
         """
-        Текущий экземпляр класса TeleBot содержащий API для управления Telegram-ботом
+        Очередь исходящих сообщений с ограничением скорости отправки в Telegram
         """
 
-        self.database_api = DatabaseAPI(database_conn_kwargs)
+        self.router = CallbackRouter()
         """
-        Текущий экземпляр класса DatabaseAPI содержащий API для запросов к БД
+        Обработчики нажатий на кнопки по коду действия
         """
 
-        self.model: Sequential | None = model
+        self.webhook: WebhookServer | None = None
         """
-        Текущий экземпляр класса Sequential представляющий модель глубокой нейронной сети для предсказания 
-        самого оптимального хода при игре против AI
+        HTTP-сервер приема обновлений, если бот запущен через start_webhook
         """
 
-        # Запускает новый поток который ассинхронно каждые несколько секунд проверяет пользователей (период задается в
-        # файле start.bat)
-        #
-        # Удаляет данные о пользователе из оперативной памяти, если пользователь не делал никаких действий больше чем
-        # заданный период времени (это необходимо чтоб уменьшить расходы оперативной памяти, но не использовать запросы
-        # к БД слишком часто)
-        update_users_thread = threading.Thread(
-            target=_check_players,
-            args=(self._timestamps, self._chats_statuses, self._games, reset_time)
-        )
-        update_users_thread.start()
+        self.core.start()
+        self.dispatcher.start()
 
         # Изменяет время последней активности пользователя. Если пользователь не загружен из БД - загружает, если
         # это новый пользователь - также добавляет его в БД
-        #
-        # Загрузка данных пользователя из БД делается для того чтобы, не приходилось каждый раз при смене статуса
-        # пользователя открывать соединение с БД и изменять или загружать данные, а работать с данными в оперативной
-        # памяти
         def _update_timestamp(player_id: int):
-            if player_id in self._chats_statuses.keys() and player_id in self._timestamps.keys():
-                self._timestamps[player_id] = time.time()
-            else:
-                is_user_in_bd_query = self.database_api.is_user_in_bd(player_id)
-
-                if is_user_in_bd_query.success:
-                    if is_user_in_bd_query.data:
-                        self._chats_statuses[player_id] = _Status.IS_NOW_CHAT
-                    else:
-                        user_append_query = self.database_api.append_user(player_id)
+            if self.core.touch(player_id):
+                return
 
-                        if user_append_query.success:
-                            self._chats_statuses[player_id] = _Status.IS_NOW_CHAT
-                            _log(f"Новый пользователь {player_id}")
-                        else:
-                            self.bot.send_message(player_id, text="Ошибка")
+            ensure_user_query = self.database.call("ensure_user", player_id)
 
-                    self._timestamps[player_id] = time.time()
-                    _log(f"Пользователь {player_id} загружен из БД")
-                else:
-                    self.bot.send_message(player_id, text="Ошибка")
+            if ensure_user_query.success:
+                self.core.load_user(player_id, is_new=ensure_user_query.data)
+            else:
+                self._send(self.core.load_error(player_id))
 
         # Обрабатывает сообщение если отправивший его пользователь не начал поиск сессии или игру и просто общается с
         # ботом или если это новый пользователь
         @self.bot.message_handler(
-            func=lambda message:
-            message.text[0] != '/' and
-            (
-                    message.from_user.id not in self._chats_statuses.keys()
-                    or
-                    self._chats_statuses[message.from_user.id] == _Status.IS_NOW_CHAT
-            )
+            func=lambda message: not is_command(message.text) and self.core.is_chatting(message.from_user.id)
         )
         def chat_message_handler(message: Message):
-            player_id = message.from_user.id
-            _update_timestamp(player_id)
+            _update_timestamp(message.from_user.id)
 
-            self.bot.reply_to(message, text="Привет, это бот для игры в крестики-нолики. Введите /start чтобы начать"
-                                            "игру")
+            self._send(self.core.greeting(message))
 
         # Обрабатывает сообщение если отправивший его пользователь сейчас в игре
         @self.bot.message_handler(
-            func=lambda message:
-            message.text[0] != '/' and
-            self._chats_statuses[message.from_user.id] == _Status.IS_NOW_GAME
+            func=lambda message: not is_command(message.text) and self.core.is_in_game(message.from_user.id)
         )
         def chat_message_handler_while_game(message):
-            player_id = message.from_user.id
-            _update_timestamp(player_id)
-
-        # В следующих обработчиках проверяется лишь первый элемент callback_data так как он содержит информацию об
-        # нажатой кнопке, остальные элементы будут содержать координаты хода игрока
-
-        # Обрабатывает нажатие на кнопку "СТАРТ"
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.BUTTON_START)
-        def button_start_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            nick_query = self.database_api.get_nickname(player_id)
-            nickname = None
-
-            if nick_query.success:
-                nickname = nick_query.data
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_CHAT:
-                token = self._create_new_game(player_id)
-                button = InlineKeyboardMarkup()
-                button.add(InlineKeyboardButton(text="Отмена", callback_data=_CallData.RESET))
-
-                if nickname is None:
-                    self.bot.send_message(player_id,
-                                          text=f"Теперь в списке игр будет ваш id: {player_id}. Чтобы установить себе "
-                                               f"никнейм вместо id воспользуйтесь командой /nick 'ваш ник'",
-                                          reply_markup=button
-                                          )
-                else:
-                    self.bot.send_message(player_id,
-                                          text=f"Теперь в списке игр будет ваш ник: {nickname}",
-                                          reply_markup=button
-                                          )
-
-                self._chats_statuses[player_id] = _Status.IS_NOW_AWAITING_PLAYER
-                _log(f"Начата новая сессия {token}")
-                _log(f"Сессия {token}. Игроки - 1")
-            else:
-                self.bot.send_message(player_id, text="Вы не можете сейчас начать новую сессию")
-
-        # Обрабатывает нажатие на кнопку "ПРИСОЕДИНИТЬСЯ"
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.BUTTON_JOIN)
-        def button_join_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_CHAT:
-                non_fulled_games = [i for i in self._games if len(i.players) == 1]
-
-                if len(non_fulled_games) == 0:
-                    self.bot.send_message(player_id, text="Сейчас никто не ищет противников. Попробуйте начать свою "
-                                                          "игру или сыграйте против AI")
-                else:
-                    self.bot.send_message(player_id,
-                                          text="Список всех доступных игр, нажмите чтобы присоединиться:",
-                                          reply_markup=self._games_to_markup()
-                                          )
-            else:
-                self.bot.send_message(player_id, text="Вы не можете сейчас присоедениться к сессии")
-
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.SESSION_JOIN)
-        def session_join_session_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_CHAT:
-                token = call.data.split(' ')[1]
-                game = self._find_game_by_session_token(token)
+            _update_timestamp(message.from_user.id)
 
-                if game is not None:
-                    is_join_success = self._join_to_game(game, player_id)
+        # Все нажатия проходят через один обработчик: он сразу отвечает на нажатие, чтобы у пользователя пропал
+        # индикатор загрузки на кнопке, один раз разбирает callback_data и вызывает обработчик действия из self.router
+        @self.bot.callback_query_handler(func=lambda call: True)
+        def callback_handler(call: CallbackQuery):
+            self._answer(call)
+            routed = self.router.route(call.data)
 
-                    if is_join_success:
-                        start_matrix = game.start_game()
+            # Кнопка из прежнего формата callback_data
+            if routed is None:
+                return
 
-                        markup = self._matrix_to_markup(start_matrix)
-                        message_matrix = self._matrix_to_emojis(start_matrix)
-
-                        turn_player_id = game.turn_now_player.id
-                        wait_player_id = game.awaiting_player.id
-
-                        self.bot.send_message(turn_player_id, "Сессия найдена, вы играете за \"X\".\nВаш ход:")
-                        self.bot.send_message(turn_player_id, message_matrix, reply_markup=markup)
-
-                        self.bot.send_message(wait_player_id, "Сессия найдена, вы играете за \"О\".\nОжидайте ход "
-                                                              "другого игрока...")
-                        self.bot.send_message(wait_player_id, message_matrix)
-
-                        self._chats_statuses[turn_player_id] = _Status.IS_NOW_GAME
-                        self._chats_statuses[wait_player_id] = _Status.IS_NOW_GAME
-
-                        _log(f"Сессия {token}. Игроки - 2")
-                    else:
-                        self.bot.send_message(player_id, "Не получилось присоедениться к игре")
-                else:
-                    self.bot.send_message(player_id, "Не найдена сессия, возможно первый игрок отменил игру, или место "
-                                                     "уже занято")
-            else:
-                self.bot.send_message(player_id, "Вы не можете сейчас присоедениться к игре")
-
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.RESET)
-        def reset_callback(call):
+            handler, callback = routed
             player_id = call.from_user.id
             _update_timestamp(player_id)
 
-            if self._chats_statuses[player_id] == _Status.IS_NOW_GAME:
-                for i in range(len(self._games)):
-                    game = self._games[i]
-                    awaiting_player_id = game.awaiting_player.id
-                    turn_now_player_id = game.turn_now_player.id
-
-                    if player_id == awaiting_player_id:
-                        self.bot.send_message(awaiting_player_id, text="Вы сдались")
-                        self.bot.send_message(turn_now_player_id, text="Ваш противник сдался")
-                        self._chats_statuses[turn_now_player_id] = _Status.IS_NOW_CHAT
-
-                    if player_id == turn_now_player_id:
-                        self.bot.send_message(turn_now_player_id, text="Вы сдались")
-                        self.bot.send_message(awaiting_player_id, text="Ваш противник сдался")
-                        self._chats_statuses[awaiting_player_id] = _Status.IS_NOW_CHAT
-
-                    if player_id == awaiting_player_id or player_id == turn_now_player_id:
-                        del self._games[i]
+            handler(player_id, callback)
 
-            if self._chats_statuses[player_id] == _Status.IS_NOW_AI_GAME:
-                for i in range(len(self._ai_games)):
-                    ai_game = self._ai_games[i]
-
-                    if player_id == ai_game.player.id:
-                        self.bot.send_message(player_id, text="Вы сдались")
+        # Обрабатывает нажатие на кнопку "СТАРТ"
+        @self.router.handler(CallData.BUTTON_START)
+        def button_start_callback(player_id: int, callback: Callback):
+            nick_query = self.database.call("get_nickname", player_id)
+            nickname = nick_query.data if nick_query.success else None
 
-                        del self._ai_games[i]
+            self._send(self.core.start_session(player_id, nickname))
 
-            if self._chats_statuses[player_id] == _Status.IS_NOW_AWAITING_PLAYER:
-                for i in range(len(self._games)):
-                    game = self._games[i]
-                    player = game.players[0]
+        # Обрабатывает нажатие на кнопку "ПРИСОЕДИНИТЬСЯ"
+        @self.router.handler(CallData.BUTTON_JOIN)
+        def button_join_callback(player_id: int, callback: Callback):
+            lobbies = self.core.joinable_lobbies(player_id)
+            nicknames = (
+                self.database.call("get_nicknames", [i.players[0].id for i in lobbies]).data if lobbies else None
+            )
 
-                    if player_id == player.id:
-                        self.bot.send_message(player_id, text="Отмена игры")
+            self._send(self.core.join_menu(player_id, lobbies, nicknames))
 
-                        del self._games[i]
+        @self.router.handler(CallData.SESSION_JOIN)
+        def session_join_session_callback(player_id: int, callback: Callback):
+            self._send(self.core.join_session(player_id, callback.tag))
 
-            self._chats_statuses[player_id] = _Status.IS_NOW_CHAT
+        @self.router.handler(CallData.RESET)
+        def reset_callback(player_id: int, callback: Callback):
+            self._send(self.core.reset(player_id))
 
         # Обрабатывает нажатие на кнопку хода
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.TURN)
-        def game_turn_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_GAME:
-                game: Game = self._find_game_by_player_id(player_id)
-
-                turn_player_id = player_id
-                wait_player_id = [pl for pl in game.players if pl.id != player_id][0]
-
-                if player_id == turn_player_id:
-                    turn_res = self._game_turn(game, player_id, call.data)
-
-                    if turn_res.is_turn_success:
-                        message_matrix = self._matrix_to_emojis(turn_res.matrix)
+        @self.router.handler(CallData.TURN)
+        def game_turn_callback(player_id: int, callback: Callback):
+            replies, record = self.core.turn(player_id, callback.cell, callback.tag)
+            self._send(replies)
 
-                        match turn_res.game_result_code:
-                            case GameResultCode.GAME_CONTINUE:
-                                markup = self._matrix_to_markup(turn_res.matrix)
+            if record is not None:
+                self._record(record)
 
-                                self.bot.send_message(turn_player_id, f"Результат вашего хода:\n{message_matrix}")
-                                self.bot.send_message(turn_player_id, "Ожидайте ход другого игрока...")
+        @self.router.handler(CallData.BUTTON_AI)
+        def button_ai_callback(player_id: int, callback: Callback):
+            self._send(self.core.start_ai_game(player_id))
 
-                                self.bot.send_message(wait_player_id, "Ваш ход:")
-                                self.bot.send_message(wait_player_id, message_matrix, reply_markup=markup)
-
-                            case GameResultCode.NO_ONE_WIN:
-                                self.bot.send_message(turn_player_id, f"Ничья:\n{message_matrix}")
-                                self.bot.send_message(wait_player_id, f"Ничья:\n{message_matrix}")
-
-                                turn_player_query = self.database_api.increment_draws(turn_player_id)
-                                wait_player_query = self.database_api.increment_draws(wait_player_id)
-
-                                if turn_player_query.success and wait_player_query.success:
-                                    _log(f"Изменены данные пользователя {turn_player_id} в БД ")
-                                    _log(f"Изменены данные пользователя {wait_player_id} в БД ")
-                                else:
-                                    self.bot.send_message(turn_player_id, "Ошибка. Данные не сохраненны")
-                                    self.bot.send_message(wait_player_id, "Ошибка. Данные не сохраненны")
-
-                                self._end_game(game)
-
-                            case GameResultCode.PLAYER_WIN:
-                                self.bot.send_message(turn_player_id, f"Результат вашего хода:\n{message_matrix}")
-                                self.bot.send_message(turn_player_id, "Вы выиграли")
-
-                                self.bot.send_message(wait_player_id, f"Ход другого игрока:\n{message_matrix}")
-                                self.bot.send_message(wait_player_id, "Вы проиграли")
-
-                                turn_player_query = self.database_api.increment_wins(turn_player_id)
-                                wait_player_query = self.database_api.increment_loses(wait_player_id)
-
-                                if turn_player_query.success and wait_player_query.success:
-                                    _log(f"Изменены данные пользователя {turn_player_id} в БД ")
-                                    _log(f"Изменены данные пользователя {wait_player_id} в БД ")
-                                else:
-                                    self.bot.send_message(turn_player_id, "Ошибка. Данные не сохраненны")
-                                    self.bot.send_message(wait_player_id, "Ошибка. Данные не сохраненны")
-
-                                self._end_game(game)
-                    else:
-                        match turn_res.turn_result_code:
-                            case TurnResultCode.INCORRECT_TURN:
-                                self.bot.send_message(turn_player_id, "Неправильный ход")
-                            case TurnResultCode.NO_PLAYER:
-                                self.bot.send_message(turn_player_id, "Не найден игрок")
-                            case TurnResultCode.NO_SESSION:
-                                self.bot.send_message(turn_player_id, "Не найдена сессия")
-                else:
-                    self.bot.send_message(wait_player_id, "Ожидайте ваш ход")
-            else:
-                self.bot.send_message(player_id, "Вы не можете сейчас ходить")
-
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.BUTTON_AI)
-        def button_ai_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_CHAT:
-                self._create_new_ai_game(player_id)
-                self._chats_statuses[player_id] = _Status.IS_NOW_AI_GAME
-
-                ai_games = [i for i in self._ai_games if i.player.id == player_id]
-
-                if len(ai_games) > 0:
-                    ai_game = ai_games[0]
-                    matrix = ai_game.matrix
-
-                    markup = self._ai_matrix_to_markup(matrix)
-                    message_matrix = self._matrix_to_emojis(matrix)
-
-                    self.bot.send_message(player_id, "Игра началась, вы играете за \"X\".\nВаш ход:")
-                    self.bot.send_message(player_id, message_matrix, reply_markup=markup)
-
-                    self._chats_statuses[player_id] = _Status.IS_NOW_AI_GAME
-
-                    _log(f"Игрок {player_id} начал сессию против AI")
-                else:
-                    self.bot.send_message(player_id, text="Ошибка начала игры")
-            else:
-                self.bot.send_message(player_id, text="Вы не можете сейчас начать игру")
-
-        @self.bot.callback_query_handler(func=lambda call: call.data.split(' ')[0] == _CallData.TURN_AI)
-        def ai_game_turn_callback(call):
-            player_id = call.from_user.id
-            _update_timestamp(player_id)
-
-            if self._chats_statuses[player_id] == _Status.IS_NOW_AI_GAME:
-                ai_games = [i for i in self._ai_games if i.player.id == player_id]
-
-                if len(ai_games) > 0:
-                    ai_game = ai_games[0]
-                    turn_res = self._ai_game_turn(ai_game, call.data)
-
-                    if turn_res.is_turn_success:
-                        message_matrix = self._matrix_to_emojis(turn_res.matrix)
-
-                        match turn_res.game_result_code:
-                            case GameResultCode.GAME_CONTINUE:
-                                markup = self._ai_matrix_to_markup(turn_res.matrix)
-
-                                self.bot.send_message(player_id, "Теперь ваш ход:")
-                                self.bot.send_message(player_id, message_matrix, reply_markup=markup)
-
-                            case GameResultCode.NO_ONE_WIN:
-                                self.bot.send_message(player_id, f"Ничья:\n{message_matrix}")
-
-                                self._end_ai_game(ai_game)
-
-                            case GameResultCode.PLAYER_WIN:
-                                self.bot.send_message(player_id, f"Результат вашего хода:\n{message_matrix}")
-                                self.bot.send_message(player_id, "Вы выиграли")
-
-                                self._end_ai_game(ai_game)
-                            case GameResultCode.AI_WIN:
-                                self.bot.send_message(player_id, f"Результат хода бота:\n{message_matrix}")
-                                self.bot.send_message(player_id, "Вы прогирали")
-
-                                self._end_ai_game(ai_game)
-                    else:
-                        if turn_res.turn_result_code == TurnResultCode.INCORRECT_TURN:
-                            self.bot.send_message(player_id, "Неправильный ход")
-                else:
-                    self.bot.send_message(player_id, "Ошибка хода")
-            else:
-                self.bot.send_message(player_id, "Вы не можете сейчас ходить")
+        @self.router.handler(CallData.TURN_AI)
+        def ai_game_turn_callback(player_id: int, callback: Callback):
+            self._send(self.core.ai_turn(player_id, callback.cell, callback.tag))
 
         @self.bot.message_handler(commands=["start"])
-        def command_leaders_message_handler(message):
-            player_id = message.from_user.id
-            _update_timestamp(player_id)
-
-            markup = InlineKeyboardMarkup(row_width=1)
-
-            if self.model is not None:
-                markup.row(InlineKeyboardButton("ИГРА С БОТОМ", callback_data=_CallData.BUTTON_AI))
+        def command_start_message_handler(message):
+            _update_timestamp(message.from_user.id)
 
-            markup.row(InlineKeyboardButton("СТАРТ", callback_data=_CallData.BUTTON_START))
-            markup.row(InlineKeyboardButton("ПРИСОЕДИНИТЬСЯ", callback_data=_CallData.BUTTON_JOIN))
-
-            self.bot.reply_to(message, text="Нажмите СТАРТ чтобы начать новую игру, или ПРИСОЕДИНИТЬСЯ чтобы "
-                                            "присоединиться к существующей", reply_markup=markup)
+            self._send(self.core.main_menu(message))
 
         @self.bot.message_handler(commands=["leaders"])
         def command_leaders_message_handler(message):
             player_id = message.from_user.id
-            get_leaders_query = self.database_api.get_leaders()
+            get_leaders_query = self._get_leaders()
             _update_timestamp(player_id)
 
-            if get_leaders_query.success:
-                data = get_leaders_query.data
-                out_str = ""
-
-                if len(data) > 0 and data is not None:
-                    out_str += "Вот результаты лучших игроков\n\n"
-                    place = 1
-
-                    for i in data:
-                        win_rate = 'недостаточно данных' if i[1] is None else f"{round(100 * i[1], 1)}%"
-                        out_str += f"{place}. {i[0]} - {win_rate}\n"
-                        place += 1
-                else:
-                    out_str = "Нет данных о лучших игроках"
-
-                self.bot.send_message(player_id, text=out_str)
-            else:
-                self.bot.send_message(player_id, text="Ошибка")
+            self._send(self.core.leaders(player_id, get_leaders_query))
 
         @self.bot.message_handler(commands=["score"])
         def command_score_message_handler(message):
             player_id = message.from_user.id
-            get_score_query = self.database_api.get_user_score(player_id)
+            get_score_query = self.database.call("get_user_score", player_id)
+            get_rank_query = self._get_user_rank(player_id)
             _update_timestamp(player_id)
 
-            if get_score_query.success:
-                if get_score_query.data is not None:
-                    data = get_score_query.data
-
-                    wins = data[0]
-                    loses = data[1]
-                    draws = data[2]
-                    win_rate = "недостаточно данных" if data[3] is None else f"{round(data[3], 1)}%"
-                    nick = "нет" if data[4] is None else data[4]
-
-                    name = player_id if data[4] is None else data[4]
-
-                    out_str = \
-                        f"""Вот результаты игрока {name}:
-                            
-                        Винрейт - {win_rate}
-
-                        Победы - {wins}
-                        Поражения - {loses}
-                        Ничьи - {draws}
-                                                        
-                        id: {player_id}
-                        Никнейм: {nick}
-                        """
-                else:
-                    out_str = "Нет данных об игроке"
-
-                self.bot.send_message(player_id, text=out_str)
-            else:
-                self.bot.send_message(player_id, text="Ошибка")
+            self._send(self.core.score(player_id, get_score_query, get_rank_query))
 
         @self.bot.message_handler(commands=["nick"])
         def command_nick_message_handler(message):
             player_id = message.from_user.id
             _update_timestamp(player_id)
 
-            if len(message.text.split(' ')) == 2:
-                nick = message.text.split(' ')[1]
-                set_nick_query = self.database_api.set_nickname(player_id, nick)
-
-                if set_nick_query.success:
-                    self.bot.send_message(player_id, text=f"Теперь вас зовут {nick}")
-                else:
-                    self.bot.send_message(player_id, text="Ошибка")
-            else:
-                self.bot.send_message(player_id, text="Ошибка ввода. Введите данные в формате - \"/nick никнейм\". "
-                                                      "Никнейм не должен содержать пробелы.")
-
-    def _create_new_ai_game(self, player_id: int):
-        """
-        Создает новую игру с одним игроком
-        :param player_id: id игрока
-        :return: Токен сессии
-        """
-
-        ai_game = GameAI(model=self.model)
-        ai_game.start_new_session(player_id)
-
-        self._ai_games.append(ai_game)
-
-    def _create_new_game(self, player_id: int) -> str:
-        """
-        Создает новую игру с одним игроком
-        :param player_id: id игрока
-        :return: Токен сессии
-        """
-
-        time_based_token = str(int(time.time()))
-
-        game = Game()
-        game.start_new_session(player_id, time_based_token)
+            nick = self.core.parse_nickname(message.text)
+            set_nick_query = None if nick is None else self.database.call("set_nickname", player_id, nick)
 
-        self._games.append(game)
+            self._send(self.core.nickname_replies(player_id, nick, set_nick_query))
 
-        return time_based_token
+    def _send(self, replies: [Reply]):
+        self.dispatcher.submit(replies)
 
-    @staticmethod
-    def _join_to_game(game: Game, player_id: int) -> bool:
-        """
-        Присоединяет игрока к существующей игре
-        :param player_id: id игрока
-        :return: True - если попытка присоединения прошла удачно
-        """
-
-        is_join_to_session = game.join_to_session(player_id)
-        start_matrix = game.start_game()
-
-        if is_join_to_session and start_matrix is not None:
-            return True
+    def _send_reply(self, reply: Reply):
+        # Вызывается из потоков OutboundDispatcher
+        if reply.reply_to is not None:
+            self.bot.reply_to(reply.reply_to, text=reply.text, reply_markup=reply.reply_markup)
+        elif reply.board == Board.NONE:
+            self.bot.send_message(reply.chat_id, text=reply.text, reply_markup=reply.reply_markup)
         else:
-            return False
-
-    @staticmethod
-    def _ai_game_turn(ai_game: GameAI, raw_turn: str) -> TurnResult:
-        """
-        :param ai_game: игра в которой будет сделан ход
-        :param raw_turn: строка с информацией о ходе
-        :return: Экземпляр класса TurnResult с информацией о результате хода
-        """
-
-        turn = [int(i) for i in raw_turn.split(' ')[1:]]
-        turn_data = ai_game.make_turn(turn[0], turn[1])
-
-        return turn_data
-
-    @staticmethod
-    def _game_turn(game: Game, player_id: int, raw_turn: str) -> TurnResult:
-        """
-        :param game: игра в которой будет сделан ход
-        :param player_id: id игрока
-        :param raw_turn: строка с информацией о ходе
-        :return: Экземпляр класса TurnResult с информацией о результате хода
-        """
-
-        turn = [int(i) for i in raw_turn.split(' ')[1:]]
-        turn_data = game.make_turn(player_id, turn[0], turn[1])
-
-        return turn_data
-
-    def _games_to_markup(self) -> InlineKeyboardMarkup:
-        not_fulled_games = [i for i in self._games if len(i.players) == 1]
-        awaiting_players_ids = [i.players[0].id for i in not_fulled_games]
-        awaiting_players_data = self.database_api.get_nicknames(awaiting_players_ids).data
-
-        awaiting_players_tokens = [i.session_token for i in not_fulled_games]
-        awaiting_players_names = []
-
-        for player_id, player_data in zip(awaiting_players_ids, awaiting_players_data):
-            if player_data is None:
-                awaiting_players_names.append(str(player_id))
-            else:
-                awaiting_players_names.append(player_data)
-
-        markup = telebot.types.InlineKeyboardMarkup(row_width=1)
-
-        for i in range(len(not_fulled_games)):
-            cell = InlineKeyboardButton(
-                text=f"Присоеденится к {awaiting_players_names[i]}",
-                callback_data=f"{_CallData.SESSION_JOIN} {awaiting_players_tokens[i]}"
-            )
-
-            markup.row(cell)
+            self._send_board(reply)
 
-        return markup
+    def _answer(self, call: CallbackQuery):
+        try:
+            self.bot.answer_callback_query(call.id)
+        except ApiTelegramException as e:
+            # Telegram не принимает ответ на слишком старое нажатие, само нажатие при этом обрабатывается
+            _log(f"Не удалось ответить на нажатие {call.id}: {e}")
 
-    @staticmethod
-    def _ai_matrix_to_markup(matrix: [[str]]) -> InlineKeyboardMarkup:
+    def _send_board(self, reply: Reply):
         """
-        Преобразование 3х3 матрицы из строк в интерактивную клавиатуру
-        :param matrix: двумерный список из строк показывающий текущее состояние игры
-        :returns: Экземпляр класса InlineKeyBoardMarkup используемый для создания интерактивной клавиатуры в сообщении
+        Изменяет сообщение с полем игрока, а если его нет - отправляет новое
         """
 
-        markup = telebot.types.InlineKeyboardMarkup(row_width=3)
+        boards = self.core.boards
+        message_id = None if reply.board == Board.NEW else boards.get(reply.chat_id)
 
-        cell_1_1 = InlineKeyboardButton(matrix[0][0], callback_data=f'{_CallData.TURN_AI} 0 0')
-        cell_1_2 = InlineKeyboardButton(matrix[0][1], callback_data=f'{_CallData.TURN_AI} 0 1')
-        cell_1_3 = InlineKeyboardButton(matrix[0][2], callback_data=f'{_CallData.TURN_AI} 0 2')
-        markup.row(cell_1_1, cell_1_2, cell_1_3)
+        if message_id is not None:
+            try:
+                self.bot.edit_message_text(reply.text, reply.chat_id, message_id, reply_markup=reply.reply_markup)
+            except ApiTelegramException as e:
+                if is_board_lost(e):
+                    # Сообщение удалили, или оно слишком старое для изменения - поле отправляется заново
+                    _log(f"Не удалось изменить поле игрока {reply.chat_id}: {e}")
+                    message_id = None
+                elif not is_board_not_modified(e):
+                    # Остальные ошибки, в том числе 429 (его OutboundDispatcher повторит позже), новым сообщением не
+                    # исправить: у игрока оказалось бы два поля
+                    raise
 
-        cell_2_1 = InlineKeyboardButton(matrix[1][0], callback_data=f'{_CallData.TURN_AI} 1 0')
-        cell_2_2 = InlineKeyboardButton(matrix[1][1], callback_data=f'{_CallData.TURN_AI} 1 1')
-        cell_2_3 = InlineKeyboardButton(matrix[1][2], callback_data=f'{_CallData.TURN_AI} 1 2')
-        markup.row(cell_2_1, cell_2_2, cell_2_3)
+            if message_id is not None:
+                if reply.board == Board.FINAL:
+                    boards.pop(reply.chat_id)
 
-        cell_3_1 = InlineKeyboardButton(matrix[2][0], callback_data=f'{_CallData.TURN_AI} 2 0')
-        cell_3_2 = InlineKeyboardButton(matrix[2][1], callback_data=f'{_CallData.TURN_AI} 2 1')
-        cell_3_3 = InlineKeyboardButton(matrix[2][2], callback_data=f'{_CallData.TURN_AI} 2 2')
-        markup.row(cell_3_1, cell_3_2, cell_3_3)
+                return
 
-        markup.row(InlineKeyboardButton(text="Отмена", callback_data=_CallData.RESET))
+        message = self.bot.send_message(reply.chat_id, text=reply.text, reply_markup=reply.reply_markup)
 
-        return markup
+        if reply.board == Board.FINAL:
+            boards.pop(reply.chat_id)
+        else:
+            boards.set(reply.chat_id, message.message_id)
 
-    @staticmethod
-    def _matrix_to_markup(matrix: [[str]]) -> InlineKeyboardMarkup:
+    def _record(self, record: GameRecord):
         """
-        Преобразование 3х3 матрицы из строк в интерактивную клавиатуру
-        :param matrix: двумерный список из строк показывающий текущее состояние игры
-        :returns: Экземпляр класса InlineKeyBoardMarkup используемый для создания интерактивной клавиатуры в сообщении
+        Сохраняет результат игры в БД в фоне: игроки уже получили ответ на последний ход, а об ошибке сохранения
+        узнают, когда запрос завершится
         """
 
-        markup = telebot.types.InlineKeyboardMarkup(row_width=3)
+        if record.is_draw:
+            future = self.database.submit("record_draw", record.winner_id, record.loser_id)
+        else:
+            future = self.database.submit("record_game_result", record.winner_id, record.loser_id)
 
-        cell_1_1 = InlineKeyboardButton(matrix[0][0], callback_data=f'{_CallData.TURN} 0 0')
-        cell_1_2 = InlineKeyboardButton(matrix[0][1], callback_data=f'{_CallData.TURN} 0 1')
-        cell_1_3 = InlineKeyboardButton(matrix[0][2], callback_data=f'{_CallData.TURN} 0 2')
-        markup.row(cell_1_1, cell_1_2, cell_1_3)
+        future.add_done_callback(lambda done: self._send(self.core.record_replies(record, done.result().success)))
 
-        cell_2_1 = InlineKeyboardButton(matrix[1][0], callback_data=f'{_CallData.TURN} 1 0')
-        cell_2_2 = InlineKeyboardButton(matrix[1][1], callback_data=f'{_CallData.TURN} 1 1')
-        cell_2_3 = InlineKeyboardButton(matrix[1][2], callback_data=f'{_CallData.TURN} 1 2')
-        markup.row(cell_2_1, cell_2_2, cell_2_3)
+    def _get_leaders(self) -> DatabaseOperationResult:
+        # Загруженная таблица лидеров читается из памяти, без очереди запросов. С отложенной записью к ней добавляется
+        # незаписанная статистика, для которой может понадобиться запрос к БД
+        if self.database_api.leaderboard.is_loaded and self.database_api.write_behind is None:
+            return self.database_api.get_leaders()
 
-        cell_3_1 = InlineKeyboardButton(matrix[2][0], callback_data=f'{_CallData.TURN} 2 0')
-        cell_3_2 = InlineKeyboardButton(matrix[2][1], callback_data=f'{_CallData.TURN} 2 1')
-        cell_3_3 = InlineKeyboardButton(matrix[2][2], callback_data=f'{_CallData.TURN} 2 2')
-        markup.row(cell_3_1, cell_3_2, cell_3_3)
+        return self.database.call("get_leaders")
 
-        markup.row(InlineKeyboardButton(text="Отмена", callback_data=_CallData.RESET))
+    def _get_user_rank(self, player_id: int) -> DatabaseOperationResult:
+        # Загруженный индекс мест читается из памяти, без очереди запросов. С отложенной записью к нему добавляется
+        # незаписанная статистика, для которой может понадобиться запрос к БД
+        if self.database_api.rank_index.is_loaded and self.database_api.write_behind is None:
+            return self.database_api.get_user_rank(player_id)
 
-        return markup
+        return self.database.call("get_user_rank", player_id)
 
-    @staticmethod
-    def _matrix_to_emojis(matrix: [[str]]) -> str:
+    def set_model(self, model: Model | None):
         """
-        Преобразование 3х3 матрицы из строк в строку сообщения
-        :param matrix: двумерный список из строк показывающий текущее состояние игры
+        Заменяет модель для игры против AI, кэш ходов старой модели сбрасывается. Уже идущие игры доигрываются старой
+        моделью
         """
 
-        out_str = ""
-
-        for row in matrix:
-            row_str = ""
-
-            for cell in row:
-                if cell == ' ':
-                    row_str += "⬜️"
-                elif cell == 'O':
-                    row_str += "⭕️"
-                elif cell == "X":
-                    row_str += "❌"
-
-            row_str += "\n"
-            out_str += row_str
+        self.core.set_model(model)
 
-        return out_str
-
-    def _find_game_by_player_id(self, player_id: int) -> Game:
+    def metrics(self) -> {str: any}:
         """
-        Поиск игры по id участника
-        :param player_id: id игрока
-        :return: None - если игра не найдена, экземпляр класса Game - если игра найдена
+        Метрики компонентов бота
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
         """
 
-        game = None
-
-        for g in self._games:
-            for p in g.players:
-                if player_id == p.id:
-                    game = g
-
-        return game
+        out_dict = self.core.metrics()
+        out_dict["outbound"] = self.dispatcher.metrics()
 
-    def _find_game_by_session_token(self, session_token: str) -> Game:
-        """
-        Поиск игры по токену игровой сессии
-        :param session_token: токен сессии
-        :return: None - если игра не найдена, экземпляр класса Game - если игра найдена
-        """
+        if self.webhook is not None:
+            out_dict["webhook"] = self.webhook.metrics()
 
-        game = None
+        out_dict["database_executor"] = self.database.metrics()
+        out_dict.update(self.database_api.metrics())
 
-        for g in self._games:
-            if session_token == g.session_token and len(g.players) == 1:
-                game = g
+        return out_dict
 
-        return game
-
-    def _end_ai_game(self, ai_game: GameAI):
+    def start(self):
         """
-        Заканчивает игровую сессию
-        :param ai_game: игра которую требуется завершить
+        Запуск бота в режиме long polling (getUpdates)
         """
+        _log("Старт бота")
 
-        player = ai_game.player
-        self._chats_statuses[player.id] = _Status.IS_NOW_CHAT
+        try:
+            # Пока у бота установлен webhook, Telegram не отдает обновления через getUpdates
+            self.bot.remove_webhook()
+            self.bot.infinity_polling()
+        finally:
+            self.stop()
+
+    def start_webhook(self, url: str, host: str = "0.0.0.0", port: int = 8443, secret_token: str | None = None,
+                      workers: int = 8, max_queue: int = 1024):
+        """
+        Запуск бота в режиме webhook: Telegram отправляет обновления на url, а встроенный WebhookServer принимает их
+        на host:port и обрабатывает в пуле из workers потоков. Блокирует вызывающий поток до остановки
+        :param url: публичный HTTPS адрес, по которому Telegram доступен бот (путь из него - путь сервера)
+        :param secret_token: секретный токен для проверки, что запрос пришел от Telegram (1-256 символов A-Z, a-z,
+        0-9, _ и -), или None - сгенерировать новый при запуске
+        :param max_queue: максимальное количество обновлений ожидающих свободного потока, сверх него Telegram получает
+        503 и повторяет доставку позже
+        """
+        _log("Старт бота (webhook)")
+
+        if secret_token is None:
+            secret_token = secrets.token_urlsafe(32)
+
+        # Обработчики выполняются прямо в потоках WebhookServer, пул потоков TeleBot не нужен
+        self.bot.threaded = False
+        self.webhook = WebhookServer(
+            lambda update: self.bot.process_new_updates([Update.de_json(update)]),
+            host=host,
+            port=port,
+            path=urlparse(url).path or "/",
+            secret_token=secret_token,
+            workers=workers,
+            max_queue=max_queue
+        )
 
-        for i in range(len(self._ai_games)):
-            if self._ai_games[i].player.id == player.id:
-                del self._ai_games[i]
+        try:
+            self.webhook.start()
+            self.bot.set_webhook(url=url, secret_token=secret_token, max_connections=workers)
+            self.webhook.wait()
+        finally:
+            self.stop()
 
-    def _end_game(self, game: Game):
+    def stop(self):
         """
-        Заканчивает игровую сессию
-        :param game: игра которую требуется завершить
+        Остановка бота, сервера webhook, фонового потока удаления неактивных пользователей, очереди отправки и пула
+        запросов к БД
         """
 
-        session_token = game.session_token
-        players = game.players
-
-        for pl in players:
-            self._chats_statuses[pl.id] = _Status.IS_NOW_CHAT
+        self.bot.stop_polling()
 
-        for i in range(len(self._games)):
-            if self._games[i].session_token == session_token:
-                del self._games[i]
+        if self.webhook is not None:
+            self.webhook.stop(timeout=5.0)
 
-    def start(self):
-        """
-        Запуск бота
-        """
-        _log("Старт бота")
-        self.bot.infinity_polling()
+        self.core.stop()
+        self.dispatcher.stop(timeout=5.0)
+        self.database.close()
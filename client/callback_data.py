@@ -0,0 +1,123 @@
+# --------------------------------------------------------------------------
+# Компактная callback_data кнопок и маршрутизация нажатий
+#
+# callback_data состоит из полей фиксированной ширины без разделителей:
+#   [0]  - код действия (CallData)
+#   [1]  - номер клетки 0..8 (row * 3 + column) или "-"
+#   [2:] - метка: для ходов код поля (engine.board_code, 5 цифр), на котором
+#          была нажата кнопка, для SESSION_JOIN - токен сессии, иначе пусто
+# Строка разбирается один раз, а обработчик выбирается по коду действия из
+# таблицы CallbackRouter. По метке поля ядро отбрасывает нажатия на
+# устаревшее поле сравнением строк, не разбирая ход
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+from enum import StrEnum
+from typing import Callable
+
+from game import engine
+
+
+# В данном случае используется StrEnum так как параметр callback_data класса InlineKeyboardMarkup требует
+# строчный тип данных входного значения
+class CallData(StrEnum):
+    BUTTON_AI = "a"
+    BUTTON_START = "s"
+    BUTTON_JOIN = "j"
+    SESSION_JOIN = "g"
+    TURN = "t"
+    TURN_AI = "i"
+    RESET = "r"
+
+
+NO_CELL = "-"
+
+# Метки всех 3^9 полей, чтобы не форматировать код поля на каждом нажатии
+_TAGS = tuple(f"{code:05d}" for code in range(3 ** 9))
+
+_ACTIONS = {action.value: action for action in CallData}
+_CELLS = {str(cell): cell for cell in range(9)}
+_CELLS[NO_CELL] = None
+
+
+@dataclasses.dataclass
+class Callback:
+    """
+    Разобранная callback_data:
+    action: CallData - код действия
+    cell: int | None - номер клетки, или None - если кнопка не клетка поля
+    tag: str - метка поля или токен сессии
+    """
+    action: CallData
+    cell: int | None
+    tag: str
+
+
+def encode(action: CallData, cell: int | None = None, tag: str = "") -> str:
+    return f"{action}{NO_CELL if cell is None else cell}{tag}"
+
+
+def code_tag(code: int) -> str:
+    """
+    Метка поля с кодом code (engine.board_code) для callback_data кнопок клеток
+    """
+
+    return _TAGS[code]
+
+
+def board_tag(x_mask: int, o_mask: int) -> str:
+    return _TAGS[engine.board_code(x_mask, o_mask)]
+
+
+def decode(data: str | None) -> Callback | None:
+    """
+    :return: разобранная callback_data, или None - если это не callback_data бота (например кнопка из прежнего
+    формата)
+    """
+
+    if data is None or len(data) < 2:
+        return None
+
+    action = _ACTIONS.get(data[0])
+
+    if action is None or data[1] not in _CELLS:
+        return None
+
+    return Callback(action, _CELLS[data[1]], data[2:])
+
+
+class CallbackRouter:
+    """
+    Таблица обработчиков нажатий по коду действия. Обработчик вызывается с id игрока и разобранной callback_data, для
+    AsyncBotClient обработчики - корутины
+    """
+
+    def __init__(self):
+        self._handlers: {CallData: Callable} = {}
+
+    def handler(self, action: CallData) -> Callable[[Callable], Callable]:
+        """
+        Декоратор регистрирующий обработчик действия
+        """
+
+        def register(func: Callable) -> Callable:
+            self._handlers[action] = func
+
+            return func
+
+        return register
+
+    def route(self, data: str | None) -> tuple[Callable, Callback] | None:
+        """
+        :return: обработчик и разобранная callback_data, или None - если нажатие обрабатывать не нужно
+        """
+
+        callback = decode(data)
+
+        if callback is None:
+            return None
+
+        handler = self._handlers.get(callback.action)
+
+        return None if handler is None else (handler, callback)
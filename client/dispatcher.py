@@ -0,0 +1,552 @@
+# --------------------------------------------------------------------------
+# Очередь исходящих сообщений с ограничением скорости
+#
+# Telegram принимает от бота примерно 30 сообщений в секунду всего и около
+# одного в секунду в один чат, сверх этого отвечает ошибкой 429. Раньше
+# ответы отправлялись прямо из обработчиков, и в пиковые моменты часть
+# сообщений терялась. Очередь принимает ответы и отправляет их сама:
+#   - общий и поканальные (по чатам) ведра токенов ограничивают скорость;
+#   - ответы одного чата отправляются строго по порядку;
+#   - поля игры (Board) отправляются раньше информационных сообщений;
+#   - на 429 чат ставится на паузу на retry_after секунд, а ответ
+#     отправляется повторно, пока он не старше max_age;
+#   - поле игры, ждавшее отправки дольше max_age, отбрасывается: оно уже
+#     устарело, а законченное поле (FINAL) отправляется всегда;
+#   - неотправленное изменение поля заменяется более новым изменением того
+#     же поля, так что отстающий чат получает только последнее состояние.
+# OutboundDispatcher отправляет из пула потоков (BotClient), а
+# AsyncOutboundDispatcher - задачами в цикле событий (AsyncBotClient), так
+# что одновременные запросы к Telegram не занимают потоки
+# --------------------------------------------------------------------------
+
+
+import abc
+import asyncio
+import collections
+import dataclasses
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable
+
+from client.game_core import Board, Reply
+
+
+class Priority(IntEnum):
+    GAME = 0
+    INFO = 1
+
+
+@dataclasses.dataclass
+class DispatcherMetrics:
+    """
+    Статистика очереди исходящих сообщений:
+    queue_depth: int - количество ответов ожидающих отправки
+    chats: int - количество чатов с неотправленными ответами
+    sent: int - количество отправленных ответов
+    coalesced: int - количество изменений поля замененных более новыми до отправки
+    rate_limited: int - количество ответов Telegram с ошибкой 429
+    retries: int - количество повторных отправок
+    dropped: int - количество неотправленных ответов (переполнение очереди или ошибка Telegram)
+    expired: int - количество ответов отброшенных из-за возраста (повтор после 429 или устаревшее поле)
+    mean_latency: float - среднее время от постановки в очередь до отправки в секундах
+    max_latency: float - наибольшее время от постановки в очередь до отправки в секундах
+    """
+    queue_depth: int
+    chats: int
+    sent: int
+    coalesced: int
+    rate_limited: int
+    retries: int
+    dropped: int
+    expired: int
+    mean_latency: float
+    max_latency: float
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class TokenBucket:
+    """
+    Ведро токенов: пополняется со скоростью rate токенов в секунду и вмещает не больше burst токенов. Не
+    потокобезопасно, используется под блокировкой OutboundDispatcher
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """
+        :return: через сколько секунд в ведре будет токен (0 - если есть уже сейчас)
+        """
+
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        return self._tokens + (now - self._updated) * self.rate >= self.burst
+
+
+@dataclasses.dataclass
+class _Outgoing:
+    reply: Reply
+    priority: Priority
+    enqueued_at: float
+    attempts: int = 0
+
+
+class _Chat:
+    def __init__(self, rate: float, burst: float):
+        self.queue: collections.deque[_Outgoing] = collections.deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+        self.is_sending = False
+        self.is_scheduled = False
+
+
+class _OutboundQueue(abc.ABC):
+    """
+    Очередь ответов с ограничениями скорости, общая для OutboundDispatcher и AsyncOutboundDispatcher. Состояние
+    меняется под threading.Condition, потому что ответы ставятся в очередь из любых потоков
+    """
+
+    def __init__(self, send: Callable, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: int = 3,
+                 max_queue: int = 10000, max_attempts: int = 3, max_age: float = 60.0):
+        """
+        :param send: функция (или корутина) отправляющая один ответ. Ошибки Telegram пробрасывает исключением с полями
+        error_code и result_json (ApiTelegramException)
+        :param global_rate: максимальное количество отправок в секунду всего
+        :param chat_rate: максимальное количество отправок в секунду в один чат
+        :param chat_burst: сколько отправок в один чат можно сделать подряд без ожидания
+        :param max_queue: максимальное количество ответов ожидающих отправки, сверх него новые ответы отбрасываются
+        :param max_attempts: сколько раз отправка повторяется при сетевой ошибке
+        :param max_age: через сколько секунд после постановки в очередь ответ больше не повторяется после 429, а
+        незаконченное поле игры не отправляется
+        """
+
+        self.send = send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+
+        self._condition = threading.Condition()
+        self._is_running = False
+        self._global_bucket = TokenBucket(global_rate, max(1.0, global_rate / 10))
+
+        self._chats: {int: _Chat} = {}
+        """
+        _chats: {chat_id: int, _Chat}
+        Очередь ответов, ведро токенов и пауза после 429 каждого чата. Чат без ответов удаляется, когда его ведро
+        снова полное
+        """
+
+        self._ready: [(Priority, int, int)] = []
+        """
+        _ready: куча (приоритет первого ответа, порядковый номер, chat_id)
+        Чаты, первый ответ которых можно отправить без ожидания ведра чата. Поля игры идут раньше остальных ответов, а
+        внутри одного приоритета - в порядке постановки
+        """
+
+        self._delayed: [(float, int)] = []
+        """
+        _delayed: куча (время готовности, chat_id)
+        Чаты, которые ждут токен своего ведра или окончания паузы после 429
+        """
+
+        self._sequence = itertools.count()
+        self._depth = 0
+        self._last_sweep = time.monotonic()
+
+        self._sent = 0
+        self._coalesced = 0
+        self._rate_limited = 0
+        self._retries = 0
+        self._dropped = 0
+        self._expired = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def submit(self, replies: [Reply]):
+        """
+        Ставит ответы в очередь. Не ждет отправки и может вызываться из любого потока
+        """
+
+        now = time.monotonic()
+
+        with self._condition:
+            for reply in replies:
+                chat = self._chats.get(reply.chat_id)
+
+                if chat is None:
+                    chat = self._chats[reply.chat_id] = _Chat(self.chat_rate, self.chat_burst)
+
+                if reply.board in (Board.EDIT, Board.FINAL) and self._coalesce(chat, reply):
+                    continue
+
+                if self._depth >= self.max_queue:
+                    self._dropped += 1
+                    _log(f"Очередь отправки переполнена, ответ в чат {reply.chat_id} отброшен")
+                    continue
+
+                priority = Priority.INFO if reply.board == Board.NONE else Priority.GAME
+                chat.queue.append(_Outgoing(reply, priority, now))
+                self._depth += 1
+                self._schedule(reply.chat_id, chat, now)
+
+            self._wake()
+
+    def metrics(self) -> DispatcherMetrics:
+        with self._condition:
+            return DispatcherMetrics(
+                queue_depth=self._depth,
+                chats=sum(1 for chat in self._chats.values() if chat.queue or chat.is_sending),
+                sent=self._sent,
+                coalesced=self._coalesced,
+                rate_limited=self._rate_limited,
+                retries=self._retries,
+                dropped=self._dropped,
+                expired=self._expired,
+                mean_latency=self._total_latency / self._sent if self._sent else 0.0,
+                max_latency=self._max_latency
+            )
+
+    def _coalesce(self, chat: _Chat, reply: Reply) -> bool:
+        """
+        Заменяет еще не отправленное поле чата более новым состоянием
+        :return: True - если ответ объединен с ожидающим полем и отдельно ставить его в очередь не нужно
+        """
+
+        for outgoing in reversed(chat.queue):
+            if outgoing.reply.board == Board.NONE:
+                continue
+
+            # Законченное поле (FINAL) уже забыто клиентом, после него может идти только поле новой игры
+            if outgoing.reply.board == Board.FINAL:
+                return False
+
+            # Неотправленное новое поле остается новым, но сразу получает последнее состояние
+            board = Board.NEW if outgoing.reply.board == Board.NEW and reply.board == Board.EDIT else reply.board
+            outgoing.reply = dataclasses.replace(reply, board=board)
+            self._coalesced += 1
+
+            return True
+
+        return False
+
+    def _schedule(self, chat_id: int, chat: _Chat, now: float):
+        if chat.is_scheduled or chat.is_sending or not chat.queue:
+            return
+
+        chat.is_scheduled = True
+        ready_at = max(now + chat.bucket.delay(now), chat.paused_until)
+
+        if ready_at <= now:
+            heapq.heappush(self._ready, (chat.queue[0].priority, next(self._sequence), chat_id))
+        else:
+            heapq.heappush(self._delayed, (ready_at, chat_id))
+
+    @abc.abstractmethod
+    def _wake(self):
+        """
+        Будит отправку после изменения очереди, вызывается под блокировкой
+        """
+
+    def _take(self, now: float) -> tuple[int, _Outgoing] | float | None:
+        """
+        Забирает из очереди ответ, который можно отправить сейчас с учетом всех ограничений. Вызывается под блокировкой
+        :return: (chat_id, ответ), или через сколько секунд проверить снова (None - после следующего _wake)
+        """
+
+        while self._delayed and self._delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self._delayed)
+            chat = self._chats[chat_id]
+            chat.is_scheduled = False
+            self._schedule(chat_id, chat, now)
+
+        if now - self._last_sweep > 1.0:
+            self._sweep(now)
+
+        while self._ready:
+            global_delay = self._global_bucket.delay(now)
+
+            if global_delay > 0:
+                return global_delay
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            chat.is_scheduled = False
+            outgoing = chat.queue.popleft()
+            self._depth -= 1
+
+            if self._is_expired(outgoing, now):
+                self._expired += 1
+                self._schedule(chat_id, chat, now)
+                continue
+
+            self._global_bucket.take()
+            chat.bucket.take()
+            chat.is_sending = True
+
+            return chat_id, outgoing
+
+        return self._delayed[0][0] - now if self._delayed else None
+
+    def _is_expired(self, outgoing: _Outgoing, now: float) -> bool:
+        """
+        :return: True - если это незаконченное поле игры, ждавшее отправки дольше max_age. Его состояние уже
+        устарело, а следующий ход отправит поле заново
+        """
+
+        return outgoing.reply.board in (Board.NEW, Board.EDIT) and now - outgoing.enqueued_at > self.max_age
+
+    def _sweep(self, now: float):
+        # Удаляет чаты без ответов, ведро которых уже полное - новый чат с полным ведром ничем от них не отличается
+        self._last_sweep = now
+
+        for chat_id in [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.queue and not chat.is_sending and chat.paused_until <= now and chat.bucket.is_full(now)
+        ]:
+            del self._chats[chat_id]
+
+    def _finish(self, chat_id: int, outgoing: _Outgoing, error: Exception | None):
+        now = time.monotonic()
+
+        with self._condition:
+            chat = self._chats[chat_id]
+            chat.is_sending = False
+            error_code = getattr(error, "error_code", None)
+
+            if error is None:
+                latency = now - outgoing.enqueued_at
+                self._sent += 1
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+            elif error_code == 429:
+                parameters = getattr(error, "result_json", {}).get("parameters") or {}
+                chat.paused_until = now + parameters.get("retry_after", 1)
+                self._rate_limited += 1
+
+                # Пауза может повторяться бесконечно, поэтому повтор ограничен возрастом ответа
+                if chat.paused_until - outgoing.enqueued_at > self.max_age:
+                    self._expired += 1
+                    _log(f"Ответ в чат {chat_id} не отправлен за {self.max_age:.0f} с из-за 429")
+                else:
+                    self._retry(chat, outgoing)
+            elif error_code is None and outgoing.attempts + 1 < self.max_attempts:
+                # Сетевая ошибка: повтор с экспоненциально растущей паузой
+                outgoing.attempts += 1
+                chat.paused_until = now + 0.5 * 2 ** outgoing.attempts
+                self._retry(chat, outgoing)
+            else:
+                # Остальные ошибки Telegram (бот заблокирован, сообщение не найдено) повтором не исправить
+                self._dropped += 1
+                _log(f"Не удалось отправить ответ в чат {chat_id}: {error}")
+
+            self._schedule(chat_id, chat, now)
+            self._wake()
+
+    def _retry(self, chat: _Chat, outgoing: _Outgoing):
+        chat.queue.appendleft(outgoing)
+        self._depth += 1
+        self._retries += 1
+
+
+class OutboundDispatcher(_OutboundQueue):
+    def __init__(self, send: Callable[[Reply], None], workers: int = 4, global_rate: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: int = 3, max_queue: int = 10000, max_attempts: int = 3,
+                 max_age: float = 60.0, name: str = "outbound"):
+        """
+        :param send: функция отправляющая один ответ, вызывается из потоков очереди
+        :param workers: количество потоков отправки
+        :param name: префикс имен потоков
+        Остальные параметры как у _OutboundQueue
+        """
+
+        super().__init__(send, global_rate=global_rate, chat_rate=chat_rate, chat_burst=chat_burst,
+                         max_queue=max_queue, max_attempts=max_attempts, max_age=max_age)
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+
+    def start(self):
+        self._is_running = True
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """
+        Отправляет уже принятые ответы и останавливает потоки. Ответы не отправленные за timeout секунд теряются
+        """
+
+        with self._condition:
+            self._is_running = False
+            self._wake()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        if self._depth:
+            _log(f"Не отправлено ответов при остановке: {self._depth}")
+
+    def _wake(self):
+        self._condition.notify_all()
+
+    def _next(self) -> tuple[int, _Outgoing] | None:
+        """
+        Ждет ответ который можно отправить и забирает его из очереди
+        :return: (chat_id, ответ), или None - если очередь остановлена и пуста
+        """
+
+        with self._condition:
+            while True:
+                if not self._is_running and not self._depth:
+                    return None
+
+                item = self._take(time.monotonic())
+
+                if isinstance(item, tuple):
+                    return item
+
+                self._condition.wait(item)
+
+    def _run(self):
+        while True:
+            item = self._next()
+
+            if item is None:
+                return
+
+            chat_id, outgoing = item
+
+            try:
+                self.send(outgoing.reply)
+            except Exception as e:
+                self._finish(chat_id, outgoing, e)
+            else:
+                self._finish(chat_id, outgoing, None)
+
+
+class AsyncOutboundDispatcher(_OutboundQueue):
+    def __init__(self, send: Callable[[Reply], Awaitable[None]], concurrency: int = 32, global_rate: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: int = 3, max_queue: int = 10000, max_attempts: int = 3,
+                 max_age: float = 60.0):
+        """
+        :param send: корутина отправляющая один ответ, выполняется в цикле событий очереди
+        :param concurrency: максимальное количество одновременных отправок
+        Остальные параметры как у _OutboundQueue
+        """
+
+        super().__init__(send, global_rate=global_rate, chat_rate=chat_rate, chat_burst=chat_burst,
+                         max_queue=max_queue, max_attempts=max_attempts, max_age=max_age)
+
+        self.concurrency = concurrency
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._in_flight = 0
+
+    def start(self):
+        """
+        Запускает отправку в текущем цикле событий, вызывается из корутины
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._is_running = True
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self, timeout: float | None = None):
+        """
+        Отправляет уже принятые ответы и останавливает отправку. Ответы не отправленные за timeout секунд теряются
+        """
+
+        with self._condition:
+            self._is_running = False
+            self._wake()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+
+        if self._depth:
+            _log(f"Не отправлено ответов при остановке: {self._depth}")
+
+    def _wake(self):
+        # Ответы ставятся в очередь и из других потоков (ExpiryService), поэтому событие выставляется через цикл
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _next(self) -> tuple[int, _Outgoing] | None:
+        """
+        Ждет ответ который можно отправить и забирает его из очереди
+        :return: (chat_id, ответ), или None - если очередь остановлена, пуста и ни один ответ не отправляется (иначе
+        при ошибке он может вернуться в очередь)
+        """
+
+        while True:
+            self._wakeup.clear()
+
+            with self._condition:
+                if not self._is_running and not self._depth and not self._in_flight:
+                    return None
+
+                item = self._take(time.monotonic())
+
+            if isinstance(item, tuple):
+                return item
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), item)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+
+        while True:
+            await slots.acquire()
+            item = await self._next()
+
+            if item is None:
+                return
+
+            self._in_flight += 1
+            self._loop.create_task(self._send_one(*item, slots))
+
+    async def _send_one(self, chat_id: int, outgoing: _Outgoing, slots: asyncio.Semaphore):
+        error = None
+
+        try:
+            await self.send(outgoing.reply)
+        except Exception as e:
+            error = e
+        finally:
+            slots.release()
+            self._in_flight -= 1
+
+        self._finish(chat_id, outgoing, error)
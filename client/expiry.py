@@ -0,0 +1,118 @@
+import heapq
+import threading
+import time
+import traceback
+from typing import Callable, Hashable
+
+
+class ExpiryService:
+    """
+    Удаляет неактивных пользователей вскоре после того как истекло их время бездействия
+
+    Для каждого ключа хранится срок истечения, а в куче - не больше одной записи на ключ. Продление срока (touch) только
+    обновляет словарь, а устаревшая запись кучи при извлечении перекладывается на актуальный срок, так что каждая
+    операция с кучей стоит O(log n)
+    """
+
+    def __init__(self, timeout: float, on_expire: Callable[[Hashable], None], name: str = "expiry"):
+        """
+        :param timeout: время бездействия в секундах, после которого вызывается on_expire
+        :param on_expire: функция вызываемая с ключом истекшей записи (вызывается из потока сервиса без блокировок)
+        :param name: имя потока сервиса
+        """
+
+        self.timeout = timeout
+        self.on_expire = on_expire
+
+        self._deadlines: {Hashable: float} = {}
+        self._heap: [(float, Hashable)] = []
+        self._condition = threading.Condition()
+        self._is_running = False
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._is_running = True
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """
+        Останавливает поток сервиса и ждет его завершения
+        """
+
+        with self._condition:
+            self._is_running = False
+            self._condition.notify()
+
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def touch(self, key: Hashable):
+        """
+        Продлевает срок ключа на timeout секунд от текущего момента, или начинает отслеживать новый ключ
+        """
+
+        deadline = time.monotonic() + self.timeout
+
+        with self._condition:
+            is_new = key not in self._deadlines
+            self._deadlines[key] = deadline
+
+            if is_new:
+                heapq.heappush(self._heap, (deadline, key))
+
+                # Новая запись раньше всех остальных - поток должен проснуться раньше
+                if self._heap[0][1] == key:
+                    self._condition.notify()
+
+    def is_tracked(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _next_expired(self) -> [Hashable]:
+        with self._condition:
+            while self._is_running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                now = time.monotonic()
+                deadline, key = self._heap[0]
+
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+
+                expired = []
+
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, key = heapq.heappop(self._heap)
+                    actual_deadline = self._deadlines[key]
+
+                    if actual_deadline > now:
+                        # Срок был продлен через touch
+                        heapq.heappush(self._heap, (actual_deadline, key))
+                        continue
+
+                    del self._deadlines[key]
+                    expired.append(key)
+
+                if expired:
+                    return expired
+
+            return []
+
+    def _run(self):
+        while True:
+            expired = self._next_expired()
+
+            if not expired:
+                return
+
+            for key in expired:
+                try:
+                    self.on_expire(key)
+                except Exception:
+                    traceback.print_exc()
@@ -0,0 +1,832 @@
+# --------------------------------------------------------------------------
+# Общее ядро игровой логики для BotClient и AsyncBotClient
+#
+# GameCore хранит статусы пользователей, идущие игры и сроки бездействия и
+# решает что ответить на каждое действие пользователя, но сам ничего не
+# отправляет в Telegram и не обращается к БД. Каждый метод возвращает список
+# ответов (Reply), а данные из БД получает аргументами, поэтому синхронный и
+# асинхронный клиенты ведут себя одинаково и отличаются только вводом-выводом
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import datetime
+from enum import IntEnum
+from typing import Callable
+
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from client.callback_data import CallData, board_tag, encode
+from client.expiry import ExpiryService
+from client.render_cache import RenderCache, RenderedMarkup
+from client.session_registry import SessionRegistry
+from client.state_store import BoardMessages, StatusStore, StripedLock
+from database.storage import DatabaseOperationResult
+from game.game import Game, TurnResult, GameResultCode, TurnResultCode, GameAI
+from game.inference import Model
+from game.move_cache import MoveCache
+
+
+class Status(IntEnum):
+    IS_NOW_CHAT = 0
+    IS_NOW_AWAITING_TOKEN = 1
+    IS_NOW_GAME = 2
+    IS_NOW_AWAITING_PLAYER = 3
+    IS_NOW_AI_GAME = 4
+
+
+class Board(IntEnum):
+    """
+    Как клиент отправляет поле игры. Поле каждого игрока живет в одном сообщении, которое изменяется на каждом ходу
+    """
+
+    NONE = 0
+    """
+    Обычное сообщение, не поле игры
+    """
+
+    NEW = 1
+    """
+    Поле новой игры: отправить сообщение и запомнить его id
+    """
+
+    EDIT = 2
+    """
+    Изменить запомненное поле. Если его нет, или сообщение удалено или слишком старое для изменения - отправить
+    новое и запомнить
+    """
+
+    FINAL = 3
+    """
+    Последнее изменение поля законченной игры: изменить запомненное поле (или отправить новое) и забыть его
+    """
+
+
+@dataclasses.dataclass
+class Reply:
+    """
+    Сообщение которое клиент должен отправить пользователю:
+    chat_id: int - id чата получателя
+    text: str - текст сообщения
+    reply_markup: InlineKeyboardMarkup | RenderedMarkup | None - клавиатура сообщения
+    reply_to: Message | None - если задано, сообщение отправляется ответом на него
+    board: Board - является ли сообщение полем игры и как его отправить
+    """
+    chat_id: int
+    text: str
+    reply_markup: InlineKeyboardMarkup | RenderedMarkup | None = None
+    reply_to: Message | None = None
+    board: Board = Board.NONE
+
+
+@dataclasses.dataclass
+class GameRecord:
+    """
+    Результат законченной игры между игроками, который клиент должен сохранить в БД:
+    winner_id: int - id победителя (при ничьей - id одного из игроков)
+    loser_id: int - id проигравшего (при ничьей - id другого игрока)
+    is_draw: bool - ничья или нет
+    """
+    winner_id: int
+    loser_id: int
+    is_draw: bool
+
+
+# Описания ошибок 400, с которыми Telegram отказывается изменять сообщение, которого больше нет: оно удалено или
+# слишком старое. Только в этих случаях поле отправляется заново
+_BOARD_LOST_ERRORS = ("message to edit not found", "message can't be edited", "message_id_invalid")
+
+
+def is_board_not_modified(error: Exception) -> bool:
+    """
+    :param error: ApiTelegramException изменения поля
+    :return: True - если у поля уже такие текст и клавиатура (например, повтор после 429), изменение можно считать
+    выполненным
+    """
+
+    return getattr(error, "error_code", None) == 400 and "message is not modified" in error.description.lower()
+
+
+def is_board_lost(error: Exception) -> bool:
+    """
+    :param error: ApiTelegramException изменения поля
+    :return: True - если сообщения с полем больше нельзя изменить и поле нужно отправить новым сообщением
+    """
+
+    if getattr(error, "error_code", None) != 400:
+        return False
+
+    description = error.description.lower()
+
+    return any(lost in description for lost in _BOARD_LOST_ERRORS)
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class GameCore:
+    def __init__(self, reset_time: int, model: Model | None, on_expire: Callable[[list[Reply]], None]):
+        """
+        :param reset_time: время после которого пользователь будет удален из оперативной памяти (не из БД)
+        :param model: модель для игры против AI, или None - если не подразумевается режим против бота
+        :param on_expire: функция отправляющая ответы, которые появились при удалении неактивного пользователя
+        (вызывается из потока ExpiryService)
+        """
+
+        self.on_expire = on_expire
+
+        self._chats_statuses = StatusStore()
+        """
+        _chats_statuses: StatusStore {player_id: int, status: Status}
+        Статусы всех пользователей. Переход из одного статуса в другой делается через compare_and_set, поэтому два
+        одновременных нажатия одного пользователя не могут, например, создать две сессии
+
+        player_id:
+            id игрока
+        status:
+            Status.IS_NOW_CHAT - еще не идёт игра или поиск сессии
+            Status.IS_NOW_AWAITING_TOKEN - ожидается ввод токена для присоеденения к существующей сессии
+            Status.IS_NOW_GAME - в данный момент идёт игра
+        """
+
+        self._session_locks = StripedLock()
+        """
+        _session_locks: StripedLock
+        Блокировки игр по токену сессии (для игр против AI - по id игрока). Ходы и завершение одной игры выполняются
+        строго по очереди, а разные игры не мешают друг другу. Берутся раньше блокировок SessionRegistry и StatusStore
+        """
+
+        self._expiry = ExpiryService(reset_time, self._expire_player, name="expire-players")
+        """
+        _expiry: ExpiryService
+        Сроки бездействия всех загруженных пользователей, по истечении срока пользователь и все его сессии удаляются из
+        оперативной памяти
+        """
+
+        self._sessions = SessionRegistry()
+        """
+        _sessions: SessionRegistry
+        Все игры и открытые сессии идущие на данный момент с индексами по id игрока и токену сессии
+        """
+
+        self.model: Model | None = model
+        """
+        Текущий экземпляр модели глубокой нейронной сети (NumpyModel или keras.Sequential) для предсказания
+        самого оптимального хода при игре против AI
+        """
+
+        self.move_cache = MoveCache(model)
+        """
+        Общий для всех игр против AI кэш ходов модели
+        """
+
+        self.render = RenderCache(encode(CallData.RESET))
+        """
+        Текст и клавиатуры полей, строятся один раз на каждое поле
+        """
+
+        self.boards = BoardMessages()
+        """
+        id сообщений с полем текущей игры каждого игрока. Заполняют клиенты при отправке ответов с Board.NEW и
+        Board.EDIT, ядро удаляет поля неактивных пользователей
+        """
+
+        self._leaders_text: (tuple, str) | None = None
+        """
+        Последний ответ на /leaders и данные таблицы лидеров по которым он составлен. Storage.get_leaders
+        возвращает один и тот же картеж пока таблица не меняется, поэтому текст переиспользуется по тождеству данных
+        """
+
+    def start(self):
+        """
+        Запускает поток который удаляет данные о пользователе из оперативной памяти вскоре после того, как
+        пользователь не делал никаких действий больше чем заданный период времени (период задается в файле start.bat).
+        Это необходимо чтоб уменьшить расходы оперативной памяти, но не использовать запросы к БД слишком часто
+        """
+
+        self._expiry.start()
+
+    def stop(self):
+        self._expiry.stop()
+
+    def is_chatting(self, player_id: int) -> bool:
+        """
+        :return: True - если пользователь не начал поиск сессии или игру, или это новый пользователь
+        """
+
+        return player_id not in self._chats_statuses or self._chats_statuses.get(player_id) == Status.IS_NOW_CHAT
+
+    def is_in_game(self, player_id: int) -> bool:
+        return self._chats_statuses.get(player_id) == Status.IS_NOW_GAME
+
+    def touch(self, player_id: int) -> bool:
+        """
+        Изменяет время последней активности пользователя, если он загружен в оперативную память
+        :return: True - если пользователь загружен, False - если клиент должен загрузить его из БД (load_user)
+        """
+
+        if player_id in self._chats_statuses and self._expiry.is_tracked(player_id):
+            self._expiry.touch(player_id)
+
+            return True
+
+        return False
+
+    def load_user(self, player_id: int, is_new: bool = False):
+        """
+        Добавляет пользователя загруженного из БД в оперативную память
+
+        Загрузка данных пользователя из БД делается для того чтобы, не приходилось каждый раз при смене статуса
+        пользователя открывать соединение с БД и изменять или загружать данные, а работать с данными в оперативной
+        памяти
+        :param player_id: id игрока
+        :param is_new: True - если пользователь только что добавлен в БД
+        """
+
+        # Параллельный обработчик мог уже загрузить пользователя и сменить его статус
+        self._chats_statuses.set_default(player_id, Status.IS_NOW_CHAT)
+        self._expiry.touch(player_id)
+
+        if is_new:
+            _log(f"Новый пользователь {player_id}")
+
+        _log(f"Пользователь {player_id} загружен из БД")
+
+    @staticmethod
+    def load_error(player_id: int) -> [Reply]:
+        return [Reply(player_id, "Ошибка")]
+
+    @staticmethod
+    def greeting(message: Message) -> [Reply]:
+        return [Reply(message.from_user.id, "Привет, это бот для игры в крестики-нолики. Введите /start чтобы начать"
+                                            "игру", reply_to=message)]
+
+    def main_menu(self, message: Message) -> [Reply]:
+        markup = InlineKeyboardMarkup(row_width=1)
+
+        if self.model is not None:
+            markup.row(InlineKeyboardButton("ИГРА С БОТОМ", callback_data=encode(CallData.BUTTON_AI)))
+
+        markup.row(InlineKeyboardButton("СТАРТ", callback_data=encode(CallData.BUTTON_START)))
+        markup.row(InlineKeyboardButton("ПРИСОЕДИНИТЬСЯ", callback_data=encode(CallData.BUTTON_JOIN)))
+
+        return [Reply(message.from_user.id, "Нажмите СТАРТ чтобы начать новую игру, или ПРИСОЕДИНИТЬСЯ чтобы "
+                                            "присоединиться к существующей", markup, reply_to=message)]
+
+    def start_session(self, player_id: int, nickname: str | None) -> [Reply]:
+        """
+        Нажатие на кнопку "СТАРТ"
+        :param player_id: id игрока
+        :param nickname: ник игрока из БД, или None - если ника нет
+        """
+
+        if not self._chats_statuses.compare_and_set(player_id, Status.IS_NOW_CHAT, Status.IS_NOW_AWAITING_PLAYER):
+            return [Reply(player_id, "Вы не можете сейчас начать новую сессию")]
+
+        token = self._sessions.create_game(player_id).session_token
+        button = InlineKeyboardMarkup()
+        button.add(InlineKeyboardButton(text="Отмена", callback_data=encode(CallData.RESET)))
+
+        _log(f"Начата новая сессия {token}")
+        _log(f"Сессия {token}. Игроки - 1")
+
+        if nickname is None:
+            return [Reply(player_id, f"Теперь в списке игр будет ваш id: {player_id}. Чтобы установить себе никнейм "
+                                     f"вместо id воспользуйтесь командой /nick 'ваш ник'", button)]
+
+        return [Reply(player_id, f"Теперь в списке игр будет ваш ник: {nickname}", button)]
+
+    def joinable_lobbies(self, player_id: int) -> (Game,):
+        """
+        :return: снимок открытых сессий, если игрок может к ним присоединиться, иначе - пустой кортеж. Клиент загружает
+        ники их владельцев и передает в join_menu
+        """
+
+        if self._chats_statuses.get(player_id) != Status.IS_NOW_CHAT:
+            return ()
+
+        return self._sessions.lobbies()
+
+    def join_menu(self, player_id: int, lobbies: (Game,), nicknames: dict[int, str | None] | None) -> [Reply]:
+        """
+        Нажатие на кнопку "ПРИСОЕДИНИТЬСЯ"
+        :param player_id: id игрока
+        :param lobbies: открытые сессии полученные из joinable_lobbies
+        :param nicknames: результат Storage.get_nicknames для владельцев сессий, или None - если ники не известны
+        """
+
+        if self._chats_statuses.get(player_id) != Status.IS_NOW_CHAT:
+            return [Reply(player_id, "Вы не можете сейчас присоедениться к сессии")]
+
+        if not lobbies:
+            return [Reply(player_id, "Сейчас никто не ищет противников. Попробуйте начать свою игру или сыграйте "
+                                     "против AI")]
+
+        return [Reply(player_id, "Список всех доступных игр, нажмите чтобы присоединиться:",
+                      self._games_to_markup(lobbies, nicknames))]
+
+    def join_session(self, player_id: int, token: str) -> [Reply]:
+        """
+        Нажатие на открытую сессию из списка
+        :param player_id: id игрока
+        :param token: токен сессии
+        """
+
+        if not self._chats_statuses.compare_and_set(player_id, Status.IS_NOW_CHAT, Status.IS_NOW_GAME):
+            return [Reply(player_id, "Вы не можете сейчас присоедениться к игре")]
+
+        game = self._sessions.find_lobby(token)
+
+        if game is None:
+            self._chats_statuses.set(player_id, Status.IS_NOW_CHAT)
+
+            return [Reply(player_id, "Не найдена сессия, возможно первый игрок отменил игру, или место уже занято")]
+
+        with self._session_locks.hold(token):
+            is_join_success = self._sessions.join_game(token, player_id) is game
+
+            if is_join_success:
+                self._chats_statuses.set(game.players[0].id, Status.IS_NOW_GAME)
+
+        if not is_join_success:
+            self._chats_statuses.set(player_id, Status.IS_NOW_CHAT)
+
+            return [Reply(player_id, "Не получилось присоедениться к игре")]
+
+        markup = self.render.markup(game.x_mask, game.o_mask, CallData.TURN)
+        message_matrix = self.render.text(game.x_mask, game.o_mask)
+
+        turn_player_id = game.turn_now_player.id
+        wait_player_id = game.awaiting_player.id
+
+        _log(f"Сессия {token}. Игроки - 2")
+
+        return [
+            Reply(turn_player_id, f"Сессия найдена, вы играете за \"X\".\nВаш ход:\n{message_matrix}", markup,
+                  board=Board.NEW),
+            Reply(wait_player_id, f"Сессия найдена, вы играете за \"О\".\nОжидайте ход другого игрока...\n"
+                                  f"{message_matrix}", board=Board.NEW)
+        ]
+
+    def reset(self, player_id: int) -> [Reply]:
+        """
+        Нажатие на кнопку "Отмена": сдача в игре или отмена открытой сессии
+        """
+
+        replies = []
+        status = self._chats_statuses.get(player_id)
+
+        if status == Status.IS_NOW_GAME or status == Status.IS_NOW_AWAITING_PLAYER:
+            game = self._sessions.find_game_by_player(player_id)
+
+            if game is not None:
+                with self._session_locks.hold(game.session_token):
+                    # Пока ждали блокировку, игра могла закончиться ходом противника
+                    if self._sessions.find_game_by_player(player_id) is game:
+                        opponents_ids = [pl.id for pl in game.players if pl.id != player_id]
+
+                        if opponents_ids:
+                            message_matrix = self.render.text(game.x_mask, game.o_mask)
+
+                            replies.append(Reply(player_id, f"Вы сдались:\n{message_matrix}", board=Board.FINAL))
+                            replies.append(Reply(opponents_ids[0], f"Ваш противник сдался:\n{message_matrix}",
+                                                 board=Board.FINAL))
+                        else:
+                            replies.append(Reply(player_id, "Отмена игры"))
+
+                        self._end_game(game)
+
+        if status == Status.IS_NOW_AI_GAME:
+            ai_game = self._sessions.find_ai_game(player_id)
+
+            if ai_game is not None:
+                with self._session_locks.hold(player_id):
+                    if self._sessions.find_ai_game(player_id) is ai_game:
+                        message_matrix = self.render.text(ai_game.x_mask, ai_game.o_mask)
+
+                        replies.append(Reply(player_id, f"Вы сдались:\n{message_matrix}", board=Board.FINAL))
+
+                        self._end_ai_game(ai_game)
+
+        self._chats_statuses.set(player_id, Status.IS_NOW_CHAT)
+
+        return replies
+
+    def turn(self, player_id: int, cell: int | None, tag: str) -> ([Reply], GameRecord | None):
+        """
+        Нажатие на клетку поля в игре против игрока
+        :param player_id: id игрока
+        :param cell: номер нажатой клетки
+        :param tag: метка поля, на котором нажата клетка
+        :return: ответы и результат игры который нужно сохранить в БД (или None - если игра продолжается)
+        """
+
+        game: Game = self._sessions.find_game_by_player(player_id)
+        session_token = None if game is None else game.session_token
+
+        with self._session_locks.hold(session_token):
+            # Пока ждали блокировку, ход противника мог закончить игру
+            if (
+                    self._chats_statuses.get(player_id) != Status.IS_NOW_GAME or game is None or
+                    self._sessions.find_game_by_player(player_id) is not game
+            ):
+                return [Reply(player_id, "Вы не можете сейчас ходить")], None
+
+            # Нажатие на поле, которое уже изменилось (двойное нажатие или еще не обновленное сообщение)
+            if tag != board_tag(game.x_mask, game.o_mask):
+                return [], None
+
+            turn_player_id = game.turn_now_player.id
+            wait_player_id = game.awaiting_player.id
+
+            if player_id != turn_player_id:
+                return [Reply(player_id, "Ожидайте ваш ход")], None
+
+            turn_res = self._game_turn(game, player_id, cell)
+
+            if not turn_res.is_turn_success:
+                match turn_res.turn_result_code:
+                    case TurnResultCode.INCORRECT_TURN:
+                        return [Reply(turn_player_id, "Неправильный ход")], None
+                    case TurnResultCode.NO_PLAYER:
+                        return [Reply(turn_player_id, "Не найден игрок")], None
+                    case TurnResultCode.NO_SESSION:
+                        return [Reply(turn_player_id, "Не найдена сессия")], None
+
+                return [], None
+
+            message_matrix = self.render.text(turn_res.x_mask, turn_res.o_mask)
+
+            match turn_res.game_result_code:
+                case GameResultCode.NO_ONE_WIN:
+                    self._end_game(game)
+
+                    return [
+                        Reply(turn_player_id, f"Ничья:\n{message_matrix}", board=Board.FINAL),
+                        Reply(wait_player_id, f"Ничья:\n{message_matrix}", board=Board.FINAL)
+                    ], GameRecord(turn_player_id, wait_player_id, is_draw=True)
+
+                case GameResultCode.PLAYER_WIN:
+                    self._end_game(game)
+
+                    return [
+                        Reply(turn_player_id, f"Результат вашего хода:\n{message_matrix}Вы выиграли",
+                              board=Board.FINAL),
+                        Reply(wait_player_id, f"Ход другого игрока:\n{message_matrix}Вы проиграли",
+                              board=Board.FINAL)
+                    ], GameRecord(turn_player_id, wait_player_id, is_draw=False)
+
+            markup = self.render.markup(turn_res.x_mask, turn_res.o_mask, CallData.TURN)
+
+            return [
+                Reply(turn_player_id, f"Результат вашего хода:\n{message_matrix}Ожидайте ход другого игрока...",
+                      board=Board.EDIT),
+                Reply(wait_player_id, f"Ход другого игрока:\n{message_matrix}Ваш ход:", markup, board=Board.EDIT)
+            ], None
+
+    @staticmethod
+    def record_replies(record: GameRecord, is_saved: bool) -> [Reply]:
+        """
+        :param record: результат игры
+        :param is_saved: True - если результат сохранен в БД
+        :return: ответы игрокам о сохранении результата
+        """
+
+        if is_saved:
+            _log(f"Изменены данные пользователя {record.winner_id} в БД ")
+            _log(f"Изменены данные пользователя {record.loser_id} в БД ")
+
+            return []
+
+        return [
+            Reply(record.winner_id, "Ошибка. Данные не сохраненны"),
+            Reply(record.loser_id, "Ошибка. Данные не сохраненны")
+        ]
+
+    def start_ai_game(self, player_id: int) -> [Reply]:
+        """
+        Нажатие на кнопку "ИГРА С БОТОМ"
+        """
+
+        if not self._chats_statuses.compare_and_set(player_id, Status.IS_NOW_CHAT, Status.IS_NOW_AI_GAME):
+            return [Reply(player_id, "Вы не можете сейчас начать игру")]
+
+        ai_game = self._create_new_ai_game(player_id)
+
+        if ai_game is None:
+            self._chats_statuses.set(player_id, Status.IS_NOW_CHAT)
+
+            return [Reply(player_id, "Ошибка начала игры")]
+
+        _log(f"Игрок {player_id} начал сессию против AI")
+
+        return [
+            Reply(player_id, f"Игра началась, вы играете за \"X\".\nВаш ход:\n"
+                             f"{self.render.text(ai_game.x_mask, ai_game.o_mask)}",
+                  self.render.markup(ai_game.x_mask, ai_game.o_mask, CallData.TURN_AI), board=Board.NEW)
+        ]
+
+    def ai_turn(self, player_id: int, cell: int | None, tag: str) -> [Reply]:
+        """
+        Нажатие на клетку поля в игре против AI. Может ждать ход модели, поэтому асинхронный клиент вызывает его вне
+        цикла событий
+        :param player_id: id игрока
+        :param cell: номер нажатой клетки
+        :param tag: метка поля, на котором нажата клетка
+        """
+
+        with self._session_locks.hold(player_id):
+            if self._chats_statuses.get(player_id) != Status.IS_NOW_AI_GAME:
+                return [Reply(player_id, "Вы не можете сейчас ходить")]
+
+            ai_game = self._sessions.find_ai_game(player_id)
+
+            if ai_game is None:
+                return [Reply(player_id, "Ошибка хода")]
+
+            if tag != board_tag(ai_game.x_mask, ai_game.o_mask):
+                return []
+
+            turn_res = self._ai_game_turn(ai_game, cell)
+
+            if not turn_res.is_turn_success:
+                if turn_res.turn_result_code == TurnResultCode.INCORRECT_TURN:
+                    return [Reply(player_id, "Неправильный ход")]
+
+                return []
+
+            message_matrix = self.render.text(turn_res.x_mask, turn_res.o_mask)
+
+            match turn_res.game_result_code:
+                case GameResultCode.NO_ONE_WIN:
+                    self._end_ai_game(ai_game)
+
+                    return [Reply(player_id, f"Ничья:\n{message_matrix}", board=Board.FINAL)]
+
+                case GameResultCode.PLAYER_WIN:
+                    self._end_ai_game(ai_game)
+
+                    return [Reply(player_id, f"Результат вашего хода:\n{message_matrix}Вы выиграли", board=Board.FINAL)]
+
+                case GameResultCode.AI_WIN:
+                    self._end_ai_game(ai_game)
+
+                    return [Reply(player_id, f"Результат хода бота:\n{message_matrix}Вы проиграли", board=Board.FINAL)]
+
+            return [
+                Reply(player_id, f"Ход бота:\n{message_matrix}Теперь ваш ход:",
+                      self.render.markup(turn_res.x_mask, turn_res.o_mask, CallData.TURN_AI), board=Board.EDIT)
+            ]
+
+    def leaders(self, player_id: int, get_leaders_query: DatabaseOperationResult) -> [Reply]:
+        """
+        Команда /leaders
+        :param player_id: id игрока
+        :param get_leaders_query: результат Storage.get_leaders
+        """
+
+        if not get_leaders_query.success:
+            return [Reply(player_id, "Ошибка")]
+
+        data = get_leaders_query.data
+        cached = self._leaders_text
+
+        if cached is not None and cached[0] is data:
+            return [Reply(player_id, cached[1])]
+
+        out_str = ""
+
+        if data is not None and len(data) > 0:
+            out_str += "Вот результаты лучших игроков\n\n"
+            place = 1
+
+            for i in data:
+                win_rate = 'недостаточно данных' if i[1] is None else f"{round(100 * i[1], 1)}%"
+                out_str += f"{place}. {i[0]} - {win_rate}\n"
+                place += 1
+        else:
+            out_str = "Нет данных о лучших игроках"
+
+        self._leaders_text = (data, out_str)
+
+        return [Reply(player_id, out_str)]
+
+    @staticmethod
+    def score(player_id: int, get_score_query: DatabaseOperationResult,
+              get_rank_query: DatabaseOperationResult | None = None) -> [Reply]:
+        """
+        Команда /score
+        :param player_id: id игрока
+        :param get_score_query: результат Storage.get_user_score
+        :param get_rank_query: результат Storage.get_user_rank, или None - если место не показывается
+        """
+
+        if not get_score_query.success:
+            return [Reply(player_id, "Ошибка")]
+
+        if get_score_query.data is None:
+            return [Reply(player_id, "Нет данных об игроке")]
+
+        data = get_score_query.data
+
+        wins = data[0]
+        loses = data[1]
+        draws = data[2]
+        win_rate = "недостаточно данных" if data[3] is None else f"{round(100 * data[3], 1)}%"
+        nick = "нет" if data[4] is None else data[4]
+
+        if get_rank_query is not None and get_rank_query.success and get_rank_query.data is not None:
+            rank, total = get_rank_query.data
+            place = f"{rank} из {total} (лучше чем у {round(100 * (total - rank) / total, 1)}% игроков)"
+        else:
+            place = "недостаточно данных"
+
+        name = player_id if data[4] is None else data[4]
+
+        out_str = \
+            f"""Вот результаты игрока {name}:
+
+            Винрейт - {win_rate}
+            Место - {place}
+
+            Победы - {wins}
+            Поражения - {loses}
+            Ничьи - {draws}
+
+            id: {player_id}
+            Никнейм: {nick}
+            """
+
+        return [Reply(player_id, out_str)]
+
+    @staticmethod
+    def parse_nickname(text: str) -> str | None:
+        """
+        :param text: текст команды /nick
+        :return: новый ник, или None - если команда введена в неверном формате
+        """
+
+        if len(text.split(' ')) == 2:
+            return text.split(' ')[1]
+
+        return None
+
+    @staticmethod
+    def nickname_replies(player_id: int, nick: str | None, set_nick_query: DatabaseOperationResult | None) -> [Reply]:
+        """
+        Команда /nick
+        :param player_id: id игрока
+        :param nick: ник из parse_nickname
+        :param set_nick_query: результат Storage.set_nickname, или None - если ник не был введен
+        """
+
+        if nick is None:
+            return [Reply(player_id, "Ошибка ввода. Введите данные в формате - \"/nick никнейм\". Никнейм не должен "
+                                     "содержать пробелы.")]
+
+        if set_nick_query.success:
+            return [Reply(player_id, f"Теперь вас зовут {nick}")]
+
+        return [Reply(player_id, "Ошибка")]
+
+    def _create_new_ai_game(self, player_id: int) -> GameAI:
+        """
+        Создает новую игру против AI
+        :param player_id: id игрока
+        :return: Экземпляр класса GameAI
+        """
+
+        ai_game = GameAI(model=self.model, move_cache=self.move_cache)
+        ai_game.start_new_session(player_id)
+
+        self._sessions.add_ai_game(ai_game)
+
+        return ai_game
+
+    @staticmethod
+    def _ai_game_turn(ai_game: GameAI, cell: int | None) -> TurnResult:
+        """
+        :param ai_game: игра в которой будет сделан ход
+        :param cell: номер клетки, None - неправильный ход
+        :return: Экземпляр класса TurnResult с информацией о результате хода
+        """
+
+        row, column = (-1, -1) if cell is None else divmod(cell, 3)
+
+        return ai_game.make_turn(row, column)
+
+    @staticmethod
+    def _game_turn(game: Game, player_id: int, cell: int | None) -> TurnResult:
+        """
+        :param game: игра в которой будет сделан ход
+        :param player_id: id игрока
+        :param cell: номер клетки, None - неправильный ход
+        :return: Экземпляр класса TurnResult с информацией о результате хода
+        """
+
+        row, column = (-1, -1) if cell is None else divmod(cell, 3)
+
+        return game.make_turn(player_id, row, column)
+
+    @staticmethod
+    def _games_to_markup(not_fulled_games: (Game,), nicknames: dict[int, str | None] | None) -> InlineKeyboardMarkup:
+        awaiting_players_ids = [i.players[0].id for i in not_fulled_games]
+        nicknames = {} if nicknames is None else nicknames
+
+        awaiting_players_tokens = [i.session_token for i in not_fulled_games]
+        awaiting_players_names = []
+
+        for player_id in awaiting_players_ids:
+            player_data = nicknames.get(player_id)
+
+            if player_data is None:
+                awaiting_players_names.append(str(player_id))
+            else:
+                awaiting_players_names.append(player_data)
+
+        markup = InlineKeyboardMarkup(row_width=1)
+
+        for i in range(len(awaiting_players_names)):
+            cell = InlineKeyboardButton(
+                text=f"Присоеденится к {awaiting_players_names[i]}",
+                callback_data=encode(CallData.SESSION_JOIN, tag=awaiting_players_tokens[i])
+            )
+
+            markup.row(cell)
+
+        return markup
+
+    def _end_ai_game(self, ai_game: GameAI):
+        """
+        Заканчивает игровую сессию
+        :param ai_game: игра которую требуется завершить
+        """
+
+        player = ai_game.player
+        self._chats_statuses.set(player.id, Status.IS_NOW_CHAT)
+
+        self._sessions.end_ai_game(ai_game)
+
+    def _end_game(self, game: Game):
+        """
+        Заканчивает игровую сессию
+        :param game: игра которую требуется завершить
+        """
+
+        for pl in game.players:
+            self._chats_statuses.set(pl.id, Status.IS_NOW_CHAT)
+
+        self._sessions.end_game(game)
+
+    def _expire_player(self, player_id: int):
+        """
+        Удаляет пользователя и все его сессии из оперативной памяти, вызывается из потока ExpiryService
+        :param player_id: id игрока
+        """
+
+        replies = []
+        game = self._sessions.find_game_by_player(player_id)
+        locked_keys = (player_id,) if game is None else (player_id, game.session_token)
+
+        with self._session_locks.hold(*locked_keys):
+            game, ai_game = self._sessions.expire_player(player_id)
+
+            if game is not None:
+                for pl in game.players:
+                    if pl.id != player_id and self._chats_statuses.compare_and_set(
+                            pl.id, Status.IS_NOW_GAME, Status.IS_NOW_CHAT
+                    ):
+                        replies.append(Reply(pl.id, f"Ваш противник покинул игру:\n"
+                                                    f"{self.render.text(game.x_mask, game.o_mask)}",
+                                             board=Board.FINAL))
+
+        self._chats_statuses.pop(player_id, None)
+        self.boards.pop(player_id)
+        _log(f"Пользователь {player_id} удалён из оперативной памяти")
+
+        if replies:
+            self.on_expire(replies)
+
+    def set_model(self, model: Model | None):
+        """
+        Заменяет модель для игры против AI, кэш ходов старой модели сбрасывается. Уже идущие игры доигрываются старой
+        моделью
+        """
+
+        self.model = model
+        self.move_cache.invalidate(model)
+
+    def metrics(self) -> {str: any}:
+        """
+        Метрики компонентов ядра
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
+        """
+
+        out_dict = {"move_cache": self.move_cache.metrics()}
+
+        if self.model is not None and hasattr(self.model, "metrics"):
+            out_dict["ai_batching"] = self.model.metrics()
+
+        return out_dict
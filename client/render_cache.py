@@ -0,0 +1,144 @@
+# --------------------------------------------------------------------------
+# Кэш отрисовки игрового поля
+#
+# На каждом ходу поле заново превращалось в двумерный список строк, из него
+# собирались 10 InlineKeyboardButton и строка из эмодзи, а при отправке
+# клавиатура еще раз сериализовалась в JSON. Различных полей всего 3^9,
+# поэтому текст и уже сериализованная клавиатура строятся один раз на
+# каждое поле и дальше берутся по коду поля (engine.board_code) и действию
+# кнопок клеток
+# --------------------------------------------------------------------------
+
+
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, JsonSerializable
+
+from client.callback_data import CallData, code_tag, encode
+from game import engine
+
+
+_SIZE = 3 ** 9
+
+_EMOJIS = ("⬜️", "❌", "⭕️")
+_SIGNS = (" ", "X", "O")
+
+
+class RenderedMarkup(JsonSerializable):
+    """
+    Клавиатура, уже сериализованная в JSON. TeleBot передает в запрос результат to_json без изменений, поэтому объект
+    используется вместо InlineKeyboardMarkup в reply_markup
+    """
+
+    __slots__ = ("json",)
+
+    def __init__(self, json: str):
+        self.json = json
+
+    def to_json(self) -> str:
+        return self.json
+
+
+def _cells(code: int) -> [int]:
+    """
+    :return: список из 9 чисел, где 0 - пустая клетка, 1 - "X", 2 - "O"
+    """
+
+    cells = []
+
+    for _ in range(9):
+        code, cell = divmod(code, 3)
+        cells.append(cell)
+
+    return cells
+
+
+class RenderCache:
+    """
+    Текст и клавиатуры всех полей по коду поля. Записи строятся при первом обращении (или сразу все через build) и
+    больше не меняются, поэтому чтение не блокируется: два потока могут одновременно построить одну запись, но
+    результат у них одинаковый
+    """
+
+    def __init__(self, reset_callback_data: str):
+        """
+        :param reset_callback_data: callback_data кнопки "Отмена" под полем
+        """
+
+        self.reset_callback_data = reset_callback_data
+
+        self._texts: [str | None] = [None] * _SIZE
+        self._markups: {CallData: [RenderedMarkup | None]} = {}
+        """
+        _markups: {prefix: CallData, [RenderedMarkup | None]}
+        Клавиатуры по действию кнопок клеток и коду поля
+        """
+
+    def text(self, x_mask: int, o_mask: int) -> str:
+        """
+        :return: поле в виде трех строк из эмодзи, каждая заканчивается переводом строки
+        """
+
+        code = engine.board_code(x_mask, o_mask)
+        text = self._texts[code]
+
+        if text is None:
+            text = self._texts[code] = self._render_text(code)
+
+        return text
+
+    def markup(self, x_mask: int, o_mask: int, prefix: CallData) -> RenderedMarkup:
+        """
+        :param prefix: действие кнопок клеток, например CallData.TURN
+        :return: клавиатура поля с кнопкой "Отмена"
+        """
+
+        code = engine.board_code(x_mask, o_mask)
+        markups = self._markups.get(prefix)
+
+        if markups is None:
+            markups = self._markups.setdefault(prefix, [None] * _SIZE)
+
+        markup = markups[code]
+
+        if markup is None:
+            markup = markups[code] = self._render_markup(code, prefix)
+
+        return markup
+
+    def build(self, prefixes: (CallData,), codes: (int,) = range(_SIZE)):
+        """
+        Заранее строит текст и клавиатуры полей
+        :param prefixes: действия кнопок клеток, для которых строятся клавиатуры
+        :param codes: коды полей, например только достижимые в игре (OutcomeTable.is_reachable)
+        """
+
+        for prefix in prefixes:
+            markups = self._markups.setdefault(prefix, [None] * _SIZE)
+
+            for code in codes:
+                if markups[code] is None:
+                    markups[code] = self._render_markup(code, prefix)
+
+        for code in codes:
+            if self._texts[code] is None:
+                self._texts[code] = self._render_text(code)
+
+    @staticmethod
+    def _render_text(code: int) -> str:
+        cells = _cells(code)
+
+        return "".join("".join(_EMOJIS[cell] for cell in cells[row * 3:row * 3 + 3]) + "\n" for row in range(3))
+
+    def _render_markup(self, code: int, prefix: CallData) -> RenderedMarkup:
+        cells = _cells(code)
+        tag = code_tag(code)
+        markup = InlineKeyboardMarkup(row_width=3)
+
+        for row in range(3):
+            markup.row(*(
+                InlineKeyboardButton(_SIGNS[cells[cell]], callback_data=encode(prefix, cell, tag))
+                for cell in range(row * 3, row * 3 + 3)
+            ))
+
+        markup.row(InlineKeyboardButton(text="Отмена", callback_data=self.reset_callback_data))
+
+        return RenderedMarkup(markup.to_json())
@@ -0,0 +1,166 @@
+import secrets
+import threading
+
+from client.state_store import StripedLock
+from game.game import Game, GameAI
+
+
+class SessionRegistry:
+    """
+    Хранит все идущие игры и индексы по ним, так что поиск игры по id игрока или токену сессии и список открытых сессий
+    не зависят от количества игр
+
+    Изменения индексов блокируют только токен затронутой сессии и id её игроков, поэтому обработчики разных игр не ждут
+    друг друга. Поиск не блокируется, а список открытых сессий читается из неизменяемого снимка
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._locks = StripedLock(stripes)
+
+        self._games_by_token: {str: Game} = {}
+        """
+        _games_by_token: {session_token: str, game: Game}
+        Все игры против игроков, в том числе ожидающие второго игрока
+        """
+
+        self._games_by_player: {int: Game} = {}
+        """
+        _games_by_player: {player_id: int, game: Game}
+        Игра в которой сейчас находится игрок
+        """
+
+        self._lobbies: {str: Game} = {}
+        """
+        _lobbies: {session_token: str, game: Game}
+        Сессии ожидающие второго игрока в порядке создания
+        """
+
+        self._lobbies_lock = threading.Lock()
+        self._lobbies_snapshot: (Game,) = ()
+
+        self._ai_games_by_player: {int: GameAI} = {}
+        """
+        _ai_games_by_player: {player_id: int, ai_game: GameAI}
+        Игры против AI
+        """
+
+    def _new_token(self) -> str:
+        while True:
+            token = secrets.token_hex(4)
+
+            if token not in self._games_by_token:
+                return token
+
+    def _update_lobbies(self, add: Game | None = None, remove: str | None = None):
+        # Снимок пересобирается при каждом изменении, а читатели получают ссылку на готовый кортеж без блокировки
+        with self._lobbies_lock:
+            if add is not None:
+                self._lobbies[add.session_token] = add
+            if remove is not None:
+                self._lobbies.pop(remove, None)
+
+            self._lobbies_snapshot = tuple(self._lobbies.values())
+
+    def create_game(self, player_id: int) -> Game:
+        """
+        Создает новую сессию с одним игроком и добавляет её в список открытых сессий
+        :param player_id: id игрока
+        :return: экземпляр класса Game
+        """
+
+        game = Game()
+        game.start_new_session(player_id, self._new_token())
+
+        with self._locks.hold(game.session_token, player_id):
+            self._games_by_token[game.session_token] = game
+            self._games_by_player[player_id] = game
+            self._update_lobbies(add=game)
+
+        return game
+
+    def join_game(self, session_token: str, player_id: int) -> Game | None:
+        """
+        Присоединяет игрока к открытой сессии и начинает игру
+        :param session_token: токен сессии
+        :param player_id: id игрока
+        :return: экземпляр класса Game, или None - если открытой сессии с таким токеном нет
+        """
+
+        with self._locks.hold(session_token, player_id):
+            game = self._lobbies.get(session_token)
+
+            if game is None or not game.join_to_session(player_id) or game.start_game() is None:
+                return None
+
+            self._games_by_player[player_id] = game
+            self._update_lobbies(remove=session_token)
+
+            return game
+
+    def end_game(self, game: Game):
+        """
+        Удаляет игру (или открытую сессию) из всех индексов
+        """
+
+        while True:
+            players_ids = [pl.id for pl in game.players]
+
+            with self._locks.hold(game.session_token, *players_ids):
+                # Пока ждали блокировку, к сессии мог присоединиться второй игрок
+                if len(game.players) != len(players_ids):
+                    continue
+
+                if self._games_by_token.get(game.session_token) is not game:
+                    return
+
+                del self._games_by_token[game.session_token]
+
+                if game.session_token in self._lobbies:
+                    self._update_lobbies(remove=game.session_token)
+
+                for player_id in players_ids:
+                    if self._games_by_player.get(player_id) is game:
+                        del self._games_by_player[player_id]
+
+                return
+
+    def find_game_by_player(self, player_id: int) -> Game | None:
+        return self._games_by_player.get(player_id)
+
+    def find_lobby(self, session_token: str) -> Game | None:
+        return self._lobbies.get(session_token)
+
+    def lobbies(self) -> (Game,):
+        """
+        :return: снимок сессий ожидающих второго игрока в порядке создания
+        """
+
+        return self._lobbies_snapshot
+
+    def add_ai_game(self, ai_game: GameAI):
+        with self._locks.hold(ai_game.player.id):
+            self._ai_games_by_player[ai_game.player.id] = ai_game
+
+    def find_ai_game(self, player_id: int) -> GameAI | None:
+        return self._ai_games_by_player.get(player_id)
+
+    def end_ai_game(self, ai_game: GameAI):
+        with self._locks.hold(ai_game.player.id):
+            if self._ai_games_by_player.get(ai_game.player.id) is ai_game:
+                del self._ai_games_by_player[ai_game.player.id]
+
+    def expire_player(self, player_id: int) -> (Game | None, GameAI | None):
+        """
+        Удаляет все сессии игрока: открытую сессию, игру против игрока и игру против AI
+        :return: удаленная игра против игрока и удаленная игра против AI (или None)
+        """
+
+        game = self._games_by_player.get(player_id)
+        ai_game = self._ai_games_by_player.get(player_id)
+
+        if game is not None:
+            self.end_game(game)
+        if ai_game is not None:
+            self.end_ai_game(ai_game)
+
+        return game, ai_game
@@ -0,0 +1,112 @@
+import threading
+from contextlib import contextmanager
+from typing import Hashable, Iterator
+
+
+class StripedLock:
+    """
+    Набор блокировок, где каждый ключ (id пользователя, токен сессии) закреплен за одной из них по хэшу. Потоки
+    работающие с разными ключами почти никогда не ждут друг друга, а несколько ключей всегда блокируются в одном и том
+    же порядке, поэтому взаимная блокировка невозможна
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def _indexes(self, keys: (Hashable,)) -> [int]:
+        return sorted({hash(key) % len(self._locks) for key in keys})
+
+    @contextmanager
+    def hold(self, *keys: Hashable) -> Iterator[None]:
+        """
+        Блокирует все переданные ключи на время выполнения блока with
+        """
+
+        indexes = self._indexes(keys)
+
+        for i in indexes:
+            self._locks[i].acquire()
+
+        try:
+            yield
+        finally:
+            for i in reversed(indexes):
+                self._locks[i].release()
+
+
+class StatusStore:
+    """
+    Статусы пользователей с блокировкой по id пользователя. Чтение не блокируется, а изменение статуса выполняется
+    атомарной операцией сравнения и замены, так что два обработчика не могут одновременно перевести пользователя из
+    одного статуса в разные
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._statuses = {}
+        self._locks = StripedLock(stripes)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self._statuses
+
+    def __len__(self):
+        return len(self._statuses)
+
+    def get(self, player_id: int, default=None):
+        return self._statuses.get(player_id, default)
+
+    def set(self, player_id: int, status):
+        with self._locks.hold(player_id):
+            self._statuses[player_id] = status
+
+    def set_default(self, player_id: int, status):
+        """
+        Устанавливает статус только если у пользователя его еще нет
+        :return: текущий статус пользователя
+        """
+
+        with self._locks.hold(player_id):
+            return self._statuses.setdefault(player_id, status)
+
+    def compare_and_set(self, player_id: int, expected, status) -> bool:
+        """
+        Меняет статус пользователя на status, только если сейчас у него статус expected
+        :return: True - если статус изменен
+        """
+
+        with self._locks.hold(player_id):
+            if self._statuses.get(player_id) != expected:
+                return False
+
+            self._statuses[player_id] = status
+
+            return True
+
+    def pop(self, player_id: int, default=None):
+        with self._locks.hold(player_id):
+            return self._statuses.pop(player_id, default)
+
+
+class BoardMessages:
+    """
+    id сообщений с полем текущей игры по id чата. Поле каждого игрока живет в одном сообщении, которое клиент
+    изменяет на каждом ходу вместо отправки новых сообщений. Чтение, запись и удаление одного ключа в dict атомарны,
+    поэтому блокировка не нужна
+    """
+
+    def __init__(self):
+        self._messages = {}
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._messages
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, chat_id: int) -> int | None:
+        return self._messages.get(chat_id)
+
+    def set(self, chat_id: int, message_id: int):
+        self._messages[chat_id] = message_id
+
+    def pop(self, chat_id: int) -> int | None:
+        return self._messages.pop(chat_id, None)
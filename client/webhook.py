@@ -0,0 +1,266 @@
+# --------------------------------------------------------------------------
+# Прием обновлений через webhook
+#
+# В режиме infinity_polling бот сам запрашивает обновления (getUpdates), и
+# каждое обновление ждет очередного ответа на длинный запрос, а принимать
+# обновления может только один процесс. В режиме webhook Telegram отправляет
+# каждое обновление POST-запросом на адрес бота. WebhookServer - встроенный
+# HTTP-сервер на http.server:
+#   - принимает POST только на свой путь и проверяет секретный токен из
+#     заголовка X-Telegram-Bot-Api-Secret-Token;
+#   - разбирает JSON и сразу отвечает 200, а само обновление обрабатывается
+#     в пуле из workers потоков;
+#   - очередь пула ограничена max_queue обновлениями: когда бот не успевает,
+#     сервер отвечает 503 и Telegram повторит доставку позже, вместо того
+#     чтобы обновления копились в памяти.
+# Сервер работает по обычному HTTP, HTTPS для Telegram обеспечивает
+# обратный прокси (nginx и т.п.) перед ботом
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import datetime
+import hmac
+import json
+import queue
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_MAX_BODY = 1 << 20
+
+
+@dataclasses.dataclass
+class WebhookMetrics:
+    """
+    Статистика приема обновлений:
+    queue_depth: int - количество обновлений ожидающих свободного потока
+    received: int - количество принятых обновлений
+    processed: int - количество обработанных обновлений
+    rejected: int - количество отклоненных запросов (чужой путь, неверный секретный токен или тело запроса)
+    overloaded: int - количество обновлений, на которые сервер ответил 503 из-за переполнения очереди
+    errors: int - количество обновлений, обработка которых завершилась исключением
+    mean_latency: float - среднее время от приема обновления до окончания обработки в секундах
+    max_latency: float - наибольшее время от приема обновления до окончания обработки в секундах
+    """
+    queue_depth: int
+    received: int
+    processed: int
+    rejected: int
+    overloaded: int
+    errors: int
+    mean_latency: float
+    max_latency: float
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: соединение закрывается после ответа, поэтому поток соединения не висит на keep-alive
+    server: "_HTTPServer"
+
+    def do_POST(self):
+        self._respond(self.server.webhook.receive(self.path, self.headers, self.rfile))
+
+    def do_GET(self):
+        self._respond(405)
+
+    def _respond(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args):
+        # Каждый запрос не логируется, ошибки видны в WebhookMetrics
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    webhook: "WebhookServer"
+
+
+class WebhookServer:
+    def __init__(self, handle: Callable[[dict], None], host: str = "0.0.0.0", port: int = 8443, path: str = "/",
+                 secret_token: str | None = None, workers: int = 8, max_queue: int = 1024, name: str = "webhook"):
+        """
+        :param handle: функция обрабатывающая одно обновление (разобранный JSON), вызывается из потоков пула
+        :param host: адрес, на котором сервер принимает запросы
+        :param port: порт сервера (0 - любой свободный, занятый порт доступен в address)
+        :param path: путь, на который Telegram отправляет обновления
+        :param secret_token: секретный токен переданный в setWebhook, или None - если не проверяется
+        :param workers: количество потоков обработки обновлений
+        :param max_queue: максимальное количество обновлений ожидающих свободного потока
+        :param name: префикс имен потоков
+        """
+
+        self.handle = handle
+        self.path = path
+        self.secret_token = secret_token
+
+        self._queue: queue.Queue[tuple[dict, float] | None] = queue.Queue(maxsize=max_queue)
+        """
+        _queue: очередь (обновление, время приема), None - сигнал остановки потоку пула
+        """
+
+        self._lock = threading.Lock()
+        self._is_stopped = False
+        self._received = 0
+        self._processed = 0
+        self._rejected = 0
+        self._overloaded = 0
+        self._errors = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+        self._server = _HTTPServer((host, port), _RequestHandler)
+        self._server.webhook = self
+
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name=f"{name}-http", daemon=True)
+        self._workers = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self):
+        for thread in self._workers:
+            thread.start()
+
+        self._server_thread.start()
+
+    def wait(self):
+        """
+        Блокирует вызывающий поток, пока сервер не остановлен. Ожидание идет короткими отрезками, чтобы главный поток
+        получал KeyboardInterrupt
+        """
+
+        while self._server_thread.is_alive():
+            self._server_thread.join(1.0)
+
+    def stop(self, timeout: float | None = None):
+        """
+        Перестает принимать запросы, обрабатывает уже принятые обновления и останавливает потоки. Обновления не
+        обработанные за timeout секунд теряются. Повторный вызов ничего не делает
+        """
+
+        with self._lock:
+            if self._is_stopped:
+                return
+
+            self._is_stopped = True
+
+        if self._server_thread.is_alive():
+            self._server.shutdown()
+
+        self._server.server_close()
+
+        for _ in self._workers:
+            self._queue.put(None)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        for thread in self._workers:
+            if thread.is_alive():
+                thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        if self._queue.qsize() > len(self._workers):
+            _log(f"Не обработано обновлений при остановке: {self._queue.qsize() - len(self._workers)}")
+
+    def receive(self, path: str, headers, body) -> int:
+        """
+        Проверяет запрос и ставит обновление в очередь. Вызывается из потоков HTTP-сервера
+        :param headers: заголовки запроса
+        :param body: поток с телом запроса
+        :return: HTTP-статус ответа
+        """
+
+        if path != self.path:
+            return self._reject(404)
+
+        if self.secret_token is not None and not hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            return self._reject(403)
+
+        try:
+            length = int(headers.get("Content-Length", ""))
+        except ValueError:
+            return self._reject(411)
+
+        if not 0 < length <= _MAX_BODY:
+            return self._reject(413 if length > 0 else 400)
+
+        try:
+            update = json.loads(body.read(length))
+        except ValueError:
+            return self._reject(400)
+
+        if not isinstance(update, dict):
+            return self._reject(400)
+
+        try:
+            self._queue.put_nowait((update, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._overloaded += 1
+
+            return 503
+
+        with self._lock:
+            self._received += 1
+
+        return 200
+
+    def metrics(self) -> WebhookMetrics:
+        with self._lock:
+            return WebhookMetrics(
+                queue_depth=self._queue.qsize(),
+                received=self._received,
+                processed=self._processed,
+                rejected=self._rejected,
+                overloaded=self._overloaded,
+                errors=self._errors,
+                mean_latency=self._total_latency / self._processed if self._processed else 0.0,
+                max_latency=self._max_latency
+            )
+
+    def _reject(self, status: int) -> int:
+        with self._lock:
+            self._rejected += 1
+
+        return status
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                return
+
+            update, received_at = item
+            is_error = False
+
+            try:
+                self.handle(update)
+            except Exception:
+                is_error = True
+                _log(f"Ошибка обработки обновления {update.get('update_id')}:\n{traceback.format_exc()}")
+
+            latency = time.monotonic() - received_at
+
+            with self._lock:
+                self._processed += 1
+                self._errors += is_error
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
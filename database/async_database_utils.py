@@ -0,0 +1,94 @@
+import asyncio
+
+from database.executor import DatabaseExecutor
+from database.storage import DatabaseOperationResult, Storage
+
+
+class AsyncDatabaseAPI:
+    """
+    Асинхронный вариант Storage для AsyncBotClient. Запросы выполняет то же синхронное хранилище, но в ограниченном
+    пуле потоков DatabaseExecutor, поэтому цикл событий не блокируется на соединении с БД, а количество одновременных
+    запросов (и потоков) не растет вместе с количеством пользователей
+    """
+
+    def __init__(self, storage: Storage, max_workers: int = 8, max_queue: int = 1024, timeout: float = 5.0):
+        """
+        :param storage: хранилище которое выполняет запросы, закрывается вместе с AsyncDatabaseAPI
+        :param max_workers: максимальное количество одновременных запросов к хранилищу, для DatabaseAPI должно быть не
+        больше размера пула соединений
+        :param max_queue: максимальное количество запросов ожидающих свободного потока
+        :param timeout: время в секундах, дольше которого результат запроса не ждут
+        """
+
+        self.database_api = storage
+        """
+        Синхронное хранилище которое выполняет запросы
+        """
+
+        self.executor = DatabaseExecutor(storage, max_workers=max_workers, max_queue=max_queue, timeout=timeout)
+
+    async def _run(self, operation: str, *args) -> DatabaseOperationResult:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.executor.submit(operation, *args)),
+                                          self.executor.timeout)
+        except asyncio.TimeoutError:
+            self.executor.record_timeout(operation)
+
+            return DatabaseOperationResult(False, None)
+
+    async def get_users_ids(self) -> DatabaseOperationResult:
+        return await self._run("get_users_ids")
+
+    async def get_users_scores(self) -> DatabaseOperationResult:
+        return await self._run("get_users_scores")
+
+    async def get_user_score(self, user_id: int) -> DatabaseOperationResult:
+        return await self._run("get_user_score", user_id)
+
+    async def ensure_user(self, user_id: int) -> DatabaseOperationResult:
+        return await self._run("ensure_user", user_id)
+
+    async def record_game_result(self, winner_id: int, loser_id: int) -> DatabaseOperationResult:
+        return await self._run("record_game_result", winner_id, loser_id)
+
+    async def record_draw(self, first_user_id: int, second_user_id: int) -> DatabaseOperationResult:
+        return await self._run("record_draw", first_user_id, second_user_id)
+
+    async def get_nicknames(self, users_ids: [int]) -> DatabaseOperationResult:
+        return await self._run("get_nicknames", users_ids)
+
+    async def get_nickname(self, user_id: int) -> DatabaseOperationResult:
+        return await self._run("get_nickname", user_id)
+
+    async def set_nickname(self, user_id: int, user_nickname: str) -> DatabaseOperationResult:
+        return await self._run("set_nickname", user_id, user_nickname)
+
+    async def get_leaders(self) -> DatabaseOperationResult:
+        # Загруженная таблица лидеров читается из памяти, без перехода в поток. С отложенной записью к ней добавляется
+        # незаписанная статистика, для которой может понадобиться запрос к БД
+        if self.database_api.leaderboard.is_loaded and self.database_api.write_behind is None:
+            return self.database_api.get_leaders()
+
+        return await self._run("get_leaders")
+
+    async def get_user_rank(self, user_id: int) -> DatabaseOperationResult:
+        # Загруженный индекс мест читается из памяти, без перехода в поток. С отложенной записью к нему добавляется
+        # незаписанная статистика, для которой может понадобиться запрос к БД
+        if self.database_api.rank_index.is_loaded and self.database_api.write_behind is None:
+            return self.database_api.get_user_rank(user_id)
+
+        return await self._run("get_user_rank", user_id)
+
+    def metrics(self) -> {str: any}:
+        out_dict = {"database_executor": self.executor.metrics()}
+        out_dict.update(self.database_api.metrics())
+
+        return out_dict
+
+    def close(self):
+        """
+        Дожидается уже принятых запросов, останавливает потоки пула, записывает накопленную статистику и закрывает
+        соединения с БД
+        """
+
+        self.executor.close()
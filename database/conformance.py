@@ -0,0 +1,438 @@
+# --------------------------------------------------------------------------
+# Общие проверки и бенчмарк реализаций Storage
+#
+# Каждая проверка получает новое пустое хранилище и проверяет поведение,
+# на которое рассчитывают BotClient и AsyncBotClient: добавление
+# пользователей, запись результатов игр (в том числе из нескольких потоков
+# одновременно), ники, таблицу лидеров, места и приращения отложенной
+# записи. Бенчмарк замеряет те же операции на одном и том же сценарии для
+# всех реализаций.
+#
+# По умолчанию проверяются MemoryStorage, SQLiteStorage и SQLiteStorage с
+# отложенной записью статистики. С --mysql проверяется и DatabaseAPI:
+# таблицы users и stats_journal_state этой БД удаляются перед каждой
+# проверкой, поэтому указывать можно только тестовую БД.
+#
+# Запуск из корня репозитория:
+#   python -m database.conformance
+#   python -m database.conformance --users 10000 --games 50000
+#   python -m database.conformance --mysql test_database database_user database_password
+# --------------------------------------------------------------------------
+
+
+import argparse
+import dataclasses
+import os
+import random
+import tempfile
+import threading
+import time
+import traceback
+from typing import Callable
+
+from database.memory_storage import MemoryStorage
+from database.sqlite_storage import SQLiteStorage
+from database.storage import Storage
+
+
+class ConformanceError(AssertionError):
+    pass
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """
+    Результат замера одной операции:
+    operation: str - название операции
+    count: int - количество выполненных операций
+    seconds: float - суммарное время в секундах
+    ops_per_second: float - операций в секунду
+    """
+    operation: str
+    count: int
+    seconds: float
+    ops_per_second: float
+
+
+StorageFactory = Callable[[str], Storage]
+"""
+Создает новое пустое хранилище, аргумент - временная папка для файлов хранилища
+"""
+
+
+def _check(condition: bool, message: str):
+    if not condition:
+        raise ConformanceError(message)
+
+
+def _check_equal(actual, expected, message: str):
+    if actual != expected:
+        raise ConformanceError(f"{message}: ожидалось {expected!r}, получено {actual!r}")
+
+
+def _check_score(storage: Storage, user_id: int, expected: tuple):
+    score_query = storage.get_user_score(user_id)
+    _check(score_query.success, f"get_user_score({user_id}) завершился ошибкой")
+    score = score_query.data
+
+    # win_rate в MySQL хранится как FLOAT, поэтому винрейт сравнивается приблизительно
+    _check(score is not None and score[:3] == expected[:3] and score[4:] == expected[4:]
+           and (score[3] is None) == (expected[3] is None)
+           and (score[3] is None or abs(score[3] - expected[3]) < 1e-5),
+           f"get_user_score({user_id}): ожидалось {expected!r}, получено {score!r}")
+
+
+def _settle(storage: Storage):
+    """
+    Записывает накопленную отложенной записью статистику, после этого таблица лидеров и места учитывают все игры
+    """
+
+    if storage.write_behind is not None:
+        _check(storage.write_behind.flush(), "запись накопленной статистики завершилась ошибкой")
+
+
+def _add_users(storage: Storage, users_ids):
+    for user_id in users_ids:
+        _check(storage.ensure_user(user_id).success, f"ensure_user({user_id}) завершился ошибкой")
+
+
+def check_register(storage: Storage):
+    _check_equal(storage.ensure_user(1).data, True, "первый ensure_user")
+    _check_equal(storage.ensure_user(1).data, False, "повторный ensure_user")
+    _check_score(storage, 1, (0, 0, 0, None, None))
+    _check_equal(storage.get_user_score(404).data, None, "get_user_score несуществующего пользователя")
+    _check_equal(storage.get_users_ids().data, [1], "get_users_ids")
+
+
+def check_game_result(storage: Storage):
+    _add_users(storage, (1, 2))
+
+    _check(storage.record_game_result(1, 2).success, "record_game_result завершился ошибкой")
+    _check_score(storage, 1, (1, 0, 0, 1.0, None))
+    _check_score(storage, 2, (0, 1, 0, 0.0, None))
+
+    _check(storage.record_draw(1, 2).success, "record_draw завершился ошибкой")
+    _check(storage.record_game_result(2, 1).success, "record_game_result завершился ошибкой")
+    _settle(storage)
+    _check_score(storage, 1, (1, 1, 1, 0.5, None))
+    _check_score(storage, 2, (1, 1, 1, 0.5, None))
+
+
+def check_missing_player(storage: Storage):
+    # В режиме отложенной записи результат принимается сразу, а пользователь добавляется при записи в БД
+    if storage.write_behind is not None:
+        return
+
+    _add_users(storage, (1,))
+    _check(not storage.record_game_result(1, 404).success, "record_game_result с несуществующим игроком успешен")
+    _check(not storage.record_draw(1, 404).success, "record_draw с несуществующим игроком успешен")
+
+
+def check_nicknames(storage: Storage):
+    _add_users(storage, (1, 2, 3))
+    # Ник не должен менять текст запроса
+    nickname = "Robert'); DROP TABLE users; --"
+
+    _check(storage.set_nickname(1, nickname).success, "set_nickname завершился ошибкой")
+    _check(storage.set_nickname(2, "Игрок 2").success, "set_nickname завершился ошибкой")
+    _check_equal(storage.get_nickname(1).data, nickname, "get_nickname")
+    _check_equal(storage.get_nickname(3).data, None, "get_nickname пользователя без ника")
+    _check_equal(storage.get_nickname(404).data, None, "get_nickname несуществующего пользователя")
+    _check_equal(storage.get_nicknames([1, 2, 3, 404, 1]).data, {1: nickname, 2: "Игрок 2", 3: None},
+                 "get_nicknames")
+
+    _check(storage.set_nickname(2, "Игрок два").success, "set_nickname завершился ошибкой")
+    _check_equal(storage.get_nickname(2).data, "Игрок два", "get_nickname после смены ника")
+    _check_score(storage, 2, (0, 0, 0, None, "Игрок два"))
+
+
+def _play_ladder(storage: Storage):
+    """
+    Игроки 1..6 играют по 6 игр с игроком 7, игрок i выигрывает i из них (винрейт i / 6). Игрок 7 выигрывает 15 из
+    36 игр (винрейт 0.417), игрок 8 не играет
+    """
+
+    _add_users(storage, range(1, 9))
+
+    for user_id in range(1, 7):
+        for game in range(6):
+            if game < user_id:
+                storage.record_game_result(user_id, 7)
+            else:
+                storage.record_game_result(7, user_id)
+
+    _settle(storage)
+
+
+def check_leaders(storage: Storage):
+    _play_ladder(storage)
+
+    leaders_query = storage.get_leaders()
+    _check(leaders_query.success, "get_leaders завершился ошибкой")
+    leaders = leaders_query.data
+    _check_equal([i[0] for i in leaders], ["6", "5", "4", "3", "7"], "порядок таблицы лидеров")
+    _check(all(abs(rate - expected) < 1e-5 for (_, rate), expected in zip(leaders, (1, 5 / 6, 4 / 6, 0.5, 15 / 36))),
+           f"винрейты таблицы лидеров: {leaders!r}")
+    _check(storage.get_leaders().data is leaders, "неизменная таблица лидеров должна возвращать тот же картеж")
+
+    _check(storage.set_nickname(6, "leader").success, "set_nickname завершился ошибкой")
+    _check_equal(storage.get_leaders().data[0][0], "leader", "ник в таблице лидеров")
+
+    # Игрок 1 (винрейт 1 / 6) выигрывает 30 игр подряд и попадает в таблицу
+    for _ in range(30):
+        storage.record_game_result(1, 8)
+
+    _settle(storage)
+    _check_equal([i[0] for i in storage.get_leaders().data], ["leader", "1", "5", "4", "3"],
+                 "таблица лидеров после серии побед")
+
+
+def check_rank(storage: Storage):
+    _play_ladder(storage)
+
+    _check_equal(storage.get_user_rank(6).data, (1, 7), "место лучшего игрока")
+    _check_equal(storage.get_user_rank(7).data, (5, 7), "место игрока 7")
+    _check_equal(storage.get_user_rank(1).data, (7, 7), "место худшего игрока")
+    _check_equal(storage.get_user_rank(8).data, None, "место игрока без игр")
+
+    storage.record_game_result(8, 1)
+    _settle(storage)
+    _check_equal(storage.get_user_rank(8).data, (1, 8), "место игрока после первой победы")
+
+
+def check_users_scores(storage: Storage):
+    _play_ladder(storage)
+    storage.set_nickname(3, "three")
+
+    scores_query = storage.get_users_scores()
+    _check(scores_query.success, "get_users_scores завершился ошибкой")
+    _check_equal(len(scores_query.data), 8, "количество пользователей в get_users_scores")
+    _check_equal(dict(storage.iter_users_scores(batch_size=3)), scores_query.data, "iter_users_scores")
+    _check_equal(sorted(storage.iter_users_ids(batch_size=3)), list(range(1, 9)), "iter_users_ids")
+    _check_equal(sorted(storage.get_users_ids().data), list(range(1, 9)), "get_users_ids")
+    _check_equal(scores_query.data[3][4], "three", "ник в get_users_scores")
+
+
+def check_stats_deltas(storage: Storage):
+    _check_equal(storage.get_applied_stats_sequence().data, 0, "номер записанного результата пустого журнала")
+    _add_users(storage, (1,))
+
+    _check(storage.apply_stats_deltas({1: [2, 1, 0], 500: [0, 1, 1]}, 10).success,
+           "apply_stats_deltas завершился ошибкой")
+    _check_score(storage, 1, (2, 1, 0, 2 / 3, None))
+    _check_score(storage, 500, (0, 1, 1, 0.0, None))
+    _check_equal(storage.get_applied_stats_sequence().data, 10, "номер записанного результата")
+
+    # Номер записанного результата не уменьшается
+    _check(storage.apply_stats_deltas({1: [0, 0, 3]}, 5).success, "apply_stats_deltas завершился ошибкой")
+    _check_equal(storage.get_applied_stats_sequence().data, 10, "номер записанного результата после меньшего")
+    _check_score(storage, 1, (2, 1, 3, 2 / 3, None))
+    _check_equal(storage.get_user_rank(1).data, (1, 2), "место после apply_stats_deltas")
+
+
+def check_concurrent_games(storage: Storage, threads: int = 8, games_per_thread: int = 200):
+    users_ids = list(range(1, 21))
+    _add_users(storage, users_ids)
+    expected = {user_id: [0, 0] for user_id in users_ids}
+    schedules = []
+
+    for thread in range(threads):
+        rng = random.Random(thread)
+        schedule = [tuple(rng.sample(users_ids, 2)) for _ in range(games_per_thread)]
+        schedules.append(schedule)
+
+        for winner_id, loser_id in schedule:
+            expected[winner_id][0] += 1
+            expected[loser_id][1] += 1
+
+    errors = []
+
+    def _play(schedule):
+        for winner_id, loser_id in schedule:
+            if not storage.record_game_result(winner_id, loser_id).success:
+                errors.append((winner_id, loser_id))
+
+    workers = [threading.Thread(target=_play, args=(schedule,)) for schedule in schedules]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    _settle(storage)
+    _check(not errors, f"record_game_result завершился ошибкой для {len(errors)} игр")
+
+    for user_id, (wins, loses) in expected.items():
+        _check_score(storage, user_id, (wins, loses, 0, wins / (wins + loses), None))
+
+
+CHECKS = (
+    check_register,
+    check_game_result,
+    check_missing_player,
+    check_nicknames,
+    check_leaders,
+    check_rank,
+    check_users_scores,
+    check_stats_deltas,
+    check_concurrent_games
+)
+
+
+def run_conformance(factory: StorageFactory) -> [(str, str | None)]:
+    """
+    Выполняет все проверки CHECKS, каждую на новом хранилище
+    :return: список пар (название проверки, текст ошибки или None - если проверка пройдена)
+    """
+
+    out_list = []
+
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = factory(directory)
+
+            try:
+                check(storage)
+                out_list.append((check.__name__, None))
+            except ConformanceError as e:
+                out_list.append((check.__name__, str(e)))
+            except Exception:
+                out_list.append((check.__name__, traceback.format_exc()))
+            finally:
+                storage.close()
+
+    return out_list
+
+
+def _measure(operation: str, func: Callable, args_list: list) -> BenchmarkResult:
+    started = time.perf_counter()
+
+    for args in args_list:
+        func(*args)
+
+    seconds = time.perf_counter() - started
+
+    return BenchmarkResult(operation, len(args_list), seconds, len(args_list) / seconds if seconds > 0 else 0.0)
+
+
+def run_benchmark(factory: StorageFactory, users: int = 1000, games: int = 5000,
+                  threads: int = 8) -> [BenchmarkResult]:
+    """
+    Замеряет основные операции хранилища на одном сценарии: добавление users пользователей, games результатов игр
+    подряд и из threads потоков, чтения статистики, ников, таблицы лидеров и мест
+    """
+
+    rng = random.Random(0)
+    users_ids = list(range(1, users + 1))
+    pairs = [tuple(rng.sample(users_ids, 2)) for _ in range(games)]
+    lookups = [(rng.choice(users_ids),) for _ in range(games)]
+    out_list = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = factory(directory)
+
+        try:
+            out_list.append(_measure("ensure_user (новые)", storage.ensure_user, [(i,) for i in users_ids]))
+            out_list.append(_measure("ensure_user (известные)", storage.ensure_user, lookups))
+            out_list.append(_measure("record_game_result", storage.record_game_result, pairs))
+
+            started = time.perf_counter()
+            workers = [
+                threading.Thread(target=lambda part: [storage.record_game_result(*pair) for pair in part],
+                                 args=(pairs[i::threads],))
+                for i in range(threads)
+            ]
+
+            for worker in workers:
+                worker.start()
+
+            for worker in workers:
+                worker.join()
+
+            seconds = time.perf_counter() - started
+            out_list.append(BenchmarkResult(f"record_game_result ({threads} потоков)", games, seconds,
+                                            games / seconds if seconds > 0 else 0.0))
+
+            _settle(storage)
+            out_list.append(_measure("get_user_score", storage.get_user_score, lookups))
+            out_list.append(_measure("set_nickname", storage.set_nickname,
+                                     [(user_id, f"player {user_id}") for (user_id,) in lookups[:users]]))
+            out_list.append(_measure("get_nicknames (10 id)", storage.get_nicknames,
+                                     [([i[0] for i in lookups[j:j + 10]],) for j in range(0, games, 10)]))
+            out_list.append(_measure("get_leaders", storage.get_leaders, [()] * games))
+            out_list.append(_measure("get_user_rank", storage.get_user_rank, lookups))
+        finally:
+            storage.close()
+
+    return out_list
+
+
+def _mysql_factory(db_connect_kwargs: dict) -> StorageFactory:
+    import mysql.connector
+
+    from database.database_utils import DatabaseAPI
+
+    def factory(directory: str) -> Storage:
+        connection = mysql.connector.connect(**db_connect_kwargs)
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS users, stats_journal_state")
+        finally:
+            connection.close()
+
+        return DatabaseAPI(db_connect_kwargs)
+
+    return factory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mysql", type=str, nargs=3, default=None,
+                        metavar=("DATABASE_NAME", "DATABASE_USER", "DATABASE_PASSWORD"),
+                        help="проверить и DatabaseAPI на тестовой БД (её таблицы удаляются)")
+    parser.add_argument("--users", type=int, default=1000, help="количество пользователей в бенчмарке")
+    parser.add_argument("--games", type=int, default=5000, help="количество игр в бенчмарке")
+    parser.add_argument("--skip_benchmark", action="store_true")
+    args = parser.parse_args()
+
+    factories = [
+        ("memory", lambda directory: MemoryStorage()),
+        ("sqlite", lambda directory: SQLiteStorage(os.path.join(directory, "storage.db"))),
+        ("sqlite, write-behind", lambda directory: SQLiteStorage(
+            os.path.join(directory, "storage.db"), stats_journal_path=os.path.join(directory, "stats.journal")
+        ))
+    ]
+
+    if args.mysql is not None:
+        factories.append(("mysql", _mysql_factory({
+            "host": "localhost",
+            "user": args.mysql[1],
+            "password": args.mysql[2],
+            "database": args.mysql[0]
+        })))
+
+    failed = 0
+
+    for name, factory in factories:
+        print(f"== {name}")
+
+        for check_name, error in run_conformance(factory):
+            print(f"  {'OK  ' if error is None else 'FAIL'} {check_name}")
+
+            if error is not None:
+                failed += 1
+                print(f"       {error}")
+
+        if not args.skip_benchmark:
+            for result in run_benchmark(factory, users=args.users, games=args.games):
+                print(f"  {result.operation:>36}: {result.ops_per_second:12.0f} оп/с ({result.count} за "
+                      f"{result.seconds:.3f} с)")
+
+    if failed:
+        raise SystemExit(f"Не пройдено проверок: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# --------------------------------------------------------------------------
+# Пул соединений с БД
+#
+# Раньше каждый запрос DatabaseAPI открывал новое соединение с MySQL (TCP и
+# авторизация), и один законченный матч стоил несколько таких соединений.
+# ConnectionPool держит до size открытых соединений и выдает их запросам:
+# - соединение старше max_lifetime закрывается вместо возврата в пул
+# - соединение простоявшее дольше health_check_interval проверяется ping
+#   перед выдачей, мертвые соединения закрываются и заменяются новыми
+# - если все соединения заняты, запрос ждет не дольше acquire_timeout
+#
+# Для каждого соединения пул хранит подготовленные на сервере запросы
+# (execute): запрос разбирается сервером один раз за время жизни соединения,
+# а параметры передаются отдельно от текста запроса
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from mysql.connector import connect, Error
+from mysql.connector.errors import PoolError
+
+
+@dataclasses.dataclass
+class PoolMetrics:
+    """
+    Статистика пула соединений:
+    size: int - максимальное количество соединений
+    open: int - количество открытых соединений
+    idle: int - количество свободных соединений
+    checkouts: int - количество выданных соединений
+    created: int - количество открытых за все время соединений
+    closed: int - количество закрытых соединений (истек срок жизни, не прошли проверку или сломались)
+    timeouts: int - количество запросов не дождавшихся соединения
+    mean_wait: float - среднее время ожидания соединения в секундах
+    p99_wait: float - 99-й перцентиль этого времени по последним запросам в секундах
+    max_wait: float - максимальное время ожидания соединения в секундах
+    mean_checkout: float - среднее время использования соединения запросом в секундах
+    max_checkout: float - максимальное время использования соединения запросом в секундах
+    prepared: int - количество подготовленных запросов во всех открытых соединениях
+    """
+    size: int
+    open: int
+    idle: int
+    checkouts: int
+    created: int
+    closed: int
+    timeouts: int
+    mean_wait: float
+    p99_wait: float
+    max_wait: float
+    mean_checkout: float
+    max_checkout: float
+    prepared: int
+
+
+class _PooledConnection:
+    __slots__ = ("connection", "created_at", "last_used_at")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    def __init__(self, connect_kwargs: {str: str}, size: int = 8, max_lifetime: float = 3600.0,
+                 acquire_timeout: float = 5.0, health_check_interval: float = 10.0, wait_window: int = 1024):
+        """
+        :param connect_kwargs: словарь с аргументами для соединения с БД
+        :param size: максимальное количество одновременно открытых соединений
+        :param max_lifetime: время в секундах, после которого соединение закрывается и заменяется новым
+        :param acquire_timeout: максимальное время ожидания свободного соединения в секундах
+        :param health_check_interval: время простоя в секундах, после которого соединение проверяется перед выдачей
+        :param wait_window: количество последних запросов по которым считается p99_wait
+        """
+
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: deque[_PooledConnection] = deque()
+        self._open = 0
+        self._condition = threading.Condition()
+        self._is_closed = False
+
+        self._checkouts = 0
+        self._created = 0
+        self._closed = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recent_waits = deque(maxlen=wait_window)
+        self._total_checkout = 0.0
+        self._max_checkout = 0.0
+
+        self._statements: {int: {str: any}} = {}
+        """
+        _statements: {id(connection): int, {operation: str, cursor}}
+        Курсоры подготовленных запросов открытых соединений. Соединение в каждый момент используется одним потоком,
+        поэтому словарь одного соединения не требует блокировки
+        """
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """
+        Выдает соединение на время выполнения блока with и возвращает его в пул. Незавершенная транзакция
+        откатывается, а соединение на котором блок завершился ошибкой БД закрывается
+        :raises PoolError: если свободное соединение не появилось за acquire_timeout секунд
+        """
+
+        pooled = self._acquire()
+        checkout_started = time.perf_counter()
+        is_broken = False
+
+        try:
+            yield pooled.connection
+        except Error:
+            is_broken = True
+            raise
+        finally:
+            self._release(pooled, time.perf_counter() - checkout_started, is_broken)
+
+    def execute(self, connection, operation: str, params: tuple = ()):
+        """
+        Выполняет подготовленный запрос на соединении выданном connection. Запрос подготавливается при первом
+        выполнении на этом соединении, дальше переиспользуется, если operation - тот же объект строки (поэтому
+        запросы стоит хранить в константах, а не собирать при каждом вызове)
+        :param connection: соединение выданное connection
+        :param operation: текст запроса с %s на месте параметров, один запрос без multi
+        :param params: параметры запроса
+        :return: курсор с результатом запроса, результат нужно прочитать до следующего запроса на этом соединении
+        """
+
+        statements = self._statements.get(id(connection))
+
+        if statements is None:
+            statements = self._statements[id(connection)] = {}
+
+        cursor = statements.get(operation)
+
+        if cursor is None:
+            cursor = statements[operation] = connection.cursor(prepared=True)
+
+        cursor.execute(operation, params)
+
+        return cursor
+
+    def metrics(self) -> PoolMetrics:
+        with self._condition:
+            waits = sorted(self._recent_waits)
+
+            return PoolMetrics(
+                size=self.size,
+                open=self._open,
+                idle=len(self._idle),
+                checkouts=self._checkouts,
+                created=self._created,
+                closed=self._closed,
+                timeouts=self._timeouts,
+                mean_wait=self._total_wait / self._checkouts if self._checkouts else 0.0,
+                p99_wait=waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                max_wait=self._max_wait,
+                mean_checkout=self._total_checkout / self._checkouts if self._checkouts else 0.0,
+                max_checkout=self._max_checkout,
+                prepared=sum(len(i) for i in list(self._statements.values()))
+            )
+
+    def close(self):
+        """
+        Закрывает свободные соединения, занятые соединения закрываются при возврате
+        """
+
+        with self._condition:
+            self._is_closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._closed += len(idle)
+            self._condition.notify_all()
+
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def _take(self, deadline: float) -> (_PooledConnection | None, [_PooledConnection]):
+        """
+        Ждет свободное соединение или место для нового
+        :return: свободное соединение (или None - если нужно открыть новое) и соединения с истекшим сроком жизни,
+        которые нужно закрыть
+        """
+
+        expired = []
+
+        with self._condition:
+            while True:
+                if self._is_closed:
+                    raise PoolError(msg="Пул соединений закрыт")
+
+                now = time.monotonic()
+
+                while self._idle:
+                    # Последнее возвращенное соединение - самое "горячее" и реже всего требует проверки
+                    pooled = self._idle.pop()
+
+                    if now - pooled.created_at < self.max_lifetime:
+                        return pooled, expired
+
+                    self._open -= 1
+                    self._closed += 1
+                    expired.append(pooled)
+
+                if self._open < self.size:
+                    self._open += 1
+
+                    return None, expired
+
+                timeout = deadline - time.perf_counter()
+
+                if timeout <= 0:
+                    self._timeouts += 1
+
+                    raise PoolError(msg=f"Нет свободного соединения с БД за {self.acquire_timeout} с")
+
+                self._condition.wait(timeout)
+
+    def _acquire(self) -> _PooledConnection:
+        started = time.perf_counter()
+        deadline = started + self.acquire_timeout
+
+        while True:
+            pooled, expired = self._take(deadline)
+
+            for old in expired:
+                self._close_quietly(old)
+
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(connect(**self.connect_kwargs))
+                except BaseException:
+                    with self._condition:
+                        self._open -= 1
+                        self._condition.notify()
+
+                    raise
+
+                with self._condition:
+                    self._created += 1
+
+            elif time.monotonic() - pooled.last_used_at > self.health_check_interval and not self._is_alive(pooled):
+                self._discard(pooled)
+
+                continue
+
+            wait = time.perf_counter() - started
+
+            with self._condition:
+                self._checkouts += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                self._recent_waits.append(wait)
+
+            return pooled
+
+    def _release(self, pooled: _PooledConnection, checkout_time: float, is_broken: bool):
+        if not is_broken:
+            try:
+                # Иначе следующий запрос на этом соединении продолжит чужую транзакцию и будет читать старый снимок
+                if pooled.connection.in_transaction:
+                    pooled.connection.rollback()
+            except Error:
+                is_broken = True
+
+        now = time.monotonic()
+        is_expired = now - pooled.created_at >= self.max_lifetime
+
+        with self._condition:
+            self._total_checkout += checkout_time
+            self._max_checkout = max(self._max_checkout, checkout_time)
+
+            if is_broken or is_expired or self._is_closed:
+                self._open -= 1
+                self._closed += 1
+            else:
+                pooled.last_used_at = now
+                self._idle.append(pooled)
+
+            self._condition.notify()
+
+        if is_broken or is_expired or self._is_closed:
+            self._close_quietly(pooled)
+
+    def _discard(self, pooled: _PooledConnection):
+        with self._condition:
+            self._open -= 1
+            self._closed += 1
+            self._condition.notify()
+
+        self._close_quietly(pooled)
+
+    @staticmethod
+    def _is_alive(pooled: _PooledConnection) -> bool:
+        try:
+            return pooled.connection.is_connected()
+        except Error:
+            return False
+
+    def _close_quietly(self, pooled: _PooledConnection):
+        # Подготовленные запросы удаляются сервером вместе с соединением
+        self._statements.pop(id(pooled.connection), None)
+
+        try:
+            pooled.connection.close()
+        except Error:
+            pass
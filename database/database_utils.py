@@ -1,20 +1,11 @@
-import dataclasses
 import datetime
+from typing import Iterator
 
-from mysql.connector import connect, Error, MySQLConnection, CMySQLConnection
+from mysql.connector import Error, MySQLConnection, CMySQLConnection, errorcode
 from mysql.connector.pooling import PooledMySQLConnection
 
-
-@dataclasses.dataclass
-class DatabaseOperationResult:
-    """
-    Данные о запросе к БД:
-    succes: bool - успешен запрос или нет
-    data: int or [int] or {int: (int, int, int)} or (int, int, int) or None - если запрос к БД подразумевает возвращение
-    данных и запрос был успешен, то содержит возвращаемые данные, в противном случае - None
-    """
-    success: bool
-    data: any
+from database.connection_pool import ConnectionPool
+from database.storage import DatabaseOperationResult, Storage, StorageError
 
 
 def _log(error: Error, func_name: str):
@@ -22,12 +13,61 @@ def _log(error: Error, func_name: str):
     print(f"{str(date)}: (запрос к БД послал ошибку) {func_name} => {error.msg}")
 
 
-class DatabaseAPI:
-    def __init__(self, db_connect_kwargs):
+class DatabaseAPI(Storage):
+    """
+    Хранилище в MySQL
+    """
+
+    # Запросы выполняемые через ConnectionPool.execute: каждый подготавливается сервером один раз на соединение,
+    # параметры передаются отдельно от текста запроса. Запросы из нескольких команд (multi) подготовить нельзя, их
+    # параметры экранируются драйвером
+    _SELECT_USERS_IDS = "SELECT id FROM users"
+    _SELECT_USERS_SCORES = "SELECT * FROM users"
+    _SELECT_USER_SCORE = "SELECT * FROM users WHERE id = %s"
+    # Без изменений строки MySQL возвращает 0 измененных строк, для новой строки - 1
+    _UPSERT_USER = "INSERT INTO users VALUES (%s, 0, 0, 0, NULL, NULL) ON DUPLICATE KEY UPDATE id = id"
+    _SELECT_APPLIED_SEQUENCE = "SELECT applied_sequence FROM stats_journal_state WHERE id = 1"
+    _SELECT_NICKNAME = "SELECT nickname FROM users WHERE id = %s"
+    _UPDATE_NICKNAME = "UPDATE users SET nickname = %s WHERE id = %s"
+
+    # Строки пользователей в виде нужном Leaderboard: (id, ник, винрейт, количество игр)
+    _LEADERBOARD_SELECT = "SELECT id, nickname, win_rate, wins + loses + draws FROM users"
+    _SELECT_LEADERS = _LEADERBOARD_SELECT + " ORDER BY win_rate DESC LIMIT %s"
+
+    # Максимальное количество id в одном запросе с IN (select_scores, select_nicknames)
+    _IN_CHUNK_SIZE = 1000
+
+    def __init__(self, db_connect_kwargs, pool_size: int = 8, max_lifetime: float = 3600.0,
+                 acquire_timeout: float = 5.0, health_check_interval: float = 10.0,
+                 stats_journal_path: str | None = None, stats_flush_interval: float = 1.0,
+                 stats_flush_threshold: int = 256, profile_cache_size: int = 10000,
+                 profile_cache_ttl: float = 300.0, load_rank_index: bool = True):
+        """
+        :param db_connect_kwargs: словарь с аргументами для соединения с БД
+        :param pool_size: максимальное количество одновременно открытых соединений с БД
+        :param max_lifetime: время в секундах, после которого соединение с БД переоткрывается
+        :param acquire_timeout: максимальное время ожидания свободного соединения в секундах
+        :param health_check_interval: время простоя в секундах, после которого соединение проверяется перед запросом
+        :param stats_journal_path: путь к журналу отложенной записи статистики, или None - если результаты игр
+        записываются в БД сразу
+        :param stats_flush_interval: период отложенной записи статистики в секундах
+        :param stats_flush_threshold: количество пользователей с незаписанной статистикой, при котором запись
+        начинается досрочно
+        :param profile_cache_size: максимальное количество пользователей в кэше профилей
+        :param profile_cache_ttl: время жизни данных в кэше профилей в секундах
+        :param load_rank_index: загрузить индекс мест сразу, или False - если индекс загрузится при первом get_user_rank
+        """
+
         self.db_connect_kwargs = db_connect_kwargs
 
+        self.pool = ConnectionPool(db_connect_kwargs, size=pool_size, max_lifetime=max_lifetime,
+                                   acquire_timeout=acquire_timeout, health_check_interval=health_check_interval)
+        """
+        Пул соединений с БД общий для всех запросов
+        """
+
         # Создаем таблицу с данными пользователя если её нет
-        with connect(**self.db_connect_kwargs) as connection:
+        with self.pool.connection() as connection:
             with connection.cursor() as cursor:
                 try:
                     cursor.execute(
@@ -38,72 +78,94 @@ class DatabaseAPI:
                                 loses INT UNSIGNED,
                                 draws INT UNSIGNED,
                                 win_rate FLOAT,
-                                nickname TEXT
+                                nickname TEXT,
+                                INDEX win_rate_index (win_rate)
+                            )
+                        """
+                    )
+                    cursor.execute(
+                        """
+                            CREATE TABLE IF NOT EXISTS stats_journal_state(
+                                id TINYINT PRIMARY KEY NOT NULL,
+                                applied_sequence BIGINT UNSIGNED NOT NULL
                             )
                         """
                     )
                 except Error as e:
                     _log(e, "DatabaseAPI.__init__")
 
+                # Таблицы созданные до появления индекса. Индекс нужен только для загрузки таблицы лидеров
+                try:
+                    cursor.execute("ALTER TABLE users ADD INDEX win_rate_index (win_rate)")
+                except Error as e:
+                    if e.errno != errorcode.ER_DUP_KEYNAME:
+                        _log(e, "DatabaseAPI.__init__")
+
+        super().__init__(stats_journal_path=stats_journal_path, stats_flush_interval=stats_flush_interval,
+                         stats_flush_threshold=stats_flush_threshold, profile_cache_size=profile_cache_size,
+                         profile_cache_ttl=profile_cache_ttl, load_rank_index=load_rank_index)
+
     # Данный декоратор автоматически вставляет в первый аргумент функции класс позволяющий работать с БД для того чтобы
-    # не приходилось прописывать это каждый раз при добавлении нового API для работы с БД
+    # не приходилось прописывать это каждый раз при добавлении нового API для работы с БД. Соединение берется из пула
+    # и возвращается в него после запроса. Ошибки БД не перехватываются внутри запросов: выйдя из блока with, ошибка
+    # помечает соединение сломанным и пул закрывает его вместо возврата, а wrapper возвращает неуспешный результат
     @staticmethod
     def _database_operation(func):
         match func.__name__:
-            case "get_users_ids" | "get_users_scores" | "get_leaders":
+            case "get_users_ids" | "select_users_scores" | "get_applied_stats_sequence":
                 def wrapper(self):
-                    with connect(**self.db_connect_kwargs) as connection:
-                        try:
-                            data = func(self, connection)
-                            connection.close()
+                    try:
+                        with self.pool.connection() as connection:
+                            return func(self, connection)
+                    except Error as e:
+                        _log(e, func.__name__)
 
-                            return data
-                        except Error as e:
-                            _log(e, func.__name__)
-
-                            return DatabaseOperationResult(False, None)
+                        return DatabaseOperationResult(False, None)
 
                 out_func = wrapper
-            case "set_nickname":
+            case "write_nickname":
                 def wrapper(self, user_id: int, nickname: str):
-                    with connect(**self.db_connect_kwargs) as connection:
-                        try:
-                            data = func(self, connection, user_id, nickname)
-                            connection.close()
-
-                            return data
-                        except Error as e:
-                            _log(e, func.__name__)
+                    try:
+                        with self.pool.connection() as connection:
+                            return func(self, connection, user_id, nickname)
+                    except Error as e:
+                        _log(e, func.__name__)
 
-                            return DatabaseOperationResult(False, None)
+                        return DatabaseOperationResult(False, None)
 
                 out_func = wrapper
-            case "get_nicknames":
+            case "select_nicknames" | "select_scores":
                 def wrapper(self, users_ids: [int]):
-                    with connect(**self.db_connect_kwargs) as connection:
-                        try:
-                            data = func(self, connection, users_ids)
-                            connection.close()
+                    try:
+                        with self.pool.connection() as connection:
+                            return func(self, connection, users_ids)
+                    except Error as e:
+                        _log(e, func.__name__)
 
-                            return data
-                        except Error as e:
-                            _log(e, func.__name__)
+                        return DatabaseOperationResult(False, None)
 
-                            return DatabaseOperationResult(False, None)
+                out_func = wrapper
+            case "write_game_result" | "write_draw" | "write_stats_deltas":
+                def wrapper(self, first_arg, second_arg):
+                    try:
+                        with self.pool.connection() as connection:
+                            return func(self, connection, first_arg, second_arg)
+                    except Error as e:
+                        _log(e, func.__name__)
+
+                        return DatabaseOperationResult(False, None)
 
                 out_func = wrapper
             case _:
+                # Запросы с одним аргументом, обычно id пользователя
                 def wrapper(self, user_id: int):
-                    with connect(**self.db_connect_kwargs) as connection:
-                        try:
-                            data = func(self, connection, user_id)
-                            connection.close()
+                    try:
+                        with self.pool.connection() as connection:
+                            return func(self, connection, user_id)
+                    except Error as e:
+                        _log(e, func.__name__)
 
-                            return data
-                        except Error as e:
-                            _log(e, func.__name__)
-
-                            return DatabaseOperationResult(False, None)
+                        return DatabaseOperationResult(False, None)
 
                 out_func = wrapper
 
@@ -122,337 +184,375 @@ class DatabaseAPI:
         """
         out_list = []
 
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute("SELECT id FROM users")
-                result = cursor.fetchall()
+        cursor = self.pool.execute(conn, self._SELECT_USERS_IDS)
+        result = cursor.fetchall()
 
-                for row in result:
-                    out_list.append(int(row[0]))
+        for row in result:
+            out_list.append(int(row[0]))
 
-                return DatabaseOperationResult(True, out_list)
-            except Error as e:
-                _log(e, "get_users_ids")
-
-                return DatabaseOperationResult(False, None)
+        return DatabaseOperationResult(True, out_list)
 
     @_database_operation
-    def get_users_scores(self,
-                         conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None
-                         ) -> DatabaseOperationResult:
+    def select_users_scores(self,
+                            conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None
+                            ) -> DatabaseOperationResult:
         """
-        Возвращает данные о всех пользователей в БД в виде экземпляра класса DatabaseOperationResult где в случае успеха
-        data это словарь где ключ - id пользователя, значение - картеж из 4 чисел и строки: количество побед, количество
-        поражений, количество ничьих, винрейт, никнейм; в противном случае - None
+        Читает из БД данные всех пользователей для get_users_scores
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
         :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
         """
         out_dict = {}
 
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute("SELECT * FROM users")
-                result = cursor.fetchall()
+        cursor = self.pool.execute(conn, self._SELECT_USERS_SCORES)
+        result = cursor.fetchall()
 
-                for row in result:
-                    out_dict[row[0]] = (row[1], row[2], row[3], row[4], row[5])
+        for row in result:
+            out_dict[row[0]] = (row[1], row[2], row[3], row[4], row[5])
 
-                return DatabaseOperationResult(True, out_dict)
-            except Error as e:
-                _log(e, "get_users_scores")
+        return DatabaseOperationResult(True, out_dict)
 
-                return DatabaseOperationResult(False, None)
+    def iter_users_ids(self, batch_size: int = 1000) -> Iterator[int]:
+        """
+        Как get_users_ids, но id читаются с сервера частями по batch_size через небуферизованный курсор, поэтому
+        память не зависит от количества пользователей. Соединение с БД занято, пока генератор не исчерпан или не закрыт
 
-    @_database_operation
-    def get_user_score(self,
-                       conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                       user_id: int) -> DatabaseOperationResult:
+        :arg batch_size: количество строк читаемых с сервера за раз
+        :raises StorageError: если запрос к БД завершился ошибкой
         """
-        Возвращает данные о пользователе в БД по его id в виде экземпляра класса DatabaseOperationResult где в случае
-        успеха data это картеж из 4 чисел и строки: количество побед, количество поражений, количество ничьих, винрейт,
-        никнейм; в противном случае - None
+        for row in self._iter_rows(self._SELECT_USERS_IDS, batch_size, "iter_users_ids"):
+            yield int(row[0])
 
-        :arg conn: подключение к БД, автоматически заполняется декоратором
-        :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: (int, int, int, int, str) | None)
+    def iter_users_rows(self, batch_size: int = 1000) -> Iterator[tuple]:
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"SELECT * FROM users WHERE id = {user_id}")
-                rows = cursor.fetchall()
+        Читает строки всех пользователей для iter_users_scores через небуферизованный курсор. Соединение с БД занято,
+        пока генератор не исчерпан или не закрыт
 
-                if len(rows) == 1:
-                    result = rows[0]
+        :arg batch_size: количество строк читаемых с сервера за раз
+        :return: генератор строк (id, победы, поражения, ничьи, винрейт, никнейм)
+        :raises StorageError: если запрос к БД завершился ошибкой
+        """
+        return self._iter_rows(self._SELECT_USERS_SCORES, batch_size, "iter_users_rows")
 
-                    return DatabaseOperationResult(True, (result[1], result[2], result[3], result[4], result[5]))
-                else:
-                    return DatabaseOperationResult(True, None)
-            except Error as e:
-                _log(e, "get_user_score")
+    def _iter_rows(self, operation: str, batch_size: int, func_name: str) -> Iterator[tuple]:
+        try:
+            with self.pool.connection() as connection:
+                # Обычный курсор без buffered не читает результат целиком, строки приходят с сервера по fetchmany.
+                # При закрытии генератора до конца оставшиеся строки дочитываются и отбрасываются при закрытии курсора
+                with connection.cursor() as cursor:
+                    cursor.execute(operation)
 
-                return DatabaseOperationResult(False, None)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+
+                        if not rows:
+                            return
+
+                        yield from rows
+        except Error as e:
+            _log(e, func_name)
+
+            raise StorageError(func_name) from e
 
     @_database_operation
-    def is_user_in_bd(self,
-                      conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                      user_id: int) -> DatabaseOperationResult:
+    def select_user_score(self,
+                          conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                          user_id: int) -> DatabaseOperationResult:
         """
-        Возвращает данные о наличии пользователя в БД по его id в виде экземпляра класса DatabaseOperationResult где,
-        в случае успеха data это True если пользователь есть в БД и False - если нет, в противном случае - None
+        Читает из БД данные о пользователе для get_user_score
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
         :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: bool | None)
+        :return: DatabaseOperationResult(success: bool, data: (int, int, int, int, str) | None)
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"SELECT id FROM users WHERE id = {user_id} LIMIT 1")
-                rows = cursor.fetchall()
+        cursor = self.pool.execute(conn, self._SELECT_USER_SCORE, (user_id,))
+        rows = cursor.fetchall()
 
-                if len(rows) == 1:
-                    return DatabaseOperationResult(True, True)
-                else:
-                    return DatabaseOperationResult(True, False)
-            except Error as e:
-                _log(e, "is_user_in_bd")
+        if len(rows) == 1:
+            result = rows[0]
 
-                return DatabaseOperationResult(False, None)
+            return DatabaseOperationResult(True, (result[1], result[2], result[3], result[4], result[5]))
+        else:
+            return DatabaseOperationResult(True, None)
 
     @_database_operation
-    def append_user(self,
-                    conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                    user_id: int) -> DatabaseOperationResult:
+    def select_scores(self,
+                      conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                      users_ids: [int]) -> DatabaseOperationResult:
         """
-        Добавляет нового пользователя в БД
+        Читает из БД данные нескольких пользователей для таблицы лидеров с незаписанной статистикой
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
-        :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: None)
+        :arg users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
         """
+        out_dict = {}
+
         with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"INSERT INTO users VALUE ({user_id}, 0, 0, 0, null, null)")
-                conn.commit()
+            for start in range(0, len(users_ids), self._IN_CHUNK_SIZE):
+                chunk = users_ids[start:start + self._IN_CHUNK_SIZE]
+                cursor.execute(
+                    "SELECT id, wins, loses, draws, win_rate, nickname FROM users "
+                    f"WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk
+                )
 
-                return DatabaseOperationResult(True, None)
-            except Error as e:
-                conn.rollback()
-                _log(e, "append_user")
+                for row in cursor.fetchall():
+                    out_dict[row[0]] = (row[1], row[2], row[3], row[4], row[5])
 
-                return DatabaseOperationResult(False, None)
+            return DatabaseOperationResult(True, out_dict)
 
     @_database_operation
-    def increment_wins(self,
-                       conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                       user_id: int) -> DatabaseOperationResult:
+    def register_user(self,
+                      conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                      user_id: int) -> DatabaseOperationResult:
         """
-        Увеличивает количество побед пользователя в БД на 1 по его id
+        Добавляет пользователя в БД одним идемпотентным upsert, а не проверкой наличия и отдельной вставкой: между
+        ними параллельный обработчик мог успеть добавить того же пользователя
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
         :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: None)
+        :return: DatabaseOperationResult(success: bool, data: bool | None), data - True если пользователь добавлен,
+        False - если он уже был в БД
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute("SELECT id, wins, loses, draws FROM users "
-                               f"WHERE id = {user_id}")
-                row = cursor.fetchall()[0]
-                row = (row[0], row[1] + 1, row[2], row[3])
+        cursor = self.pool.execute(conn, self._UPSERT_USER, (user_id,))
+        is_new = cursor.rowcount == 1
+        conn.commit()
 
-                cursor.execute(
-                    "UPDATE users "
-                    f"SET id={row[0]}, wins={row[1]}, loses={row[2]}, draws={row[3]}, win_rate={row[1] / (row[1] + row[2])}"
-                    f"WHERE id = {user_id}"
-                )
-                conn.commit()
-
-                return DatabaseOperationResult(True, None)
-            except Error as e:
-                conn.rollback()
-                _log(e, "increment_wins")
-
-                return DatabaseOperationResult(False, None)
+        return DatabaseOperationResult(True, is_new)
 
     @_database_operation
-    def increment_loses(self,
-                        conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                        user_id: int) -> DatabaseOperationResult:
+    def write_game_result(self,
+                          conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                          winner_id: int,
+                          loser_id: int) -> DatabaseOperationResult:
         """
-        Увеличивает количество поражений пользователя в БД на 1 по его id
+        Сразу записывает результат игры в БД: победителю +1 победа, проигравшему +1 поражение, обоим пересчитывается
+        винрейт
+
+        Обе строки изменяются одним UPDATE с арифметикой на стороне БД (MySQL выполняет присваивания SET слева
+        направо, поэтому win_rate считается по уже увеличенным wins и loses), а COMMIT отправляется в том же пакете.
+        Результат игры стоит одного обращения к БД и не теряется при одновременных играх одного пользователя. В том же
+        пакете читаются новые строки обоих игроков для таблицы лидеров
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
-        :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: None)
+        :arg winner_id: id победителя
+        :arg loser_id: id проигравшего
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет в БД, data - новые строки игроков
         """
         with conn.cursor() as cursor:
-            try:
-                cursor.execute("SELECT id, wins, loses, draws FROM users "
-                               f"WHERE id = {user_id}")
-                row = cursor.fetchall()[0]
-                row = (row[0], row[1], row[2] + 1, row[3])
+            results = cursor.execute(
+                "UPDATE users "
+                "SET wins = wins + (id = %s), loses = loses + (id = %s), win_rate = wins / (wins + loses) "
+                "WHERE id IN (%s, %s); "
+                f"{self._LEADERBOARD_SELECT} WHERE id IN (%s, %s); "
+                "COMMIT",
+                (winner_id, loser_id, winner_id, loser_id, winner_id, loser_id),
+                multi=True
+            )
+            updated_rows, changed_rows = self._read_multi_results(results)
+
+            return DatabaseOperationResult(updated_rows == 2, changed_rows)
 
-                cursor.execute(
-                    "UPDATE users "
-                    f"SET id={row[0]}, wins={row[1]}, loses={row[2]}, draws={row[3]}, win_rate={row[1] / (row[1] + row[2])}"
-                    f"WHERE id = {user_id}"
-                )
-                conn.commit()
+    @_database_operation
+    def write_draw(self,
+                   conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                   first_user_id: int,
+                   second_user_id: int) -> DatabaseOperationResult:
+        """
+        Сразу записывает ничью обоим игрокам одним UPDATE и читает их новые строки, так же как write_game_result.
+        Винрейт от ничьих не зависит
 
-                return DatabaseOperationResult(True, None)
-            except Error as e:
-                conn.rollback()
-                _log(e, "increment_loses")
+        :arg conn: подключение к БД, автоматически заполняется декоратором
+        :arg first_user_id: id первого игрока
+        :arg second_user_id: id второго игрока
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет в БД, data - новые строки игроков
+        """
+        with conn.cursor() as cursor:
+            results = cursor.execute(
+                "UPDATE users SET draws = draws + 1 WHERE id IN (%s, %s); "
+                f"{self._LEADERBOARD_SELECT} WHERE id IN (%s, %s); "
+                "COMMIT",
+                (first_user_id, second_user_id, first_user_id, second_user_id),
+                multi=True
+            )
+            updated_rows, changed_rows = self._read_multi_results(results)
 
-                return DatabaseOperationResult(False, None)
+            return DatabaseOperationResult(updated_rows == 2, changed_rows)
 
     @_database_operation
-    def increment_draws(self,
-                        conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                        user_id: int) -> DatabaseOperationResult:
+    def write_stats_deltas(self,
+                           conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                           deltas: {int: [int]},
+                           sequence: int) -> DatabaseOperationResult:
         """
-        Увеличивает количество ничьих пользователя в БД на 1 по его id
+        Добавляет накопленные отложенной записью приращения статистики одним многострочным upsert и в той же
+        транзакции запоминает номер последнего записанного результата журнала. Новые строки пользователей читаются
+        в том же пакете для таблицы лидеров
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
-        :arg user_id: id пользователя
-        :return: DatabaseOperationResult(success: bool, data: None)
+        :arg deltas: словарь где ключ - id пользователя, значение - приращения [победы, поражения, ничьи]
+        :arg sequence: номер последнего результата журнала вошедшего в deltas
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None)
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute("SELECT id, wins, loses, draws FROM users "
-                               f"WHERE id = {user_id}")
-                row = cursor.fetchall()[0]
-                row = (row[0], row[1], row[2], row[3] + 1)
+        rows = []
+        params = []
 
-                cursor.execute(
-                    "UPDATE users "
-                    f"SET id={row[0]}, wins={row[1]}, loses={row[2]}, draws={row[3]} "
-                    f"WHERE id = {user_id}"
-                )
-                conn.commit()
+        for user_id, (wins, loses, draws) in deltas.items():
+            rows.append("(%s, %s, %s, %s, %s, NULL)")
+            params.extend((user_id, wins, loses, draws, wins / (wins + loses) if wins + loses > 0 else None))
 
-                return DatabaseOperationResult(True, None)
-            except Error as e:
-                conn.rollback()
-                _log(e, "increment_draws")
+        params.append(sequence)
+        params.extend(deltas.keys())
 
-                return DatabaseOperationResult(False, None)
+        with conn.cursor() as cursor:
+            # Как и в write_game_result, win_rate считается по уже увеличенным wins и loses
+            results = cursor.execute(
+                f"INSERT INTO users VALUES {', '.join(rows)} "
+                "ON DUPLICATE KEY UPDATE "
+                "wins = wins + VALUES(wins), loses = loses + VALUES(loses), draws = draws + VALUES(draws), "
+                "win_rate = IF(wins + loses > 0, wins / (wins + loses), NULL); "
+                "INSERT INTO stats_journal_state VALUES (1, %s) "
+                "ON DUPLICATE KEY UPDATE applied_sequence = GREATEST(applied_sequence, VALUES(applied_sequence)); "
+                f"{self._LEADERBOARD_SELECT} WHERE id IN ({', '.join(['%s'] * len(deltas))}); "
+                "COMMIT",
+                params,
+                multi=True
+            )
+            _, changed_rows = self._read_multi_results(results)
+
+            return DatabaseOperationResult(True, changed_rows)
 
     @_database_operation
-    def get_nicknames(self,
-                      conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                      users_ids: [int]) -> DatabaseOperationResult:
+    def get_applied_stats_sequence(self,
+                                   conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None
+                                   ) -> DatabaseOperationResult:
         """
-        Возвращает ник пользователя в БД по его id в виде экземпляра класса DatabaseOperationResult, где в случае если
-        такой пользователь есть в БД, и запрос был завершен без ошибок, data это массив из строк содержащих ники, иначе
-        - None
+        Возвращает номер последнего результата журнала отложенной записи, который уже есть в БД
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
-        :arg users_ids: id пользователей
-        :return: DatabaseOperationResult(success: bool, data: [str] | None)
+        :return: DatabaseOperationResult(success: bool, data: int | None)
         """
+        cursor = self.pool.execute(conn, self._SELECT_APPLIED_SEQUENCE)
+        rows = cursor.fetchall()
 
-        ids_string = ""
+        return DatabaseOperationResult(True, int(rows[0][0]) if rows else 0)
 
-        for i in users_ids:
-            ids_string += f"{i},"
+    @_database_operation
+    def select_nicknames(self,
+                         conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                         users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Читает из БД ники пользователей для get_nicknames
 
-        ids_string = ids_string[:1]
+        :arg conn: подключение к БД, автоматически заполняется декоратором
+        :arg users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: str | None} | None)
+        """
+        out_dict = {}
 
         with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"SELECT nickname FROM users WHERE id IN ({ids_string})")
-                nickname = cursor.fetchall()
+            for start in range(0, len(users_ids), self._IN_CHUNK_SIZE):
+                chunk = users_ids[start:start + self._IN_CHUNK_SIZE]
+                cursor.execute(
+                    f"SELECT id, nickname FROM users WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk
+                )
 
-                if len(nickname) != 0:
-                    return DatabaseOperationResult(True, nickname)
-                else:
-                    return DatabaseOperationResult(True, None)
-            except Error as e:
-                _log(e, "get_nicknames")
+                for row in cursor.fetchall():
+                    out_dict[row[0]] = row[1]
 
-                return DatabaseOperationResult(False, None)
+            return DatabaseOperationResult(True, out_dict)
 
     @_database_operation
-    def get_nickname(self,
-                     conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                     user_id: int) -> DatabaseOperationResult:
+    def select_nickname(self,
+                        conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                        user_id: int) -> DatabaseOperationResult:
         """
-        Возвращает ник пользователя в БД по его id в виде экземпляра класса DatabaseOperationResult, где в случае если
-        такой пользователь есть в БД, и запрос был завершен без ошибок, data это строка содержащая ник, иначе - None
+        Читает из БД ник пользователя для get_nickname
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
         :arg user_id: id пользователя
         :return: DatabaseOperationResult(success: bool, data: str | None)
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"SELECT nickname FROM users WHERE id = {user_id}")
-                nickname = cursor.fetchall()
+        cursor = self.pool.execute(conn, self._SELECT_NICKNAME, (user_id,))
+        nickname = cursor.fetchall()
 
-                if len(nickname) == 1:
-                    return DatabaseOperationResult(True, nickname[0][0])
-                else:
-                    return DatabaseOperationResult(True, None)
-            except Error as e:
-                _log(e, "get_nickname")
-
-                return DatabaseOperationResult(False, None)
+        if len(nickname) == 1:
+            return DatabaseOperationResult(True, nickname[0][0])
+        else:
+            return DatabaseOperationResult(True, None)
 
     @_database_operation
-    def set_nickname(self,
-                     conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
-                     user_id: int,
-                     user_nickname: str
-                     ) -> DatabaseOperationResult:
+    def write_nickname(self,
+                       conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                       user_id: int,
+                       user_nickname: str
+                       ) -> DatabaseOperationResult:
         """
-        Устанавливает пользователю с нужным id новый ник
+        Устанавливает пользователю с нужным id новый ник для set_nickname
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
         :arg user_id: id пользователя
         :arg user_nickname: ник пользователя
         :return: DatabaseOperationResult(success: bool, data: None)
         """
-        with conn.cursor() as cursor:
-            try:
-                var = f"UPDATE users SET nickname='{user_nickname}' WHERE id={user_id}"
-                cursor.execute(var)
-
-                conn.commit()
+        # Ник передается параметром отдельно от текста запроса и не может изменить сам запрос
+        self.pool.execute(conn, self._UPDATE_NICKNAME, (user_nickname, user_id))
+        conn.commit()
 
-                return DatabaseOperationResult(True, None)
-            except Error as e:
-                conn.rollback()
-                _log(e, "set_nickname")
-
-                return DatabaseOperationResult(False, None)
+        return DatabaseOperationResult(True, None)
 
     @_database_operation
-    def get_leaders(self,
-                    conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None
-                    ) -> DatabaseOperationResult:
+    def select_leaders(self,
+                       conn: PooledMySQLConnection | MySQLConnection | CMySQLConnection | None,
+                       limit: int) -> DatabaseOperationResult:
         """
-        Возвращает список игроков с самым большим винрейтом в виде экземпляра класса DatabaseOperationResult, где в
-        случае если запрос был завершен без ошибок, data это список из до 5 картежей где первый элемент это id или ник
-        игрока (если есть), а второй - винрейт, иначе - None
+        Читает из БД лучших игроков для загрузки таблицы лидеров, запрос идет по индексу win_rate_index
 
         :arg conn: подключение к БД, автоматически заполняется декоратором
-        :return: DatabaseOperationResult(success: bool, data: [(str, int)] | None)
+        :arg limit: количество игроков
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None)
         """
-        with conn.cursor() as cursor:
-            try:
-                cursor.execute(f"SELECT id, nickname, win_rate FROM users ORDER BY win_rate DESC LIMIT 5")
-                rows = cursor.fetchall()
-                out_list = []
-
-                for row in rows:
-                    if row[1] is not None:
-                        out_list.append((row[1], row[2]))
-                    else:
-                        out_list.append((str(row[0]), row[2]))
-
-                return DatabaseOperationResult(True, out_list)
-            except Error as e:
-                _log(e, "get_leaders")
-
-                return DatabaseOperationResult(False, None)
+        cursor = self.pool.execute(conn, self._SELECT_LEADERS, (limit,))
+
+        return DatabaseOperationResult(True, cursor.fetchall())
+
+    @staticmethod
+    def _read_multi_results(results) -> (int, [tuple]):
+        """
+        Читает результаты запроса с multi=True
+        :return: количество строк измененных первым запросом и строки прочитанные SELECT
+        """
+
+        updated_rows = None
+        rows = []
+
+        for result in results:
+            if result.with_rows:
+                rows.extend(result.fetchall())
+            elif updated_rows is None:
+                updated_rows = result.rowcount
+
+        return updated_rows, rows
+
+    def metrics(self) -> {str: any}:
+        """
+        Метрики пула соединений с БД, кэша профилей, таблицы лидеров, индекса мест и отложенной записи статистики
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
+        """
+
+        out_dict = {"database_pool": self.pool.metrics()}
+        out_dict.update(super().metrics())
+
+        return out_dict
+
+    def close(self):
+        """
+        Записывает накопленную статистику и закрывает соединения с БД
+        """
+
+        super().close()
+        self.pool.close()
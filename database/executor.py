@@ -0,0 +1,211 @@
+# --------------------------------------------------------------------------
+# Ограниченный пул запросов к хранилищу
+#
+# Обработчики BotClient вызывали методы хранилища прямо в потоке TeleBot:
+# медленный запрос или переподключение к MySQL занимали поток обработчика,
+# а под нагрузкой все потоки TeleBot ждали БД. DatabaseExecutor выполняет
+# запросы в своих max_workers потоках и возвращает Future:
+#   - call ждет результат не дольше timeout и возвращает неуспешный
+#     DatabaseOperationResult вместо того, чтобы держать поток обработчика;
+#   - submit не ждет вовсе, так записываются результаты игр - игроки
+#     получают ответ сразу, а сохранение завершается в фоне.
+# Очередь ограничена max_queue запросами: когда БД не успевает, новые
+# запросы сразу завершаются неуспешно, а не копятся в памяти
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import datetime
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from database.storage import DatabaseOperationResult, Storage
+
+
+@dataclasses.dataclass
+class OperationLatency:
+    """
+    Время выполнения одного метода хранилища:
+    count: int - количество выполненных запросов
+    mean: float - среднее время выполнения в секундах
+    max: float - наибольшее время выполнения в секундах
+    """
+    count: int
+    mean: float
+    max: float
+
+
+@dataclasses.dataclass
+class DatabaseExecutorMetrics:
+    """
+    Статистика пула запросов к хранилищу:
+    workers: int - количество потоков
+    queue_depth: int - количество запросов ожидающих свободного потока
+    running: int - количество выполняющихся запросов
+    submitted: int - количество принятых запросов
+    rejected: int - количество запросов отклоненных из-за переполнения очереди
+    timeouts: int - количество запросов, результат которых не дождались
+    mean_wait: float - среднее время ожидания в очереди в секундах
+    latency: {str: OperationLatency} - время выполнения по методам хранилища
+    """
+    workers: int
+    queue_depth: int
+    running: int
+    submitted: int
+    rejected: int
+    timeouts: int
+    mean_wait: float
+    latency: dict
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class DatabaseExecutor:
+    def __init__(self, storage: Storage, max_workers: int = 8, max_queue: int = 1024, timeout: float = 5.0):
+        """
+        :param storage: хранилище которое выполняет запросы, закрывается вместе с DatabaseExecutor
+        :param max_workers: максимальное количество одновременных запросов, для DatabaseAPI должно быть не больше
+        размера пула соединений
+        :param max_queue: максимальное количество запросов ожидающих свободного потока
+        :param timeout: время в секундах, дольше которого call не ждет результат
+        """
+
+        self.storage = storage
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="database")
+        self._lock = threading.Lock()
+
+        self._queued = 0
+        self._running = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._started = 0
+
+        self._latency: {str: list} = {}
+        """
+        _latency: {operation: str, [count: int, total: float, max: float]}
+        """
+
+    def submit(self, operation: str, *args) -> Future:
+        """
+        Ставит вызов метода хранилища в очередь
+        :param operation: название метода хранилища, например "get_user_score"
+        :param args: аргументы метода
+        :return: Future с результатом метода (DatabaseOperationResult). Если очередь переполнена, Future уже
+        завершен с DatabaseOperationResult(False, None)
+        """
+
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                future = Future()
+                future.set_result(DatabaseOperationResult(False, None))
+
+                return future
+
+            self._queued += 1
+            self._submitted += 1
+
+        future = self._executor.submit(self._execute, operation, time.perf_counter(), args)
+        future.add_done_callback(self._on_done)
+
+        return future
+
+    def call(self, operation: str, *args, timeout: float | None = None) -> DatabaseOperationResult:
+        """
+        Вызывает метод хранилища и ждет результат не дольше timeout
+        :param operation: название метода хранилища
+        :param args: аргументы метода
+        :param timeout: время ожидания в секундах, None - self.timeout
+        :return: результат метода, или DatabaseOperationResult(False, None) - если его не дождались
+        """
+
+        future = self.submit(operation, *args)
+
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            # Еще не начатый запрос убирается из очереди, начатый завершится сам, его результат не нужен
+            future.cancel()
+            self.record_timeout(operation)
+
+            return DatabaseOperationResult(False, None)
+
+    def record_timeout(self, operation: str):
+        """
+        Учитывает запрос, результат которого не дождались (вызывается и AsyncDatabaseAPI)
+        """
+
+        with self._lock:
+            self._timeouts += 1
+
+        _log(f"Запрос к БД {operation} не завершился за отведенное время")
+
+    def metrics(self) -> DatabaseExecutorMetrics:
+        with self._lock:
+            return DatabaseExecutorMetrics(
+                workers=self.max_workers,
+                queue_depth=self._queued,
+                running=self._running,
+                submitted=self._submitted,
+                rejected=self._rejected,
+                timeouts=self._timeouts,
+                mean_wait=self._total_wait / self._started if self._started else 0.0,
+                latency={
+                    operation: OperationLatency(count=count, mean=total / count, max=max_time)
+                    for operation, (count, total, max_time) in self._latency.items()
+                }
+            )
+
+    def close(self):
+        """
+        Дожидается уже принятых запросов, останавливает потоки и закрывает хранилище
+        """
+
+        self._executor.shutdown(wait=True)
+        self.storage.close()
+
+    def _on_done(self, future: Future):
+        # Отменить можно только еще не начатый запрос, _execute для него не вызывается
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _execute(self, operation: str, submitted_at: float, args: tuple) -> DatabaseOperationResult:
+        started = time.perf_counter()
+
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._started += 1
+            self._total_wait += started - submitted_at
+
+        try:
+            return getattr(self.storage, operation)(*args)
+        except Exception as e:
+            # Ошибки БД хранилище возвращает как неуспешный результат, сюда попадают только непредвиденные
+            _log(f"Запрос к БД {operation} завершился исключением {e!r}")
+
+            return DatabaseOperationResult(False, None)
+        finally:
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self._running -= 1
+                latency = self._latency.get(operation)
+
+                if latency is None:
+                    self._latency[operation] = [1, elapsed, elapsed]
+                else:
+                    latency[0] += 1
+                    latency[1] += elapsed
+                    latency[2] = max(latency[2], elapsed)
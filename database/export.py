@@ -0,0 +1,141 @@
+# --------------------------------------------------------------------------
+# Выгрузка таблицы users в CSV или JSON Lines
+#
+# Строки читаются из БД частями через Storage.iter_users_scores и сразу
+# пишутся в файл, поэтому выгрузка занимает постоянную память при любом
+# количестве пользователей. Выгрузка пишется во временный файл рядом с
+# path и переименовывается в path только после успешного завершения
+#
+# Запуск из корня репозитория:
+#   python -m database.export database_name database_user database_password users.csv
+#   python -m database.export database_name database_user database_password users.jsonl --format jsonl
+# --------------------------------------------------------------------------
+
+
+import argparse
+import csv
+import dataclasses
+import json
+import os
+import time
+
+from database.storage import DatabaseOperationResult, Storage, StorageError
+
+
+FORMATS = ("csv", "jsonl")
+COLUMNS = ("id", "wins", "loses", "draws", "win_rate", "nickname")
+
+
+@dataclasses.dataclass
+class ExportReport:
+    """
+    Результат выгрузки:
+    path: str - путь к файлу
+    format: str - формат файла (csv или jsonl)
+    rows: int - количество выгруженных пользователей
+    bytes: int - размер файла в байтах
+    seconds: float - длительность выгрузки в секундах
+    rows_per_second: float - скорость выгрузки в строках в секунду
+    """
+    path: str
+    format: str
+    rows: int
+    bytes: int
+    seconds: float
+    rows_per_second: float
+
+
+def export_users(database_api: Storage, path: str, export_format: str = "csv",
+                 batch_size: int = 1000) -> DatabaseOperationResult:
+    """
+    Выгружает таблицу users в файл
+    :param database_api: хранилище из которого читаются пользователи
+    :param path: путь к файлу
+    :param export_format: "csv" - с заголовком из COLUMNS, или "jsonl" - один JSON объект на строку
+    :param batch_size: количество строк читаемых из БД за раз
+    :return: DatabaseOperationResult(success: bool, data: ExportReport | None)
+    """
+
+    if export_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки {export_format}, доступны: {', '.join(FORMATS)}")
+
+    temp_path = f"{path}.tmp"
+    started = time.perf_counter()
+    rows = 0
+    completed = False
+
+    try:
+        with open(temp_path, "w", encoding="utf-8", newline="") as file:
+            if export_format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(COLUMNS)
+
+                for user_id, score in database_api.iter_users_scores(batch_size):
+                    writer.writerow((user_id, *score))
+                    rows += 1
+            else:
+                for user_id, score in database_api.iter_users_scores(batch_size):
+                    file.write(json.dumps(dict(zip(COLUMNS, (user_id, *score))), ensure_ascii=False))
+                    file.write("\n")
+                    rows += 1
+
+        os.replace(temp_path, path)
+        completed = True
+    except StorageError:
+        # Ошибка уже записана в лог хранилища, неполная выгрузка не должна заменить предыдущую
+        return DatabaseOperationResult(False, None)
+    finally:
+        # Любая ошибка, в том числе OSError при записи файла, не должна оставлять неполную выгрузку
+        if not completed and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    seconds = time.perf_counter() - started
+
+    return DatabaseOperationResult(True, ExportReport(
+        path=path,
+        format=export_format,
+        rows=rows,
+        bytes=os.path.getsize(path),
+        seconds=seconds,
+        rows_per_second=rows / seconds if seconds > 0 else 0.0
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("database_name", type=str)
+    parser.add_argument("database_user", type=str)
+    parser.add_argument("database_password", type=str)
+    parser.add_argument("path", type=str, help="путь к файлу выгрузки")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    parser.add_argument("--batch_size", type=int, default=1000,
+                        help="количество строк читаемых из БД за раз")
+    args = parser.parse_args()
+
+    from database.database_utils import DatabaseAPI
+
+    # Индекс мест выгрузке не нужен, а его загрузка - это еще один полный проход по таблице users
+    database_api = DatabaseAPI({
+        "host": "localhost",
+        "user": args.database_user,
+        "password": args.database_password,
+        "database": args.database_name
+    }, pool_size=1, load_rank_index=False)
+
+    try:
+        export_query = export_users(database_api, args.path, args.format, args.batch_size)
+    finally:
+        database_api.close()
+
+    if not export_query.success:
+        print("Выгрузка не удалась")
+
+        return
+
+    report = export_query.data
+    print(f"Выгружено пользователей: {report.rows} в {report.path} ({report.bytes / 1024:.1f} КБ) "
+          f"за {report.seconds:.2f} с, {report.rows_per_second:.0f} строк/с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# --------------------------------------------------------------------------
+# Таблица лидеров в памяти процесса
+#
+# Раньше каждая команда /leaders сортировала всю таблицу users по win_rate.
+# Leaderboard хранит capacity лучших игроков (больше, чем показывается, чтобы
+# игрок выпавший из верхних size не требовал нового запроса к БД) и
+# обновляется строками, которые Storage получает при записи результатов
+# игр. Инвариант: у всех неотслеживаемых пользователей винрейт не больше
+# порога _threshold, поэтому верхние size отслеживаемых - верхние size всей
+# таблицы. Из БД таблица загружается только при старте и если после выбывания
+# игроков отслеживаемых осталось меньше size
+# --------------------------------------------------------------------------
+
+
+import collections
+import dataclasses
+import threading
+
+
+@dataclasses.dataclass
+class LeaderboardMetrics:
+    """
+    Статистика таблицы лидеров:
+    tracked: int - количество отслеживаемых пользователей
+    loads: int - количество загрузок из БД
+    updates: int - количество обновлений строк пользователей
+    reads: int - количество запросов таблицы лидеров
+    rebuilds: int - количество пересборок верхних size после изменений
+    """
+    tracked: int
+    loads: int
+    updates: int
+    reads: int
+    rebuilds: int
+
+
+def _key(win_rate: float | None) -> (bool, float):
+    # Как и в MySQL при ORDER BY DESC, пользователи без винрейта идут последними
+    return win_rate is not None, win_rate or 0.0
+
+
+class Leaderboard:
+    def __init__(self, size: int = 5, capacity: int = 25):
+        """
+        :param size: количество показываемых лучших игроков
+        :param capacity: количество отслеживаемых лучших игроков
+        """
+
+        self.size = size
+        self.capacity = capacity
+
+        self._entries: {int: tuple} = {}
+        """
+        _entries: {user_id: int, row: (user_id: int, nickname: str | None, win_rate: float | None, games: int)}
+        Отслеживаемые пользователи, games - количество сыгранных игр, по нему отбрасываются устаревшие строки
+        """
+
+        self._dropped: collections.OrderedDict[int, int] = collections.OrderedDict()
+        """
+        _dropped: {user_id: int, games: int}
+        Количество игр последних capacity * 4 пользователей выпавших из отслеживаемых. По нему отбрасываются устаревшие
+        строки пришедшие после выбывания, иначе такая строка вернула бы пользователя со старым винрейтом
+        """
+
+        self._threshold: (bool, float) | None = None
+        """
+        Винрейт (в виде _key) не меньше чем у любого неотслеживаемого пользователя, или None - если отслеживаются все
+        """
+
+        self._top: tuple | None = None
+        """
+        Верхние size в виде ((id или ник, винрейт), ...), или None - если их нужно пересобрать. Пока таблица не
+        меняется, возвращается один и тот же картеж
+        """
+
+        self._is_loaded = False
+        self._updates_while_loading: list | None = None
+        self._lock = threading.Lock()
+
+        self._loads = 0
+        self._updates = 0
+        self._reads = 0
+        self._rebuilds = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._is_loaded
+
+    def begin_load(self):
+        """
+        Вызывается перед запросом к БД для load: обновления пришедшие во время запроса будут повторены после загрузки
+        """
+
+        with self._lock:
+            self._updates_while_loading = []
+
+    def abort_load(self):
+        with self._lock:
+            self._updates_while_loading = None
+
+    def load(self, rows: [tuple]):
+        """
+        Заменяет отслеживаемых пользователей лучшими из БД
+        :param rows: до capacity строк (id, ник, винрейт, количество игр) упорядоченных по убыванию винрейта
+        """
+
+        with self._lock:
+            self._entries = {row[0]: tuple(row) for row in rows}
+            self._threshold = None if len(rows) < self.capacity else min(_key(row[2]) for row in rows)
+            self._top = None
+            self._is_loaded = True
+            self._loads += 1
+
+            for row in self._updates_while_loading or []:
+                self._apply(row)
+
+            self._updates_while_loading = None
+
+    def update(self, rows: [tuple]):
+        """
+        Учитывает новую статистику пользователей
+        :param rows: строки (id, ник, винрейт, количество игр) прочитанные после записи результата игры
+        """
+
+        with self._lock:
+            if self._updates_while_loading is not None:
+                self._updates_while_loading.extend(rows)
+
+            if not self._is_loaded:
+                return
+
+            for row in rows:
+                self._apply(tuple(row))
+
+            # Отслеживаемых не хватает для верхних size, а в БД есть другие пользователи
+            if len(self._entries) < self.size and self._threshold is not None:
+                self._is_loaded = False
+
+    def rename(self, user_id: int, nickname: str):
+        with self._lock:
+            row = self._entries.get(user_id)
+
+            if row is not None:
+                self._entries[user_id] = (row[0], nickname, row[2], row[3])
+                self._top = None
+
+    def top(self) -> tuple:
+        """
+        :return: картеж до size пар (id или ник, винрейт) по убыванию винрейта
+        """
+
+        with self._lock:
+            self._reads += 1
+
+            if self._top is None:
+                rows = sorted(self._entries.values(), key=lambda row: _key(row[2]), reverse=True)[:self.size]
+                self._top = tuple((row[1] if row[1] is not None else str(row[0]), row[2]) for row in rows)
+                self._rebuilds += 1
+
+            return self._top
+
+    def top_with(self, scores: {int: (str | None, float | None)}) -> tuple:
+        """
+        Как top, но перед сортировкой ник и винрейт пользователей из scores заменяются (или пользователи добавляются)
+        :param scores: словарь где ключ - id пользователя, значение - (ник, винрейт), например с учетом статистики еще
+        не записанной в БД
+        :return: картеж до size пар (id или ник, винрейт) по убыванию винрейта
+        """
+
+        with self._lock:
+            self._reads += 1
+            rows = {row[0]: (row[1], row[2]) for row in self._entries.values()}
+
+        rows.update(scores)
+        ordered = sorted(rows.items(), key=lambda item: _key(item[1][1]), reverse=True)[:self.size]
+
+        return tuple((nickname if nickname is not None else str(user_id), win_rate)
+                     for user_id, (nickname, win_rate) in ordered)
+
+    def metrics(self) -> LeaderboardMetrics:
+        with self._lock:
+            return LeaderboardMetrics(
+                tracked=len(self._entries),
+                loads=self._loads,
+                updates=self._updates,
+                reads=self._reads,
+                rebuilds=self._rebuilds
+            )
+
+    def _apply(self, row: tuple):
+        user_id, win_rate, games = row[0], row[2], row[3]
+        old = self._entries.get(user_id)
+        key = _key(win_rate)
+        known_games = old[3] if old is not None else self._dropped.get(user_id)
+
+        # Запросы разных игр могут вернуть строки не в том порядке, в котором они были записаны
+        if known_games is not None and known_games > games:
+            return
+
+        if self._threshold is not None and (key < self._threshold if old is not None else key <= self._threshold):
+            if old is not None:
+                del self._entries[user_id]
+                self._top = None
+
+            if old is not None or user_id in self._dropped:
+                self._dropped[user_id] = games
+
+                if len(self._dropped) > self.capacity * 4:
+                    self._dropped.popitem(last=False)
+
+            return
+
+        self._dropped.pop(user_id, None)
+        self._entries[user_id] = row
+        self._top = None
+        self._updates += 1
+
+        if len(self._entries) > self.capacity:
+            lowest = min(self._entries.values(), key=lambda entry: _key(entry[2]))
+            del self._entries[lowest[0]]
+            self._threshold = _key(lowest[2])
@@ -0,0 +1,222 @@
+# --------------------------------------------------------------------------
+# Хранилище в памяти процесса
+#
+# Для бенчмарков и проверки логики бота без БД: пользователи хранятся в
+# словаре, каждая операция выполняется под одной блокировкой и поэтому
+# атомарна, как транзакция в БД. После остановки процесса данные теряются
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+from typing import Iterator
+
+from database.storage import DatabaseOperationResult, Storage
+
+
+@dataclasses.dataclass
+class MemoryStorageMetrics:
+    """
+    Статистика хранилища в памяти:
+    users: int - количество пользователей
+    reads: int - количество чтений
+    writes: int - количество записей
+    """
+    users: int
+    reads: int
+    writes: int
+
+
+class MemoryStorage(Storage):
+    def __init__(self, stats_journal_path: str | None = None, stats_flush_interval: float = 1.0,
+                 stats_flush_threshold: int = 256, profile_cache_size: int = 10000,
+                 profile_cache_ttl: float = 300.0, load_rank_index: bool = True):
+        """
+        :param stats_journal_path: путь к журналу отложенной записи статистики, или None - если результаты игр
+        записываются сразу
+        :param stats_flush_interval: период отложенной записи статистики в секундах
+        :param stats_flush_threshold: количество пользователей с незаписанной статистикой, при котором запись
+        начинается досрочно
+        :param profile_cache_size: максимальное количество пользователей в кэше профилей
+        :param profile_cache_ttl: время жизни данных в кэше профилей в секундах
+        :param load_rank_index: загрузить индекс мест сразу, или False - если индекс загрузится при первом get_user_rank
+        """
+
+        self._users: {int: list} = {}
+        """
+        _users: {user_id: int, [wins: int, loses: int, draws: int, win_rate: float | None, nickname: str | None]}
+        """
+
+        self._applied_sequence = 0
+        self._lock = threading.Lock()
+
+        self._reads = 0
+        self._writes = 0
+
+        super().__init__(stats_journal_path=stats_journal_path, stats_flush_interval=stats_flush_interval,
+                         stats_flush_threshold=stats_flush_threshold, profile_cache_size=profile_cache_size,
+                         profile_cache_ttl=profile_cache_ttl, load_rank_index=load_rank_index)
+
+    def get_users_ids(self) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+
+            return DatabaseOperationResult(True, list(self._users.keys()))
+
+    def iter_users_ids(self, batch_size: int = 1000) -> Iterator[int]:
+        yield from self.get_users_ids().data
+
+    def select_users_scores(self) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+
+            return DatabaseOperationResult(True, {user_id: tuple(user) for user_id, user in self._users.items()})
+
+    def iter_users_rows(self, batch_size: int = 1000) -> Iterator[tuple]:
+        # Снимок всех строк, как одна транзакция чтения в БД
+        with self._lock:
+            self._reads += 1
+            rows = [(user_id, *user) for user_id, user in self._users.items()]
+
+        yield from rows
+
+    def select_user_score(self, user_id: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+            user = self._users.get(user_id)
+
+            return DatabaseOperationResult(True, None if user is None else tuple(user))
+
+    def select_scores(self, users_ids: [int]) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+
+            return DatabaseOperationResult(True, {
+                user_id: tuple(self._users[user_id]) for user_id in users_ids if user_id in self._users
+            })
+
+    def register_user(self, user_id: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._writes += 1
+
+            if user_id in self._users:
+                return DatabaseOperationResult(True, False)
+
+            self._users[user_id] = [0, 0, 0, None, None]
+
+            return DatabaseOperationResult(True, True)
+
+    def write_game_result(self, winner_id: int, loser_id: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._writes += 1
+            updated_rows = 0
+
+            for user_id, wins, loses in ((winner_id, 1, 0), (loser_id, 0, 1)):
+                if user_id in self._users:
+                    self._add_stats(user_id, wins, loses, 0)
+                    updated_rows += 1
+
+            return DatabaseOperationResult(updated_rows == 2, self._leaderboard_rows([winner_id, loser_id]))
+
+    def write_draw(self, first_user_id: int, second_user_id: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._writes += 1
+            updated_rows = 0
+
+            for user_id in (first_user_id, second_user_id):
+                if user_id in self._users:
+                    self._add_stats(user_id, 0, 0, 1)
+                    updated_rows += 1
+
+            return DatabaseOperationResult(updated_rows == 2, self._leaderboard_rows([first_user_id, second_user_id]))
+
+    def write_stats_deltas(self, deltas: {int: [int]}, sequence: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._writes += 1
+
+            for user_id, (wins, loses, draws) in deltas.items():
+                if user_id not in self._users:
+                    self._users[user_id] = [0, 0, 0, None, None]
+
+                self._add_stats(user_id, wins, loses, draws)
+
+            self._applied_sequence = max(self._applied_sequence, sequence)
+
+            return DatabaseOperationResult(True, self._leaderboard_rows(list(deltas.keys())))
+
+    def get_applied_stats_sequence(self) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+
+            return DatabaseOperationResult(True, self._applied_sequence)
+
+    def select_nickname(self, user_id: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+            user = self._users.get(user_id)
+
+            return DatabaseOperationResult(True, None if user is None else user[4])
+
+    def select_nicknames(self, users_ids: [int]) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+
+            return DatabaseOperationResult(True, {
+                user_id: self._users[user_id][4] for user_id in users_ids if user_id in self._users
+            })
+
+    def write_nickname(self, user_id: int, user_nickname: str) -> DatabaseOperationResult:
+        with self._lock:
+            self._writes += 1
+            user = self._users.get(user_id)
+
+            if user is not None:
+                user[4] = user_nickname
+
+            return DatabaseOperationResult(True, None)
+
+    def select_leaders(self, limit: int) -> DatabaseOperationResult:
+        with self._lock:
+            self._reads += 1
+            rows = self._leaderboard_rows(list(self._users.keys()))
+
+        # Как ORDER BY win_rate DESC: пользователи без винрейта идут последними
+        rows.sort(key=lambda row: (row[2] is not None, row[2] or 0.0), reverse=True)
+
+        return DatabaseOperationResult(True, rows[:limit])
+
+    def _add_stats(self, user_id: int, wins: int, loses: int, draws: int):
+        user = self._users[user_id]
+        user[0] += wins
+        user[1] += loses
+        user[2] += draws
+
+        if user[0] + user[1] > 0:
+            user[3] = user[0] / (user[0] + user[1])
+
+    def _leaderboard_rows(self, users_ids: [int]) -> [tuple]:
+        """
+        :return: строки (id, ник, винрейт, количество игр) пользователей, которые есть в хранилище
+        """
+
+        rows = []
+
+        for user_id in users_ids:
+            user = self._users.get(user_id)
+
+            if user is not None:
+                rows.append((user_id, user[4], user[3], user[0] + user[1] + user[2]))
+
+        return rows
+
+    def metrics(self) -> {str: any}:
+        with self._lock:
+            out_dict = {"memory_storage": MemoryStorageMetrics(
+                users=len(self._users),
+                reads=self._reads,
+                writes=self._writes
+            )}
+
+        out_dict.update(super().metrics())
+
+        return out_dict
@@ -0,0 +1,182 @@
+# --------------------------------------------------------------------------
+# Кэш профилей пользователей
+#
+# Почти каждое действие пользователя читало из БД одно и то же: есть ли
+# пользователь в БД, его ник и статистику. ProfileCache хранит эти данные
+# для не более чем capacity последних пользователей (LRU), каждое значение
+# живет не дольше ttl секунд на случай изменений БД в обход бота.
+# Storage сбрасывает ник при set_nickname и статистику при записи
+# результата игры.
+#
+# Чтение из БД и сброс могут выполняться одновременно: значение прочитанное
+# до сброса не должно попасть в кэш после него. Поэтому перед чтением из БД
+# берется номер поколения (begin_read), invalidate запоминает поколение
+# сброса каждого поля, и put сохраняет значение только если это поле этого
+# пользователя с тех пор не сбрасывалось. Сбросы других пользователей и
+# других полей чтение не отменяют. Поколения сбросов хранятся не больше чем
+# для capacity полей, самые старые забываются и считаются сброшенными у всех
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+
+
+@dataclasses.dataclass
+class ProfileCacheMetrics:
+    """
+    Статистика кэша профилей:
+    size: int - количество пользователей в кэше
+    hits: int - количество значений взятых из кэша
+    misses: int - количество значений прочитанных из БД
+    invalidations: int - количество сбросов значений
+    evictions: int - количество вытесненных пользователей
+    hit_rate: float - доля значений взятых из кэша
+    """
+    size: int
+    hits: int
+    misses: int
+    invalidations: int
+    evictions: int
+    hit_rate: float
+
+
+class ProfileCache:
+    # Поля профиля
+    EXISTS = 0
+    NICKNAME = 1
+    SCORE = 2
+
+    MISSING = object()
+    """
+    Возвращается get, если значения нет в кэше (None - допустимое значение, например пользователь без ника)
+    """
+
+    def __init__(self, capacity: int = 10000, ttl: float = 300.0):
+        """
+        :param capacity: максимальное количество пользователей в кэше
+        :param ttl: время жизни значения в секундах
+        """
+
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self._profiles: OrderedDict[int, dict] = OrderedDict()
+        """
+        _profiles: {user_id: int, {field: int, (value, expires_at: float)}}
+        Пользователи в порядке последнего обращения, последний - самый недавний
+        """
+
+        self._generation = 0
+
+        self._invalidated: OrderedDict[(int, int), int] = OrderedDict()
+        """
+        _invalidated: {(user_id: int, field: int), generation: int}
+        Поколение последнего сброса поля, в порядке сбросов, последний - самый недавний
+        """
+
+        self._forgotten = 0
+        """
+        Поколение последнего сброса, вытесненного из _invalidated
+        """
+
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    def begin_read(self) -> int:
+        """
+        Вызывается перед чтением значения из БД
+        :return: номер поколения для put
+        """
+
+        with self._lock:
+            return self._generation
+
+    def get(self, user_id: int, field: int):
+        """
+        :return: значение поля, или MISSING - если его нет в кэше или оно устарело
+        """
+
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            entry = None if profile is None else profile.get(field)
+
+            if entry is None or entry[1] < time.monotonic():
+                self._misses += 1
+
+                return self.MISSING
+
+            self._profiles.move_to_end(user_id)
+            self._hits += 1
+
+            return entry[0]
+
+    def put(self, user_id: int, field: int, value, generation: int | None = None):
+        """
+        :param generation: результат begin_read перед чтением value из БД, или None - если value не прочитано из БД,
+        а только что записано в неё
+        """
+
+        with self._lock:
+            if generation is not None and self._invalidated_since(user_id, field, generation):
+                return
+
+            profile = self._profiles.get(user_id)
+
+            if profile is None:
+                profile = self._profiles[user_id] = {}
+
+                if len(self._profiles) > self.capacity:
+                    self._profiles.popitem(last=False)
+                    self._evictions += 1
+            else:
+                self._profiles.move_to_end(user_id)
+
+            profile[field] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id: int, *fields: int):
+        with self._lock:
+            self._generation += 1
+
+            for field in fields:
+                self._invalidated[(user_id, field)] = self._generation
+                self._invalidated.move_to_end((user_id, field))
+
+            while len(self._invalidated) > self.capacity:
+                self._forgotten = self._invalidated.popitem(last=False)[1]
+
+            profile = self._profiles.get(user_id)
+
+            if profile is None:
+                return
+
+            for field in fields:
+                if profile.pop(field, None) is not None:
+                    self._invalidations += 1
+
+    def _invalidated_since(self, user_id: int, field: int, generation: int) -> bool:
+        """
+        Вызывается под _lock
+        :return: True - если поле могло быть сброшено после begin_read, вернувшего generation
+        """
+
+        return max(self._invalidated.get((user_id, field), 0), self._forgotten) > generation
+
+    def metrics(self) -> ProfileCacheMetrics:
+        with self._lock:
+            reads = self._hits + self._misses
+
+            return ProfileCacheMetrics(
+                size=len(self._profiles),
+                hits=self._hits,
+                misses=self._misses,
+                invalidations=self._invalidations,
+                evictions=self._evictions,
+                hit_rate=self._hits / reads if reads else 0.0
+            )
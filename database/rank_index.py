@@ -0,0 +1,228 @@
+# --------------------------------------------------------------------------
+# Индекс мест игроков по винрейту
+#
+# Место игрока - 1 + количество игроков с большим винрейтом. Считать его
+# запросом COUNT(*) WHERE win_rate > x на каждую команду /score - полный
+# проход по таблице. RankIndex делит винрейт [0, 1] на buckets равных
+# корзин и хранит количество игроков в каждой корзине в дереве Фенвика:
+# и место, и изменение винрейта игрока стоят O(log buckets). Игроки из одной
+# корзины (винрейт отличается меньше чем на 1 / buckets) делят место.
+# Игроки без винрейта (только ничьи или нет игр) в рейтинге не участвуют
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+from typing import Iterable
+
+
+@dataclasses.dataclass
+class RankIndexMetrics:
+    """
+    Статистика индекса мест:
+    ranked: int - количество игроков в рейтинге
+    loads: int - количество загрузок из БД
+    updates: int - количество изменений винрейта игроков
+    lookups: int - количество запросов места
+    """
+    ranked: int
+    loads: int
+    updates: int
+    lookups: int
+
+
+class _FenwickTree:
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def build(self, counts: [int]):
+        """
+        Заполняет дерево количествами по корзинам за O(size)
+        """
+
+        tree = [0] + list(counts)
+
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+
+            if parent <= self.size:
+                tree[parent] += tree[i]
+
+        self._tree = tree
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        """
+        :return: сумма количеств корзин 0..index
+        """
+
+        out = 0
+        i = index + 1
+
+        while i > 0:
+            out += self._tree[i]
+            i -= i & -i
+
+        return out
+
+
+class RankIndex:
+    def __init__(self, buckets: int = 10000):
+        """
+        :param buckets: количество корзин винрейта, точность места - 1 / buckets
+        """
+
+        self.buckets = buckets
+
+        self._tree = _FenwickTree(buckets + 1)
+        self._users: {int: (int, int)} = {}
+        """
+        _users: {user_id: int, (bucket: int, games: int)}
+        Корзина игрока в рейтинге и количество его игр, по которому отбрасываются устаревшие строки
+        """
+
+        self._is_loaded = False
+        self._updates_while_loading: list | None = None
+        self._lock = threading.Lock()
+
+        self._loads = 0
+        self._updates = 0
+        self._lookups = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._is_loaded
+
+    def begin_load(self):
+        """
+        Вызывается перед запросом к БД для load: обновления пришедшие во время запроса будут повторены после загрузки
+        """
+
+        with self._lock:
+            self._updates_while_loading = []
+
+    def abort_load(self):
+        with self._lock:
+            self._updates_while_loading = None
+
+    def load(self, users_scores: Iterable[tuple]):
+        """
+        Заполняет индекс всеми пользователями за O(количество пользователей + buckets)
+        :param users_scores: пары (id, данные пользователя как в Storage.get_users_scores), например из
+        Storage.iter_users_scores
+        """
+
+        counts = [0] * (self.buckets + 1)
+        users = {}
+
+        # Пользователи читаются из БД без блокировки, обновления пришедшие за это время повторяются ниже
+        for user_id, score in users_scores:
+            if score[3] is not None:
+                bucket = self._bucket(score[3])
+                users[user_id] = (bucket, score[0] + score[1] + score[2])
+                counts[bucket] += 1
+
+        with self._lock:
+            self._tree.build(counts)
+            self._users = users
+            self._is_loaded = True
+            self._loads += 1
+
+            for row in self._updates_while_loading or []:
+                self._apply(row)
+
+            self._updates_while_loading = None
+
+    def update(self, rows: [tuple]):
+        """
+        Учитывает новую статистику пользователей
+        :param rows: строки (id, ник, винрейт, количество игр) прочитанные после записи результата игры
+        """
+
+        with self._lock:
+            if self._updates_while_loading is not None:
+                self._updates_while_loading.extend(rows)
+
+            if not self._is_loaded:
+                return
+
+            for row in rows:
+                self._apply(row)
+
+    def rank(self, user_id: int) -> tuple[int, int] | None:
+        """
+        :return: место игрока и количество игроков в рейтинге, или None - если игрока нет в рейтинге
+        """
+
+        with self._lock:
+            self._lookups += 1
+            user = self._users.get(user_id)
+
+            if user is None:
+                return None
+
+            total = len(self._users)
+
+            return total - self._tree.prefix_sum(user[0]) + 1, total
+
+    def rank_at(self, user_id: int, win_rate: float | None) -> tuple[int, int] | None:
+        """
+        Место игрока, если бы его винрейт был win_rate (например с учетом статистики еще не записанной в БД), при
+        неизменных винрейтах остальных игроков
+        :return: место игрока и количество игроков в рейтинге, или None - если win_rate нет
+        """
+
+        if win_rate is None:
+            return None
+
+        bucket = self._bucket(win_rate)
+
+        with self._lock:
+            self._lookups += 1
+            user = self._users.get(user_id)
+            others = len(self._users) - (user is not None)
+            higher = len(self._users) - self._tree.prefix_sum(bucket)
+
+            # Сам игрок не выше себя
+            if user is not None and user[0] > bucket:
+                higher -= 1
+
+            return higher + 1, others + 1
+
+    def metrics(self) -> RankIndexMetrics:
+        with self._lock:
+            return RankIndexMetrics(
+                ranked=len(self._users),
+                loads=self._loads,
+                updates=self._updates,
+                lookups=self._lookups
+            )
+
+    def _bucket(self, win_rate: float) -> int:
+        return min(self.buckets, max(0, int(win_rate * self.buckets)))
+
+    def _apply(self, row: tuple):
+        user_id, win_rate, games = row[0], row[2], row[3]
+        old = self._users.get(user_id)
+
+        # Запросы разных игр могут вернуть строки не в том порядке, в котором они были записаны
+        if old is not None and old[1] > games:
+            return
+
+        if old is not None:
+            self._tree.add(old[0], -1)
+            del self._users[user_id]
+
+        if win_rate is not None:
+            bucket = self._bucket(win_rate)
+            self._tree.add(bucket, 1)
+            self._users[user_id] = (bucket, games)
+
+        self._updates += 1
@@ -0,0 +1,544 @@
+# --------------------------------------------------------------------------
+# Хранилище во встроенной БД SQLite
+#
+# Для небольших установок, CI и нагрузочных тестов, где отдельный сервер
+# MySQL не нужен: вся БД - один файл. Журнал в режиме WAL позволяет читать
+# параллельно с записью, поэтому:
+#   - все записи идут через одно соединение под блокировкой (SQLite все
+#     равно допускает только одного пишущего), каждая запись - одна
+#     транзакция BEGIN IMMEDIATE ... COMMIT;
+#   - чтения идут через пул из readers соединений только для чтения и не
+#     ждут ни записи, ни друг друга.
+# Модуль sqlite3 сам кэширует подготовленные запросы каждого соединения, так
+# же как ConnectionPool.execute для MySQL.
+#
+# Нужен SQLite 3.24 или новее (INSERT ... ON CONFLICT DO UPDATE)
+# --------------------------------------------------------------------------
+
+
+import contextlib
+import dataclasses
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+from typing import Iterator
+
+from database.storage import DatabaseOperationResult, Storage, StorageError
+
+
+@dataclasses.dataclass
+class SQLiteMetrics:
+    """
+    Статистика соединений с SQLite:
+    readers: int - количество соединений для чтения
+    idle_readers: int - количество свободных соединений для чтения
+    reads: int - количество чтений
+    writes: int - количество транзакций записи
+    write_wait_time: float - суммарное время ожидания соединения для записи в секундах
+    """
+    readers: int
+    idle_readers: int
+    reads: int
+    writes: int
+    write_wait_time: float
+
+
+def _log(error: sqlite3.Error, func_name: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: (запрос к БД послал ошибку) {func_name} => {error}")
+
+
+class SQLiteStorage(Storage):
+    _SELECT_USERS_IDS = "SELECT id FROM users"
+    _SELECT_USERS_SCORES = "SELECT id, wins, loses, draws, win_rate, nickname FROM users"
+    _SELECT_USER_SCORE = _SELECT_USERS_SCORES + " WHERE id = ?"
+    _UPSERT_USER = "INSERT INTO users VALUES (?, 0, 0, 0, NULL, NULL) ON CONFLICT (id) DO NOTHING"
+    # В отличие от MySQL, SQLite считает все выражения SET по старым значениям строки
+    _WRITE_GAME_RESULT = (
+        "UPDATE users "
+        "SET wins = wins + (id = ?), loses = loses + (id = ?), "
+        "win_rate = CAST(wins + (id = ?) AS REAL) / (wins + loses + 1) "
+        "WHERE id IN (?, ?)"
+    )
+    _WRITE_DRAW = "UPDATE users SET draws = draws + 1 WHERE id IN (?, ?)"
+    _UPSERT_STATS = (
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?, NULL) "
+        "ON CONFLICT (id) DO UPDATE SET "
+        "wins = wins + excluded.wins, loses = loses + excluded.loses, draws = draws + excluded.draws, "
+        "win_rate = CASE WHEN wins + excluded.wins + loses + excluded.loses > 0 "
+        "THEN CAST(wins + excluded.wins AS REAL) / (wins + excluded.wins + loses + excluded.loses) ELSE NULL END"
+    )
+    _UPSERT_APPLIED_SEQUENCE = (
+        "INSERT INTO stats_journal_state VALUES (1, ?) "
+        "ON CONFLICT (id) DO UPDATE SET applied_sequence = MAX(applied_sequence, excluded.applied_sequence)"
+    )
+    _SELECT_APPLIED_SEQUENCE = "SELECT applied_sequence FROM stats_journal_state WHERE id = 1"
+    _SELECT_NICKNAME = "SELECT nickname FROM users WHERE id = ?"
+    _UPDATE_NICKNAME = "UPDATE users SET nickname = ? WHERE id = ?"
+
+    # Строки пользователей в виде нужном Leaderboard: (id, ник, винрейт, количество игр)
+    _LEADERBOARD_SELECT = "SELECT id, nickname, win_rate, wins + loses + draws FROM users"
+    _SELECT_LEADERS = _LEADERBOARD_SELECT + " ORDER BY win_rate DESC LIMIT ?"
+
+    # Максимальное количество id в одном запросе с IN, старые версии SQLite ограничивают число параметров 999
+    _IN_CHUNK_SIZE = 500
+
+    def __init__(self, path: str, readers: int = 4, busy_timeout: float = 5.0, acquire_timeout: float = 5.0,
+                 stats_journal_path: str | None = None, stats_flush_interval: float = 1.0,
+                 stats_flush_threshold: int = 256, profile_cache_size: int = 10000,
+                 profile_cache_ttl: float = 300.0, load_rank_index: bool = True):
+        """
+        :param path: путь к файлу БД, создается если его нет
+        :param readers: количество соединений для чтения, столько чтений выполняется одновременно
+        :param busy_timeout: максимальное время ожидания блокировки файла БД другим процессом в секундах
+        :param acquire_timeout: максимальное время ожидания свободного соединения для чтения в секундах
+        :param stats_journal_path: путь к журналу отложенной записи статистики, или None - если результаты игр
+        записываются в БД сразу
+        :param stats_flush_interval: период отложенной записи статистики в секундах
+        :param stats_flush_threshold: количество пользователей с незаписанной статистикой, при котором запись
+        начинается досрочно
+        :param profile_cache_size: максимальное количество пользователей в кэше профилей
+        :param profile_cache_ttl: время жизни данных в кэше профилей в секундах
+        :param load_rank_index: загрузить индекс мест сразу, или False - если индекс загрузится при первом get_user_rank
+        """
+
+        self.path = path
+        self.acquire_timeout = acquire_timeout
+
+        # isolation_level=None - модуль sqlite3 не начинает транзакции сам, они начинаются явно в _write
+        self._writer = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        # В режиме WAL с synchronous = NORMAL транзакция не теряется при падении процесса, а COMMIT не ждет диска
+        self._writer.execute("PRAGMA synchronous = NORMAL")
+        self._writer.execute(
+            """
+                CREATE TABLE IF NOT EXISTS users(
+                    id INTEGER PRIMARY KEY NOT NULL,
+                    wins INTEGER,
+                    loses INTEGER,
+                    draws INTEGER,
+                    win_rate REAL,
+                    nickname TEXT
+                )
+            """
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS win_rate_index ON users (win_rate)")
+        self._writer.execute(
+            """
+                CREATE TABLE IF NOT EXISTS stats_journal_state(
+                    id INTEGER PRIMARY KEY NOT NULL,
+                    applied_sequence INTEGER NOT NULL
+                )
+            """
+        )
+        self._write_lock = threading.Lock()
+
+        self.readers = readers
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+
+        for _ in range(readers):
+            reader = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+            reader.execute("PRAGMA query_only = ON")
+            self._readers.put(reader)
+
+        self._metrics_lock = threading.Lock()
+        self._reads = 0
+        self._writes = 0
+        self._write_wait_time = 0.0
+
+        super().__init__(stats_journal_path=stats_journal_path, stats_flush_interval=stats_flush_interval,
+                         stats_flush_threshold=stats_flush_threshold, profile_cache_size=profile_cache_size,
+                         profile_cache_ttl=profile_cache_ttl, load_rank_index=load_rank_index)
+
+    @contextlib.contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Берет свободное соединение для чтения и возвращает его в пул после запроса
+        :raises sqlite3.OperationalError: если свободного соединения не было дольше acquire_timeout
+        """
+
+        try:
+            reader = self._readers.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Нет свободного соединения для чтения за {self.acquire_timeout} с")
+
+        with self._metrics_lock:
+            self._reads += 1
+
+        try:
+            yield reader
+        finally:
+            self._readers.put(reader)
+
+    @contextlib.contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выполняет запросы внутри with в одной транзакции единственного соединения для записи. При исключении
+        транзакция откатывается
+        """
+
+        started = time.perf_counter()
+
+        with self._write_lock:
+            with self._metrics_lock:
+                self._writes += 1
+                self._write_wait_time += time.perf_counter() - started
+
+            # IMMEDIATE сразу берет блокировку записи, а не при первом изменении, поэтому транзакция не может
+            # завершиться SQLITE_BUSY посередине
+            self._writer.execute("BEGIN IMMEDIATE")
+
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+
+                raise
+
+            self._writer.execute("COMMIT")
+
+    def get_users_ids(self) -> DatabaseOperationResult:
+        """
+        Возвращает id всех пользователей в БД в виде экземпляра класса DatabaseOperationResult где в случае успеха
+        data это список всех id, в противном случае - None
+
+        :return: DatabaseOperationResult(success: bool, data: [int] | None)
+        """
+        try:
+            with self._read() as reader:
+                return DatabaseOperationResult(True, [row[0] for row in reader.execute(self._SELECT_USERS_IDS)])
+        except sqlite3.Error as e:
+            _log(e, "get_users_ids")
+
+            return DatabaseOperationResult(False, None)
+
+    def iter_users_ids(self, batch_size: int = 1000) -> Iterator[int]:
+        """
+        Как get_users_ids, но id читаются частями по batch_size. Соединение для чтения занято, пока генератор не
+        исчерпан или не закрыт
+
+        :param batch_size: количество строк читаемых за раз
+        :raises StorageError: если запрос к БД завершился ошибкой
+        """
+        for row in self._iter_rows(self._SELECT_USERS_IDS, batch_size, "iter_users_ids"):
+            yield row[0]
+
+    def select_users_scores(self) -> DatabaseOperationResult:
+        """
+        Читает из БД данные всех пользователей для get_users_scores
+
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
+        """
+        try:
+            with self._read() as reader:
+                return DatabaseOperationResult(True, {
+                    row[0]: (row[1], row[2], row[3], row[4], row[5])
+                    for row in reader.execute(self._SELECT_USERS_SCORES)
+                })
+        except sqlite3.Error as e:
+            _log(e, "select_users_scores")
+
+            return DatabaseOperationResult(False, None)
+
+    def iter_users_rows(self, batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        Читает строки всех пользователей для iter_users_scores. Все строки берутся из одного снимка БД, записи в это
+        время не ждут. Соединение для чтения занято, пока генератор не исчерпан или не закрыт
+
+        :param batch_size: количество строк читаемых за раз
+        :return: генератор строк (id, победы, поражения, ничьи, винрейт, никнейм)
+        :raises StorageError: если запрос к БД завершился ошибкой
+        """
+        return self._iter_rows(self._SELECT_USERS_SCORES, batch_size, "iter_users_rows")
+
+    def _iter_rows(self, operation: str, batch_size: int, func_name: str) -> Iterator[tuple]:
+        try:
+            with self._read() as reader:
+                cursor = reader.execute(operation)
+
+                try:
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+
+                        if not rows:
+                            return
+
+                        yield from rows
+                finally:
+                    # Незавершенный запрос держит снимок БД и не дает WAL сбросить журнал в основной файл
+                    cursor.close()
+        except sqlite3.Error as e:
+            _log(e, func_name)
+
+            raise StorageError(func_name) from e
+
+    def select_user_score(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Читает из БД данные о пользователе для get_user_score
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: (int, int, int, int, str) | None)
+        """
+        try:
+            with self._read() as reader:
+                row = reader.execute(self._SELECT_USER_SCORE, (user_id,)).fetchone()
+
+            return DatabaseOperationResult(True, None if row is None else row[1:])
+        except sqlite3.Error as e:
+            _log(e, "select_user_score")
+
+            return DatabaseOperationResult(False, None)
+
+    def select_scores(self, users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Читает из БД данные нескольких пользователей для таблицы лидеров с незаписанной статистикой
+
+        :param users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
+        """
+        out_dict = {}
+
+        try:
+            with self._read() as reader:
+                for start in range(0, len(users_ids), self._IN_CHUNK_SIZE):
+                    chunk = users_ids[start:start + self._IN_CHUNK_SIZE]
+                    cursor = reader.execute(
+                        f"{self._SELECT_USERS_SCORES} WHERE id IN ({', '.join(['?'] * len(chunk))})",
+                        chunk
+                    )
+
+                    for row in cursor:
+                        out_dict[row[0]] = row[1:]
+
+            return DatabaseOperationResult(True, out_dict)
+        except sqlite3.Error as e:
+            _log(e, "select_scores")
+
+            return DatabaseOperationResult(False, None)
+
+    def register_user(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Добавляет пользователя в БД, если его там еще нет
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: bool | None), data - True если пользователь добавлен,
+        False - если он уже был в БД
+        """
+        try:
+            with self._write() as writer:
+                is_new = writer.execute(self._UPSERT_USER, (user_id,)).rowcount == 1
+
+            return DatabaseOperationResult(True, is_new)
+        except sqlite3.Error as e:
+            _log(e, "register_user")
+
+            return DatabaseOperationResult(False, None)
+
+    def write_game_result(self, winner_id: int, loser_id: int) -> DatabaseOperationResult:
+        """
+        Записывает результат игры одним UPDATE и в той же транзакции читает новые строки обоих игроков для таблицы
+        лидеров
+
+        :param winner_id: id победителя
+        :param loser_id: id проигравшего
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет в БД, data - новые строки игроков
+        """
+        try:
+            with self._write() as writer:
+                updated_rows = writer.execute(
+                    self._WRITE_GAME_RESULT, (winner_id, loser_id, winner_id, winner_id, loser_id)
+                ).rowcount
+                changed_rows = self._select_leaderboard_rows(writer, [winner_id, loser_id])
+
+            return DatabaseOperationResult(updated_rows == 2, changed_rows)
+        except sqlite3.Error as e:
+            _log(e, "write_game_result")
+
+            return DatabaseOperationResult(False, None)
+
+    def write_draw(self, first_user_id: int, second_user_id: int) -> DatabaseOperationResult:
+        """
+        Записывает ничью обоим игрокам одним UPDATE и в той же транзакции читает новые строки обоих игроков для
+        таблицы лидеров. Винрейт от ничьих не зависит
+
+        :param first_user_id: id первого игрока
+        :param second_user_id: id второго игрока
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет в БД, data - новые строки игроков
+        """
+        try:
+            with self._write() as writer:
+                updated_rows = writer.execute(self._WRITE_DRAW, (first_user_id, second_user_id)).rowcount
+                changed_rows = self._select_leaderboard_rows(writer, [first_user_id, second_user_id])
+
+            return DatabaseOperationResult(updated_rows == 2, changed_rows)
+        except sqlite3.Error as e:
+            _log(e, "write_draw")
+
+            return DatabaseOperationResult(False, None)
+
+    def write_stats_deltas(self, deltas: {int: [int]}, sequence: int) -> DatabaseOperationResult:
+        """
+        Добавляет накопленные отложенной записью приращения статистики и в той же транзакции запоминает номер
+        последнего записанного результата журнала и читает новые строки пользователей для таблицы лидеров
+
+        :param deltas: словарь где ключ - id пользователя, значение - приращения [победы, поражения, ничьи]
+        :param sequence: номер последнего результата журнала вошедшего в deltas
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None)
+        """
+        rows = [
+            (user_id, wins, loses, draws, wins / (wins + loses) if wins + loses > 0 else None)
+            for user_id, (wins, loses, draws) in deltas.items()
+        ]
+
+        try:
+            with self._write() as writer:
+                writer.executemany(self._UPSERT_STATS, rows)
+                writer.execute(self._UPSERT_APPLIED_SEQUENCE, (sequence,))
+                changed_rows = self._select_leaderboard_rows(writer, list(deltas.keys()))
+
+            return DatabaseOperationResult(True, changed_rows)
+        except sqlite3.Error as e:
+            _log(e, "write_stats_deltas")
+
+            return DatabaseOperationResult(False, None)
+
+    def get_applied_stats_sequence(self) -> DatabaseOperationResult:
+        """
+        Возвращает номер последнего результата журнала отложенной записи, который уже есть в БД
+
+        :return: DatabaseOperationResult(success: bool, data: int | None)
+        """
+        try:
+            with self._read() as reader:
+                row = reader.execute(self._SELECT_APPLIED_SEQUENCE).fetchone()
+
+            return DatabaseOperationResult(True, 0 if row is None else row[0])
+        except sqlite3.Error as e:
+            _log(e, "get_applied_stats_sequence")
+
+            return DatabaseOperationResult(False, None)
+
+    def select_nickname(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Читает из БД ник пользователя для get_nickname
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: str | None)
+        """
+        try:
+            with self._read() as reader:
+                row = reader.execute(self._SELECT_NICKNAME, (user_id,)).fetchone()
+
+            return DatabaseOperationResult(True, None if row is None else row[0])
+        except sqlite3.Error as e:
+            _log(e, "select_nickname")
+
+            return DatabaseOperationResult(False, None)
+
+    def select_nicknames(self, users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Читает из БД ники пользователей для get_nicknames
+
+        :param users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: str | None} | None)
+        """
+        out_dict = {}
+
+        try:
+            with self._read() as reader:
+                for start in range(0, len(users_ids), self._IN_CHUNK_SIZE):
+                    chunk = users_ids[start:start + self._IN_CHUNK_SIZE]
+                    cursor = reader.execute(
+                        f"SELECT id, nickname FROM users WHERE id IN ({', '.join(['?'] * len(chunk))})",
+                        chunk
+                    )
+
+                    for row in cursor:
+                        out_dict[row[0]] = row[1]
+
+            return DatabaseOperationResult(True, out_dict)
+        except sqlite3.Error as e:
+            _log(e, "select_nicknames")
+
+            return DatabaseOperationResult(False, None)
+
+    def write_nickname(self, user_id: int, user_nickname: str) -> DatabaseOperationResult:
+        """
+        Устанавливает пользователю с нужным id новый ник для set_nickname
+
+        :param user_id: id пользователя
+        :param user_nickname: ник пользователя
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+        try:
+            with self._write() as writer:
+                writer.execute(self._UPDATE_NICKNAME, (user_nickname, user_id))
+
+            return DatabaseOperationResult(True, None)
+        except sqlite3.Error as e:
+            _log(e, "write_nickname")
+
+            return DatabaseOperationResult(False, None)
+
+    def select_leaders(self, limit: int) -> DatabaseOperationResult:
+        """
+        Читает из БД лучших игроков для загрузки таблицы лидеров, запрос идет по индексу win_rate_index
+
+        :param limit: количество игроков
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None)
+        """
+        try:
+            with self._read() as reader:
+                return DatabaseOperationResult(True, reader.execute(self._SELECT_LEADERS, (limit,)).fetchall())
+        except sqlite3.Error as e:
+            _log(e, "select_leaders")
+
+            return DatabaseOperationResult(False, None)
+
+    def _select_leaderboard_rows(self, connection: sqlite3.Connection, users_ids: [int]) -> [tuple]:
+        rows = []
+
+        for start in range(0, len(users_ids), self._IN_CHUNK_SIZE):
+            chunk = users_ids[start:start + self._IN_CHUNK_SIZE]
+            rows.extend(connection.execute(
+                f"{self._LEADERBOARD_SELECT} WHERE id IN ({', '.join(['?'] * len(chunk))})",
+                chunk
+            ))
+
+        return rows
+
+    def metrics(self) -> {str: any}:
+        """
+        Метрики соединений с SQLite, кэша профилей, таблицы лидеров, индекса мест и отложенной записи статистики
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
+        """
+
+        with self._metrics_lock:
+            out_dict = {"sqlite": SQLiteMetrics(
+                readers=self.readers,
+                idle_readers=self._readers.qsize(),
+                reads=self._reads,
+                writes=self._writes,
+                write_wait_time=self._write_wait_time
+            )}
+
+        out_dict.update(super().metrics())
+
+        return out_dict
+
+    def close(self):
+        """
+        Записывает накопленную статистику и закрывает соединения с БД
+        """
+
+        super().close()
+
+        with self._write_lock:
+            self._writer.close()
+
+        for _ in range(self.readers):
+            self._readers.get(timeout=self.acquire_timeout).close()
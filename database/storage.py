@@ -0,0 +1,651 @@
+# --------------------------------------------------------------------------
+# Хранилище статистики пользователей
+#
+# Storage - интерфейс, от которого зависят BotClient и AsyncBotClient. Он
+# же содержит все, что не зависит от конкретной БД: кэш профилей, таблицу
+# лидеров и индекс мест в памяти процесса и отложенную запись статистики.
+# Реализация хранилища (backend) реализует только простые чтения и записи
+# (абстрактные методы ниже):
+#   DatabaseAPI (database_utils.py) - MySQL
+#   SQLiteStorage (sqlite_storage.py) - встроенная БД в одном файле
+#   MemoryStorage (memory_storage.py) - словарь в памяти для бенчмарков
+#
+# Все реализации проверяются одним набором тестов database/conformance.py.
+#
+# Методы записи реализации возвращают новые строки измененных пользователей
+# в виде (id, ник, винрейт, количество игр) - по ним Storage обновляет
+# таблицу лидеров и индекс мест без дополнительных запросов
+# --------------------------------------------------------------------------
+
+
+import abc
+import dataclasses
+import threading
+from typing import Iterator
+
+from database.leaderboard import Leaderboard
+from database.profile_cache import ProfileCache
+from database.rank_index import RankIndex
+from database.write_behind import StatsWriteBehind
+
+
+@dataclasses.dataclass
+class DatabaseOperationResult:
+    """
+    Данные о запросе к БД:
+    succes: bool - успешен запрос или нет
+    data: int or [int] or {int: (int, int, int)} or (int, int, int) or None - если запрос к БД подразумевает возвращение
+    данных и запрос был успешен, то содержит возвращаемые данные, в противном случае - None
+    """
+    success: bool
+    data: any
+
+
+class StorageError(Exception):
+    """
+    Ошибка чтения из хранилища в генераторах iter_users_ids и iter_users_scores (остальные методы возвращают
+    DatabaseOperationResult с success=False). Исходная ошибка БД доступна через __cause__
+    """
+
+
+class Storage(abc.ABC):
+    def __init__(self, stats_journal_path: str | None = None, stats_flush_interval: float = 1.0,
+                 stats_flush_threshold: int = 256, profile_cache_size: int = 10000, profile_cache_ttl: float = 300.0,
+                 load_rank_index: bool = True):
+        """
+        Вызывается реализацией в конце её __init__, когда таблицы уже созданы: здесь загружается индекс мест и
+        повторяется журнал отложенной записи
+
+        :param stats_journal_path: путь к журналу отложенной записи статистики, или None - если результаты игр
+        записываются в БД сразу
+        :param stats_flush_interval: период отложенной записи статистики в секундах
+        :param stats_flush_threshold: количество пользователей с незаписанной статистикой, при котором запись
+        начинается досрочно
+        :param profile_cache_size: максимальное количество пользователей в кэше профилей
+        :param profile_cache_ttl: время жизни данных в кэше профилей в секундах
+        :param load_rank_index: загрузить индекс мест сразу, или False - если индекс загрузится при первом get_user_rank
+        """
+
+        self.profile_cache = ProfileCache(capacity=profile_cache_size, ttl=profile_cache_ttl)
+        """
+        Наличие в БД, ники и статистика недавних пользователей
+        """
+
+        self.leaderboard = Leaderboard()
+        """
+        Лучшие игроки в памяти процесса, обновляются при записи результатов игр
+        """
+
+        self._leaderboard_load_lock = threading.Lock()
+
+        self._merged_leaders: (int, tuple, tuple) | None = None
+        """
+        _merged_leaders: (номер результата журнала, таблица лидеров из Leaderboard.top, таблица лидеров с
+        незаписанной статистикой)
+        Последняя таблица лидеров с учетом журнала отложенной записи
+        """
+
+        self.rank_index = RankIndex()
+        """
+        Места игроков по винрейту в памяти процесса, обновляются при записи результатов игр
+        """
+
+        self._rank_index_load_lock = threading.Lock()
+
+        self.write_behind: StatsWriteBehind | None = None
+        """
+        Отложенная запись статистики, или None - если результаты игр записываются в БД сразу
+        """
+
+        # До запуска отложенной записи, чтобы результаты повторенные из журнала попали в уже загруженный индекс.
+        # Незагруженный индекс пропускает обновления и при первом get_user_rank читается из БД целиком
+        if load_rank_index:
+            self._load_rank_index()
+
+        if stats_journal_path is not None:
+            self.write_behind = StatsWriteBehind(self, stats_journal_path, flush_interval=stats_flush_interval,
+                                                 flush_threshold=stats_flush_threshold)
+            self.write_behind.start()
+
+    # ----------------------------------------------------------------------
+    # Методы реализации хранилища
+    # ----------------------------------------------------------------------
+
+    @abc.abstractmethod
+    def get_users_ids(self) -> DatabaseOperationResult:
+        """
+        :return: DatabaseOperationResult(success: bool, data: [int] | None) - id всех пользователей
+        """
+
+    @abc.abstractmethod
+    def iter_users_ids(self, batch_size: int = 1000) -> Iterator[int]:
+        """
+        Как get_users_ids, но id читаются частями по batch_size, поэтому память не зависит от количества пользователей
+        :raises StorageError: если чтение завершилось ошибкой
+        """
+
+    @abc.abstractmethod
+    def select_users_scores(self) -> DatabaseOperationResult:
+        """
+        Читает данные всех пользователей для get_users_scores
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
+        """
+
+    @abc.abstractmethod
+    def iter_users_rows(self, batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        Читает данные всех пользователей частями по batch_size для iter_users_scores
+        :return: генератор строк (id, победы, поражения, ничьи, винрейт, никнейм)
+        :raises StorageError: если чтение завершилось ошибкой
+        """
+
+    @abc.abstractmethod
+    def select_user_score(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Читает данные пользователя для get_user_score
+        :return: DatabaseOperationResult(success: bool, data: (int, int, int, int, str) | None)
+        """
+
+    @abc.abstractmethod
+    def select_scores(self, users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Читает данные нескольких пользователей одним запросом (или несколькими на больших списках)
+        :param users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None), пользователей
+        которых нет в data нет и в БД
+        """
+
+    @abc.abstractmethod
+    def register_user(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Добавляет пользователя одной идемпотентной операцией, если его еще нет
+        :return: DatabaseOperationResult(success: bool, data: bool | None), data - True если пользователь добавлен,
+        False - если он уже был
+        """
+
+    @abc.abstractmethod
+    def write_game_result(self, winner_id: int, loser_id: int) -> DatabaseOperationResult:
+        """
+        Атомарно записывает результат игры: победителю +1 победа, проигравшему +1 поражение, обоим пересчитывается
+        винрейт
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет, data - новые строки игроков
+        """
+
+    @abc.abstractmethod
+    def write_draw(self, first_user_id: int, second_user_id: int) -> DatabaseOperationResult:
+        """
+        Атомарно записывает ничью обоим игрокам
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), success -
+        False если кого-то из игроков нет, data - новые строки игроков
+        """
+
+    @abc.abstractmethod
+    def write_stats_deltas(self, deltas: {int: [int]}, sequence: int) -> DatabaseOperationResult:
+        """
+        Одной транзакцией добавляет приращения статистики (пользователи которых нет добавляются) и запоминает номер
+        последнего записанного результата журнала, если он больше уже записанного
+        :param deltas: словарь где ключ - id пользователя, значение - приращения [победы, поражения, ничьи]
+        :param sequence: номер последнего результата журнала вошедшего в deltas
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None), data -
+        новые строки пользователей
+        """
+
+    @abc.abstractmethod
+    def get_applied_stats_sequence(self) -> DatabaseOperationResult:
+        """
+        :return: DatabaseOperationResult(success: bool, data: int | None) - номер последнего результата журнала
+        отложенной записи, который уже записан, 0 - если такого нет
+        """
+
+    @abc.abstractmethod
+    def select_nickname(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Читает ник пользователя для get_nickname
+        :return: DatabaseOperationResult(success: bool, data: str | None)
+        """
+
+    @abc.abstractmethod
+    def select_nicknames(self, users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Читает ники пользователей для get_nicknames
+        :param users_ids: id пользователей без повторов
+        :return: DatabaseOperationResult(success: bool, data: {int: str | None} | None)
+        """
+
+    @abc.abstractmethod
+    def write_nickname(self, user_id: int, user_nickname: str) -> DatabaseOperationResult:
+        """
+        Устанавливает пользователю новый ник
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+
+    @abc.abstractmethod
+    def select_leaders(self, limit: int) -> DatabaseOperationResult:
+        """
+        Читает limit игроков с самым большим винрейтом для загрузки таблицы лидеров, пользователи без винрейта идут
+        последними
+        :return: DatabaseOperationResult(success: bool, data: [(int, str | None, float | None, int)] | None)
+        """
+
+    # ----------------------------------------------------------------------
+    # Общие методы
+    # ----------------------------------------------------------------------
+
+    def get_users_scores(self) -> DatabaseOperationResult:
+        """
+        Возвращает данные о всех пользователей в БД в виде экземпляра класса DatabaseOperationResult где в случае успеха
+        data это словарь где ключ - id пользователя, значение - картеж из 4 чисел и строки: количество побед, количество
+        поражений, количество ничьих, винрейт, никнейм; в противном случае - None
+
+        :return: DatabaseOperationResult(success: bool, data: {int: (int, int, int, int, str)} | None)
+        """
+        if self.write_behind is None:
+            return self.select_users_scores()
+
+        # Повторяется, если во время чтения началась запись приращений в БД (StatsWriteBehind.begin_read)
+        while True:
+            version = self.write_behind.begin_read()
+            select_users_scores_query = self.select_users_scores()
+
+            if not select_users_scores_query.success:
+                return select_users_scores_query
+
+            deltas = self.write_behind.pending_deltas()
+
+            if self.write_behind.is_current(version):
+                break
+
+        out_dict = select_users_scores_query.data
+
+        for user_id, delta in deltas.items():
+            if user_id in out_dict:
+                out_dict[user_id] = self.write_behind.merge_score(out_dict[user_id], delta)
+
+        return select_users_scores_query
+
+    def iter_users_scores(self, batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        Как get_users_scores, но данные читаются частями по batch_size, поэтому память не зависит от количества
+        пользователей
+
+        :param batch_size: количество строк читаемых за раз
+        :return: генератор картежей (id, (победы, поражения, ничьи, винрейт, никнейм))
+        :raises StorageError: если чтение завершилось ошибкой
+        """
+        if self.write_behind is None:
+            for row in self.iter_users_rows(batch_size):
+                yield row[0], (row[1], row[2], row[3], row[4], row[5])
+
+            return
+
+        # Чтение всей таблицы нельзя повторить, как в get_users_scores, поэтому запись приращений в БД откладывается до
+        # его конца
+        with self.write_behind.paused():
+            deltas = self.write_behind.pending_deltas()
+
+            for row in self.iter_users_rows(batch_size):
+                score = (row[1], row[2], row[3], row[4], row[5])
+
+                if row[0] in deltas:
+                    score = self.write_behind.merge_score(score, deltas[row[0]])
+
+                yield row[0], score
+
+    def get_user_score(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Возвращает данные о пользователе в БД по его id в виде экземпляра класса DatabaseOperationResult где в случае
+        успеха data это картеж из 4 чисел и строки: количество побед, количество поражений, количество ничьих, винрейт,
+        никнейм; в противном случае - None. Данные берутся из кэша профилей, если они там есть
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: (int, int, int, int, str) | None)
+        """
+        while True:
+            version = None if self.write_behind is None else self.write_behind.begin_read()
+            score = self.profile_cache.get(user_id, ProfileCache.SCORE)
+
+            if score is ProfileCache.MISSING:
+                generation = self.profile_cache.begin_read()
+                select_user_score_query = self.select_user_score(user_id)
+
+                if not select_user_score_query.success:
+                    return select_user_score_query
+
+                score = select_user_score_query.data
+                self.profile_cache.put(user_id, ProfileCache.SCORE, score, generation)
+
+            if score is None or self.write_behind is None:
+                return DatabaseOperationResult(True, score)
+
+            # В кэше хранятся данные из БД, незаписанная статистика меняется чаще и добавляется при каждом чтении.
+            # Повторяется, если во время чтения началась запись приращений в БД
+            delta = self.write_behind.pending_delta(user_id)
+
+            if self.write_behind.is_current(version):
+                return DatabaseOperationResult(True, self.write_behind.merge_score(score, delta))
+
+    def ensure_user(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Добавляет пользователя в БД, если его там еще нет. Пользователи которые уже есть в кэше профилей не требуют
+        запроса к БД
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: bool | None), data - True если пользователь только что
+        добавлен
+        """
+        if self.profile_cache.get(user_id, ProfileCache.EXISTS) is True:
+            return DatabaseOperationResult(True, False)
+
+        register_user_query = self.register_user(user_id)
+
+        if register_user_query.success:
+            if register_user_query.data:
+                self.profile_cache.invalidate(user_id, ProfileCache.NICKNAME, ProfileCache.SCORE)
+                self.leaderboard.update([(user_id, None, None, 0)])
+
+            self.profile_cache.put(user_id, ProfileCache.EXISTS, True)
+
+        return register_user_query
+
+    def record_game_result(self, winner_id: int, loser_id: int) -> DatabaseOperationResult:
+        """
+        Записывает результат игры: победителю +1 победа, проигравшему +1 поражение, обоим пересчитывается винрейт. В
+        режиме отложенной записи результат только попадает в журнал и память, иначе сразу записывается в БД
+
+        :param winner_id: id победителя
+        :param loser_id: id проигравшего
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+        if self.write_behind is not None:
+            self.write_behind.record_game_result(winner_id, loser_id)
+
+            return DatabaseOperationResult(True, None)
+
+        write_game_result_query = self.write_game_result(winner_id, loser_id)
+        # Часть строк могла измениться, даже если кого-то из игроков нет
+        self.profile_cache.invalidate(winner_id, ProfileCache.SCORE)
+        self.profile_cache.invalidate(loser_id, ProfileCache.SCORE)
+
+        if write_game_result_query.data:
+            self.leaderboard.update(write_game_result_query.data)
+            self.rank_index.update(write_game_result_query.data)
+
+        return DatabaseOperationResult(write_game_result_query.success, None)
+
+    def record_draw(self, first_user_id: int, second_user_id: int) -> DatabaseOperationResult:
+        """
+        Записывает ничью обоим игрокам, так же как record_game_result
+
+        :param first_user_id: id первого игрока
+        :param second_user_id: id второго игрока
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+        if self.write_behind is not None:
+            self.write_behind.record_draw(first_user_id, second_user_id)
+
+            return DatabaseOperationResult(True, None)
+
+        write_draw_query = self.write_draw(first_user_id, second_user_id)
+        self.profile_cache.invalidate(first_user_id, ProfileCache.SCORE)
+        self.profile_cache.invalidate(second_user_id, ProfileCache.SCORE)
+
+        # Винрейт от ничьих не зависит, но количество игр в таблице лидеров и индексе мест растет
+        if write_draw_query.data:
+            self.leaderboard.update(write_draw_query.data)
+            self.rank_index.update(write_draw_query.data)
+
+        return DatabaseOperationResult(write_draw_query.success, None)
+
+    def apply_stats_deltas(self, deltas: {int: [int]}, sequence: int) -> DatabaseOperationResult:
+        """
+        Записывает накопленные отложенной записью приращения статистики (write_stats_deltas) и учитывает новые строки
+        пользователей в кэше профилей, таблице лидеров и индексе мест
+
+        :param deltas: словарь где ключ - id пользователя, значение - приращения [победы, поражения, ничьи]
+        :param sequence: номер последнего результата журнала вошедшего в deltas
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+        write_stats_deltas_query = self.write_stats_deltas(deltas, sequence)
+
+        if not write_stats_deltas_query.success:
+            return write_stats_deltas_query
+
+        for user_id in deltas.keys():
+            self.profile_cache.invalidate(user_id, ProfileCache.SCORE)
+
+        self.leaderboard.update(write_stats_deltas_query.data)
+        self.rank_index.update(write_stats_deltas_query.data)
+
+        return DatabaseOperationResult(True, None)
+
+    def get_nicknames(self, users_ids: [int]) -> DatabaseOperationResult:
+        """
+        Возвращает ники пользователей в БД по их id в виде экземпляра класса DatabaseOperationResult, где в случае если
+        запрос был завершен без ошибок, data это словарь где ключ - id пользователя, значение - ник или None, если
+        ника нет. Пользователей которых нет в БД в словаре нет. Ники из кэша профилей не запрашиваются из БД, а
+        остальные запрашиваются одним select_nicknames
+
+        :param users_ids: id пользователей
+        :return: DatabaseOperationResult(success: bool, data: {int: str | None} | None)
+        """
+        out_dict = {}
+        missing_ids = []
+
+        for user_id in dict.fromkeys(users_ids):
+            nickname = self.profile_cache.get(user_id, ProfileCache.NICKNAME)
+
+            if nickname is ProfileCache.MISSING:
+                missing_ids.append(user_id)
+            else:
+                out_dict[user_id] = nickname
+
+        if not missing_ids:
+            return DatabaseOperationResult(True, out_dict)
+
+        generation = self.profile_cache.begin_read()
+        select_nicknames_query = self.select_nicknames(missing_ids)
+
+        if not select_nicknames_query.success:
+            return select_nicknames_query
+
+        for user_id, nickname in select_nicknames_query.data.items():
+            self.profile_cache.put(user_id, ProfileCache.NICKNAME, nickname, generation)
+            out_dict[user_id] = nickname
+
+        return DatabaseOperationResult(True, out_dict)
+
+    def get_nickname(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Возвращает ник пользователя в БД по его id в виде экземпляра класса DatabaseOperationResult, где в случае если
+        такой пользователь есть в БД, и запрос был завершен без ошибок, data это строка содержащая ник, иначе - None.
+        Ник берется из кэша профилей, если он там есть
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: str | None)
+        """
+        nickname = self.profile_cache.get(user_id, ProfileCache.NICKNAME)
+
+        if nickname is not ProfileCache.MISSING:
+            return DatabaseOperationResult(True, nickname)
+
+        generation = self.profile_cache.begin_read()
+        select_nickname_query = self.select_nickname(user_id)
+
+        # None - и пользователь без ника, и пользователь которого нет в БД. Второй не должен попасть в кэш, иначе
+        # get_nicknames вернет его как существующего
+        if select_nickname_query.success and (select_nickname_query.data is not None or
+                                              self.profile_cache.get(user_id, ProfileCache.EXISTS) is True):
+            self.profile_cache.put(user_id, ProfileCache.NICKNAME, select_nickname_query.data, generation)
+
+        return select_nickname_query
+
+    def set_nickname(self, user_id: int, user_nickname: str) -> DatabaseOperationResult:
+        """
+        Устанавливает пользователю с нужным id новый ник
+
+        :param user_id: id пользователя
+        :param user_nickname: ник пользователя
+        :return: DatabaseOperationResult(success: bool, data: None)
+        """
+        write_nickname_query = self.write_nickname(user_id, user_nickname)
+
+        if write_nickname_query.success:
+            self.profile_cache.invalidate(user_id, ProfileCache.NICKNAME, ProfileCache.SCORE)
+            self.leaderboard.rename(user_id, user_nickname)
+
+        return write_nickname_query
+
+    def get_leaders(self) -> DatabaseOperationResult:
+        """
+        Возвращает список игроков с самым большим винрейтом в виде экземпляра класса DatabaseOperationResult, где в
+        случае если запрос был завершен без ошибок, data это картеж из до 5 картежей где первый элемент это id или ник
+        игрока (если есть), а второй - винрейт, иначе - None. Таблица лидеров хранится в памяти, к БД запрос идет
+        только при первой загрузке (и если отслеживаемых игроков стало слишком мало). Пока таблица не меняется,
+        возвращается один и тот же картеж
+
+        В режиме отложенной записи учитываются и результаты из журнала, еще не записанные в БД
+
+        :return: DatabaseOperationResult(success: bool, data: ((str, int), ...) | None)
+        """
+
+        if not self.leaderboard.is_loaded:
+            with self._leaderboard_load_lock:
+                if not self.leaderboard.is_loaded:
+                    self.leaderboard.begin_load()
+                    select_leaders_query = self.select_leaders(self.leaderboard.capacity)
+
+                    if not select_leaders_query.success:
+                        self.leaderboard.abort_load()
+
+                        return DatabaseOperationResult(False, None)
+
+                    self.leaderboard.load(select_leaders_query.data)
+
+        top = self.leaderboard.top()
+
+        if self.write_behind is None:
+            return DatabaseOperationResult(True, top)
+
+        return DatabaseOperationResult(True, self._merge_pending_leaders(top))
+
+    def _merge_pending_leaders(self, top: tuple) -> tuple:
+        """
+        Добавляет к таблице лидеров незаписанную статистику: игроки с ней могут подняться в таблицу или опуститься из
+        нее. Отслеживаемые Leaderboard игроки и игроки с незаписанной статистикой - все, кто может быть выше порога
+        Leaderboard, поэтому остальных читать не нужно. Результат пересчитывается только после нового результата
+        журнала или изменения самой таблицы лидеров
+        :param top: Leaderboard.top()
+        :return: таблица лидеров того же вида
+        """
+
+        sequence = self.write_behind.sequence
+        merged = self._merged_leaders
+
+        if merged is not None and merged[0] == sequence and merged[1] is top:
+            return merged[2]
+
+        # Повторяется, если во время чтения началась запись приращений в БД (StatsWriteBehind.begin_read)
+        while True:
+            version = self.write_behind.begin_read()
+            deltas = self.write_behind.pending_deltas()
+            select_scores_query = self.select_scores(list(deltas.keys())) if deltas else None
+
+            # Без БД остается таблица лидеров по уже записанной статистике, и она не кэшируется
+            if select_scores_query is not None and not select_scores_query.success:
+                return top
+
+            if self.write_behind.is_current(version):
+                break
+
+        if deltas:
+            scores = {}
+
+            for user_id, score in select_scores_query.data.items():
+                score = self.write_behind.merge_score(score, deltas[user_id])
+                scores[user_id] = (score[4], score[3])
+
+            out_top = self.leaderboard.top_with(scores)
+        else:
+            out_top = top
+
+        self._merged_leaders = (sequence, top, out_top)
+
+        return out_top
+
+    def get_user_rank(self, user_id: int) -> DatabaseOperationResult:
+        """
+        Возвращает место игрока по винрейту в виде экземпляра класса DatabaseOperationResult, где в случае если
+        запрос был завершен без ошибок, data это картеж (место, количество игроков в рейтинге) или None - если у
+        игрока еще нет винрейта. Места хранятся в памяти, к БД запрос идет только если индекс не загружался при
+        старте (load_rank_index=False) или его не удалось загрузить
+
+        В режиме отложенной записи место игрока считается по его винрейту с незаписанной статистикой, так же как в
+        get_user_score
+
+        :param user_id: id пользователя
+        :return: DatabaseOperationResult(success: bool, data: (int, int) | None)
+        """
+
+        if not self.rank_index.is_loaded and not self._load_rank_index():
+            return DatabaseOperationResult(False, None)
+
+        if self.write_behind is not None and self.write_behind.pending_delta(user_id) != (0, 0, 0):
+            get_user_score_query = self.get_user_score(user_id)
+
+            if not get_user_score_query.success:
+                return DatabaseOperationResult(False, None)
+
+            if get_user_score_query.data is None:
+                return DatabaseOperationResult(True, None)
+
+            return DatabaseOperationResult(True, self.rank_index.rank_at(user_id, get_user_score_query.data[3]))
+
+        return DatabaseOperationResult(True, self.rank_index.rank(user_id))
+
+    def _load_rank_index(self) -> bool:
+        """
+        Загружает индекс мест статистикой всех пользователей
+        :return: True - если индекс загружен
+        """
+
+        with self._rank_index_load_lock:
+            if self.rank_index.is_loaded:
+                return True
+
+            self.rank_index.begin_load()
+
+            try:
+                self.rank_index.load(self.iter_users_scores())
+            except StorageError:
+                self.rank_index.abort_load()
+
+                return False
+
+            return True
+
+    def metrics(self) -> {str: any}:
+        """
+        Метрики кэша профилей, таблицы лидеров, индекса мест и отложенной записи статистики. Реализации добавляют
+        метрики своих соединений с БД
+        :return: словарь где ключ - название компонента, значение - экземпляр класса с его метриками
+        """
+
+        out_dict = {
+            "leaderboard": self.leaderboard.metrics(),
+            "rank_index": self.rank_index.metrics(),
+            "profile_cache": self.profile_cache.metrics()
+        }
+
+        if self.write_behind is not None:
+            out_dict["stats_write_behind"] = self.write_behind.metrics()
+
+        return out_dict
+
+    def close(self):
+        """
+        Записывает накопленную статистику. Реализации после этого закрывают свои соединения с БД
+        """
+
+        if self.write_behind is not None:
+            self.write_behind.close()
@@ -0,0 +1,410 @@
+# --------------------------------------------------------------------------
+# Отложенная запись статистики игроков
+#
+# В режиме write-behind результат игры не пишется в БД сразу, а копится в
+# памяти как приращения побед, поражений и ничьих каждого пользователя.
+# Накопленные приращения записываются в БД одним многострочным upsert раз в
+# flush_interval секунд, при накоплении flush_threshold пользователей и при
+# остановке.
+#
+# Каждый результат перед попаданием в память дописывается в журнал с
+# порядковым номером. Вместе с приращениями в той же транзакции в таблицу
+# stats_journal_state записывается номер последнего примененного результата,
+# поэтому после падения процесса при старте из журнала повторяются только
+# результаты, которых еще нет в БД. Журнал разбит на сегменты: при каждой
+# записи в БД начинается новый сегмент, а записанные сегменты удаляются.
+#
+# Чтение статистики складывает строку из БД с незаписанными приращениями.
+# Пока идет запись в БД, строка может уже содержать записываемые приращения,
+# поэтому запись меняет номер версии (нечетный - запись идет), а чтение
+# ждет ее окончания и повторяется, если за время чтения началась запись
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import datetime
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@dataclasses.dataclass
+class WriteBehindMetrics:
+    """
+    Статистика отложенной записи:
+    pending_users: int - количество пользователей с еще не записанными приращениями
+    recorded: int - количество принятых результатов игр
+    flushes: int - количество успешных записей в БД
+    failed_flushes: int - количество неудачных записей в БД (приращения остаются в памяти и журнале)
+    flushed_users: int - количество записанных строк пользователей
+    last_flush_time: float - длительность последней записи в БД в секундах
+    """
+    pending_users: int
+    recorded: int
+    flushes: int
+    failed_flushes: int
+    flushed_users: int
+    last_flush_time: float
+
+
+def _log(message: str):
+    date = datetime.datetime.today()
+    print(f"{str(date)}: {message}")
+
+
+class StatsWriteBehind:
+    # Тип результата в журнале
+    WIN = "W"
+    DRAW = "D"
+
+    def __init__(self, database_api, journal_path: str, flush_interval: float = 1.0, flush_threshold: int = 256,
+                 fsync: bool = False):
+        """
+        :param database_api: Storage через который выполняется запись (apply_stats_deltas)
+        :param journal_path: путь к журналу, сегменты хранятся в файлах journal_path.00000001 и т.д.
+        :param flush_interval: период записи в БД в секундах
+        :param flush_threshold: количество пользователей с приращениями, при котором запись начинается досрочно
+        :param fsync: True - журнал сбрасывается на диск после каждого результата (переживает отключение питания, а
+        не только падение процесса, но каждая запись в журнал становится заметно дороже)
+        """
+
+        self.database_api = database_api
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.fsync = fsync
+
+        self._pending: {int: [int]} = {}
+        """
+        _pending: {user_id: int, delta: [wins: int, loses: int, draws: int]}
+        Приращения еще не отправленные в БД
+        """
+
+        self._flushing: {int: [int]} = {}
+        """
+        _flushing: {user_id: int, delta: [wins: int, loses: int, draws: int]}
+        Приращения которые сейчас записываются в БД, учитываются при чтении до окончания записи
+        """
+
+        self._lock = threading.Condition()
+        self._flushed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+
+        self._version = 0
+        """
+        Увеличивается в начале и в конце каждой записи в БД: нечетный - запись идет и строки в БД могут уже
+        содержать приращения _flushing
+        """
+        self._is_running = False
+
+        self._sequence = 0
+        self._segment_number = 0
+        self._journal = None
+        self._journal_lines = 0
+        self._closed_segments: [str] = []
+
+        self._recorded = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._flushed_users = 0
+        self._last_flush_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="stats-write-behind", daemon=True)
+
+    def start(self):
+        """
+        Повторяет результаты из журнала, которых еще нет в БД, записывает их и запускает поток периодической записи
+        """
+
+        self._recover()
+        self.flush()
+
+        self._is_running = True
+        self._thread.start()
+
+    def close(self):
+        """
+        Останавливает поток и записывает в БД все накопленные приращения
+        """
+
+        with self._lock:
+            self._is_running = False
+            self._lock.notify()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+        self.flush()
+
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    @property
+    def sequence(self) -> int:
+        """
+        Номер последнего принятого результата: пока он не меняется, не меняются и суммы БД и незаписанных приращений
+        """
+
+        with self._lock:
+            return self._sequence
+
+    def begin_read(self) -> int:
+        """
+        Вызывается перед чтением статистики из БД (или кэша профилей), ждет окончания текущей записи в БД
+        :return: версия для is_current
+        """
+
+        with self._lock:
+            while self._version % 2:
+                self._flushed.wait()
+
+            return self._version
+
+    def is_current(self, version: int) -> bool:
+        """
+        Вызывается после чтения из БД и незаписанных приращений
+        :param version: результат begin_read перед чтением
+        :return: True - если с begin_read запись в БД не начиналась, иначе прочитанные строки могут уже содержать
+        приращения и чтение нужно повторить
+        """
+
+        with self._lock:
+            return self._version == version
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """
+        Откладывает запись в БД до конца блока with, для длинных чтений (всей таблицы) которые нельзя повторить
+        """
+
+        with self._flush_lock:
+            yield
+
+    def record_game_result(self, winner_id: int, loser_id: int):
+        self._record(self.WIN, winner_id, loser_id)
+
+    def record_draw(self, first_user_id: int, second_user_id: int):
+        self._record(self.DRAW, first_user_id, second_user_id)
+
+    def pending_delta(self, user_id: int) -> (int, int, int):
+        """
+        :return: еще не записанные в БД приращения (победы, поражения, ничьи) пользователя
+        """
+
+        with self._lock:
+            pending = self._pending.get(user_id, (0, 0, 0))
+            flushing = self._flushing.get(user_id, (0, 0, 0))
+
+            return pending[0] + flushing[0], pending[1] + flushing[1], pending[2] + flushing[2]
+
+    def pending_deltas(self) -> {int: (int, int, int)}:
+        """
+        :return: словарь где ключ - id пользователя, значение - еще не записанные в БД приращения
+        """
+
+        with self._lock:
+            out_dict = {user_id: tuple(delta) for user_id, delta in self._flushing.items()}
+
+            for user_id, delta in self._pending.items():
+                old = out_dict.get(user_id, (0, 0, 0))
+                out_dict[user_id] = (old[0] + delta[0], old[1] + delta[1], old[2] + delta[2])
+
+            return out_dict
+
+    @staticmethod
+    def merge_score(score: tuple, delta: (int, int, int)) -> tuple:
+        """
+        Добавляет приращения к данным пользователя из БД и пересчитывает винрейт
+        :param score: картеж (победы, поражения, ничьи, винрейт, никнейм)
+        :param delta: приращения (победы, поражения, ничьи)
+        :return: картеж того же вида
+        """
+
+        if delta == (0, 0, 0):
+            return score
+
+        wins = score[0] + delta[0]
+        loses = score[1] + delta[1]
+        draws = score[2] + delta[2]
+        win_rate = wins / (wins + loses) if wins + loses > 0 else score[3]
+
+        return (wins, loses, draws, win_rate) + tuple(score[4:])
+
+    def flush(self) -> bool:
+        """
+        Записывает накопленные приращения в БД одним запросом
+        :return: True - если записывать было нечего или запись успешна
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    # Все закрытые сегменты уже записаны (иначе их результаты остались бы в _pending)
+                    segments = self._closed_segments
+                    self._closed_segments = []
+
+                    for segment in segments:
+                        os.remove(segment)
+
+                    return True
+
+                deltas = self._pending
+                sequence = self._sequence
+                self._pending = {}
+                self._flushing = deltas
+                self._version += 1
+
+                # Все результаты до sequence остаются в закрытых сегментах, новые пишутся в следующий
+                self._rotate_journal()
+                segments = list(self._closed_segments)
+
+            started = time.perf_counter()
+            result = self.database_api.apply_stats_deltas(deltas, sequence)
+            flush_time = time.perf_counter() - started
+
+            with self._lock:
+                self._flushing = {}
+                self._version += 1
+                self._flushed.notify_all()
+                self._last_flush_time = flush_time
+
+                if result.success:
+                    self._flushes += 1
+                    self._flushed_users += len(deltas)
+                    self._closed_segments = [i for i in self._closed_segments if i not in segments]
+                else:
+                    # Приращения возвращаются в память, а их сегменты журнала остаются до следующей успешной записи
+                    self._failed_flushes += 1
+
+                    for user_id, delta in deltas.items():
+                        self._add_delta(user_id, *delta)
+
+            if result.success:
+                for segment in segments:
+                    os.remove(segment)
+
+            return result.success
+
+    def metrics(self) -> WriteBehindMetrics:
+        with self._lock:
+            return WriteBehindMetrics(
+                pending_users=len(self._pending),
+                recorded=self._recorded,
+                flushes=self._flushes,
+                failed_flushes=self._failed_flushes,
+                flushed_users=self._flushed_users,
+                last_flush_time=self._last_flush_time
+            )
+
+    def _record(self, kind: str, first_user_id: int, second_user_id: int):
+        with self._lock:
+            self._sequence += 1
+            self._journal.write(f"{self._sequence} {kind} {first_user_id} {second_user_id}\n")
+            self._journal.flush()
+            self._journal_lines += 1
+
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+            self._apply(kind, first_user_id, second_user_id)
+            self._recorded += 1
+
+            if len(self._pending) >= self.flush_threshold:
+                self._lock.notify()
+
+    def _apply(self, kind: str, first_user_id: int, second_user_id: int):
+        if kind == self.WIN:
+            self._add_delta(first_user_id, 1, 0, 0)
+            self._add_delta(second_user_id, 0, 1, 0)
+        else:
+            self._add_delta(first_user_id, 0, 0, 1)
+            self._add_delta(second_user_id, 0, 0, 1)
+
+    def _add_delta(self, user_id: int, wins: int, loses: int, draws: int):
+        delta = self._pending.get(user_id)
+
+        if delta is None:
+            self._pending[user_id] = [wins, loses, draws]
+        else:
+            delta[0] += wins
+            delta[1] += loses
+            delta[2] += draws
+
+    def _segment_path(self, number: int) -> str:
+        return f"{self.journal_path}.{number:08d}"
+
+    def _rotate_journal(self):
+        # Пустой сегмент не нужно закрывать, иначе пока БД недоступна каждая попытка записи создает новый файл
+        if self._journal is not None and self._journal_lines == 0:
+            return
+
+        if self._journal is not None:
+            self._journal.close()
+            self._closed_segments.append(self._segment_path(self._segment_number))
+
+        self._segment_number += 1
+        self._journal = open(self._segment_path(self._segment_number), "a", encoding="utf-8")
+        self._journal_lines = 0
+
+    def _recover(self):
+        applied_query = self.database_api.get_applied_stats_sequence()
+
+        if not applied_query.success:
+            raise RuntimeError("Не удалось прочитать номер последнего записанного результата из БД")
+
+        applied_sequence = applied_query.data
+        segments = sorted(glob.glob(f"{glob.escape(self.journal_path)}.[0-9]*"))
+        replayed = 0
+
+        with self._lock:
+            self._sequence = applied_sequence
+
+            for segment in segments:
+                with open(segment, encoding="utf-8") as file:
+                    for line in file:
+                        # Последняя строка могла быть записана не полностью, если процесс упал во время записи. Перевод
+                        # строки пишется последним, а обрезанная строка может выглядеть полной, например "17 W 1234 56"
+                        # вместо "17 W 1234 567"
+                        if not line.endswith("\n"):
+                            continue
+
+                        parts = line.split()
+
+                        if len(parts) != 4 or parts[1] not in (self.WIN, self.DRAW):
+                            continue
+
+                        sequence = int(parts[0])
+
+                        if sequence > applied_sequence:
+                            self._apply(parts[1], int(parts[2]), int(parts[3]))
+                            replayed += 1
+
+                        self._sequence = max(self._sequence, sequence)
+
+                self._segment_number = max(self._segment_number, int(segment.rsplit(".", 1)[1]))
+
+            self._closed_segments = segments
+            self._segment_number += 1
+            self._journal = open(self._segment_path(self._segment_number), "a", encoding="utf-8")
+
+        if replayed:
+            _log(f"Из журнала статистики восстановлено результатов: {replayed}")
+
+    def _run(self):
+        is_failed = False
+
+        while True:
+            with self._lock:
+                # После неудачной записи ждем полный период, чтобы не нагружать недоступную БД
+                if self._is_running and (is_failed or len(self._pending) < self.flush_threshold):
+                    self._lock.wait(self.flush_interval)
+
+                if not self._is_running:
+                    return
+
+            is_failed = not self.flush()
@@ -0,0 +1,205 @@
+# --------------------------------------------------------------------------
+# Планировщик, объединяющий ходы AI из разных потоков в один батч
+#
+# Обработчики Telegram-бота выполняются в пуле потоков, и при большом
+# количестве игр против AI каждый поток вызывал model.predict для одного
+# поля. BatchingModel собирает запросы в течение короткого окна (max_wait
+# секунд или max_batch_size полей), выполняет один predict для всего батча
+# и раздает результаты ожидающим потокам
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from game.inference import Model
+
+
+@dataclasses.dataclass
+class BatchingMetrics:
+    """
+    Статистика планировщика:
+    requests: int - количество обработанных запросов
+    batches: int - количество выполненных predict
+    mean_batch_size: float - средний размер батча
+    max_batch_size: int - максимальный размер батча
+    mean_wait: float - среднее время от постановки запроса в очередь до получения результата в секундах
+    p99_wait: float - 99-й перцентиль этого времени по последним запросам в секундах
+    max_wait: float - максимальное время ожидания в секундах
+    """
+    requests: int
+    batches: int
+    mean_batch_size: float
+    max_batch_size: int
+    mean_wait: float
+    p99_wait: float
+    max_wait: float
+
+
+class _Request:
+    __slots__ = ("inputs", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, inputs: np.ndarray):
+        self.inputs = inputs
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingModel:
+    def __init__(self, model: Model, max_batch_size: int = 32, max_wait: float = 0.002, wait_window: int = 1024):
+        """
+        :param model: модель, predict которой будет вызываться для батча
+        :param max_batch_size: максимальное количество полей в одном батче
+        :param max_wait: максимальное время ожидания других запросов после прихода первого в секундах
+        :param wait_window: количество последних запросов по которым считается p99_wait
+        """
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._pending: deque[_Request] = deque()
+        self._pending_size = 0
+        self._condition = threading.Condition()
+        self._is_running = True
+
+        self._requests = 0
+        self._batches = 0
+        self._max_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recent_waits = deque(maxlen=wait_window)
+
+        self._worker = threading.Thread(target=self._run, name="ai-batching", daemon=True)
+        self._worker.start()
+
+    def predict(self, x, verbose: int = 0) -> np.ndarray:
+        """
+        Ставит поле в очередь и ждет результата батча, повторяет интерфейс keras.Model.predict
+        :param x: массив формы (n, 1, 27), (n, 27) или список из одного такого массива
+        :param verbose: не используется, оставлен для совместимости с Keras
+        :return: массив формы (n, 9)
+        """
+
+        if isinstance(x, (list, tuple)):
+            x = x[0]
+
+        request = _Request(np.asarray(x, dtype=np.float32).reshape(-1, 27))
+
+        with self._condition:
+            if not self._is_running:
+                raise RuntimeError("Планировщик ходов AI остановлен")
+
+            self._pending.append(request)
+            self._pending_size += len(request.inputs)
+            self._condition.notify()
+
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def metrics(self) -> BatchingMetrics:
+        with self._condition:
+            waits = sorted(self._recent_waits)
+
+            return BatchingMetrics(
+                requests=self._requests,
+                batches=self._batches,
+                mean_batch_size=self._requests / self._batches if self._batches else 0.0,
+                max_batch_size=self._max_batch_size,
+                mean_wait=self._total_wait / self._requests if self._requests else 0.0,
+                p99_wait=waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                max_wait=self._max_wait
+            )
+
+    def close(self):
+        """
+        Останавливает поток планировщика, уже поставленные в очередь запросы будут обработаны
+        """
+
+        with self._condition:
+            self._is_running = False
+            self._condition.notify()
+
+        self._worker.join()
+
+    def _take_batch(self) -> [_Request]:
+        with self._condition:
+            while not self._pending and self._is_running:
+                self._condition.wait()
+
+            if not self._pending:
+                return []
+
+            # Ждем пока наберется полный батч, но не дольше max_wait с момента прихода первого запроса
+            deadline = self._pending[0].enqueued_at + self.max_wait
+
+            while self._is_running and self._pending_size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+
+                if timeout <= 0:
+                    break
+
+                self._condition.wait(timeout)
+
+            batch = []
+            size = 0
+
+            while self._pending and (not batch or size + len(self._pending[0].inputs) <= self.max_batch_size):
+                request = self._pending.popleft()
+                batch.append(request)
+                size += len(request.inputs)
+
+            self._pending_size -= size
+
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+
+            if not batch:
+                return
+
+            inputs = np.concatenate([r.inputs for r in batch])
+
+            try:
+                predicted = np.asarray(self.model.predict(inputs.reshape(-1, 1, 27), verbose=0))
+                error = None
+            except Exception as e:
+                predicted = None
+                error = e
+
+            finished_at = time.perf_counter()
+            offset = 0
+
+            for request in batch:
+                if error is None:
+                    request.result = predicted[offset:offset + len(request.inputs)]
+                    offset += len(request.inputs)
+                else:
+                    request.error = error
+
+            with self._condition:
+                self._batches += 1
+                self._max_batch_size = max(self._max_batch_size, len(inputs))
+
+                for request in batch:
+                    wait = finished_at - request.enqueued_at
+
+                    self._requests += 1
+                    self._total_wait += wait
+                    self._max_wait = max(self._max_wait, wait)
+                    self._recent_waits.append(wait)
+
+            for request in batch:
+                request.done.set()
@@ -0,0 +1,170 @@
+# --------------------------------------------------------------------------
+# Битовое представление игрового поля 3х3
+#
+# Поле хранится как два 9-битных числа: маска клеток занятых "X" и маска
+# клеток занятых "O". Клетка (row, column) соответствует биту с номером
+# row * 3 + column. Проверка хода, победы и ничьей сводятся к нескольким
+# целочисленным операциям, а двумерный список из строк строится только для
+# отрисовки
+# --------------------------------------------------------------------------
+
+
+FULL_MASK = 0b111_111_111
+
+# Маски всех выигрышных линий: 3 строки, 3 столбца и 2 диагонали
+WIN_MASKS = (
+    0b000_000_111,
+    0b000_111_000,
+    0b111_000_000,
+    0b001_001_001,
+    0b010_010_010,
+    0b100_100_100,
+    0b100_010_001,
+    0b001_010_100
+)
+
+# Состояния поля возвращаемые outcome
+CONTINUE = 0
+X_WIN = 1
+O_WIN = 2
+DRAW = 3
+
+# Для каждой из 512 возможных масок заранее посчитано, содержит ли она выигрышную линию
+_WINNING = bytes(
+    any(mask & win_mask == win_mask for win_mask in WIN_MASKS)
+    for mask in range(FULL_MASK + 1)
+)
+
+# Для каждой из 512 масок заранее посчитано число в троичной системе, где цифра клетки равна 1 если её бит установлен
+_TERNARY = tuple(
+    sum(3 ** i for i in range(9) if mask >> i & 1)
+    for mask in range(FULL_MASK + 1)
+)
+
+# 8 симметрий квадрата (повороты и отражения) в виде перестановок клеток: клетка i переходит в клетку
+# SYMMETRIES[t][i]
+SYMMETRIES = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8),
+    (2, 5, 8, 1, 4, 7, 0, 3, 6),
+    (8, 7, 6, 5, 4, 3, 2, 1, 0),
+    (6, 3, 0, 7, 4, 1, 8, 5, 2),
+    (2, 1, 0, 5, 4, 3, 8, 7, 6),
+    (6, 7, 8, 3, 4, 5, 0, 1, 2),
+    (0, 3, 6, 1, 4, 7, 2, 5, 8),
+    (8, 5, 2, 7, 4, 1, 6, 3, 0)
+)
+
+# Обратные перестановки: клетка SYMMETRIES[t][i] переходит обратно в клетку i
+_INVERSE_SYMMETRIES = tuple(
+    tuple(symmetry.index(i) for i in range(9))
+    for symmetry in SYMMETRIES
+)
+
+# Для каждой симметрии и каждой из 512 масок заранее посчитана преобразованная маска
+_TRANSFORMED = tuple(
+    tuple(sum(1 << symmetry[i] for i in range(9) if mask >> i & 1) for mask in range(FULL_MASK + 1))
+    for symmetry in SYMMETRIES
+)
+
+
+def cell_bit(row: int, column: int) -> int:
+    """
+    Переводит координаты клетки в битовую маску этой клетки
+    :param row: номер строки
+    :param column: номер столбца
+    :return: маска с одним установленным битом, или 0 - если координаты вне поля
+    """
+
+    if 0 <= row < 3 and 0 <= column < 3:
+        return 1 << (row * 3 + column)
+
+    return 0
+
+
+def outcome(x_mask: int, o_mask: int) -> int:
+    """
+    :param x_mask: маска клеток занятых "X"
+    :param o_mask: маска клеток занятых "O"
+    :return: CONTINUE, X_WIN, O_WIN или DRAW
+    """
+
+    if _WINNING[x_mask]:
+        return X_WIN
+    if _WINNING[o_mask]:
+        return O_WIN
+    if x_mask | o_mask == FULL_MASK:
+        return DRAW
+
+    return CONTINUE
+
+
+def board_code(x_mask: int, o_mask: int) -> int:
+    """
+    Компактный код позиции: число в троичной системе, где цифра клетки i равна 0 для пустой клетки, 1 для "X" и 2
+    для "O"
+    :return: число от 0 до 3^9 - 1
+    """
+
+    return _TERNARY[x_mask] + 2 * _TERNARY[o_mask]
+
+
+def canonical(x_mask: int, o_mask: int) -> (int, int, int, int):
+    """
+    Приводит поле к каноническому виду: из 8 симметричных полей выбирается поле с наименьшим кодом
+    :return: код канонического поля, его маски "X" и "O" и номер симметрии переводящей исходное поле в каноническое
+    """
+
+    best = None
+
+    for t, transformed in enumerate(_TRANSFORMED):
+        canonical_x = transformed[x_mask]
+        canonical_o = transformed[o_mask]
+        code = _TERNARY[canonical_x] + 2 * _TERNARY[canonical_o]
+
+        if best is None or code < best[0]:
+            best = (code, canonical_x, canonical_o, t)
+
+    return best
+
+
+def untransform_cell(index: int, symmetry: int) -> int:
+    """
+    Переводит номер клетки канонического поля обратно в номер клетки исходного поля
+    :param index: номер клетки канонического поля
+    :param symmetry: номер симметрии, которую вернул canonical
+    """
+
+    return _INVERSE_SYMMETRIES[symmetry][index]
+
+
+def to_field(x_mask: int, o_mask: int) -> [int]:
+    """
+    :return: список из 9 чисел, где 0 - пустая клетка, 1 - "X", 2 - "O"
+    """
+
+    return [(x_mask >> i & 1) + 2 * (o_mask >> i & 1) for i in range(9)]
+
+
+def to_matrix(x_mask: int, o_mask: int) -> [[str]]:
+    """
+    Двумерный список из строк, используется только для отрисовки поля
+    """
+
+    out_matrix = []
+
+    for row in range(3):
+        out_row = []
+
+        for column in range(3):
+            bit = 1 << (row * 3 + column)
+
+            if x_mask & bit:
+                out_row.append("X")
+            elif o_mask & bit:
+                out_row.append("O")
+            else:
+                out_row.append(" ")
+
+        out_matrix.append(out_row)
+
+    return out_matrix
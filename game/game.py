@@ -1,9 +1,12 @@
 import dataclasses
 from enum import IntEnum
 
-import keras
 import numpy as np
-from keras import Sequential
+
+from game import engine
+from game.inference import Model, encode_board
+from game.move_cache import MoveCache
+from game.outcome_table import OutcomeTable, shared_table
 
 
 class TurnResultCode(IntEnum):
@@ -20,6 +23,18 @@ class GameResultCode(IntEnum):
     AI_WIN = 3
 
 
+# Соответствие состояния поля из game.engine (CONTINUE, X_WIN, O_WIN, DRAW) коду сообщения о состоянии игры после хода
+# игрока и после хода AI
+_PLAYER_GAME_RESULTS = (GameResultCode.GAME_CONTINUE, GameResultCode.PLAYER_WIN, GameResultCode.PLAYER_WIN,
+                        GameResultCode.NO_ONE_WIN)
+_AI_GAME_RESULTS = (GameResultCode.GAME_CONTINUE, GameResultCode.AI_WIN, GameResultCode.AI_WIN,
+                    GameResultCode.NO_ONE_WIN)
+
+
+# Таблица исходов загружается один раз при старте и используется всеми сессиями только для чтения
+_outcome_table: OutcomeTable = shared_table()
+
+
 @dataclasses.dataclass
 class Player:
     """
@@ -38,23 +53,41 @@ class TurnResult:
     is_turn_success: bool - успешен ли ход
     game_code: GameResultCode - код сообщения о состоянии игры
     turn_result_code: TurnResultCode - код сообщения о результате хода
-    matrix: [[str]] - двумерный список из строк показывающий текущее состояние игры
+    x_mask: int - битовая маска клеток занятых "X"
+    o_mask: int - битовая маска клеток занятых "O"
     """
     is_turn_success: bool
     game_result_code: GameResultCode
     turn_result_code: TurnResultCode
-    matrix: [[str]]
+    x_mask: int | None
+    o_mask: int | None
+
+    @property
+    def matrix(self) -> [[str]]:
+        """
+        Двумерный список из строк показывающий текущее состояние игры, строится только при отрисовке
+        """
+
+        if self.x_mask is None:
+            return None
+
+        return engine.to_matrix(self.x_mask, self.o_mask)
 
 
 class Game:
-    matrix: [[str]] = None
+    x_mask: int = 0
+    o_mask: int = 0
     turn: str = None
     session_token: str = None
-    players: [Player] = []
+    players: [Player] = None
 
     _is_session_active = False
     _is_game_active = False
 
+    @property
+    def matrix(self) -> [[str]]:
+        return engine.to_matrix(self.x_mask, self.o_mask)
+
     @property
     def turn_now_player(self) -> Player:
         for pl in self.players:
@@ -76,12 +109,11 @@ class Game:
 
     def start_new_session(self, player_id: int, session_token: str):
         self.session_token = session_token
-        self.matrix = [[" ", " ", " "],
-                       [" ", " ", " "],
-                       [" ", " ", " "]]
+        self.x_mask = 0
+        self.o_mask = 0
 
         player = Player("X", player_id)
-        self.players.append(player)
+        self.players = [player]
         self.turn = "X"
         self._is_session_active = True
 
@@ -104,7 +136,7 @@ class Game:
 
     def make_turn(self, player_id: int, row: int, column: int) -> TurnResult:
         if not self._is_session_active:
-            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.NO_SESSION, None)
+            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.NO_SESSION, None, None)
 
         player = None
         for pl in self.players:
@@ -112,183 +144,93 @@ class Game:
                 player = pl
 
         if player is None:
-            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.NO_PLAYER, None)
+            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.NO_PLAYER, None, None)
 
-        if row in [0, 1, 2] and column in [0, 1, 2]:
-            cell = self.matrix[row][column]
+        bit = engine.cell_bit(row, column)
 
-            if cell == " ":
-                self.matrix[row][column] = player.sign
-
-                if player.sign == "X":
-                    self.turn = "O"
-                else:
-                    self.turn = "X"
-
-                is_player_win = self._is_player_win(self.matrix)
-                is_matrix_full = self._is_matrix_full(self.matrix)
+        if bit and not (self.x_mask | self.o_mask) & bit:
+            if player.sign == "X":
+                self.x_mask |= bit
+                self.turn = "O"
+            else:
+                self.o_mask |= bit
+                self.turn = "X"
 
-                if is_player_win:
-                    game_result = GameResultCode.PLAYER_WIN
-                elif is_matrix_full:
-                    game_result = GameResultCode.NO_ONE_WIN
-                else:
-                    game_result = GameResultCode.GAME_CONTINUE
+            game_result = _PLAYER_GAME_RESULTS[_outcome_table.outcome(engine.board_code(self.x_mask, self.o_mask))]
 
-                return TurnResult(True, game_result, TurnResultCode.SUCCESS, self.matrix)
-            else:
-                return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.matrix)
+            return TurnResult(True, game_result, TurnResultCode.SUCCESS, self.x_mask, self.o_mask)
         else:
-            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.matrix)
+            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.x_mask,
+                              self.o_mask)
 
-    @staticmethod
-    def _is_player_win(matrix: [[str]]) -> bool:
-        for sign in ["X", "O"]:
-            if matrix[0][0] == sign and matrix[0][1] == sign and matrix[0][2] == sign:
-                return True
-            if matrix[1][0] == sign and matrix[1][1] == sign and matrix[1][2] == sign:
-                return True
-            if matrix[2][0] == sign and matrix[2][1] == sign and matrix[2][2] == sign:
-                return True
 
-            if matrix[0][0] == sign and matrix[1][0] == sign and matrix[2][0] == sign:
-                return True
-            if matrix[0][1] == sign and matrix[1][1] == sign and matrix[2][1] == sign:
-                return True
-            if matrix[0][2] == sign and matrix[1][2] == sign and matrix[2][2] == sign:
-                return True
+class GameAI:
+    def __init__(self, model: Model | None, move_cache: MoveCache | None = None):
+        """
+        :param model: модель для предсказания хода AI, или None - если AI ходит по таблице исходов
+        :param move_cache: общий для всех игр кэш ходов модели, или None - если кэш не используется
+        """
 
-            if matrix[0][0] == sign and matrix[1][1] == sign and matrix[2][2] == sign:
-                return True
-            if matrix[0][2] == sign and matrix[1][1] == sign and matrix[2][0] == sign:
-                return True
+        self.player = None
+        self.x_mask = 0
+        self.o_mask = 0
+        self.model: Model | None = model
+        self.move_cache: MoveCache | None = move_cache
 
-        return False
+    @property
+    def matrix(self) -> [[str]]:
+        return engine.to_matrix(self.x_mask, self.o_mask)
 
-    @staticmethod
-    def _is_matrix_full(matrix: [[str]]) -> bool:
-        for row in matrix:
-            if " " in row:
-                return False
-        return True
+    def start_new_session(self, player_id: int):
+        self.x_mask = 0
+        self.o_mask = 0
+        self.player: Player = Player('X', player_id)
 
+    def _ai_move(self) -> int:
+        """
+        :return: номер клетки в которую пойдет AI. Если модели нет - используется лучший ход из таблицы исходов
+        """
 
-class GameAI:
-    def __init__(self, model: Sequential):
-        self.player = None
-        self.matrix = None
-        self.model: Sequential = model
+        if self.model is None:
+            return _outcome_table.best_move(engine.board_code(self.x_mask, self.o_mask))
 
-    def start_new_session(self, player_id: int):
-        self.matrix: [[str]] = [[" ", " ", " "],
-                                [" ", " ", " "],
-                                [" ", " ", " "]]
-        self.player: Player = Player('X', player_id)
+        # Модель всегда ходит на каноническом поле, поэтому ход для всех симметричных позиций одинаков и его можно
+        # хранить в кэше один раз
+        code, x_mask, o_mask, symmetry = engine.canonical(self.x_mask, self.o_mask)
+        model = self.model
+        move = None if self.move_cache is None else self.move_cache.get(model, code)
 
-    def _one_hot(self):
-        field = np.zeros(9, dtype='int')
+        if move is None:
+            predicted = model.predict(encode_board(x_mask, o_mask).reshape(1, 1, 27), verbose=0)
+            occupied = x_mask | o_mask
+            checked_predicted = [-100 if occupied >> i & 1 else predicted[0][i] for i in range(9)]
+            move = int(np.argmax(checked_predicted))
 
-        for i in range(3):
-            for a in range(3):
-                if self.matrix[i][a] == 'X':
-                    field[i*a] = 1
-                if self.matrix[i][a] == 'O':
-                    field[i*a] = 2
+            if self.move_cache is not None:
+                self.move_cache.put(model, code, move)
 
-        return np.eye(3)[field][:, [0, 2, 1]].reshape(-1)
+        return engine.untransform_cell(move, symmetry)
 
     def make_turn(self, row: int, column: int) -> TurnResult:
         #
         # Ход человека
         #
-        if row in [0, 1, 2] and column in [0, 1, 2]:
-            cell = self.matrix[row][column]
-
-            if cell == ' ':
-                self.matrix[row][column] = 'X'
-
-                is_player_win = self._is_player_win()
-                is_matrix_full = self._is_matrix_full()
-
-                if is_player_win or is_matrix_full:
-                    if is_player_win:
-                        return TurnResult(True, GameResultCode.PLAYER_WIN, TurnResultCode.SUCCESS, self.matrix)
-                    else:
-                        return TurnResult(True, GameResultCode.NO_ONE_WIN, TurnResultCode.SUCCESS, self.matrix)
-                else:
-                    #
-                    # Ход AI
-                    #
-                    predicted = self.model.predict([self._one_hot().reshape(1, 1, 27)], verbose=0)
-                    checked_predicted = []
-
-                    for i in range(3):
-                        for a in range(3):
-                            if self.matrix[i][a] == ' ':
-                                checked_predicted.append(predicted[0][i*a])
-                            else:
-                                checked_predicted.append(-100)
-
-                    turn = np.argmax(checked_predicted)
-                    turn = (int(turn / 3), turn % 3)
-
-                    self.matrix[turn[0]][turn[1]] = 'O'
-
-                    if is_player_win or is_matrix_full:
-                        if is_player_win:
-                            return TurnResult(True, GameResultCode.AI_WIN, TurnResultCode.SUCCESS, self.matrix)
-                        else:
-                            return TurnResult(True, GameResultCode.NO_ONE_WIN, TurnResultCode.SUCCESS, self.matrix)
-                    else:
-                        return TurnResult(True, GameResultCode.GAME_CONTINUE, TurnResultCode.SUCCESS, self.matrix)
-            else:
-                return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.matrix)
-        else:
-            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.matrix)
+        bit = engine.cell_bit(row, column)
 
-    def _is_player_win(self) -> bool:
-        for sign in ["X", "O"]:
-            if self.matrix[0][0] == sign and self.matrix[0][1] == sign and self.matrix[0][2] == sign:
-                return True
-            if self.matrix[1][0] == sign and self.matrix[1][1] == sign and self.matrix[1][2] == sign:
-                return True
-            if self.matrix[2][0] == sign and self.matrix[2][1] == sign and self.matrix[2][2] == sign:
-                return True
+        if not bit or (self.x_mask | self.o_mask) & bit:
+            return TurnResult(False, GameResultCode.GAME_CONTINUE, TurnResultCode.INCORRECT_TURN, self.x_mask,
+                              self.o_mask)
 
-            if self.matrix[0][0] == sign and self.matrix[1][0] == sign and self.matrix[2][0] == sign:
-                return True
-            if self.matrix[0][1] == sign and self.matrix[1][1] == sign and self.matrix[2][1] == sign:
-                return True
-            if self.matrix[0][2] == sign and self.matrix[1][2] == sign and self.matrix[2][2] == sign:
-                return True
+        self.x_mask |= bit
+        game_result = _PLAYER_GAME_RESULTS[_outcome_table.outcome(engine.board_code(self.x_mask, self.o_mask))]
 
-            if self.matrix[0][0] == sign and self.matrix[1][1] == sign and self.matrix[2][2] == sign:
-                return True
-            if self.matrix[0][2] == sign and self.matrix[1][1] == sign and self.matrix[2][0] == sign:
-                return True
+        if game_result != GameResultCode.GAME_CONTINUE:
+            return TurnResult(True, game_result, TurnResultCode.SUCCESS, self.x_mask, self.o_mask)
 
-        return False
+        #
+        # Ход AI
+        #
+        self.o_mask |= 1 << self._ai_move()
+        game_result = _AI_GAME_RESULTS[_outcome_table.outcome(engine.board_code(self.x_mask, self.o_mask))]
 
-    def _is_matrix_full(self) -> bool:
-        for row in self.matrix:
-            if " " in row:
-                return False
-        return True
-
-    @staticmethod
-    def _to_int(char: str) -> float:
-        match char:
-            case ' ':
-                return 0.0
-            case 'X':
-                return 1/3
-            case 'O':
-                return 2/3
-
-    def _reshape(self) -> [[float]]:
-        out_matrix = []
-
-        for i in self.matrix:
-            out_matrix.append([self._to_int(a) for a in i])
-
-        return out_matrix
+        return TurnResult(True, game_result, TurnResultCode.SUCCESS, self.x_mask, self.o_mask)
@@ -0,0 +1,98 @@
+# --------------------------------------------------------------------------
+# Прямой проход полносвязной модели на чистом numpy
+#
+# Веса Dense слоев модели выгружаются из tic-tac-toe_model.h5 в .npz файл
+# скриптом neural_network/export.py, после чего для игры против AI не нужны
+# ни Keras, ни TensorFlow
+# --------------------------------------------------------------------------
+
+
+import os
+from typing import Protocol
+
+import numpy as np
+
+from game import engine
+
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "neural_network", "tic-tac-toe_model.npz")
+
+
+class Model(Protocol):
+    """
+    Модель для игры против AI: экземпляр NumpyModel, keras.Sequential или любой объект с тем же методом predict
+    """
+
+    def predict(self, x, verbose: int = 0) -> np.ndarray:
+        ...
+
+
+def encode_board(x_mask: int, o_mask: int) -> np.ndarray:
+    """
+    Переводит поле в бинарный вектор длиной 3*9, который подается на вход модели. Модель обучалась ходить за первого
+    игрока, а в боте ходит за "O", поэтому для каждой клетки вектор имеет вид [пусто, "O", "X"]
+    """
+
+    field = np.array(engine.to_field(x_mask, o_mask), dtype="int")
+
+    return np.eye(3, dtype=np.float32)[field][:, [0, 2, 1]].reshape(-1)
+
+
+class NumpyModel:
+    def __init__(self, ops: [str], kernels: [np.ndarray], biases: [np.ndarray]):
+        """
+        :param ops: последовательность операций: "dense" (следующий по порядку Dense слой) или "relu"
+        :param kernels: матрицы весов Dense слоев
+        :param biases: смещения Dense слоев
+        """
+
+        if ops.count("dense") != len(kernels) or len(kernels) != len(biases):
+            raise ValueError("Количество Dense слоев не совпадает с количеством весов")
+
+        for op in ops:
+            if op not in ("dense", "relu"):
+                raise ValueError(f"Неизвестная операция {op}")
+
+        self.ops = list(ops)
+        self.kernels = [np.ascontiguousarray(kernel, dtype=np.float32) for kernel in kernels]
+        self.biases = [np.ascontiguousarray(bias, dtype=np.float32) for bias in biases]
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "NumpyModel":
+        with np.load(path, allow_pickle=False) as data:
+            ops = [str(op) for op in data["ops"]]
+            count = ops.count("dense")
+
+            return cls(ops, [data[f"kernel_{i}"] for i in range(count)], [data[f"bias_{i}"] for i in range(count)])
+
+    def save(self, path: str = MODEL_PATH):
+        arrays = {"ops": np.array(self.ops)}
+
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            arrays[f"kernel_{i}"] = kernel
+            arrays[f"bias_{i}"] = bias
+
+        np.savez(path, **arrays)
+
+    def predict(self, x, verbose: int = 0) -> np.ndarray:
+        """
+        Прямой проход модели, повторяет интерфейс keras.Model.predict
+        :param x: массив формы (n, 1, 27), (n, 27) или список из одного такого массива
+        :param verbose: не используется, оставлен для совместимости с Keras
+        :return: массив формы (n, 9)
+        """
+
+        if isinstance(x, (list, tuple)):
+            x = x[0]
+
+        out = np.asarray(x, dtype=np.float32).reshape(-1, self.kernels[0].shape[0])
+        layer = 0
+
+        for op in self.ops:
+            if op == "dense":
+                out = out @ self.kernels[layer] + self.biases[layer]
+                layer += 1
+            else:
+                out = np.maximum(out, 0.0)
+
+        return out
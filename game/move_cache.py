@@ -0,0 +1,119 @@
+# --------------------------------------------------------------------------
+# LRU кэш ходов AI
+#
+# Ключ кэша - код поля приведенного к каноническому виду (engine.canonical),
+# поэтому все 8 симметричных позиций используют одну запись. Значение - ход
+# модели на каноническом поле, который переводится обратно в координаты
+# исходного поля вызывающим кодом. Кэш хранит ходы только текущей модели:
+# после смены модели уже идущие игры доигрываются старой, и ее ходы не
+# читаются из кэша и не попадают в него
+# --------------------------------------------------------------------------
+
+
+import dataclasses
+import threading
+from collections import OrderedDict
+
+from game.inference import Model
+
+
+@dataclasses.dataclass
+class MoveCacheMetrics:
+    """
+    Статистика кэша ходов:
+    size: int - количество записей
+    hits: int - количество попаданий
+    misses: int - количество промахов
+    evictions: int - количество вытесненных записей
+    invalidations: int - количество сбросов кэша из-за смены модели
+    bypassed: int - количество обращений с моделью, которая уже не текущая
+    """
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    bypassed: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+
+        return self.hits / total if total else 0.0
+
+
+class MoveCache:
+    def __init__(self, model: Model | None = None, max_size: int = 4096):
+        """
+        :param model: текущая модель, ходы которой кэшируются
+        :param max_size: максимальное количество записей, при превышении вытесняется давно не использованная запись
+        """
+
+        self.max_size = max_size
+
+        self._moves: OrderedDict[int, int] = OrderedDict()
+        self._model: Model | None = model
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._bypassed = 0
+
+    def get(self, model: Model, canonical_code: int) -> int | None:
+        """
+        :param model: модель, ходы которой требуются
+        :param canonical_code: код канонического поля
+        :return: номер клетки канонического поля, или None - если хода нет в кэше или model не текущая модель
+        """
+
+        with self._lock:
+            if model is not self._model:
+                self._bypassed += 1
+
+                return None
+
+            move = self._moves.get(canonical_code)
+
+            if move is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._moves.move_to_end(canonical_code)
+
+            return move
+
+    def put(self, model: Model, canonical_code: int, move: int):
+        """
+        :param model: модель, которая предсказала ход
+        :param canonical_code: код канонического поля
+        :param move: номер клетки канонического поля
+        """
+
+        with self._lock:
+            # Ход предсказан старой моделью: игрой начатой до смены модели или пока ее меняли
+            if model is not self._model:
+                return
+
+            self._moves[canonical_code] = move
+            self._moves.move_to_end(canonical_code)
+
+            if len(self._moves) > self.max_size:
+                self._moves.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, model: Model | None):
+        """
+        Делает model текущей моделью и удаляет ходы предыдущей
+        """
+
+        with self._lock:
+            self._model = model
+            self._moves.clear()
+            self._invalidations += 1
+
+    def metrics(self) -> MoveCacheMetrics:
+        with self._lock:
+            return MoveCacheMetrics(len(self._moves), self._hits, self._misses, self._evictions, self._invalidations,
+                                    self._bypassed)
@@ -0,0 +1,216 @@
+# --------------------------------------------------------------------------
+# Таблица исходов и лучших ходов для всех достижимых позиций поля 3х3
+#
+# Позиция кодируется числом в троичной системе: цифра клетки i равна 0 для
+# пустой клетки, 1 для "X" и 2 для "O" (см. engine.board_code), всего
+# 3^9 = 19683 кода. Для каждого кода в таблице хранится одно 16-битное
+# число:
+#   биты 0-8  - маска лучших ходов для игрока, который сейчас ходит
+#   биты 9-10 - состояние поля (engine.CONTINUE, X_WIN, O_WIN, DRAW)
+#   бит 15    - позиция недостижима в реальной игре
+#
+# Таблица генерируется один раз и сохраняется в файл, который при старте
+# бота отображается в память и используется всеми сессиями только для
+# чтения. Генерация файла (из корня репозитория):
+#   python -m game.outcome_table
+# --------------------------------------------------------------------------
+
+
+import mmap
+import os
+import sys
+from array import array
+
+from game import engine
+
+
+TABLE_PATH = os.path.join(os.path.dirname(__file__), "outcome_table.bin")
+
+_MAGIC = b"TTT\x01"
+_SIZE = 3 ** 9
+
+_MOVES_MASK = 0x1FF
+_OUTCOME_SHIFT = 9
+_UNREACHABLE = 0x8000
+
+
+def _minimax(x_mask: int, o_mask: int, values: {int: int}, moves_masks: {int: int}) -> int:
+    """
+    Обходит все позиции достижимые из данной, заполняя values (оценка позиции для игрока, который сейчас ходит) и
+    moves_masks (маска лучших ходов). Более быстрая победа и более поздний проигрыш оцениваются выше
+    """
+
+    code = engine.board_code(x_mask, o_mask)
+
+    if code in values:
+        return values[code]
+
+    occupied = x_mask | o_mask
+    is_x_turn = bin(x_mask).count("1") == bin(o_mask).count("1")
+
+    if engine.outcome(x_mask, o_mask) != engine.CONTINUE:
+        # Последний ход выиграл или заполнил поле, ходить больше некому
+        value = 0 if engine.outcome(x_mask, o_mask) == engine.DRAW else -(10 - bin(occupied).count("1"))
+        values[code] = value
+        moves_masks[code] = 0
+
+        return value
+
+    best_value = None
+    best_moves = 0
+
+    for i in range(9):
+        bit = 1 << i
+
+        if occupied & bit:
+            continue
+
+        if is_x_turn:
+            value = -_minimax(x_mask | bit, o_mask, values, moves_masks)
+        else:
+            value = -_minimax(x_mask, o_mask | bit, values, moves_masks)
+
+        if best_value is None or value > best_value:
+            best_value = value
+            best_moves = bit
+        elif value == best_value:
+            best_moves |= bit
+
+    values[code] = best_value
+    moves_masks[code] = best_moves
+
+    return best_value
+
+
+def generate() -> array:
+    """
+    Перебирает все достижимые позиции и строит таблицу
+    :return: массив из 3^9 16-битных чисел
+    """
+
+    values = {}
+    moves_masks = {}
+    _minimax(0, 0, values, moves_masks)
+
+    table = array("H", [_UNREACHABLE]) * _SIZE
+
+    for x_mask in range(engine.FULL_MASK + 1):
+        for o_mask in range(engine.FULL_MASK + 1):
+            if x_mask & o_mask:
+                continue
+
+            code = engine.board_code(x_mask, o_mask)
+
+            if code in moves_masks:
+                table[code] = moves_masks[code] | engine.outcome(x_mask, o_mask) << _OUTCOME_SHIFT
+
+    return table
+
+
+def save(table: array, path: str = TABLE_PATH):
+    """
+    Сохраняет таблицу в файл (числа записываются в порядке little-endian)
+    """
+
+    if sys.byteorder != "little":
+        table = array("H", table)
+        table.byteswap()
+
+    with open(path, "wb") as file:
+        file.write(_MAGIC)
+        table.tofile(file)
+
+
+class OutcomeTable:
+    """
+    Таблица исходов, доступная только для чтения. Все методы выполняют одно обращение к таблице
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: последовательность из 3^9 16-битных чисел (memoryview отображенного в память файла или array)
+        """
+
+        if len(entries) != _SIZE:
+            raise ValueError("Неверный размер таблицы исходов")
+
+        self._entries = entries
+
+    @classmethod
+    def load(cls, path: str = TABLE_PATH) -> "OutcomeTable":
+        """
+        Отображает файл таблицы в память, если файла нет - генерирует таблицу в оперативной памяти
+        """
+
+        if not os.path.exists(path):
+            return cls(generate())
+
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapped[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Файл {path} не является таблицей исходов")
+
+        if sys.byteorder != "little":
+            entries = array("H", mapped[len(_MAGIC):])
+            entries.byteswap()
+
+            return cls(entries)
+
+        return cls(memoryview(mapped)[len(_MAGIC):].cast("H"))
+
+    def is_reachable(self, code: int) -> bool:
+        return not self._entries[code] & _UNREACHABLE
+
+    def outcome(self, code: int) -> int:
+        """
+        :param code: код позиции (engine.board_code)
+        :return: engine.CONTINUE, X_WIN, O_WIN или DRAW
+        """
+
+        return self._entries[code] >> _OUTCOME_SHIFT & 0b11
+
+    def best_moves(self, code: int) -> int:
+        """
+        :param code: код позиции (engine.board_code)
+        :return: маска всех лучших ходов для игрока, который сейчас ходит, 0 - если игра закончена
+        """
+
+        return self._entries[code] & _MOVES_MASK
+
+    def best_move(self, code: int) -> int | None:
+        """
+        :param code: код позиции (engine.board_code)
+        :return: номер клетки одного из лучших ходов, None - если игра закончена
+        """
+
+        moves = self._entries[code] & _MOVES_MASK
+
+        if moves == 0:
+            return None
+
+        return (moves & -moves).bit_length() - 1
+
+
+_shared_table: OutcomeTable | None = None
+
+
+def shared_table() -> OutcomeTable:
+    """
+    Общая для всех сессий таблица, загружается один раз при первом обращении
+    """
+
+    global _shared_table
+
+    if _shared_table is None:
+        _shared_table = OutcomeTable.load()
+
+    return _shared_table
+
+
+if __name__ == "__main__":
+    generated = generate()
+    save(generated)
+
+    reachable = sum(1 for entry in generated if not entry & _UNREACHABLE)
+    print(f"Таблица сохранена в {TABLE_PATH}: {reachable} достижимых позиций")
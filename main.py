@@ -1,39 +1,130 @@
 import argparse
 import datetime
+import os
 
-from keras.models import load_model
+from game.inference import MODEL_PATH, NumpyModel
 
 parser = argparse.ArgumentParser()
 parser.add_argument("token", type=str)
 parser.add_argument("reset_user_time", type=int)
 parser.add_argument("use_game_ai", type=int)
-parser.add_argument("database_name", type=str)
-parser.add_argument("database_user", type=str)
-parser.add_argument("database_password", type=str)
+# Нужны только для --storage mysql
+parser.add_argument("database_name", type=str, nargs="?")
+parser.add_argument("database_user", type=str, nargs="?")
+parser.add_argument("database_password", type=str, nargs="?")
+parser.add_argument("--storage", type=str, default="mysql", choices=("mysql", "sqlite", "memory"),
+                    help="хранилище статистики: сервер MySQL, файл SQLite или память процесса (данные теряются при "
+                         "остановке)")
+parser.add_argument("--sqlite_path", type=str, default="./tic-tac-toe.sqlite3",
+                    help="путь к файлу БД для --storage sqlite")
+parser.add_argument("--ai_batch_size", type=int, default=1,
+                    help="максимальное количество ходов AI объединяемых в один батч (1 - без батчей)")
+parser.add_argument("--ai_batch_wait_ms", type=float, default=2.0,
+                    help="максимальное время ожидания других ходов AI для батча в миллисекундах")
+parser.add_argument("--db_pool_size", type=int, default=8,
+                    help="максимальное количество одновременно открытых соединений с БД (для SQLite - соединений для "
+                         "чтения)")
+parser.add_argument("--db_timeout", type=float, default=5.0,
+                    help="время в секундах, дольше которого обработчик не ждет ответа БД")
+parser.add_argument("--stats_journal", type=str, default=None,
+                    help="путь к журналу отложенной записи статистики (без него результаты игр пишутся в БД сразу)")
+parser.add_argument("--stats_flush_interval", type=float, default=1.0,
+                    help="период отложенной записи статистики в БД в секундах")
+parser.add_argument("--use_async", type=int, default=0,
+                    help="1 - запустить AsyncBotClient на asyncio вместо BotClient")
+parser.add_argument("--webhook_url", type=str, default=None,
+                    help="публичный HTTPS адрес бота: с ним обновления принимаются через webhook, а не long polling "
+                         "(HTTPS обеспечивает обратный прокси перед ботом)")
+parser.add_argument("--webhook_host", type=str, default="0.0.0.0",
+                    help="адрес, на котором встроенный HTTP-сервер принимает обновления")
+parser.add_argument("--webhook_port", type=int, default=8443,
+                    help="порт встроенного HTTP-сервера")
+parser.add_argument("--webhook_secret", type=str, default=None,
+                    help="секретный токен webhook (без него генерируется при каждом запуске)")
+parser.add_argument("--webhook_workers", type=int, default=8,
+                    help="количество потоков обработки обновлений в режиме webhook")
 args = parser.parse_args()
 
-db_conn_kwargs = {
-    "host": "localhost",
-    "user": args.database_user,
-    "password": args.database_password,
-    "database": args.database_name
-}
+if args.storage == "mysql" and args.database_password is None:
+    parser.error("для --storage mysql нужны database_name, database_user и database_password")
+
+if args.webhook_url is not None and args.use_async == 1:
+    parser.error("режим webhook поддерживается только BotClient, уберите --use_async")
 
 if args.use_game_ai == 1:
     date = datetime.datetime.today()
     print(f"{str(date)}: Загрузка модели")
 
-    model = load_model("./neural_network/tic-tac-toe_model.h5")
+    # Модель выгруженная в .npz (neural_network/export.py) работает без Keras и TensorFlow, иначе загружается
+    # исходная Keras модель
+    if os.path.exists(MODEL_PATH):
+        model = NumpyModel.load(MODEL_PATH)
+    else:
+        from keras.models import load_model
+
+        model = load_model("./neural_network/tic-tac-toe_model.h5")
+
+    if args.ai_batch_size > 1:
+        from game.batching import BatchingModel
+
+        model = BatchingModel(model, max_batch_size=args.ai_batch_size, max_wait=args.ai_batch_wait_ms / 1000)
 else:
     model = None
 
-from client.bot_client import BotClient
+storage_options = {
+    "stats_journal_path": args.stats_journal,
+    "stats_flush_interval": args.stats_flush_interval
+}
+
+match args.storage:
+    case "mysql":
+        from database.database_utils import DatabaseAPI
 
-bot = BotClient(
-    bot_token=args.token,
-    database_conn_kwargs=db_conn_kwargs,
-    reset_time=args.reset_user_time,
-    model=model
-)
+        storage = DatabaseAPI({
+            "host": "localhost",
+            "user": args.database_user,
+            "password": args.database_password,
+            "database": args.database_name
+        }, pool_size=args.db_pool_size, **storage_options)
+    case "sqlite":
+        from database.sqlite_storage import SQLiteStorage
 
-bot.start()
+        storage = SQLiteStorage(args.sqlite_path, readers=args.db_pool_size, **storage_options)
+    case _:
+        from database.memory_storage import MemoryStorage
+
+        storage = MemoryStorage(**storage_options)
+
+if args.use_async == 1:
+    from client.async_bot_client import AsyncBotClient
+
+    bot = AsyncBotClient(
+        bot_token=args.token,
+        storage=storage,
+        reset_time=args.reset_user_time,
+        model=model,
+        database_workers=args.db_pool_size,
+        database_timeout=args.db_timeout
+    )
+else:
+    from client.bot_client import BotClient
+
+    bot = BotClient(
+        bot_token=args.token,
+        storage=storage,
+        reset_time=args.reset_user_time,
+        model=model,
+        database_workers=args.db_pool_size,
+        database_timeout=args.db_timeout
+    )
+
+if args.webhook_url is not None:
+    bot.start_webhook(
+        url=args.webhook_url,
+        host=args.webhook_host,
+        port=args.webhook_port,
+        secret_token=args.webhook_secret,
+        workers=args.webhook_workers
+    )
+else:
+    bot.start()
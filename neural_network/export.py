@@ -0,0 +1,100 @@
+# --------------------------------------------------------------------------
+# Выгрузка весов Dense слоев модели tic-tac-toe_model.h5 в .npz файл для
+# прямого прохода на чистом numpy (game/inference.py)
+#
+# После выгрузки выходы numpy модели сравниваются с выходами Keras модели на
+# всех достижимых позициях поля
+#
+# Запуск из корня репозитория:
+#   python -m neural_network.export
+# --------------------------------------------------------------------------
+
+
+import os
+
+import numpy as np
+from keras.models import load_model
+
+from game import engine
+from game.inference import MODEL_PATH, NumpyModel, encode_board
+from game.outcome_table import shared_table
+
+
+H5_PATH = os.path.join(os.path.dirname(__file__), "tic-tac-toe_model.h5")
+
+
+def to_numpy_model(model) -> NumpyModel:
+    """
+    Переводит последовательность слоев Keras модели в операции NumpyModel
+    """
+
+    ops = []
+    kernels = []
+    biases = []
+
+    for layer in model.layers:
+        config = layer.get_config()
+
+        match type(layer).__name__:
+            case "Flatten" | "InputLayer":
+                continue
+            case "Dense":
+                kernel, bias = layer.get_weights()
+                kernels.append(kernel)
+                biases.append(bias)
+                ops.append("dense")
+            case "Activation":
+                pass
+            case name:
+                raise ValueError(f"Слой {name} не поддерживается")
+
+        match config.get("activation", "linear"):
+            case "relu":
+                ops.append("relu")
+            case "linear":
+                pass
+            case activation:
+                raise ValueError(f"Функция активации {activation} не поддерживается")
+
+    return NumpyModel(ops, kernels, biases)
+
+
+def reachable_boards() -> np.ndarray:
+    """
+    :return: массив входных векторов модели для всех достижимых позиций поля
+    """
+
+    table = shared_table()
+    boards = []
+
+    for x_mask in range(engine.FULL_MASK + 1):
+        for o_mask in range(engine.FULL_MASK + 1):
+            if not x_mask & o_mask and table.is_reachable(engine.board_code(x_mask, o_mask)):
+                boards.append(encode_board(x_mask, o_mask))
+
+    return np.array(boards)
+
+
+def main():
+    model = load_model(H5_PATH, compile=False)
+    numpy_model = to_numpy_model(model)
+
+    boards = reachable_boards()
+    keras_out = model.predict(boards.reshape(-1, 1, 27), verbose=0)
+    numpy_out = numpy_model.predict(boards)
+
+    max_error = float(np.max(np.abs(keras_out - numpy_out)))
+    argmax_mismatches = int(np.sum(np.argmax(keras_out, axis=1) != np.argmax(numpy_out, axis=1)))
+
+    print(f"Проверено позиций: {len(boards)}, максимальное расхождение: {max_error:.2e}, "
+          f"расхождений лучшего хода: {argmax_mismatches}")
+
+    if max_error > 1e-4 or argmax_mismatches != 0:
+        raise SystemExit("Выходы numpy и Keras моделей не совпадают, веса не сохранены")
+
+    numpy_model.save(MODEL_PATH)
+    print(f"Веса сохранены в {os.path.normpath(MODEL_PATH)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+
+from game.batching import BatchingModel
+
+
+class _RecordingModel:
+    """
+    Возвращает в клетке i значение входа i, запоминает размеры батчей
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, x, verbose: int = 0) -> np.ndarray:
+        self.batch_sizes.append(len(x))
+
+        return x.reshape(-1, 27)[:, :9] * 2
+
+
+class _FailingModel:
+    def predict(self, x, verbose: int = 0):
+        raise ArithmeticError("predict failed")
+
+
+def _predict_concurrently(model: BatchingModel, count: int) -> [np.ndarray]:
+    inputs = [np.full((1, 1, 27), i, dtype=np.float32) for i in range(count)]
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def worker(i: int):
+        start.wait()
+        results[i] = model.predict(inputs[i], verbose=0)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def test_concurrent_requests_share_batches():
+    inner = _RecordingModel()
+    model = BatchingModel(inner, max_batch_size=8, max_wait=0.05)
+
+    try:
+        results = _predict_concurrently(model, 16)
+    finally:
+        model.close()
+
+    # Каждый поток получил результат своего поля
+    for i, result in enumerate(results):
+        assert result.shape == (1, 9)
+        assert (result == i * 2).all()
+
+    assert sum(inner.batch_sizes) == 16
+    assert max(inner.batch_sizes) <= 8
+    assert len(inner.batch_sizes) < 16
+
+    metrics = model.metrics()
+
+    assert metrics.requests == 16
+    assert metrics.batches == len(inner.batch_sizes)
+    assert metrics.max_batch_size == max(inner.batch_sizes)
+
+
+def test_single_request_waits_at_most_max_wait():
+    model = BatchingModel(_RecordingModel(), max_batch_size=32, max_wait=0.001)
+
+    try:
+        result = model.predict([np.ones((1, 1, 27), dtype=np.float32)])
+    finally:
+        model.close()
+
+    assert (result == 2).all()
+    assert model.metrics().max_wait < 1.0
+
+
+def test_model_error_is_raised_to_caller():
+    model = BatchingModel(_FailingModel(), max_wait=0.001)
+
+    try:
+        with pytest.raises(ArithmeticError):
+            model.predict(np.zeros((1, 27), dtype=np.float32))
+    finally:
+        model.close()
+
+
+def test_predict_after_close_is_rejected():
+    model = BatchingModel(_RecordingModel())
+    model.close()
+
+    with pytest.raises(RuntimeError):
+        model.predict(np.zeros((1, 27), dtype=np.float32))
@@ -0,0 +1,152 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telebot import apihelper, asyncio_helper
+
+from client.async_bot_client import AsyncBotClient
+from client.bot_client import BotClient
+from client.callback_data import board_tag
+from client.game_core import Board, GameCore, Reply
+from client.state_store import BoardMessages
+
+
+def _error(exception_type, error_code: int, description: str) -> Exception:
+    return exception_type("editMessageText", None, {"error_code": error_code, "description": description})
+
+
+class _Bot:
+    """
+    Подмена TeleBot: изменение сообщения завершается ошибкой edit_error (если задана), отправка возвращает новые id
+    """
+
+    def __init__(self, edit_error: Exception | None = None):
+        self.edit_error = edit_error
+        self.edited = []
+        self.sent = []
+
+    def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.edited.append((chat_id, message_id, text))
+
+        if self.edit_error is not None:
+            raise self.edit_error
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, text))
+
+        return SimpleNamespace(message_id=100 + len(self.sent))
+
+
+class _AsyncBot(_Bot):
+    async def edit_message_text(self, *args, **kwargs):
+        return super().edit_message_text(*args, **kwargs)
+
+    async def send_message(self, *args, **kwargs):
+        return super().send_message(*args, **kwargs)
+
+
+def _send_board(is_async: bool, edit_error: tuple | None, board: Board = Board.EDIT) -> (_Bot, BoardMessages):
+    """
+    Отправляет поле игрока 1, сообщение которого с id 10 уже есть в чате
+    :param edit_error: (error_code, description) ошибки изменения сообщения, или None - если изменение успешно
+    :return: (подмена бота, запомненные сообщения полей)
+    """
+
+    client_type, bot_type, exception_type = (
+        (AsyncBotClient, _AsyncBot, asyncio_helper.ApiTelegramException) if is_async else
+        (BotClient, _Bot, apihelper.ApiTelegramException)
+    )
+
+    client = client_type.__new__(client_type)
+    client.bot = bot_type(None if edit_error is None else _error(exception_type, *edit_error))
+    client.core = SimpleNamespace(boards=BoardMessages())
+    client.core.boards.set(1, 10)
+
+    result = client._send_board(Reply(1, "поле", board=board))
+
+    if is_async:
+        asyncio.run(result)
+
+    return client.bot, client.core.boards
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+def test_board_is_edited_in_place(is_async):
+    bot, boards = _send_board(is_async, None)
+
+    assert bot.edited == [(1, 10, "поле")]
+    assert bot.sent == []
+    assert boards.get(1) == 10
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+def test_not_modified_is_success(is_async):
+    """
+    Повтор изменения, которое уже применено, не отправляет второе поле
+    """
+
+    bot, boards = _send_board(is_async, (400, "Bad Request: message is not modified: specified new message content "
+                                              "and reply markup are exactly the same"), Board.FINAL)
+
+    assert bot.sent == []
+    assert 1 not in boards
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+@pytest.mark.parametrize("description", ["Bad Request: message to edit not found",
+                                         "Bad Request: message can't be edited"])
+def test_lost_board_is_sent_again(is_async, description):
+    bot, boards = _send_board(is_async, (400, description))
+
+    assert bot.sent == [(1, "поле")]
+    assert boards.get(1) == 101
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+@pytest.mark.parametrize("edit_error", [(429, "Too Many Requests: retry after 3"),
+                                        (403, "Forbidden: bot was blocked by the user")])
+def test_other_errors_are_raised(is_async, edit_error):
+    with pytest.raises(Exception) as raised:
+        _send_board(is_async, edit_error)
+
+    assert raised.value.error_code == edit_error[0]
+
+
+def test_game_boards_are_created_once_and_edited():
+    """
+    Поле каждого игрока отправляется одним сообщением при начале игры, изменяется на каждом ходу и забывается после
+    последнего хода
+    """
+
+    core = GameCore(60, None, on_expire=lambda replies: None)
+    core.load_user(1)
+    core.load_user(2)
+    core.start_session(1, None)
+
+    replies = core.join_session(2, core.joinable_lobbies(2)[0].session_token)
+
+    assert [(reply.chat_id, reply.board) for reply in replies] == [(1, Board.NEW), (2, Board.NEW)]
+
+    x_mask = o_mask = 0
+
+    for player_id, cell in ((1, 0), (2, 3), (1, 1), (2, 4)):
+        tag = board_tag(x_mask, o_mask)
+        replies, record = core.turn(player_id, cell, tag)
+
+        assert record is None
+        assert [reply.board for reply in replies] == [Board.EDIT, Board.EDIT]
+        # Клавиатура с клетками только у игрока, который ходит следующим
+        assert replies[0].reply_markup is None and replies[1].reply_markup is not None
+
+        # Повторное нажатие на то же поле ничего не отправляет
+        assert core.turn(player_id, cell, tag) == ([], None)
+
+        if player_id == 1:
+            x_mask |= 1 << cell
+        else:
+            o_mask |= 1 << cell
+
+    replies, record = core.turn(1, 2, board_tag(x_mask, o_mask))
+
+    assert [(reply.chat_id, reply.board) for reply in replies] == [(1, Board.FINAL), (2, Board.FINAL)]
+    assert (record.winner_id, record.loser_id, record.is_draw) == (1, 2, False)
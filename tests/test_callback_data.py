@@ -0,0 +1,40 @@
+import pytest
+
+from client.callback_data import Callback, CallbackRouter, CallData, board_tag, code_tag, decode, encode
+
+
+@pytest.mark.parametrize("callback", [
+    Callback(CallData.TURN, 0, code_tag(0)),
+    Callback(CallData.TURN_AI, 8, code_tag(3 ** 9 - 1)),
+    Callback(CallData.SESSION_JOIN, None, "a1b2c3d4"),
+    *(Callback(action, None, "") for action in CallData)
+])
+def test_decode_reverses_encode(callback):
+    assert decode(encode(callback.action, callback.cell, callback.tag)) == callback
+
+
+@pytest.mark.parametrize("data", [None, "", "t", "x0", "t9", "tX00000", "T-", "ё-"])
+def test_malformed_data_is_rejected(data):
+    assert decode(data) is None
+
+
+def test_tags():
+    assert code_tag(5) == "00005"
+    assert board_tag(0b1, 0) == "00001"
+    assert len({code_tag(code) for code in range(3 ** 9)}) == 3 ** 9
+
+
+def test_router_dispatches_by_action():
+    router = CallbackRouter()
+
+    @router.handler(CallData.TURN)
+    def on_turn(player_id, callback):
+        return player_id, callback.cell
+
+    handler, callback = router.route(encode(CallData.TURN, 4, code_tag(0)))
+
+    assert handler is on_turn
+    assert handler(1, callback) == (1, 4)
+    # Действие без обработчика и чужая callback_data не обрабатываются
+    assert router.route(encode(CallData.RESET)) is None
+    assert router.route("legacy_button") is None
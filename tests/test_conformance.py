@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from database.conformance import CHECKS
+from database.memory_storage import MemoryStorage
+from database.sqlite_storage import SQLiteStorage
+
+
+FACTORIES = {
+    "memory": lambda directory: MemoryStorage(),
+    "memory, write-behind": lambda directory: MemoryStorage(
+        stats_journal_path=os.path.join(directory, "stats.journal")
+    ),
+    "sqlite": lambda directory: SQLiteStorage(os.path.join(directory, "storage.db")),
+    "sqlite, write-behind": lambda directory: SQLiteStorage(
+        os.path.join(directory, "storage.db"), stats_journal_path=os.path.join(directory, "stats.journal")
+    )
+}
+
+
+@pytest.mark.parametrize("factory", FACTORIES.values(), ids=FACTORIES.keys())
+@pytest.mark.parametrize("check", CHECKS, ids=lambda check: check.__name__)
+def test_storage_conformance(check, factory, tmp_path):
+    storage = factory(str(tmp_path))
+
+    try:
+        check(storage)
+    finally:
+        storage.close()
@@ -0,0 +1,96 @@
+import pytest
+from mysql.connector import Error
+
+import database.connection_pool
+from database.connection_pool import ConnectionPool
+from database.database_utils import DatabaseAPI
+
+
+class _Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, operation, params=()):
+        if not self.connection.is_alive:
+            raise Error(msg="Lost connection to MySQL server during query")
+
+    def fetchall(self):
+        return [(1, 2, 3, 0, 0.4, "nick")]
+
+
+class _Connection:
+    """
+    Соединение заглушки драйвера: пока is_alive, запросы выполняются, после разрыва каждый запрос - ошибка, но
+    is_connected ничего не знает о разрыве, как у соединения простоявшего меньше health_check_interval
+    """
+
+    def __init__(self):
+        self.is_alive = True
+        self.in_transaction = False
+        self.is_closed = False
+
+    def cursor(self, prepared=False):
+        return _Cursor(self)
+
+    def is_connected(self):
+        return True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.is_closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    connections = []
+
+    def connect(**kwargs):
+        connections.append(_Connection())
+
+        return connections[-1]
+
+    monkeypatch.setattr(database.connection_pool, "connect", connect)
+
+    return connections
+
+
+def _database_api(pool: ConnectionPool) -> DatabaseAPI:
+    # Без __init__: он создает таблицы и загружает таблицу лидеров, а проверяется только путь запроса через пул
+    database_api = DatabaseAPI.__new__(DatabaseAPI)
+    database_api.pool = pool
+
+    return database_api
+
+
+def test_failed_query_replaces_connection(connections):
+    pool = ConnectionPool({}, size=1)
+    database_api = _database_api(pool)
+
+    assert database_api.select_user_score(1).success
+    connections[0].is_alive = False
+
+    assert not database_api.select_user_score(1).success
+    assert connections[0].is_closed
+    assert pool.metrics().closed == 1
+
+    # Следующий запрос получает новое соединение, а не то же сломанное
+    assert database_api.select_user_score(1).data == (2, 3, 0, 0.4, "nick")
+    assert len(connections) == 2
+    assert pool.metrics().created == 2
+
+
+def test_error_in_block_closes_connection(connections):
+    pool = ConnectionPool({}, size=2)
+
+    with pytest.raises(Error):
+        with pool.connection():
+            raise Error(msg="Lost connection")
+
+    with pool.connection() as connection:
+        assert connection is connections[1]
+
+    metrics = pool.metrics()
+
+    assert (metrics.created, metrics.closed, metrics.idle) == (2, 1, 1)
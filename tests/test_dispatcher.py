@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+
+from client.dispatcher import AsyncOutboundDispatcher, OutboundDispatcher, TokenBucket
+from client.game_core import Board, Reply
+
+
+class _TooManyRequests(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Too Many Requests")
+        self.error_code = 429
+        self.result_json = {"error_code": 429, "parameters": {"retry_after": retry_after}}
+
+
+class _Recorder:
+    """
+    Запоминает отправленные ответы и время отправки, первые ответы на которые задан 429 завершаются ошибкой
+    """
+
+    def __init__(self, rate_limited: {str: float} = None):
+        self.rate_limited = dict(rate_limited or {})
+        self.attempts = []
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, reply: Reply):
+        with self.lock:
+            self.attempts.append((reply.text, time.monotonic()))
+            retry_after = self.rate_limited.pop(reply.text, None)
+
+            if retry_after is not None:
+                raise _TooManyRequests(retry_after)
+
+            self.sent.append((reply.chat_id, reply.text, reply.board))
+
+    async def send_async(self, reply: Reply):
+        await asyncio.sleep(0)
+        self.send(reply)
+
+
+def _run(recorder: _Recorder, replies: [Reply], **kwargs) -> OutboundDispatcher:
+    """
+    Ставит ответы в очередь до запуска потоков, отправляет их и останавливает очередь
+    """
+
+    dispatcher = OutboundDispatcher(recorder.send, workers=2, **kwargs)
+    dispatcher.submit(replies)
+    dispatcher.start()
+    dispatcher.stop(5.0)
+
+    return dispatcher
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10.0, burst=2)
+    now = time.monotonic()
+
+    for _ in range(2):
+        assert bucket.delay(now) == 0.0
+        bucket.take()
+
+    assert abs(bucket.delay(now) - 0.1) < 1e-6
+    assert bucket.delay(now + 0.1) == 0.0
+    assert not bucket.is_full(now + 0.1)
+    assert bucket.is_full(now + 0.25)
+
+
+def test_chat_rate_limit_keeps_order():
+    recorder = _Recorder()
+    _run(recorder, [Reply(1, f"m{i}") for i in range(4)], chat_rate=20.0, chat_burst=1)
+
+    assert [text for _, text, _ in recorder.sent] == ["m0", "m1", "m2", "m3"]
+
+    times = [sent_at for _, sent_at in recorder.attempts]
+
+    # Один токен ведра чата в 1 / 20 секунды
+    assert all(later - earlier >= 0.04 for earlier, later in zip(times, times[1:]))
+
+
+def test_global_rate_limit_spans_chats():
+    recorder = _Recorder()
+    _run(recorder, [Reply(chat_id, "m") for chat_id in range(6)], global_rate=20.0)
+
+    times = sorted(sent_at for _, sent_at in recorder.attempts)
+
+    # Общее ведро вмещает 2 токена, остальные 4 ответа ждут по 1 / 20 секунды
+    assert len(recorder.sent) == 6
+    assert times[-1] - times[0] >= 0.19
+
+
+def test_retry_after_429():
+    recorder = _Recorder({"m0": 0.2})
+    dispatcher = _run(recorder, [Reply(1, "m0"), Reply(1, "m1")])
+
+    # Ответ повторен после паузы и чат сохранил порядок
+    assert [text for _, text, _ in recorder.sent] == ["m0", "m1"]
+    assert [text for text, _ in recorder.attempts] == ["m0", "m0", "m1"]
+    assert recorder.attempts[1][1] - recorder.attempts[0][1] >= 0.19
+
+    metrics = dispatcher.metrics()
+
+    assert (metrics.rate_limited, metrics.retries, metrics.sent, metrics.expired) == (1, 1, 2, 0)
+
+
+def test_429_longer_than_max_age_is_not_retried():
+    recorder = _Recorder({"m0": 5.0})
+    dispatcher = _run(recorder, [Reply(1, "m0")], max_age=1.0)
+
+    assert recorder.sent == []
+    assert dispatcher.metrics().expired == 1
+
+
+def test_board_edits_are_coalesced():
+    recorder = _Recorder()
+    dispatcher = _run(recorder, [
+        Reply(1, "new", board=Board.NEW),
+        Reply(1, "edit 1", board=Board.EDIT),
+        Reply(1, "info"),
+        Reply(1, "edit 2", board=Board.EDIT),
+        Reply(1, "final", board=Board.FINAL),
+        Reply(1, "next game", board=Board.NEW),
+        Reply(2, "other chat", board=Board.EDIT)
+    ])
+
+    # Неотправленное новое поле сразу получает последнее состояние, а поле следующей игры не объединяется с прошлым
+    assert sorted(recorder.sent) == [
+        (1, "final", Board.FINAL), (1, "info", Board.NONE), (1, "next game", Board.NEW),
+        (2, "other chat", Board.EDIT)
+    ]
+    assert dispatcher.metrics().coalesced == 3
+
+
+def test_stale_boards_expire():
+    recorder = _Recorder()
+    dispatcher = OutboundDispatcher(recorder.send, max_age=0.05)
+    dispatcher.submit([
+        Reply(1, "edit", board=Board.EDIT),
+        Reply(2, "new", board=Board.NEW),
+        Reply(3, "final", board=Board.FINAL),
+        Reply(4, "info")
+    ])
+    time.sleep(0.1)
+    dispatcher.start()
+    dispatcher.stop(5.0)
+
+    # Устаревшие незаконченные поля не отправляются, законченное поле и сообщения - отправляются
+    assert sorted(text for _, text, _ in recorder.sent) == ["final", "info"]
+    assert dispatcher.metrics().expired == 2
+
+
+def test_async_dispatcher_retries_and_coalesces():
+    recorder = _Recorder({"m0": 0.1})
+
+    async def run() -> AsyncOutboundDispatcher:
+        dispatcher = AsyncOutboundDispatcher(recorder.send_async)
+        dispatcher.submit([Reply(1, "m0"), Reply(2, "edit 1", board=Board.EDIT), Reply(2, "edit 2", board=Board.EDIT)])
+        dispatcher.start()
+        await dispatcher.stop(5.0)
+
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+
+    assert sorted(recorder.sent) == [(1, "m0", Board.NONE), (2, "edit 2", Board.EDIT)]
+
+    metrics = dispatcher.metrics()
+
+    assert (metrics.rate_limited, metrics.retries, metrics.coalesced, metrics.queue_depth) == (1, 1, 1, 0)
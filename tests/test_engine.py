@@ -0,0 +1,102 @@
+from game import engine
+from game.game import Game, GameResultCode, TurnResultCode
+
+
+def _masks(field: str) -> (int, int):
+    """
+    :param field: 9 символов "X", "O" или "." по строкам сверху вниз
+    :return: маски "X" и "O"
+    """
+
+    x_mask = sum(1 << i for i, cell in enumerate(field) if cell == "X")
+    o_mask = sum(1 << i for i, cell in enumerate(field) if cell == "O")
+
+    return x_mask, o_mask
+
+
+def test_cell_bit():
+    assert engine.cell_bit(0, 0) == 1
+    assert engine.cell_bit(1, 2) == 1 << 5
+    assert engine.cell_bit(2, 2) == 1 << 8
+    assert engine.cell_bit(3, 0) == 0
+    assert engine.cell_bit(0, -1) == 0
+
+
+def test_outcome():
+    for win_mask in engine.WIN_MASKS:
+        assert engine.outcome(win_mask, 0) == engine.X_WIN
+        assert engine.outcome(0, win_mask) == engine.O_WIN
+
+    assert engine.outcome(*_masks("XX.OO....")) == engine.CONTINUE
+    assert engine.outcome(*_masks("XOXXOOOXX")) == engine.DRAW
+    # Последний ход заполнил поле и собрал линию - это победа, а не ничья
+    assert engine.outcome(*_masks("XOXOXOOXX")) == engine.X_WIN
+
+
+def test_outcome_matches_lines():
+    for x_mask in range(engine.FULL_MASK + 1):
+        expected = any(all(x_mask >> i & 1 for i in line) for line in (
+            (0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)
+        ))
+
+        assert (engine.outcome(x_mask, 0) == engine.X_WIN) == expected
+
+
+def test_board_code():
+    assert engine.board_code(0, 0) == 0
+    assert engine.board_code(*_masks("X........")) == 1
+    assert engine.board_code(*_masks(".O.......")) == 2 * 3
+    assert engine.board_code(*_masks("OOOOOOOOO")) == 3 ** 9 - 1
+
+
+def test_canonical_is_shared_by_symmetric_boards():
+    x_mask, o_mask = _masks("XO..X...O")
+    code, canonical_x, canonical_o, _ = engine.canonical(x_mask, o_mask)
+
+    for symmetry in engine.SYMMETRIES:
+        transformed_x = sum(1 << symmetry[i] for i in range(9) if x_mask >> i & 1)
+        transformed_o = sum(1 << symmetry[i] for i in range(9) if o_mask >> i & 1)
+
+        assert engine.canonical(transformed_x, transformed_o)[:3] == (code, canonical_x, canonical_o)
+
+
+def test_untransform_cell_maps_back():
+    x_mask, o_mask = _masks(".X....O..")
+    _, canonical_x, canonical_o, symmetry = engine.canonical(x_mask, o_mask)
+
+    for index in range(9):
+        original = engine.untransform_cell(index, symmetry)
+
+        assert (canonical_x >> index & 1) == (x_mask >> original & 1)
+        assert (canonical_o >> index & 1) == (o_mask >> original & 1)
+
+
+def test_to_field_and_matrix():
+    x_mask, o_mask = _masks("X.O......")
+
+    assert engine.to_field(x_mask, o_mask) == [1, 0, 2, 0, 0, 0, 0, 0, 0]
+    assert engine.to_matrix(x_mask, o_mask) == [["X", " ", "O"], [" ", " ", " "], [" ", " ", " "]]
+
+
+def test_game_turns():
+    game = Game()
+    game.start_new_session(1, "token")
+    game.join_to_session(2)
+    game.start_game()
+
+    assert game.make_turn(3, 0, 0).turn_result_code == TurnResultCode.NO_PLAYER
+
+    for player_id, row, column in ((1, 0, 0), (2, 1, 0), (1, 0, 1), (2, 1, 1)):
+        assert game.make_turn(player_id, row, column).game_result_code == GameResultCode.GAME_CONTINUE
+
+    occupied = game.make_turn(1, 1, 1)
+
+    assert not occupied.is_turn_success
+    assert occupied.turn_result_code == TurnResultCode.INCORRECT_TURN
+
+    result = game.make_turn(1, 0, 2)
+
+    assert result.is_turn_success
+    assert result.game_result_code == GameResultCode.PLAYER_WIN
+    assert result.matrix[0] == ["X", "X", "X"]
+
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from client.expiry import ExpiryService
+from client.game_core import Board, GameCore
+
+
+def _wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+
+        time.sleep(0.01)
+
+    return condition()
+
+
+def test_key_expires_after_timeout():
+    expired = []
+    service = ExpiryService(0.05, expired.append)
+    service.start()
+
+    try:
+        service.touch("a")
+
+        assert service.is_tracked("a")
+        assert _wait_until(lambda: expired == ["a"])
+        assert not service.is_tracked("a")
+        assert len(service) == 0
+    finally:
+        service.stop(1.0)
+
+
+def test_touch_extends_deadline():
+    expired = []
+    service = ExpiryService(0.2, expired.append)
+    service.start()
+
+    try:
+        service.touch("a")
+        service.touch("b")
+
+        # "a" активен дольше своего первого срока, "b" - нет
+        for _ in range(8):
+            time.sleep(0.05)
+            service.touch("a")
+
+        assert expired == ["b"]
+        assert service.is_tracked("a")
+        assert _wait_until(lambda: expired == ["b", "a"])
+    finally:
+        service.stop(1.0)
+
+
+def test_failing_callback_does_not_stop_service():
+    expired = []
+
+    def on_expire(key):
+        if key == "bad":
+            raise RuntimeError("on_expire failed")
+
+        expired.append(key)
+
+    service = ExpiryService(0.01, on_expire)
+    service.start()
+
+    try:
+        service.touch("bad")
+        assert _wait_until(lambda: not service.is_tracked("bad"))
+
+        service.touch("good")
+        assert _wait_until(lambda: expired == ["good"])
+    finally:
+        service.stop(1.0)
+
+
+def test_stop_joins_thread():
+    service = ExpiryService(60.0, lambda key: None)
+    service.start()
+    service.touch("a")
+    service.stop(1.0)
+
+    assert not service._thread.is_alive()
+
+
+def test_inactive_player_is_evicted_from_game():
+    """
+    Неактивный игрок удаляется из памяти вместе с игрой, а его противник получает последнее поле
+    """
+
+    sent = []
+    sent_event = threading.Event()
+
+    def on_expire(replies):
+        sent.extend(replies)
+        sent_event.set()
+
+    core = GameCore(0.3, None, on_expire=on_expire)
+    core.start()
+
+    try:
+        core.load_user(1)
+        core.load_user(2)
+        core.start_session(1, None)
+        token = core.joinable_lobbies(2)[0].session_token
+        core.join_session(2, token)
+
+        assert core.is_in_game(1) and core.is_in_game(2)
+
+        # Игрок 2 продолжает нажимать кнопки, игрок 1 - нет
+        deadline = time.monotonic() + 5.0
+
+        while not sent_event.is_set() and time.monotonic() < deadline:
+            assert core.touch(2)
+            sent_event.wait(0.05)
+
+        assert not core.touch(1)
+        assert not core.is_in_game(1)
+        assert not core.is_in_game(2)
+        assert [(reply.chat_id, reply.board) for reply in sent] == [(2, Board.FINAL)]
+        assert core.joinable_lobbies(2) == ()
+    finally:
+        core.stop()
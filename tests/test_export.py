@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from database.export import export_users
+from database.memory_storage import MemoryStorage
+
+
+def _storage(**kwargs) -> MemoryStorage:
+    storage = MemoryStorage(**kwargs)
+
+    for user_id in (1, 2, 3):
+        storage.ensure_user(user_id)
+
+    storage.record_game_result(1, 2)
+
+    return storage
+
+
+def test_export_without_rank_index():
+    """
+    Хранилище без загрузки индекса мест выгружает всех пользователей, а индекс загружается при первом запросе места
+    """
+
+    storage = _storage(load_rank_index=False)
+
+    assert not storage.rank_index.is_loaded
+
+    rows = list(storage.iter_users_scores())
+
+    assert [user_id for user_id, _ in rows] == [1, 2, 3]
+    assert not storage.rank_index.is_loaded
+
+    assert storage.get_user_rank(1).data == (1, 2)
+    assert storage.rank_index.is_loaded
+
+
+def test_failed_write_removes_temp_file(tmp_path, monkeypatch):
+    """
+    OSError при записи файла не оставляет временный файл и не создает файл выгрузки
+    """
+
+    storage = _storage()
+    path = tmp_path / "users.jsonl"
+
+    def failing_dumps(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr("database.export.json.dumps", failing_dumps)
+
+    with pytest.raises(OSError):
+        export_users(storage, str(path), "jsonl")
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_replaces_file(tmp_path):
+    storage = _storage()
+    path = tmp_path / "users.csv"
+
+    export_query = export_users(storage, str(path), "csv")
+
+    assert export_query.success
+    assert export_query.data.rows == 3
+    assert os.listdir(tmp_path) == ["users.csv"]
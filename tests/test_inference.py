@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from game.game import GameAI, GameResultCode
+from game.inference import MODEL_PATH, NumpyModel, encode_board
+
+
+def _random_model(seed: int = 0) -> NumpyModel:
+    generator = np.random.default_rng(seed)
+
+    return NumpyModel(["dense", "relu", "dense"],
+                      [generator.normal(size=(27, 16)), generator.normal(size=(16, 9))],
+                      [generator.normal(size=16), generator.normal(size=9)])
+
+
+def test_encode_board():
+    # Клетка 0 - "X", клетка 1 - "O", остальные пустые; для каждой клетки [пусто, "O", "X"]
+    encoded = encode_board(0b1, 0b10).reshape(9, 3)
+
+    assert encoded.dtype == np.float32
+    assert encoded[0].tolist() == [0, 0, 1]
+    assert encoded[1].tolist() == [0, 1, 0]
+    assert (encoded[2:] == [1, 0, 0]).all()
+
+
+def test_predict_matches_reference():
+    model = _random_model()
+    x = np.stack([encode_board(0, 0), encode_board(0b1, 0b10000)])
+
+    hidden = np.maximum(x @ model.kernels[0] + model.biases[0], 0.0)
+    expected = hidden @ model.kernels[1] + model.biases[1]
+
+    for shaped in (x, x.reshape(2, 1, 27), [x.reshape(2, 1, 27)]):
+        predicted = model.predict(shaped, verbose=0)
+
+        assert predicted.shape == (2, 9)
+        np.testing.assert_allclose(predicted, expected, rtol=1e-5)
+
+
+def test_save_and_load(tmp_path):
+    model = _random_model()
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = NumpyModel.load(path)
+    x = encode_board(0b101, 0b10000).reshape(1, 1, 27)
+
+    assert loaded.ops == model.ops
+    np.testing.assert_array_equal(loaded.predict(x), model.predict(x))
+
+
+def test_invalid_layers_are_rejected():
+    kernels = [np.zeros((27, 9))]
+    biases = [np.zeros(9)]
+
+    with pytest.raises(ValueError):
+        NumpyModel(["dense", "dense"], kernels, biases)
+
+    with pytest.raises(ValueError):
+        NumpyModel(["dense", "sigmoid"], kernels, biases)
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="нет выгруженной модели")
+def test_game_ai_with_exported_model():
+    """
+    AI с выгруженной моделью ходит только в свободные клетки
+    """
+
+    game = GameAI(NumpyModel.load())
+    game.start_new_session(1)
+
+    for index in range(9):
+        if (game.x_mask | game.o_mask) >> index & 1:
+            continue
+
+        result = game.make_turn(index // 3, index % 3)
+
+        assert result.is_turn_success
+        assert not result.x_mask & result.o_mask
+
+        if result.game_result_code != GameResultCode.GAME_CONTINUE:
+            break
+
+        # После каждого хода игрока AI сделал ровно один ход
+        assert result.x_mask.bit_count() == result.o_mask.bit_count()
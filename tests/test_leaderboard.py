@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from database.leaderboard import Leaderboard
+from database.memory_storage import MemoryStorage
+from database.sqlite_storage import SQLiteStorage
+
+
+def test_out_of_order_update_is_ignored():
+    """
+    Строки двух игр одного пользователя пришли в обратном порядке: более старая (меньше игр) не перезаписывает новую
+    """
+
+    leaderboard = Leaderboard(size=3, capacity=5)
+    leaderboard.load([(1, "a", 0.5, 2), (2, "b", 0.4, 5)])
+
+    leaderboard.update([(1, "a", 0.75, 4)])
+    leaderboard.update([(1, "a", 0.6, 3)])
+
+    assert leaderboard.top() == (("a", 0.75), ("b", 0.4))
+
+
+def test_newer_row_replaces_entry():
+    leaderboard = Leaderboard(size=3, capacity=5)
+    leaderboard.load([(1, "a", 0.5, 2), (2, "b", 0.4, 5)])
+
+    leaderboard.update([(2, "b", 0.9, 6), (1, "a", 0.1, 3)])
+
+    assert leaderboard.top() == (("b", 0.9), ("a", 0.1))
+
+
+def test_user_dropping_below_threshold_is_untracked():
+    leaderboard = Leaderboard(size=1, capacity=2)
+    leaderboard.load([(1, "a", 0.9, 10), (2, "b", 0.8, 10)])
+
+    # Порог - 0.8: ниже него могут быть неотслеживаемые пользователи, поэтому место выпавшего неизвестно
+    leaderboard.update([(1, "a", 0.5, 11)])
+
+    assert leaderboard.top() == (("b", 0.8),)
+    assert leaderboard.metrics().tracked == 1
+
+    # Более старая строка выпавшего пользователя не возвращает его в таблицу
+    leaderboard.update([(1, "a", 0.95, 9)])
+
+    assert leaderboard.top() == (("b", 0.8),)
+
+
+def test_updates_during_load_are_replayed():
+    leaderboard = Leaderboard(size=3, capacity=5)
+    leaderboard.begin_load()
+
+    # Запрос к БД для load начался до этой игры, поэтому его строки старее обновления
+    leaderboard.update([(1, "a", 0.75, 4)])
+    leaderboard.load([(1, "a", 0.5, 2), (2, "b", 0.4, 5)])
+
+    assert leaderboard.top() == (("a", 0.75), ("b", 0.4))
+
+
+def test_top_is_cached_until_change():
+    leaderboard = Leaderboard(size=3, capacity=5)
+    leaderboard.load([(1, None, 0.5, 2)])
+
+    top = leaderboard.top()
+
+    assert top == (("1", 0.5),)
+    assert leaderboard.top() is top
+
+    leaderboard.rename(1, "a")
+
+    assert leaderboard.top() == (("a", 0.5),)
+
+
+def test_top_with_overrides_scores():
+    leaderboard = Leaderboard(size=2, capacity=5)
+    leaderboard.load([(1, "a", 0.5, 2), (2, "b", 0.4, 5)])
+
+    assert leaderboard.top_with({2: ("b", 0.7), 3: (None, 0.6)}) == (("b", 0.7), ("3", 0.6))
+    assert leaderboard.top() == (("a", 0.5), ("b", 0.4))
+
+
+@pytest.mark.parametrize("factory", [
+    lambda directory: MemoryStorage(),
+    lambda directory: SQLiteStorage(os.path.join(directory, "storage.db"))
+], ids=["memory", "sqlite"])
+def test_draw_updates_games_count(factory, tmp_path):
+    """
+    Ничья не меняет винрейт, но количество игр обоих игроков в таблице лидеров и индексе мест растет: по нему
+    отбрасываются строки, прочитанные до ничьей
+    """
+
+    storage = factory(str(tmp_path))
+
+    try:
+        for user_id in (1, 2):
+            storage.ensure_user(user_id)
+
+        storage.record_game_result(1, 2)
+        storage.get_leaders()
+
+        leaderboard_updates = storage.leaderboard.metrics().updates
+        rank_index_updates = storage.rank_index.metrics().updates
+
+        assert storage.record_draw(1, 2).success
+        assert storage.leaderboard.metrics().updates == leaderboard_updates + 2
+        assert storage.rank_index.metrics().updates == rank_index_updates + 2
+
+        # Строка, прочитанная до ничьей, устарела и не меняет ни таблицу лидеров, ни места
+        storage.leaderboard.update([(2, None, 1.0, 1)])
+        storage.rank_index.update([(2, None, 1.0, 1)])
+
+        assert storage.get_leaders().data == (("1", 1.0), ("2", 0.0))
+        assert storage.get_user_rank(2).data == (2, 2)
+    finally:
+        storage.close()
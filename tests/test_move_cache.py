@@ -0,0 +1,93 @@
+import numpy as np
+
+from game import engine
+from game.game import GameAI
+from game.move_cache import MoveCache
+
+
+class _CountingModel:
+    """
+    Предпочитает клетки с большим номером, считает вызовы predict
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, x, verbose: int = 0) -> np.ndarray:
+        self.calls += 1
+
+        return np.tile(np.arange(9, dtype=np.float32), (len(x), 1))
+
+
+def _transform(mask: int, symmetry: tuple) -> int:
+    return sum(1 << symmetry[i] for i in range(9) if mask >> i & 1)
+
+
+def test_symmetric_boards_share_canonical_code():
+    # Поле без собственных симметрий: все 8 преобразований дают разные поля
+    x_mask, o_mask = 0b000_000_011, 0b000_100_000
+    boards = {(_transform(x_mask, symmetry), _transform(o_mask, symmetry)) for symmetry in engine.SYMMETRIES}
+
+    assert len(boards) == 8
+    assert len({engine.canonical(*board)[0] for board in boards}) == 1
+
+
+def test_symmetric_positions_use_one_entry():
+    """
+    Первый ход игрока в любой из 4 углов - одна каноническая позиция: модель вызывается один раз, а ответы AI
+    симметричны друг другу
+    """
+
+    model = _CountingModel()
+    cache = MoveCache(model)
+    boards = set()
+
+    for corner in (0, 2, 6, 8):
+        game = GameAI(model, cache)
+        game.start_new_session(1)
+        result = game.make_turn(corner // 3, corner % 3)
+
+        assert result.o_mask.bit_count() == 1
+        boards.add(engine.canonical(result.x_mask, result.o_mask)[0])
+
+    assert model.calls == 1
+    assert len(boards) == 1
+
+    metrics = cache.metrics()
+
+    assert (metrics.size, metrics.hits, metrics.misses) == (1, 3, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    model = object()
+    cache = MoveCache(model, max_size=2)
+
+    cache.put(model, 1, 4)
+    cache.put(model, 2, 0)
+    assert cache.get(model, 1) == 4
+
+    cache.put(model, 3, 8)
+
+    assert cache.get(model, 2) is None
+    assert cache.get(model, 1) == 4
+    assert cache.get(model, 3) == 8
+    assert cache.metrics().evictions == 1
+
+
+def test_moves_of_replaced_model_are_not_used():
+    old_model, new_model = object(), object()
+    cache = MoveCache(old_model)
+    cache.put(old_model, 1, 4)
+
+    cache.invalidate(new_model)
+
+    # Игра начатая до смены модели не читает и не записывает ходы новой
+    cache.put(old_model, 2, 0)
+
+    assert cache.get(old_model, 2) is None
+    assert cache.get(new_model, 1) is None
+    assert cache.get(new_model, 2) is None
+
+    metrics = cache.metrics()
+
+    assert (metrics.size, metrics.invalidations, metrics.bypassed) == (0, 1, 1)
@@ -0,0 +1,102 @@
+import pytest
+
+from game import engine
+from game.game import GameAI, GameResultCode
+from game.outcome_table import OutcomeTable, generate, save, shared_table
+
+
+def _code(field: str) -> int:
+    """
+    :param field: 9 символов "X", "O" или "." по строкам сверху вниз
+    """
+
+    return engine.board_code(sum(1 << i for i, cell in enumerate(field) if cell == "X"),
+                             sum(1 << i for i, cell in enumerate(field) if cell == "O"))
+
+
+@pytest.fixture(scope="module")
+def generated() -> OutcomeTable:
+    return OutcomeTable(generate())
+
+
+def test_reachable_positions(generated):
+    reachable = [code for code in range(3 ** 9) if generated.is_reachable(code)]
+
+    # Все различные позиции, которые встречаются в играх по правилам
+    assert len(reachable) == 5478
+    assert generated.is_reachable(0)
+    # "O" не ходит первым, а после победы ходов нет
+    assert not generated.is_reachable(_code("O........"))
+    assert not generated.is_reachable(_code("XXXOO.O.."))
+
+
+def test_outcomes(generated):
+    assert generated.outcome(0) == engine.CONTINUE
+    assert generated.outcome(_code("XXXOO....")) == engine.X_WIN
+    assert generated.outcome(_code("XX.OOOX..")) == engine.O_WIN
+    assert generated.outcome(_code("XOXXOOOXX")) == engine.DRAW
+
+
+def test_best_moves(generated):
+    # Победа в один ход лучше любого другого хода
+    assert generated.best_move(_code("XX.OO....")) == 2
+    # "O" ходит и может только помешать "X" выиграть
+    assert generated.best_moves(_code("XX..O....")) == 1 << 2
+    # Законченная игра
+    assert generated.best_move(_code("XXXOO....")) is None
+    assert generated.best_moves(_code("XXXOO....")) == 0
+
+
+def test_file_matches_generated(generated, tmp_path):
+    path = tmp_path / "outcome_table.bin"
+    save(generate(), str(path))
+    loaded = OutcomeTable.load(str(path))
+
+    for code in range(3 ** 9):
+        assert loaded.best_moves(code) == generated.best_moves(code)
+        assert loaded.outcome(code) == generated.outcome(code)
+        assert loaded.is_reachable(code) == generated.is_reachable(code)
+
+    # Файл в репозитории соответствует текущему генератору
+    assert all(shared_table().best_moves(code) == generated.best_moves(code) for code in range(3 ** 9))
+
+
+def test_load_rejects_foreign_file(tmp_path):
+    path = tmp_path / "outcome_table.bin"
+    path.write_bytes(b"\x00" * 64)
+
+    with pytest.raises(ValueError):
+        OutcomeTable.load(str(path))
+
+    with pytest.raises(ValueError):
+        OutcomeTable([0] * 10)
+
+
+def test_game_ai_never_loses_without_model():
+    """
+    Без модели AI ходит по таблице исходов и не проигрывает ни одной партии, как бы ни ходил игрок
+    """
+
+    def explore(x_mask: int, o_mask: int) -> int:
+        games = 0
+
+        for index in range(9):
+            if (x_mask | o_mask) >> index & 1:
+                continue
+
+            game = GameAI(None)
+            game.start_new_session(1)
+            game.x_mask, game.o_mask = x_mask, o_mask
+            result = game.make_turn(index // 3, index % 3)
+
+            assert result.is_turn_success
+            assert result.game_result_code != GameResultCode.PLAYER_WIN
+
+            if result.game_result_code == GameResultCode.GAME_CONTINUE:
+                games += explore(result.x_mask, result.o_mask)
+            else:
+                games += 1
+
+        return games
+
+    assert explore(0, 0) > 0
@@ -0,0 +1,59 @@
+from database.profile_cache import ProfileCache
+
+
+def test_invalidation_of_other_user_keeps_read():
+    """
+    Сброс статистики одного пользователя во время чтения другого не отменяет сохранение прочитанного значения
+    """
+
+    cache = ProfileCache(capacity=10)
+
+    generation = cache.begin_read()
+    cache.invalidate(2, ProfileCache.SCORE)
+    cache.put(1, ProfileCache.SCORE, (1, 0, 0, 1.0, "a"), generation)
+
+    assert cache.get(1, ProfileCache.SCORE) == (1, 0, 0, 1.0, "a")
+
+
+def test_invalidation_of_other_field_keeps_read():
+    cache = ProfileCache(capacity=10)
+
+    generation = cache.begin_read()
+    cache.invalidate(1, ProfileCache.NICKNAME)
+    cache.put(1, ProfileCache.SCORE, (1, 0, 0, 1.0, "a"), generation)
+
+    assert cache.get(1, ProfileCache.SCORE) == (1, 0, 0, 1.0, "a")
+
+
+def test_read_before_invalidation_is_dropped():
+    cache = ProfileCache(capacity=10)
+
+    generation = cache.begin_read()
+    cache.invalidate(1, ProfileCache.SCORE)
+    cache.put(1, ProfileCache.SCORE, (0, 0, 0, None, "a"), generation)
+
+    assert cache.get(1, ProfileCache.SCORE) is ProfileCache.MISSING
+
+    # Чтение начатое после сброса сохраняется
+    cache.put(1, ProfileCache.SCORE, (1, 0, 0, 1.0, "a"), cache.begin_read())
+
+    assert cache.get(1, ProfileCache.SCORE) == (1, 0, 0, 1.0, "a")
+
+
+def test_forgotten_invalidation_drops_read():
+    """
+    Когда поколения сбросов вытеснены, чтение начатое до них не сохраняется ни для одного пользователя
+    """
+
+    cache = ProfileCache(capacity=2)
+
+    generation = cache.begin_read()
+    cache.invalidate(1, ProfileCache.SCORE)
+    cache.invalidate(2, ProfileCache.SCORE)
+    cache.invalidate(3, ProfileCache.SCORE)
+
+    cache.put(1, ProfileCache.SCORE, (0, 0, 0, None, "a"), generation)
+    cache.put(4, ProfileCache.SCORE, (0, 0, 0, None, "d"), generation)
+
+    assert cache.get(1, ProfileCache.SCORE) is ProfileCache.MISSING
+    assert cache.get(4, ProfileCache.SCORE) is ProfileCache.MISSING
@@ -0,0 +1,57 @@
+from database.rank_index import RankIndex
+
+
+def _loaded(scores: {int: float | None}, buckets: int = 100) -> RankIndex:
+    index = RankIndex(buckets)
+    index.load((user_id, (1, 1, 0, win_rate, None)) for user_id, win_rate in scores.items())
+
+    return index
+
+
+def test_tied_bucket_shares_rank():
+    index = _loaded({1: 0.9, 2: 0.5, 3: 0.5, 4: 0.1})
+
+    assert index.rank(1) == (1, 4)
+    assert index.rank(2) == (2, 4)
+    assert index.rank(3) == (2, 4)
+    assert index.rank(4) == (4, 4)
+
+
+def test_close_win_rates_in_one_bucket_tie():
+    # Точность места - 1 / buckets: 0.501 и 0.509 попадают в одну корзину
+    index = _loaded({1: 0.501, 2: 0.509, 3: 0.7}, buckets=100)
+
+    assert index.rank(1) == index.rank(2) == (2, 3)
+
+
+def test_users_without_win_rate_are_not_ranked():
+    index = _loaded({1: 0.5, 2: None})
+
+    assert index.rank(1) == (1, 1)
+    assert index.rank(2) is None
+
+
+def test_update_moves_user_and_ignores_stale_rows():
+    index = _loaded({1: 0.9, 2: 0.5, 3: 0.5})
+
+    index.update([(2, None, 1.0, 3)])
+
+    assert index.rank(2) == (1, 3)
+    assert index.rank(1) == (2, 3)
+
+    # Строка более старой игры пришла позже
+    index.update([(2, None, 0.0, 2)])
+
+    assert index.rank(2) == (1, 3)
+
+
+def test_rank_at_with_tie():
+    index = _loaded({1: 0.9, 2: 0.5, 3: 0.5})
+
+    # Игрок 2 с винрейтом игрока 1 делит с ним первое место
+    assert index.rank_at(2, 0.9) == (1, 3)
+    # Сам игрок не считается выше себя
+    assert index.rank_at(1, 0.5) == (1, 3)
+    # Новый игрок добавляется к количеству
+    assert index.rank_at(4, 0.5) == (2, 4)
+    assert index.rank_at(4, None) is None
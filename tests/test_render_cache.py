@@ -0,0 +1,60 @@
+import json
+
+from client.callback_data import CallData, board_tag, decode, encode
+from client.render_cache import RenderCache
+from game import engine
+
+
+_RESET = encode(CallData.RESET)
+
+
+def test_text():
+    cache = RenderCache(_RESET)
+
+    # "X" в клетке 0, "O" в клетке 4
+    assert cache.text(0b1, 0b10000) == "❌⬜️⬜️\n⬜️⭕️⬜️\n⬜️⬜️⬜️\n"
+    assert cache.text(0, 0) == "⬜️⬜️⬜️\n" * 3
+
+
+def test_markup_buttons():
+    cache = RenderCache(_RESET)
+    x_mask, o_mask = 0b100, 0b1000_0000
+    rows = json.loads(cache.markup(x_mask, o_mask, CallData.TURN).to_json())["inline_keyboard"]
+
+    assert [[button["text"] for button in row] for row in rows] == [
+        [" ", " ", "X"], [" ", " ", " "], [" ", "O", " "], ["Отмена"]
+    ]
+    assert rows[3][0]["callback_data"] == _RESET
+
+    for cell in range(9):
+        button = rows[cell // 3][cell % 3]
+        callback = decode(button["callback_data"])
+
+        assert (callback.action, callback.cell, callback.tag) == (CallData.TURN, cell, board_tag(x_mask, o_mask))
+        # Ограничение Telegram на размер callback_data
+        assert len(button["callback_data"].encode()) <= 64
+
+
+def test_entries_are_built_once():
+    cache = RenderCache(_RESET)
+    markup = cache.markup(0b1, 0, CallData.TURN_AI)
+
+    assert cache.markup(0b1, 0, CallData.TURN_AI) is markup
+    assert cache.text(0b1, 0) is cache.text(0b1, 0)
+    # У разных действий разные клавиатуры
+    turn_markup = cache.markup(0b1, 0, CallData.TURN)
+    button = json.loads(turn_markup.to_json())["inline_keyboard"][0][1]
+
+    assert turn_markup is not markup
+    assert decode(button["callback_data"]).action == CallData.TURN
+
+
+def test_build_matches_lazy_rendering():
+    codes = [engine.board_code(0, 0), engine.board_code(0b11, 0b100_000)]
+    built = RenderCache(_RESET)
+    built.build((CallData.TURN,), codes)
+    lazy = RenderCache(_RESET)
+
+    for x_mask, o_mask in ((0, 0), (0b11, 0b100_000)):
+        assert built.markup(x_mask, o_mask, CallData.TURN).json == lazy.markup(x_mask, o_mask, CallData.TURN).json
+        assert built.text(x_mask, o_mask) == lazy.text(x_mask, o_mask)
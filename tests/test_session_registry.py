@@ -0,0 +1,83 @@
+import threading
+
+from client.session_registry import SessionRegistry
+from game.game import GameAI
+
+
+def test_lobby_lifecycle():
+    registry = SessionRegistry()
+    game = registry.create_game(1)
+
+    assert registry.find_game_by_player(1) is game
+    assert registry.find_lobby(game.session_token) is game
+    assert registry.lobbies() == (game,)
+
+    assert registry.join_game(game.session_token, 2) is game
+    assert registry.find_game_by_player(2) is game
+    assert registry.find_lobby(game.session_token) is None
+    assert registry.lobbies() == ()
+
+    # Сессия уже не открыта
+    assert registry.join_game(game.session_token, 3) is None
+
+    registry.end_game(game)
+
+    assert registry.find_game_by_player(1) is None
+    assert registry.find_game_by_player(2) is None
+
+
+def test_lobbies_snapshot_keeps_creation_order():
+    registry = SessionRegistry()
+    games = [registry.create_game(player_id) for player_id in range(1, 5)]
+    snapshot = registry.lobbies()
+
+    registry.end_game(games[1])
+
+    assert registry.lobbies() == (games[0], games[2], games[3])
+    # Полученный ранее снимок не меняется
+    assert snapshot == tuple(games)
+
+
+def test_join_unknown_session():
+    registry = SessionRegistry()
+
+    assert registry.join_game("missing", 1) is None
+    assert registry.find_game_by_player(1) is None
+
+
+def test_only_one_player_joins_a_lobby():
+    registry = SessionRegistry()
+    game = registry.create_game(1)
+    joined = []
+    start = threading.Barrier(8)
+
+    def join(player_id: int):
+        start.wait()
+
+        if registry.join_game(game.session_token, player_id) is not None:
+            joined.append(player_id)
+
+    threads = [threading.Thread(target=join, args=(player_id,)) for player_id in range(2, 10)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(joined) == 1
+    assert [player.id for player in game.players] == [1, joined[0]]
+
+
+def test_expire_player_removes_all_sessions():
+    registry = SessionRegistry()
+    game = registry.create_game(1)
+    ai_game = GameAI(None)
+    ai_game.start_new_session(1)
+    registry.add_ai_game(ai_game)
+
+    assert registry.expire_player(1) == (game, ai_game)
+    assert registry.find_game_by_player(1) is None
+    assert registry.find_ai_game(1) is None
+    assert registry.lobbies() == ()
+    assert registry.expire_player(1) == (None, None)
@@ -0,0 +1,101 @@
+import threading
+
+from client.state_store import BoardMessages, StatusStore, StripedLock
+
+
+def _run_concurrently(target, count: int):
+    start = threading.Barrier(count)
+
+    def worker(i: int):
+        start.wait()
+        target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+def test_compare_and_set():
+    store = StatusStore()
+
+    assert not store.compare_and_set(1, "chat", "game")
+    assert store.set_default(1, "chat") == "chat"
+    assert store.set_default(1, "game") == "chat"
+    assert store.compare_and_set(1, "chat", "game")
+    assert not store.compare_and_set(1, "chat", "lobby")
+    assert store.get(1) == "game"
+    assert 1 in store and len(store) == 1
+    assert store.pop(1) == "game"
+    assert store.pop(1, "missing") == "missing"
+
+
+def test_only_one_transition_wins():
+    """
+    Из одновременных нажатий одного пользователя статус меняет только одно
+    """
+
+    store = StatusStore()
+    store.set(1, "chat")
+    winners = []
+
+    def transition(i: int):
+        if store.compare_and_set(1, "chat", f"game-{i}"):
+            winners.append(i)
+
+    _run_concurrently(transition, 16)
+
+    assert len(winners) == 1
+    assert store.get(1) == f"game-{winners[0]}"
+
+
+def test_striped_lock_excludes_same_key():
+    locks = StripedLock(4)
+    counter = {"value": 0}
+
+    def increment(i: int):
+        for _ in range(1000):
+            with locks.hold("key"):
+                value = counter["value"]
+                counter["value"] = value + 1
+
+    _run_concurrently(increment, 8)
+
+    assert counter["value"] == 8000
+
+
+def test_striped_lock_multiple_keys_in_any_order():
+    """
+    Несколько ключей блокируются в одном порядке независимо от порядка аргументов, поэтому встречные блокировки не
+    приводят к взаимной блокировке. Ключи одной полосы и повторные блокировки в том же потоке допустимы
+    """
+
+    locks = StripedLock(8)
+
+    def hold(i: int):
+        for _ in range(200):
+            keys = (1, 2, 9) if i % 2 else (9, 2, 1)
+
+            with locks.hold(*keys):
+                with locks.hold(keys[0]):
+                    pass
+
+    thread = threading.Thread(target=_run_concurrently, args=(hold, 8))
+    thread.start()
+    thread.join(10.0)
+
+    assert not thread.is_alive()
+
+
+def test_board_messages():
+    boards = BoardMessages()
+    boards.set(1, 10)
+    boards.set(1, 11)
+
+    assert boards.get(1) == 11 and 1 in boards and len(boards) == 1
+    assert boards.pop(1) == 11
+    assert boards.pop(1) is None
+    assert boards.get(1) is None
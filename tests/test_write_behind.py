@@ -0,0 +1,218 @@
+import glob
+import threading
+
+import pytest
+
+from database.memory_storage import MemoryStorage
+from database.storage import DatabaseOperationResult
+from database.write_behind import StatsWriteBehind
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage()
+
+    for user_id in (1, 2, 3):
+        storage.register_user(user_id)
+
+    yield storage
+
+    storage.close()
+
+
+def _write_behind(storage: MemoryStorage, journal_path: str) -> StatsWriteBehind:
+    # Запись в БД только явным flush и при close
+    return StatsWriteBehind(storage, journal_path, flush_interval=3600.0, flush_threshold=10 ** 6)
+
+
+def _segments(journal_path: str) -> [str]:
+    return sorted(glob.glob(f"{glob.escape(journal_path)}.[0-9]*"))
+
+
+def _journal_lines(journal_path: str) -> [str]:
+    lines = []
+
+    for segment in _segments(journal_path):
+        with open(segment, encoding="utf-8") as file:
+            lines.extend(file)
+
+    return lines
+
+
+def _stats(storage: MemoryStorage, user_id: int) -> tuple:
+    return storage.select_user_score(user_id).data[:3]
+
+
+def test_recover_replays_journal_after_crash(storage, tmp_path):
+    journal_path = str(tmp_path / "stats.journal")
+
+    with open(f"{journal_path}.00000001", "w", encoding="utf-8") as file:
+        file.write("1 W 1 2\n2 D 1 3\n")
+
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+    write_behind.close()
+
+    assert _stats(storage, 1) == (1, 0, 1)
+    assert _stats(storage, 2) == (0, 1, 0)
+    assert _stats(storage, 3) == (0, 0, 1)
+    assert storage.get_applied_stats_sequence().data == 2
+    assert write_behind.sequence == 2
+
+
+def test_recover_skips_truncated_line(storage, tmp_path):
+    """
+    Процесс упал во время записи последней строки: "3 W 2 1" без перевода строки может быть обрезанной "3 W 2 13"
+    """
+
+    journal_path = str(tmp_path / "stats.journal")
+
+    with open(f"{journal_path}.00000001", "w", encoding="utf-8") as file:
+        file.write("1 W 1 2\n2 D 1 3\n3 W 2 1")
+
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+    write_behind.close()
+
+    assert _stats(storage, 1) == (1, 0, 1)
+    assert _stats(storage, 2) == (0, 1, 0)
+    assert write_behind.sequence == 2
+
+
+def test_recover_skips_applied_sequences(storage, tmp_path):
+    journal_path = str(tmp_path / "stats.journal")
+
+    # Первый результат уже записан в БД, но процесс упал до удаления сегмента
+    storage.apply_stats_deltas({1: [1, 0, 0], 2: [0, 1, 0]}, 1)
+
+    with open(f"{journal_path}.00000001", "w", encoding="utf-8") as file:
+        file.write("1 W 1 2\n2 W 3 1\n")
+
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+    write_behind.close()
+
+    assert _stats(storage, 1) == (1, 1, 0)
+    assert _stats(storage, 2) == (0, 1, 0)
+    assert _stats(storage, 3) == (1, 0, 0)
+    assert storage.get_applied_stats_sequence().data == 2
+
+
+def test_flush_rotates_journal(storage, tmp_path):
+    journal_path = str(tmp_path / "stats.journal")
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+
+    write_behind.record_game_result(1, 2)
+    write_behind.record_draw(1, 3)
+
+    first_segments = _segments(journal_path)
+    assert len(first_segments) == 1
+    assert write_behind.pending_delta(1) == (1, 0, 1)
+    assert _stats(storage, 1) == (0, 0, 0)
+
+    assert write_behind.flush()
+
+    # Записанный сегмент удален, новые результаты пишутся в следующий
+    segments = _segments(journal_path)
+    assert len(segments) == 1 and segments != first_segments
+    assert write_behind.pending_deltas() == {}
+    assert _stats(storage, 1) == (1, 0, 1)
+    assert storage.get_applied_stats_sequence().data == 2
+
+    write_behind.record_game_result(2, 1)
+
+    assert _journal_lines(journal_path) == ["3 W 2 1\n"]
+
+    write_behind.close()
+
+    assert _stats(storage, 2) == (1, 1, 0)
+
+
+def test_unflushed_results_survive_restart(storage, tmp_path):
+    journal_path = str(tmp_path / "stats.journal")
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+
+    write_behind.record_game_result(1, 2)
+    assert write_behind.flush()
+    write_behind.record_game_result(3, 2)
+
+    # Падение процесса: close не вызывается, второй результат есть только в журнале
+    write_behind._journal.close()
+
+    restarted = _write_behind(storage, journal_path)
+    restarted.start()
+    restarted.close()
+
+    assert _stats(storage, 1) == (1, 0, 0)
+    assert _stats(storage, 2) == (0, 2, 0)
+    assert _stats(storage, 3) == (1, 0, 0)
+    assert restarted.sequence == 2
+    assert _journal_lines(journal_path) == []
+
+
+def test_failed_flush_keeps_deltas(storage, tmp_path, monkeypatch):
+    journal_path = str(tmp_path / "stats.journal")
+    write_behind = _write_behind(storage, journal_path)
+    write_behind.start()
+    write_behind.record_game_result(1, 2)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage, "write_stats_deltas", lambda deltas, sequence: DatabaseOperationResult(False, None))
+        assert not write_behind.flush()
+
+    assert write_behind.pending_delta(1) == (1, 0, 0)
+    assert len(_segments(journal_path)) == 2
+
+    write_behind.close()
+
+    assert _stats(storage, 1) == (1, 0, 0)
+    assert _journal_lines(journal_path) == []
+
+
+@pytest.mark.parametrize("read", [
+    lambda storage: storage.get_user_score(1).data[:3],
+    lambda storage: storage.get_users_scores().data[1][:3],
+    lambda storage: dict(storage.iter_users_scores())[1][:3]
+], ids=["get_user_score", "get_users_scores", "iter_users_scores"])
+def test_read_during_flush_counts_deltas_once(tmp_path, monkeypatch, read):
+    """
+    Чтение между записью приращений в БД и их удалением из памяти не должно учитывать их дважды
+    """
+
+    storage = MemoryStorage(stats_journal_path=str(tmp_path / "stats.journal"), stats_flush_interval=3600.0)
+    storage.register_user(1)
+    storage.register_user(2)
+    storage.record_game_result(1, 2)
+
+    assert read(storage) == (1, 0, 0)
+
+    written = threading.Event()
+    release = threading.Event()
+    apply_stats_deltas = storage.apply_stats_deltas
+
+    def slow_apply_stats_deltas(deltas, sequence):
+        result = apply_stats_deltas(deltas, sequence)
+        written.set()
+        release.wait(5.0)
+
+        return result
+
+    monkeypatch.setattr(storage, "apply_stats_deltas", slow_apply_stats_deltas)
+
+    flush = threading.Thread(target=storage.write_behind.flush)
+    flush.start()
+    assert written.wait(5.0)
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(read(storage)))
+    reader.start()
+    reader.join(0.1)
+    release.set()
+    reader.join(5.0)
+    flush.join(5.0)
+
+    assert results == [(1, 0, 0)]
+
+    storage.close()